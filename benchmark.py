@@ -0,0 +1,454 @@
+"""
+Бенчмарк основных операций FinanceTracker на синтетических данных.
+
+Генератор детерминирован (фиксированный seed): одинаковые параметры дают одинаковый
+журнал операций относительно даты запуска, поэтому результаты можно сравнивать между коммитами.
+
+Отдельно замеряется запуск консоли: импорт main.py и время до первого меню,
+и подсказки при вводе на большом словаре различных описаний.
+
+Пример:
+    python benchmark.py --rows 10000 1000000 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import datetime
+
+from main import FinanceTracker, TypeaheadIndex
+
+
+# Категории расходов: (название, вес в общем потоке, медиана суммы, разброс в логнормальном распределении)
+EXPENSE_PROFILE = [
+    ("Продукты", 30, 900, 0.7),
+    ("Кафе и рестораны", 14, 700, 0.6),
+    ("Транспорт", 16, 250, 0.8),
+    ("Жилье", 2, 35000, 0.2),
+    ("Коммунальные услуги", 3, 5000, 0.3),
+    ("Связь и интернет", 3, 800, 0.2),
+    ("Одежда", 5, 3500, 0.8),
+    ("Развлечения", 9, 1500, 0.9),
+    ("Здоровье", 5, 2000, 0.9),
+    ("Образование", 2, 6000, 0.7),
+    ("Другое", 11, 1000, 1.0),
+]
+
+EXPENSE_DESCRIPTIONS = {
+    "Продукты": ["Пятёрочка", "Перекрёсток", "ВкусВилл", "Магнит", "Рынок"],
+    "Кафе и рестораны": ["Кофейня", "Бизнес-ланч", "Доставка пиццы", "Суши", "Шаурма"],
+    "Транспорт": ["Метро", "Такси", "Яндекс Go", "Бензин", "Парковка"],
+    "Жилье": ["Аренда квартиры"],
+    "Коммунальные услуги": ["ЖКХ", "Электричество"],
+    "Связь и интернет": ["Мобильная связь", "Домашний интернет"],
+    "Одежда": ["Кроссовки", "Куртка", "Джинсы"],
+    "Развлечения": ["Кино", "Netflix", "Концерт", "Игры в Steam"],
+    "Здоровье": ["Аптека", "Стоматолог", "Анализы"],
+    "Образование": ["Курсы английского", "Книги"],
+    "Другое": ["Подарок", "Хозтовары", "Ремонт"],
+}
+
+INCOME_PROFILE = [
+    ("Зарплата", "Зарплата", 120000, 0.1),
+    ("Подработка", "Фриланс", 15000, 0.6),
+    ("Проценты по вкладам", "Проценты", 1500, 0.3),
+    ("Подарки", "Подарок", 5000, 0.8),
+]
+
+ACCOUNT_TYPES = ["Дебетовая карта", "Наличные", "Кредитная карта", "Сберегательный счёт", "Инвестиции"]
+
+# Сколько строк вставлять одним executemany
+CHUNK_SIZE = 50000
+
+
+def generate_ledger(tracker, rows, accounts=3, years=3, seed=42, recurring=20, planned=20, today=None):
+    """
+    Заполняет пустую базу трекера синтетическими данными:
+    счета, доходы и расходы по реалистичным категориям, переводы, регулярные и запланированные платежи.
+    Возвращает количество вставленных операций и переводов.
+    """
+    rng = random.Random(seed)
+    today = today or datetime.date.today()
+    start = today - datetime.timedelta(days=365 * years)
+    span_seconds = (today - start).days * 86400 + 86399
+
+    cursor = tracker.cursor
+
+    # Большой начальный баланс, чтобы замеры расходов и переводов не упирались в остаток
+    for i in range(accounts):
+        tracker.create_account(f"Счёт {i + 1}", ACCOUNT_TYPES[i % len(ACCOUNT_TYPES)], 10 ** 9)
+    account_ids = [a[0] for a in tracker.get_accounts()]
+
+    expense_names = [c[0] for c in EXPENSE_PROFILE]
+    expense_weights = [c[1] for c in EXPENSE_PROFILE]
+    expense_params = {c[0]: (c[2], c[3]) for c in EXPENSE_PROFILE}
+
+    balance_deltas = dict.fromkeys(account_ids, 0)
+    transfers_count = rows // 50
+    transactions_count = rows - transfers_count
+
+    def random_timestamp():
+        moment = datetime.datetime.combine(start, datetime.time()) + datetime.timedelta(
+            seconds=rng.randint(0, span_seconds)
+        )
+        return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+    batch = []
+    for _ in range(transactions_count):
+        account_id = rng.choice(account_ids)
+        transaction_date = random_timestamp()
+
+        # Примерно каждая восьмая операция - доход
+        if rng.random() < 0.12:
+            category, description, median, sigma = rng.choice(INCOME_PROFILE)
+            amount = round(rng.lognormvariate(0, sigma) * median, 2)
+            transaction_type = "income"
+        else:
+            category = rng.choices(expense_names, expense_weights)[0]
+            median, sigma = expense_params[category]
+            amount = -round(rng.lognormvariate(0, sigma) * median, 2)
+            description = rng.choice(EXPENSE_DESCRIPTIONS[category])
+            transaction_type = "expense"
+
+        balance_deltas[account_id] += amount
+        batch.append((
+            account_id, amount, description, category, transaction_date, transaction_type,
+            tracker.get_transaction_fingerprint(account_id, amount, description, transaction_date)
+        ))
+
+        if len(batch) >= CHUNK_SIZE:
+            cursor.executemany(
+                "INSERT INTO transactions (account_id, amount, description, category, transaction_date, transaction_type, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                batch
+            )
+            batch = []
+
+    if batch:
+        cursor.executemany(
+            "INSERT INTO transactions (account_id, amount, description, category, transaction_date, transaction_type, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            batch
+        )
+
+    transfers = []
+    if len(account_ids) > 1:
+        for _ in range(transfers_count):
+            from_id, to_id = rng.sample(account_ids, 2)
+            amount = round(rng.lognormvariate(0, 0.8) * 5000, 2)
+            balance_deltas[from_id] -= amount
+            balance_deltas[to_id] += amount
+            transfers.append((from_id, to_id, amount, "Перевод", random_timestamp()))
+        cursor.executemany(
+            "INSERT INTO transfers (from_account_id, to_account_id, amount, description, transfer_date) VALUES (?, ?, ?, ?, ?)",
+            transfers
+        )
+
+    for account_id, delta in balance_deltas.items():
+        cursor.execute("UPDATE accounts SET balance = balance + ? WHERE id = ?", (delta, account_id))
+
+    # Часть регулярных платежей приходится на сегодняшний день, чтобы их обработка что-то делала.
+    # Планировщик выбирает платежи по next_due, поэтому дата считается тем же правилом, что в add_recurring_payment
+    for i in range(recurring):
+        payment_day = today.day if i % 2 == 0 else rng.randint(1, 28)
+        category = rng.choices(expense_names, expense_weights)[0]
+        next_due = tracker._first_due(tracker.recurrence_rule("monthly", payment_day, None), today=today)
+        cursor.execute(
+            """INSERT INTO recurring_payments (account_id, amount, description, category, payment_day, rule, next_due)
+            VALUES (?, ?, ?, ?, ?, 'monthly', ?)""",
+            (rng.choice(account_ids), round(rng.lognormvariate(0, 0.5) * 700, 2), f"Подписка {i + 1}", category,
+             payment_day, next_due.strftime("%Y-%m-%d"))
+        )
+
+    for i in range(planned):
+        planned_date = today + datetime.timedelta(days=rng.randint(1, 365))
+        category = rng.choices(expense_names, expense_weights)[0]
+        cursor.execute(
+            "INSERT INTO planned_payments (account_id, amount, description, category, planned_date) VALUES (?, ?, ?, ?, ?)",
+            (rng.choice(account_ids), round(rng.lognormvariate(0, 0.8) * 3000, 2), f"Платёж {i + 1}", category,
+             planned_date.strftime("%Y-%m-%d"))
+        )
+
+    tracker.conn.commit()
+    cursor.execute("ANALYZE")
+    return transactions_count, len(transfers)
+
+
+def time_call(func, repeat, setup=None):
+    """Выполняет func repeat раз и возвращает статистику времени в миллисекундах"""
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "repeat": repeat,
+        "min_ms": round(timings[0], 4),
+        "median_ms": round(statistics.median(timings), 4),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+        "max_ms": round(timings[-1], 4),
+    }
+
+
+def run_benchmarks(tracker, repeat, today=None):
+    today = today or datetime.date.today()
+    month_start = today.replace(day=1).strftime("%Y-%m-%d")
+    today_str = today.strftime("%Y-%m-%d")
+    year_start = today.replace(month=1, day=1).strftime("%Y-%m-%d")
+    account_ids = [a[0] for a in tracker.get_accounts()]
+    first, second = account_ids[0], account_ids[-1]
+
+    # Обработка сдвигает next_due на следующий месяц - перед каждым замером возвращаем исходное расписание
+    tracker.cursor.execute("SELECT next_due, id FROM recurring_payments")
+    schedule = tracker.cursor.fetchall()
+
+    def reset_recurring():
+        tracker.cursor.executemany(
+            "UPDATE recurring_payments SET last_processed = NULL, next_due = ? WHERE id = ?", schedule
+        )
+        tracker.conn.commit()
+
+    cases = {
+        "add_expense": (lambda: tracker.add_expense(first, 100, "Кофе", "Кафе и рестораны"), None),
+        "transfer_money": (lambda: tracker.transfer_money(first, second, 10, "Перевод"), None),
+        "get_transactions_latest_50": (lambda: tracker.get_transactions(limit=50), None),
+        "get_transactions_account_month": (
+            lambda: tracker.get_transactions(first, month_start, today_str), None
+        ),
+        "get_category_summary_month": (
+            lambda: tracker.get_category_summary(month_start, today_str, "expense"), None
+        ),
+        "get_category_summary_year": (lambda: tracker.get_category_summary(year_start, today_str), None),
+        "get_monthly_summary": (lambda: tracker.get_monthly_summary(today.year), None),
+        "get_day_comparison": (tracker.get_day_comparison, None),
+        "get_week_comparison": (tracker.get_week_comparison, None),
+        "get_month_comparison": (tracker.get_month_comparison, None),
+        "process_recurring_payments": (lambda: tracker.process_recurring_payments(today), reset_recurring),
+    }
+
+    results = {}
+    for name, (func, setup) in cases.items():
+        results[name] = time_call(func, repeat, setup)
+
+    # Дашборд: полная выгрузка и повторная после одной новой операции (пересчитывается один месяц)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dashboard_path = os.path.join(tmp_dir, "dashboard.html")
+        results["export_dashboard_full"] = time_call(lambda: tracker.export_dashboard(dashboard_path, full=True), repeat)
+        results["export_dashboard_incremental"] = time_call(
+            lambda: tracker.export_dashboard(dashboard_path),
+            repeat,
+            lambda: tracker.add_expense(first, 100, "Кофе", "Кафе и рестораны"),
+        )
+    return results
+
+
+# Цель по времени от запуска консоли до первого меню
+STARTUP_TARGET_MS = 50
+
+# Дочерний процесс: импорт main, создание интерфейса и главное меню до первого input()
+STARTUP_SCRIPT = """
+import builtins, json, os, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+class FirstPrompt(Exception):
+    pass
+
+def first_prompt(prompt=""):
+    raise FirstPrompt
+
+report = sys.stderr
+sys.stdout = open(os.devnull, "w")
+builtins.input = first_prompt
+ui = main.ConsoleUI()
+try:
+    ui.main_menu()
+except FirstPrompt:
+    pass
+finished = time.perf_counter()
+report.write(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_menu_ms": (finished - started) * 1000,
+    "connected": ui.tracker.is_connected(),
+}))
+"""
+
+
+def measure_startup(repeat):
+    """
+    Замеряет старт консоли в отдельных процессах с кэшем байткода во временном каталоге,
+    как при обычном повторном запуске. Интерпретатор без main.py замеряется для сравнения.
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=cache_dir)
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        
+        def run(code):
+            started = time.perf_counter()
+            result = subprocess.run([sys.executable, "-c", code], cwd=script_dir, env=env,
+                                    capture_output=True, text=True, check=True)
+            return (time.perf_counter() - started) * 1000, result.stderr
+        
+        run(STARTUP_SCRIPT)  # Прогрев: компиляция и запись байткода
+        
+        bare, process, imports, first_menu = [], [], [], []
+        connected = False
+        for _ in range(repeat):
+            bare.append(run("pass")[0])
+            wall_ms, output = run(STARTUP_SCRIPT)
+            measured = json.loads(output)
+            process.append(wall_ms)
+            imports.append(measured["import_ms"])
+            first_menu.append(measured["first_menu_ms"])
+            connected = connected or measured["connected"]
+    
+    median_first_menu = statistics.median(first_menu)
+    return {
+        "repeat": repeat,
+        "interpreter_ms": round(statistics.median(bare), 3),
+        "process_ms": round(statistics.median(process), 3),
+        "import_ms": round(statistics.median(imports), 3),
+        "first_menu_ms": round(median_first_menu, 3),
+        "db_opened_before_menu": connected,
+        "target_ms": STARTUP_TARGET_MS,
+        "within_target": median_first_menu < STARTUP_TARGET_MS,
+    }
+
+
+# Части различных описаний для бенчмарка подсказок: магазин и адрес, перевод человеку, заказ
+STREETS = ["Ленина", "Мира", "Гагарина", "Пушкина", "Садовая", "Лесная", "Школьная", "Советская",
+           "Набережная", "Заречная", "Молодёжная", "Центральная", "Полевая", "Новая", "Кирова", "Победы"]
+SURNAMES = ["Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов",
+            "Михайлов", "Новиков", "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов"]
+SHOPS = ["Ozon", "Wildberries", "Яндекс Маркет", "Lamoda", "AliExpress", "Самокат", "Купер"]
+
+
+def typeahead_descriptions(count, seed):
+    """count различных описаний вроде «Пятёрочка Ленина 12», «Перевод Иванов А.» или «Заказ 48213 Ozon»"""
+    rng = random.Random(seed)
+    merchants = [name for names in EXPENSE_DESCRIPTIONS.values() for name in names]
+    descriptions = set()
+    while len(descriptions) < count:
+        kind = rng.random()
+        if kind < 0.5:
+            descriptions.add(f"{rng.choice(merchants)} {rng.choice(STREETS)} {rng.randint(1, 200)}")
+        elif kind < 0.8:
+            descriptions.add(f"Перевод {rng.choice(SURNAMES)} {chr(rng.randint(ord('А'), ord('Я')))}.")
+        else:
+            descriptions.add(f"Заказ {rng.randint(10000, 99999)} {rng.choice(SHOPS)}")
+    return sorted(descriptions)
+
+
+def measure_typeahead(count, repeat, seed):
+    """Построение индекса подсказок на count различных описаниях и время ответа на типичные запросы"""
+    rng = random.Random(seed)
+    descriptions = typeahead_descriptions(count, seed)
+    rows = [(description, None, rng.randint(1, 30), f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}")
+            for description in descriptions]
+    
+    index = TypeaheadIndex()
+    started = time.perf_counter()
+    index.load("description", rows, create=True)
+    build_seconds = time.perf_counter() - started
+    
+    added = iter(range(repeat * 2))
+    queries = {
+        "empty": "",
+        "short_prefix": "п",
+        "prefix": "пятёр",
+        "two_words": "перев смир",
+        "full": descriptions[len(descriptions) // 2],
+        "middle_of_word": "крёсток",
+        "typo": "перекресток ленена",
+    }
+    results = {"descriptions": count, "build_seconds": round(build_seconds, 3)}
+    for name, query in queries.items():
+        index.search("description", query)  # Первый запрос достраивает готовый список префикса
+        results[f"search_{name}"] = time_call(lambda: index.search("description", query), repeat)
+    results["record_new"] = time_call(
+        lambda: index.record("description", f"Новое описание {next(added)}", 1, "2025-01-01", create=True), repeat
+    )
+    return results
+
+
+def db_size(tracker):
+    """Размер базы в байтах, в том числе для базы в памяти"""
+    page_count = tracker.cursor.execute("PRAGMA page_count").fetchone()[0]
+    page_size = tracker.cursor.execute("PRAGMA page_size").fetchone()[0]
+    return page_count * page_size
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк FinanceTracker на синтетических данных")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000],
+                        help="размеры журнала (операции + переводы), например 10000 1000000 10000000")
+    parser.add_argument("--accounts", type=int, default=3, help="количество счетов")
+    parser.add_argument("--years", type=int, default=3, help="глубина истории в годах")
+    parser.add_argument("--seed", type=int, default=42, help="seed генератора")
+    parser.add_argument("--repeat", type=int, default=20, help="повторов каждого замера")
+    parser.add_argument("--descriptions", type=int, default=100000,
+                        help="различных описаний в бенчмарке подсказок при вводе")
+    parser.add_argument("--memory", action="store_true", help="база в памяти (:memory:) вместо временного файла")
+    parser.add_argument("--output", help="файл для JSON с результатами (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "date": datetime.date.today().isoformat(),
+        "params": {"accounts": args.accounts, "years": args.years, "seed": args.seed, "repeat": args.repeat,
+                   "memory": args.memory},
+        "startup": measure_startup(args.repeat),
+        "typeahead": measure_typeahead(args.descriptions, args.repeat, args.seed),
+        "runs": [],
+    }
+
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tracker = FinanceTracker(":memory:" if args.memory else os.path.join(tmp_dir, "bench.db"))
+            started = time.perf_counter()
+            transactions, transfers = generate_ledger(tracker, rows, args.accounts, args.years, args.seed)
+            generate_seconds = time.perf_counter() - started
+
+            report["runs"].append({
+                "rows": rows,
+                "transactions": transactions,
+                "transfers": transfers,
+                "generate_seconds": round(generate_seconds, 3),
+                "db_size_bytes": db_size(tracker),
+                "results": run_benchmarks(tracker, args.repeat),
+            })
+            tracker.close()
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
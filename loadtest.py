@@ -0,0 +1,163 @@
+"""
+Нагрузочный тест HTTP/JSON API трекера.
+
+Клиенты в отдельных потоках держат keep-alive соединения и смешивают опросы отчётов
+(с If-None-Match, как это делает дашборд), чтение операций и добавление расходов.
+Без --url поднимает сервер на временной базе с синтетическим журналом из benchmark.py.
+
+Пример:
+    python loadtest.py --rows 100000 --clients 16 --duration 20 --output load.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from benchmark import generate_ledger, git_commit
+from main import ApiServer, FinanceTracker
+
+
+# Запросы на чтение: (название, путь); опросы отчётов повторяются и должны получать 304
+READ_REQUESTS = [
+    ("accounts", "/api/accounts"),
+    ("balance", "/api/balance"),
+    ("transactions", "/api/transactions?limit=50"),
+    ("report_monthly", "/api/reports/monthly"),
+    ("report_categories", "/api/reports/categories?type=expense"),
+    ("report_month_comparison", "/api/reports/comparison/month"),
+]
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def client(base_url, account_ids, stop_at, write_ratio, seed, results, lock):
+    """Один клиент: шлёт запросы до stop_at и добавляет свои замеры в results"""
+    rng = random.Random(seed)
+    url = urllib.parse.urlsplit(base_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+    etags = {}
+    samples = {}
+
+    while time.perf_counter() < stop_at:
+        headers = {}
+        if rng.random() < write_ratio:
+            name, method, path = "add_expense", "POST", "/api/transactions"
+            body = json.dumps({"type": "expense", "account_id": rng.choice(account_ids),
+                               "amount": round(rng.uniform(50, 500), 2), "description": "Нагрузочный тест"})
+            headers["Content-Type"] = "application/json"
+        else:
+            name, path = rng.choice(READ_REQUESTS)
+            method, body = "GET", None
+            if path in etags:
+                headers["If-None-Match"] = etags[path]
+
+        started = time.perf_counter()
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if method == "GET" and response.getheader("ETag"):
+            etags[path] = response.getheader("ETag")
+        samples.setdefault(name, []).append((elapsed_ms, response.status))
+
+    connection.close()
+    with lock:
+        for name, values in samples.items():
+            results.setdefault(name, []).extend(values)
+
+
+def run_load(base_url, account_ids, clients, duration, write_ratio, seed):
+    results = {}
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=client, args=(base_url, account_ids, stop_at, write_ratio, seed + i, results, lock))
+        for i in range(clients)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total = sum(len(values) for values in results.values())
+    report = {
+        "requests": total,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(total / elapsed, 1),
+        "endpoints": {},
+    }
+    for name, values in sorted(results.items()):
+        latencies = sorted(latency for latency, _ in values)
+        statuses = {}
+        for _, status in values:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        report["endpoints"][name] = {
+            "count": len(values),
+            "median_ms": round(statistics.median(latencies), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "statuses": statuses,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест HTTP/JSON API трекера")
+    parser.add_argument("--url", help="адрес запущенного сервера, например http://127.0.0.1:8765")
+    parser.add_argument("--rows", type=int, default=10000, help="размер синтетического журнала (без --url)")
+    parser.add_argument("--readers", type=int, default=4, help="потоков чтения сервера (без --url)")
+    parser.add_argument("--clients", type=int, default=8, help="одновременных клиентов")
+    parser.add_argument("--duration", type=float, default=10, help="длительность в секундах")
+    parser.add_argument("--write-ratio", type=float, default=0.05, help="доля запросов на запись")
+    parser.add_argument("--seed", type=int, default=42, help="seed генератора")
+    parser.add_argument("--output", help="файл для JSON с результатами (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "params": {"clients": args.clients, "duration": args.duration, "write_ratio": args.write_ratio},
+    }
+
+    if args.url:
+        with http.client.HTTPConnection(urllib.parse.urlsplit(args.url).netloc, timeout=30) as connection:
+            connection.request("GET", "/api/accounts")
+            account_ids = [account["id"] for account in json.loads(connection.getresponse().read())]
+        report["results"] = run_load(args.url, account_ids, args.clients, args.duration, args.write_ratio, args.seed)
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "load.db")
+            tracker = FinanceTracker(db_path)
+            generate_ledger(tracker, args.rows, seed=args.seed)
+            account_ids = [account[0] for account in tracker.get_accounts()]
+            tracker.close()
+
+            server = ApiServer(db_path, port=0, readers=args.readers)
+            host, port = server.start()
+            try:
+                report["params"].update({"rows": args.rows, "readers": args.readers})
+                report["results"] = run_load(f"http://{host}:{port}", account_ids, args.clients, args.duration,
+                                             args.write_ratio, args.seed)
+            finally:
+                server.stop()
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,165 +1,3481 @@
 import os
 import sqlite3
+import hashlib
 import datetime
 from datetime import date
-import calendar
-import locale
+import re
+import sys
+import time
+import weakref
+import contextlib
+import functools
+import json
 
-try:
-    locale.setlocale(locale.LC_TIME, 'ru_RU.UTF-8')
-except:
-    try:
-        locale.setlocale(locale.LC_TIME, 'Russian_Russia.1251')
-    except:
-        pass  # Если не удалось установить русскую локаль, оставляем по умолчанию
+# Редко нужные модули (locale, calendar, csv, logging, http.server) импортируются при первом
+# использовании: так консоль открывает первое меню без лишних затрат на старте
+
+# Названия месяцев в русской локали; локаль настраивается при первом обращении
+_month_names = None
+
+
+def month_names():
+    """Список названий месяцев с индексами 1..12, как calendar.month_name"""
+    global _month_names
+    if _month_names is None:
+        import calendar
+        import locale
+        for locale_name in ('ru_RU.UTF-8', 'Russian_Russia.1251'):
+            try:
+                locale.setlocale(locale.LC_TIME, locale_name)
+                break
+            except locale.Error:
+                pass  # Если не удалось установить русскую локаль, оставляем по умолчанию
+        _month_names = list(calendar.month_name)
+    return _month_names
+
+
+def format_month(day):
+    """Месяц и год для заголовков отчётов, например: Октябрь 2024"""
+    return f"{month_names()[day.month]} {day.year}"
+
+
+def format_date(day):
+    """Дата из базы (ГГГГ-ММ-ДД...) в виде ДД.ММ.ГГГГ"""
+    return f"{day[8:10]}.{day[5:7]}.{day[:4]}"
+
+
+# Текстовые графики для консоли и командной строки: получают готовые суммы и возвращают строки
+BAR_EIGHTHS = "▏▎▍▌▋▊▉"
+SPARK_LEVELS = "▁▂▃▄▅▆▇█"
+HEATMAP_LEVELS = "·░▒▓█"
+WEEKDAY_NAMES = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+
+def bar(value, max_value, width=30):
+    """Горизонтальная полоса длиной value / max_value от width символов, с точностью до 1/8 символа"""
+    if max_value <= 0 or value <= 0:
+        return ""
+    eighths = max(1, round(value / max_value * width * 8))
+    return "█" * (eighths // 8) + (BAR_EIGHTHS[eighths % 8 - 1] if eighths % 8 else "")
+
+
+def bar_chart(items, width=30, label_width=14):
+    """Столбчатая диаграмма: по строке на пару (подпись, значение)"""
+    max_value = max((value for _, value in items), default=0)
+    return [f"{label[:label_width]:<{label_width}} {bar(value, max_value, width):<{width}} {value:.2f}"
+            for label, value in items]
+
+
+def sparkline(values):
+    """Строка-спарклайн: высота символа пропорциональна значению, нулевые значения - пробелы"""
+    top = max(values, default=0)
+    if top <= 0:
+        return " " * len(values)
+    return "".join(SPARK_LEVELS[min(7, int(value / top * 8))] if value > 0 else " " for value in values)
+
+
+def calendar_heatmap(days, start, end):
+    """
+    Календарь расходов: по блоку на год, строки - дни недели, столбцы - недели. Яркость дня -
+    квартиль его суммы среди ненулевых дней, поэтому один крупный платёж не гасит остальные.
+    days - словарь {date: сумма}.
+    """
+    values = sorted(value for value in days.values() if value > 0)
+    thresholds = [values[len(values) * i // 4] for i in (1, 2, 3)] if values else []
+    
+    def level(value):
+        if value <= 0:
+            return HEATMAP_LEVELS[0]
+        return HEATMAP_LEVELS[1 + sum(value > threshold for threshold in thresholds)]
+    
+    lines = []
+    for year in range(start.year, end.year + 1):
+        first = max(start, date(year, 1, 1))
+        last = min(end, date(year, 12, 31))
+        week_start = first - datetime.timedelta(days=first.weekday())
+        weeks = (last - week_start).days // 7 + 1
+        
+        # Подписи месяцев над неделей, в которой месяц начинается
+        header = [" "] * weeks
+        for month in range(first.month, last.month + 1):
+            column = (max(first, date(year, month, 1)) - week_start).days // 7
+            label = month_names()[month][:3]
+            if all(cell == " " for cell in header[max(0, column - 1):column + len(label)]):
+                header[column:column + len(label)] = label
+        lines.append(f"{year} {''.join(header)[:weeks]}")
+        
+        for weekday in range(7):
+            row = []
+            for week in range(weeks):
+                day = week_start + datetime.timedelta(days=week * 7 + weekday)
+                row.append(level(days.get(day, 0)) if first <= day <= last else " ")
+            lines.append(f"  {WEEKDAY_NAMES[weekday]} {''.join(row)}")
+        lines.append("")
+    
+    lines.append("Меньше " + " ".join(HEATMAP_LEVELS) + " Больше")
+    return lines
+
+
+# Выписки в PDF без сторонних библиотек. Шрифт с кириллицей ищется в системе
+# (или задаётся переменной окружения), без него текст пишется Helvetica транслитом
+PDF_FONT_ENV = "FINANCE_TRACKER_PDF_FONT"
+PDF_FONT_PATHS = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+    "/System/Library/Fonts/Supplemental/Arial.ttf",
+    "/Library/Fonts/Arial.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+]
+TRANSLIT = dict(zip(
+    "абвгдеёжзийклмнопрстуфхцчшщъыьэюя",
+    ["a", "b", "v", "g", "d", "e", "e", "zh", "z", "i", "y", "k", "l", "m", "n", "o", "p", "r", "s", "t",
+     "u", "f", "kh", "ts", "ch", "sh", "shch", "", "y", "", "e", "yu", "ya"]
+))
+TRANSLIT.update({"₽": "RUB", "№": "No"})
+
+
+def transliterate(text):
+    """Кириллица латиницей - для стандартных шрифтов PDF, в которых её нет"""
+    return "".join(
+        TRANSLIT[char.lower()].capitalize() if char.isupper() and char.lower() in TRANSLIT else TRANSLIT.get(char, char)
+        for char in text
+    )
+
+
+class GlyphTable(dict):
+    """Словарь, который вычисляет отсутствующее значение один раз: годится для str.translate и map"""
+    def __init__(self, compute):
+        super().__init__()
+        self.compute = compute
+    
+    def __missing__(self, key):
+        value = self[key] = self.compute(key)
+        return value
+
+
+class TrueTypeFont:
+    """
+    Шрифт TrueType для PDF. Таблицы cmap и hmtx дают номера глифов и ширины символов,
+    а в файл встраивается подмножество шрифта - только глифы, которые встретились в тексте.
+    """
+    # Таблицы, которые нужны просмотрщику для шрифта CIDFontType2 с кодировкой Identity-H
+    SUBSET_TABLES = ("cvt ", "fpgm", "glyf", "head", "hhea", "hmtx", "loca", "maxp", "prep")
+    
+    def __init__(self, path):
+        import struct
+        with open(path, "rb") as f:
+            self.data = f.read()
+        self.name = re.sub(r"[^A-Za-z0-9-]", "", os.path.splitext(os.path.basename(path))[0]) or "Font"
+        if self.data[:4] not in (b"\x00\x01\x00\x00", b"true"):
+            raise ValueError(f"{path}: не шрифт TrueType")
+        
+        count = struct.unpack(">H", self.data[4:6])[0]
+        self.tables = {}
+        for i in range(count):
+            tag, _, offset, length = struct.unpack(">4sIII", self.data[12 + 16 * i:28 + 16 * i])
+            self.tables[tag.decode("latin-1")] = (offset, length)
+        missing = {"cmap", "glyf", "head", "hhea", "hmtx", "loca", "maxp"} - set(self.tables)
+        if missing:
+            raise ValueError(f"{path}: не шрифт TrueType (нет таблиц {', '.join(sorted(missing))})")
+        
+        head = self.table("head")
+        self.units_per_em = struct.unpack(">H", head[18:20])[0]
+        self.bbox = struct.unpack(">4h", head[36:44])
+        self.long_loca = struct.unpack(">h", head[50:52])[0] == 1
+        hhea = self.table("hhea")
+        self.ascent, self.descent = struct.unpack(">2h", hhea[4:8])
+        metrics_count = struct.unpack(">H", hhea[34:36])[0]
+        self.glyph_count = struct.unpack(">H", self.table("maxp")[4:6])[0]
+        advances = list(struct.unpack(f">{metrics_count * 2}H", self.table("hmtx")[:metrics_count * 4])[::2])
+        self.advances = advances + advances[-1:] * (self.glyph_count - metrics_count)
+        
+        self.cmap = self.parse_cmap()
+        self.used = {0: ""}  # Использованные глифы и их символы - для подмножества и ToUnicode
+        # Код символа -> номер глифа в hex и символ -> ширина: каждый символ разбирается один раз
+        self.codes = GlyphTable(self.glyph_code)
+        self.char_widths = GlyphTable(lambda char: self.advances[self.cmap.get(ord(char), 0)])
+    
+    def table(self, tag):
+        offset, length = self.tables[tag]
+        return self.data[offset:offset + length]
+    
+    def parse_cmap(self):
+        """Соответствие кодов Unicode номерам глифов из подтаблицы формата 12 или 4"""
+        import struct
+        cmap = self.table("cmap")
+        subtables = {}
+        for i in range(struct.unpack(">H", cmap[2:4])[0]):
+            platform, encoding, offset = struct.unpack(">HHI", cmap[4 + 8 * i:12 + 8 * i])
+            subtables[(platform, encoding)] = offset
+        
+        for key in ((3, 10), (0, 4), (3, 1), (0, 3)):
+            if key not in subtables:
+                continue
+            offset = subtables[key]
+            table_format = struct.unpack(">H", cmap[offset:offset + 2])[0]
+            mapping = {}
+            if table_format == 12:
+                groups = struct.unpack(">I", cmap[offset + 12:offset + 16])[0]
+                for start, end, glyph in struct.iter_unpack(">III", cmap[offset + 16:offset + 16 + 12 * groups]):
+                    for code in range(start, end + 1):
+                        mapping[code] = glyph + code - start
+                return mapping
+            if table_format == 4:
+                segments = struct.unpack(">H", cmap[offset + 6:offset + 8])[0] // 2
+                # endCode, startCode, idDelta, idRangeOffset; после endCode - 2 байта заполнителя
+                arrays = [struct.unpack(f">{segments}H", cmap[start:start + segments * 2])
+                          for start in (offset + 14 + i * segments * 2 + (2 if i else 0) for i in range(4))]
+                for i, (end, start, delta, range_offset) in enumerate(zip(*arrays)):
+                    for code in range(start, min(end, 0xFFFE) + 1):
+                        if range_offset == 0:
+                            glyph = (code + delta) & 0xFFFF
+                        else:
+                            position = offset + 16 + segments * 6 + i * 2 + range_offset + 2 * (code - start)
+                            glyph = struct.unpack(">H", cmap[position:position + 2])[0]
+                            glyph = (glyph + delta) & 0xFFFF if glyph else 0
+                        if glyph:
+                            mapping[code] = glyph
+                return mapping
+        raise ValueError("В шрифте нет таблицы символов Unicode")
+    
+    def glyph_code(self, code):
+        glyph = self.cmap.get(code, 0)
+        if glyph not in self.used:
+            self.used[glyph] = chr(code)
+        return f"{glyph:04X}"
+    
+    def encode(self, text):
+        """Текст шестнадцатеричной строкой PDF из номеров глифов (кодировка Identity-H)"""
+        return "<" + text.translate(self.codes) + ">"
+    
+    def width(self, text, size):
+        return sum(map(self.char_widths.__getitem__, text)) * size / self.units_per_em
+    
+    @staticmethod
+    def checksum(data):
+        import struct
+        data += b"\0" * (-len(data) % 4)
+        return sum(struct.unpack(f">{len(data) // 4}I", data)) & 0xFFFFFFFF
+    
+    def subset(self):
+        """Файл шрифта только с использованными глифами (и частями составных); номера глифов прежние"""
+        import struct
+        loca, glyf = self.table("loca"), self.table("glyf")
+        if self.long_loca:
+            offsets = struct.unpack(f">{self.glyph_count + 1}I", loca[:4 * (self.glyph_count + 1)])
+        else:
+            offsets = [offset * 2 for offset in struct.unpack(f">{self.glyph_count + 1}H", loca[:2 * (self.glyph_count + 1)])]
+        
+        keep = set(self.used)
+        pending = list(keep)
+        while pending:
+            glyph = pending.pop()
+            data = glyf[offsets[glyph]:offsets[glyph + 1]]
+            if len(data) < 10 or struct.unpack(">h", data[:2])[0] >= 0:
+                continue
+            # Составной глиф: ссылки на компоненты идут после заголовка из 10 байт
+            position = 10
+            while True:
+                flags, component = struct.unpack(">HH", data[position:position + 4])
+                if component not in keep:
+                    keep.add(component)
+                    pending.append(component)
+                position += 8 if flags & 0x0001 else 6
+                position += 2 if flags & 0x0008 else 4 if flags & 0x0040 else 8 if flags & 0x0080 else 0
+                if not flags & 0x0020:
+                    break
+        
+        new_glyf = bytearray()
+        new_offsets = []
+        for glyph in range(self.glyph_count):
+            new_offsets.append(len(new_glyf))
+            if glyph in keep:
+                new_glyf += glyf[offsets[glyph]:offsets[glyph + 1]]
+                new_glyf += b"\0" * (-len(new_glyf) % 4)
+        new_offsets.append(len(new_glyf))
+        
+        tables = {tag: self.table(tag) for tag in self.SUBSET_TABLES if tag in self.tables}
+        tables["glyf"] = bytes(new_glyf)
+        tables["loca"] = struct.pack(f">{len(new_offsets)}I", *new_offsets)
+        head = bytearray(tables["head"])
+        head[8:12] = b"\0\0\0\0"  # checkSumAdjustment считается по готовому файлу
+        head[50:52] = struct.pack(">h", 1)  # длинный формат loca
+        tables["head"] = bytes(head)
+        
+        entry_selector = len(tables).bit_length() - 1
+        search_range = 16 << entry_selector
+        font = bytearray(struct.pack(">IHHHH", 0x00010000, len(tables), search_range, entry_selector,
+                                     16 * len(tables) - search_range))
+        body = bytearray()
+        body_offset = 12 + 16 * len(tables)
+        for tag in sorted(tables):
+            data = tables[tag]
+            if tag == "head":
+                head_offset = body_offset + len(body)
+            font += struct.pack(">4sIII", tag.encode("latin-1"), self.checksum(data), body_offset + len(body), len(data))
+            body += data + b"\0" * (-len(data) % 4)
+        font += body
+        font[head_offset + 8:head_offset + 12] = struct.pack(">I", (0xB1B0AFBA - self.checksum(bytes(font))) & 0xFFFFFFFF)
+        return bytes(font)
+
+
+class PdfWriter:
+    """
+    Потоковая запись PDF: страница уходит в файл, как только заполнена, а в памяти остаются
+    только смещения объектов для таблицы xref и набор использованных глифов. Поэтому память
+    не зависит от числа страниц, а время растёт линейно с ним.
+    """
+    PAGE_WIDTH = 595  # A4 в пунктах
+    PAGE_HEIGHT = 842
+    
+    def __init__(self, output, font_path=None):
+        """output - файл, открытый на запись в двоичном режиме; font_path - шрифт TrueType с кириллицей"""
+        self.output = output
+        self.position = 0
+        self.offsets = {}
+        self.next_id = 1
+        self.catalog_id, self.pages_id, self.font_id = self.new_id(), self.new_id(), self.new_id()
+        self.page_ids = []
+        self.operations = []
+        
+        font_path = font_path or os.environ.get(PDF_FONT_ENV)
+        if not font_path:
+            font_path = next((path for path in PDF_FONT_PATHS if os.path.exists(path)), None)
+        self.font = TrueTypeFont(font_path) if font_path else None
+        
+        self.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    
+    def new_id(self):
+        self.next_id += 1
+        return self.next_id - 1
+    
+    def write(self, data):
+        self.output.write(data)
+        self.position += len(data)
+    
+    def write_object(self, object_id, body, stream=None):
+        self.offsets[object_id] = self.position
+        if stream is None:
+            self.write(f"{object_id} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+        else:
+            self.write(f"{object_id} 0 obj\n<< {body} /Length {len(stream)} >>\nstream\n".encode("latin-1"))
+            self.write(stream)
+            self.write(b"\nendstream\nendobj\n")
+    
+    def encode(self, text):
+        if self.font:
+            return self.font.encode(text)
+        text = transliterate(text).encode("cp1252", "replace").decode("latin-1")
+        return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+    
+    def text_width(self, text, size):
+        if self.font:
+            return self.font.width(text, size)
+        return len(transliterate(text)) * size * 0.52  # Средняя ширина символа Helvetica
+    
+    def fit(self, text, width, size):
+        """Обрезает текст с многоточием, чтобы он поместился в колонку шириной width"""
+        if self.text_width(text, size) <= width:
+            return text
+        text = text[:int(width * 4 / size)]
+        while text and self.text_width(text + "…", size) > width:
+            text = text[:-1]
+        return text + "…"
+    
+    def text(self, x, y, text, size=9, align="left"):
+        if align == "right":
+            x -= self.text_width(text, size)
+        self.operations.append(f"BT /F1 {size} Tf {x:.2f} {y:.2f} Td {self.encode(text)} Tj ET")
+    
+    def line(self, x1, y1, x2, y2, width=0.5, gray=0.6):
+        self.operations.append(f"{gray} G {width} w {x1:.2f} {y1:.2f} m {x2:.2f} {y2:.2f} l S")
+    
+    def rect(self, x, y, width, height, gray=0.9):
+        self.operations.append(f"{gray} g {x:.2f} {y:.2f} {width:.2f} {height:.2f} re f 0 g")
+    
+    def end_page(self):
+        """Сжимает содержимое страницы и сразу пишет его в файл"""
+        import zlib
+        content_id, page_id = self.new_id(), self.new_id()
+        self.write_object(content_id, "/Filter /FlateDecode", zlib.compress("\n".join(self.operations).encode("latin-1")))
+        self.write_object(
+            page_id,
+            f"<< /Type /Page /Parent {self.pages_id} 0 R /MediaBox [0 0 {self.PAGE_WIDTH} {self.PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 {self.font_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        self.page_ids.append(page_id)
+        self.operations = []
+    
+    def write_font(self):
+        import zlib
+        if not self.font:
+            self.write_object(self.font_id, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+            return
+        
+        font = self.font
+        scale = 1000 / font.units_per_em
+        name = f"FTRKAA+{font.name}"  # Префикс из шести букв - признак подмножества шрифта
+        file_id, descriptor_id, cid_font_id, unicode_id = self.new_id(), self.new_id(), self.new_id(), self.new_id()
+        
+        data = font.subset()
+        self.write_object(file_id, f"/Filter /FlateDecode /Length1 {len(data)}", zlib.compress(data))
+        bbox = " ".join(str(round(value * scale)) for value in font.bbox)
+        self.write_object(
+            descriptor_id,
+            f"<< /Type /FontDescriptor /FontName /{name} /Flags 32 /FontBBox [{bbox}] /ItalicAngle 0 "
+            f"/Ascent {round(font.ascent * scale)} /Descent {round(font.descent * scale)} "
+            f"/CapHeight {round(font.ascent * scale)} /StemV 80 /FontFile2 {file_id} 0 R >>"
+        )
+        widths = " ".join(f"{glyph} [{round(font.advances[glyph] * scale)}]" for glyph in sorted(font.used))
+        self.write_object(
+            cid_font_id,
+            f"<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{name} "
+            f"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+            f"/FontDescriptor {descriptor_id} 0 R /W [{widths}] /CIDToGIDMap /Identity >>"
+        )
+        
+        # Соответствие глифов символам: по нему просмотрщик копирует и ищет текст
+        pairs = [f"<{glyph:04X}> <{char.encode('utf-16-be').hex().upper()}>"
+                 for glyph, char in sorted(font.used.items()) if char]
+        blocks = "".join(f"{len(pairs[i:i + 100])} beginbfchar\n" + "\n".join(pairs[i:i + 100]) + "\nendbfchar\n"
+                         for i in range(0, len(pairs), 100))
+        cmap = ("/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+                "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n"
+                "/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n"
+                "1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n"
+                f"{blocks}endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend\n")
+        self.write_object(unicode_id, "/Filter /FlateDecode", zlib.compress(cmap.encode("latin-1")))
+        
+        self.write_object(
+            self.font_id,
+            f"<< /Type /Font /Subtype /Type0 /BaseFont /{name} /Encoding /Identity-H "
+            f"/DescendantFonts [{cid_font_id} 0 R] /ToUnicode {unicode_id} 0 R >>"
+        )
+    
+    def close(self):
+        """Дописывает шрифт, дерево страниц и таблицу xref; возвращает число страниц"""
+        if self.operations or not self.page_ids:
+            self.end_page()
+        self.write_font()
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self.write_object(self.pages_id, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>")
+        self.write_object(self.catalog_id, f"<< /Type /Catalog /Pages {self.pages_id} 0 R >>")
+        
+        xref_position = self.position
+        entries = "".join(f"{self.offsets[object_id]:010d} 00000 n \n" for object_id in range(1, self.next_id))
+        self.write(f"xref\n0 {self.next_id}\n0000000000 65535 f \n{entries}".encode("latin-1"))
+        self.write(f"trailer\n<< /Size {self.next_id} /Root {self.catalog_id} 0 R >>\n"
+                   f"startxref\n{xref_position}\n%%EOF\n".encode("latin-1"))
+        return len(self.page_ids)
+
+
+# Страница статического дашборда: данные встраиваются JSON-блоками вместо __SUMMARY__ и __MONTHS__,
+# таблицы и графики строит небольшой скрипт без внешних библиотек и запросов к сети
+DASHBOARD_HTML = """<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Финансы</title>
+<style>
+body { margin: 0; background: #f3f4f6; color: #222; font: 15px -apple-system, "Segoe UI", Roboto, sans-serif; }
+main { max-width: 760px; margin: 0 auto; padding: 12px; }
+h1 { font-size: 20px; margin: 6px 0 2px; }
+h2 { font-size: 16px; margin: 0 0 10px; }
+section { background: #fff; border-radius: 10px; padding: 12px 14px; margin-bottom: 12px; box-shadow: 0 1px 2px rgba(0, 0, 0, .08); }
+table { width: 100%; border-collapse: collapse; }
+td { padding: 5px 0; border-bottom: 1px solid #eee; vertical-align: top; }
+td.num { text-align: right; white-space: nowrap; padding-left: 8px; }
+.muted { color: #888; font-size: 12px; }
+.total { font-size: 28px; font-weight: 600; margin-bottom: 6px; }
+.tabs { margin-bottom: 8px; }
+.tabs button { border: 1px solid #ccc; background: #fff; border-radius: 14px; padding: 4px 10px; margin: 0 4px 6px 0; font-size: 13px; }
+.tabs button.active { background: #222; border-color: #222; color: #fff; }
+.bar { height: 6px; background: #eceff3; border-radius: 3px; margin-top: 4px; }
+.bar div { height: 6px; border-radius: 3px; background: #e8590c; }
+.income { color: #2b8a3e; }
+.expense { color: #c92a2a; }
+svg { display: block; width: 100%; height: 160px; margin-top: 8px; }
+</style>
+</head>
+<body>
+<main>
+<h1>💰 Финансы</h1>
+<p class="muted" id="generated"></p>
+<section><h2>Остатки</h2><div class="total" id="total"></div><table id="accounts"></table></section>
+<section><h2>Доходы и расходы</h2><div class="tabs" id="periods"></div><div id="totals"></div>
+<svg id="trend" viewBox="0 0 600 160" preserveAspectRatio="none"></svg><div class="muted" id="trend-range"></div></section>
+<section><h2>Категории</h2><div class="tabs" id="types"></div><table id="categories"></table></section>
+<section><h2>Ближайшие платежи</h2><table id="upcoming"></table></section>
+</main>
+<script type="application/json" id="dashboard-summary">__SUMMARY__</script>
+<script type="application/json" id="dashboard-months">__MONTHS__</script>
+<script>
+var summary = JSON.parse(document.getElementById("dashboard-summary").textContent);
+var data = JSON.parse(document.getElementById("dashboard-months").textContent).months;
+var MONTHS = ["янв", "фев", "мар", "апр", "май", "июн", "июл", "авг", "сен", "окт", "ноя", "дек"];
+var state = {period: "12", type: "expense"};
+
+function money(value, symbol) {
+  return value.toLocaleString("ru-RU", {minimumFractionDigits: 2, maximumFractionDigits: 2}) + " " + (symbol || summary.symbol);
+}
+function monthLabel(month) { return MONTHS[+month.slice(5) - 1] + " " + month.slice(0, 4); }
+function nextMonth(month) {
+  var year = +month.slice(0, 4), number = +month.slice(5);
+  return number == 12 ? (year + 1) + "-01" : year + "-" + (number < 9 ? "0" : "") + (number + 1);
+}
+function cell(row, text, className) {
+  var td = row.insertCell();
+  td.textContent = text;
+  if (className) td.className = className;
+  return td;
+}
+function fill(id, rows, empty) {
+  var table = document.getElementById(id);
+  table.innerHTML = "";
+  if (!rows.length) cell(table.insertRow(), empty, "muted");
+  rows.forEach(function (build) { build(table.insertRow()); });
+}
+function tabs(id, options, key) {
+  var box = document.getElementById(id);
+  box.innerHTML = "";
+  options.forEach(function (option) {
+    var button = document.createElement("button");
+    button.textContent = option[1];
+    button.className = state[key] == option[0] ? "active" : "";
+    button.onclick = function () { state[key] = option[0]; render(); };
+    box.appendChild(button);
+  });
+}
+
+// Месяцы выбранного периода подряд, включая месяцы без операций
+function periodMonths() {
+  var known = Object.keys(data).sort();
+  if (!known.length) return [];
+  var first = known[0], last = known[known.length - 1], result = [];
+  if (state.period == "12") {
+    var year = +last.slice(0, 4), number = +last.slice(5) - 11;
+    if (number < 1) { year -= 1; number += 12; }
+    first = year + "-" + (number < 10 ? "0" : "") + number;
+  } else if (state.period != "all") {
+    first = state.period + "-01";
+    last = state.period + "-12";
+  }
+  for (var month = first; month <= last; month = nextMonth(month)) result.push(month);
+  return result;
+}
+
+function renderTrend(months) {
+  var svg = document.getElementById("trend"), width = 600 / Math.max(months.length, 1), max = 0, parts = [];
+  months.forEach(function (month) {
+    var item = data[month] || {income: 0, expense: 0};
+    max = Math.max(max, item.income, item.expense);
+  });
+  months.forEach(function (month, i) {
+    var item = data[month] || {income: 0, expense: 0};
+    [["income", "#2b8a3e", 0.1], ["expense", "#c92a2a", 0.5]].forEach(function (bar) {
+      var height = max ? item[bar[0]] / max * 150 : 0;
+      parts.push('<rect x="' + (i + bar[2]) * width + '" y="' + (160 - height) + '" width="' + width * 0.4 +
+        '" height="' + height + '" fill="' + bar[1] + '"><title>' + monthLabel(month) + ": " + money(item[bar[0]]) + "</title></rect>");
+    });
+  });
+  svg.innerHTML = parts.join("");
+  document.getElementById("trend-range").textContent = months.length ?
+    monthLabel(months[0]) + " — " + monthLabel(months[months.length - 1]) + ", зелёные - доходы, красные - расходы" : "";
+}
+
+function render() {
+  var years = {};
+  Object.keys(data).forEach(function (month) { years[month.slice(0, 4)] = true; });
+  tabs("periods", [["12", "12 месяцев"]].concat(Object.keys(years).sort().reverse().map(function (year) {
+    return [year, year];
+  }), [["all", "Всё время"]]), "period");
+  tabs("types", [["expense", "Расходы"], ["income", "Доходы"]], "type");
+
+  var months = periodMonths(), income = 0, expense = 0, categories = {};
+  months.forEach(function (month) {
+    var item = data[month];
+    if (!item) return;
+    income += item.income;
+    expense += item.expense;
+    var lines = item.categories[state.type];
+    Object.keys(lines).forEach(function (name) { categories[name] = (categories[name] || 0) + lines[name]; });
+  });
+  document.getElementById("totals").innerHTML = "";
+  [["Доходы: ", income, "income"], ["Расходы: ", expense, "expense"], ["Итог: ", income - expense, ""]].forEach(function (line) {
+    var div = document.createElement("div");
+    div.textContent = line[0] + money(line[1]);
+    div.className = line[2];
+    document.getElementById("totals").appendChild(div);
+  });
+  renderTrend(months);
+
+  var total = Object.keys(categories).reduce(function (sum, name) { return sum + categories[name]; }, 0);
+  fill("categories", Object.keys(categories).sort(function (a, b) { return categories[b] - categories[a]; }).map(function (name) {
+    return function (row) {
+      var share = total ? categories[name] / total * 100 : 0;
+      var td = cell(row, name);
+      var bar = document.createElement("div"), fillBar = document.createElement("div");
+      bar.className = "bar";
+      fillBar.style.width = share.toFixed(1) + "%";
+      bar.appendChild(fillBar);
+      td.appendChild(bar);
+      cell(row, money(categories[name]) + " · " + share.toFixed(1) + "%", "num");
+    };
+  }), "Нет операций за период");
+}
+
+document.getElementById("generated").textContent = "Обновлено " + summary.generated + ", суммы в " + summary.currency;
+document.getElementById("total").textContent = money(summary.total_balance);
+fill("accounts", summary.accounts.map(function (account) {
+  return function (row) {
+    cell(row, account.name);
+    cell(row, money(account.balance, account.symbol), "num" + (account.balance < 0 ? " expense" : ""));
+  };
+}), "Нет счетов");
+fill("upcoming", summary.upcoming.map(function (payment) {
+  return function (row) {
+    cell(row, payment.date.slice(8) + "." + payment.date.slice(5, 7));
+    cell(row, payment.description + " · " + payment.account);
+    cell(row, (payment.amount > 0 ? "+" : "") + money(payment.amount, payment.symbol), "num " + (payment.amount > 0 ? "income" : "expense"));
+  };
+}), "Нет платежей в ближайшие " + summary.upcoming_days + " дней");
+render();
+</script>
+</body>
+</html>
+"""
+
+
+# Скомпилированные правила автоматической категоризации операций
+class CategoryMatcher:
+    """
+    Правила-подстроки собираются в автомат Ахо-Корасик. Туда же попадает обязательное начало
+    регулярных выражений вида "магазин\\s*\\d+": выражение проверяется, только если автомат его нашёл.
+    Остальные выражения собираются в одно выражение-альтернативу на каждый тип операции,
+    упорядоченное по приоритету правил. Поэтому описание просматривается один раз
+    независимо от количества правил, и классификация большого импорта линейна.
+    """
+    FLAGS = re.IGNORECASE | re.DOTALL
+    MIN_LITERAL = 3  # Более короткое начало встречается слишком часто, чтобы отсеивать правила
+    
+    def __init__(self, rules):
+        # rules: (id, pattern, match_type, transaction_type, category, min_amount, max_amount, account_id, priority)
+        self.rules = {rule[0]: rule for rule in rules}
+        
+        # Автомат Ахо-Корасик: переходы, ссылки неудач и номера правил в узлах
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        
+        regex_rules = {}
+        self.compiled = {}  # id правила -> отдельно скомпилированное выражение
+        self.separate_regexes = []  # (id, выражение) правил, которые нельзя объединить с другими
+        self.invalid_rules = []  # (id, шаблон, ошибка) - такие правила не применяются
+        for rule in sorted(rules, key=self.rank, reverse=True):
+            rule_id, pattern, match_type, transaction_type = rule[0], rule[1], rule[2], rule[3]
+            if match_type != "regex":
+                if pattern:
+                    self.add_word(pattern.lower(), rule_id)
+                continue
+            try:
+                self.compiled[rule_id] = re.compile(pattern, self.FLAGS)
+            except re.error as e:
+                self.invalid_rules.append((rule_id, pattern, str(e)))
+                continue
+            literal = self.required_literal(pattern)
+            if literal:
+                self.add_word(literal, rule_id)
+            elif self.merge_error(pattern):
+                # Сохранено до проверки (например, старой версией) - проверяется по одному
+                self.separate_regexes.append((rule_id, self.compiled[rule_id]))
+            else:
+                regex_rules.setdefault(transaction_type, []).append((rule_id, pattern))
+        
+        self.build_fail_links()
+        self.regex = {}  # тип операции -> (общее выражение, id правил по убыванию приоритета, их места в нём)
+        for transaction_type, type_rules in regex_rules.items():
+            order = [rule_id for rule_id, _ in type_rules]
+            self.regex[transaction_type] = (self.merge_regex(type_rules), order, {rule_id: i for i, rule_id in enumerate(order)})
+    
+    @staticmethod
+    def rank(rule):
+        """Выигрывает больший приоритет, при равенстве - более раннее правило"""
+        return rule[8], -rule[0]
+    
+    @classmethod
+    def required_literal(cls, pattern):
+        """Текст в нижнем регистре, с которого начинается любое совпадение выражения, или None"""
+        if "|" in pattern:
+            return None  # Альтернатива может начинаться с другого текста
+        text = pattern[1:] if pattern.startswith("^") else pattern
+        literal = ""
+        for char in text:
+            if char in ".^$*+?{}[]\\|()" or len(char.lower()) != 1:
+                # Символ перед квантификатором может отсутствовать
+                if char in "*?{":
+                    literal = literal[:-1]
+                break
+            literal += char.lower()
+        return literal if len(literal) >= cls.MIN_LITERAL else None
+    
+    @classmethod
+    def merge_error(cls, pattern):
+        """Почему шаблон нельзя объединить с другими правилами, или None"""
+        # Номера групп в общем выражении сдвигаются, а имена повторялись бы между правилами
+        for escape in re.finditer(r"\\(.)", pattern, re.DOTALL):
+            if escape.group(1) in "123456789":
+                return "ссылки на группы вида \\1"
+        if re.search(r"\(\?(P?<[^=!]|\()", pattern):
+            return "именованные группы и условия"
+        try:
+            cls.merge_regex([(0, pattern)])
+        except re.error:
+            return "флаги вроде (?i)"
+        return None
+    
+    @classmethod
+    def merge_regex(cls, regex_rules):
+        """Одно выражение-альтернатива из пар (id правила, шаблон): имя совпавшей группы - номер правила"""
+        return re.compile("|".join(f"(?P<r{rule_id}>{pattern})" for rule_id, pattern in regex_rules), cls.FLAGS)
+    
+    def add_word(self, word, rule_id):
+        node = 0
+        for char in word:
+            if char not in self.goto[node]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[node][char] = len(self.goto) - 1
+            node = self.goto[node][char]
+        self.output[node].append(rule_id)
+    
+    def build_fail_links(self):
+        queue = list(self.goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+    
+    def find_words(self, text):
+        """Возвращает номера всех правил, чья подстрока или начало выражения встречается в тексте"""
+        candidates = set()
+        node = 0
+        for char in text.lower():
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            if self.output[node]:
+                candidates.update(self.output[node])
+        return candidates
+    
+    def accepts(self, rule, amount, account_id, transaction_type):
+        _, _, _, rule_type, _, min_amount, max_amount, rule_account_id, _ = rule
+        if rule_type != transaction_type:
+            return False
+        if min_amount is not None and amount < min_amount:
+            return False
+        if max_amount is not None and amount > max_amount:
+            return False
+        return rule_account_id is None or rule_account_id == account_id
+    
+    def find_regex_rules(self, text, amount, account_id, transaction_type):
+        """
+        Номера регулярных правил, подходящих к операции. Общее выражение находит каждую позицию,
+        где начинается совпадение, и лучшее по приоритету правило в ней; правила ниже него
+        в этой позиции проверяются по одному, только если оно не подошло по условиям.
+        """
+        found = set()
+        if transaction_type in self.regex:
+            regex, order, places = self.regex[transaction_type]
+            position = 0
+            while position <= len(text):
+                found_match = regex.search(text, position)
+                if not found_match:
+                    break
+                start = found_match.start()
+                rule_id = int(found_match.lastgroup[1:])
+                if self.accepts(self.rules[rule_id], amount, account_id, transaction_type):
+                    found.add(rule_id)
+                else:
+                    for other_id in order[places[rule_id] + 1:]:
+                        if (self.accepts(self.rules[other_id], amount, account_id, transaction_type)
+                                and self.compiled[other_id].match(text, start)):
+                            found.add(other_id)
+                            break
+                # Совпадения правил могут перекрываться - следующее ищется со следующего символа
+                position = start + 1
+        
+        for rule_id, regex in self.separate_regexes:
+            if self.accepts(self.rules[rule_id], amount, account_id, transaction_type) and regex.search(text):
+                found.add(rule_id)
+        return found
+    
+    def match(self, description, amount, account_id=None, transaction_type="expense"):
+        """Возвращает категорию самого приоритетного подходящего правила или None"""
+        if not self.rules:
+            return None
+        
+        description = description or ""
+        amount = abs(amount)
+        candidates = []
+        for rule_id in self.find_words(description):
+            rule = self.rules[rule_id]
+            if not self.accepts(rule, amount, account_id, transaction_type):
+                continue
+            if rule[2] == "regex" and not self.compiled[rule_id].search(description):
+                continue
+            candidates.append(rule)
+        candidates.extend(self.rules[rule_id]
+                          for rule_id in self.find_regex_rules(description, amount, account_id, transaction_type))
+        return max(candidates, key=self.rank)[4] if candidates else None
+
+
+# Подсказки при вводе названий счетов, категорий и описаний
+class TypeaheadIndex:
+    """
+    Каждое слово названия лежит в отсортированном списке, поэтому варианты по началу слов
+    находятся двоичным поиском. Середина слова и опечатки ищутся по триграммам словаря
+    (различных слов намного меньше, чем названий). Для префиксов, под которые попадают
+    сотни названий, лучшие варианты хранятся готовыми и поправляются при каждом добавлении.
+    Вес варианта - log2(1 + число использований) плюс день последнего использования / RECENCY_DAYS:
+    он не зависит от сегодняшней даты, поэтому готовые списки не устаревают.
+    """
+    RECENCY_DAYS = 90
+    TOP_SIZE = 32
+    TOP_FROM = 64  # С какого числа подходящих названий префикс получает готовый список
+    FUZZY_FROM = 4  # Более короткие слова запроса ищутся только по началу
+    
+    def __init__(self):
+        self.texts = []
+        self.values = []
+        self.kinds = []
+        self.word_lists = []
+        self.scores = []
+        self.keys = {}  # kind -> {ключ: номер варианта}
+        self.usage = {}  # kind -> {ключ: [число использований, последняя дата]}
+        self.words = {}  # kind -> отсортированный список (слово, номер варианта)
+        self.vocabulary = {}  # kind -> множество всех встречавшихся слов
+        self.trigrams = {}  # kind -> {триграмма: множество слов}
+        self.top = {}  # (kind, префикс) -> номера по убыванию веса
+        self.loading = False
+    
+    @staticmethod
+    def normalize(text):
+        return " ".join(re.findall(r"\w+", (text or "").lower().replace("ё", "е")))
+    
+    @staticmethod
+    def word_trigrams(word):
+        padded = f" {word} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+    
+    def usage_key(self, text, value):
+        return value if value is not None else self.normalize(text)
+    
+    def score(self, kind, key):
+        import math
+        count, last = self.usage.get(kind, {}).get(key, (0, None))
+        if not count:
+            return 0
+        day = date.fromisoformat(last[:10]).toordinal() if last else 0
+        return math.log2(1 + count) + day / self.RECENCY_DAYS
+    
+    def set_items(self, kind, items):
+        """Заменяет варианты одного вида: items - пары (название, значение)"""
+        for entry in list(self.keys.get(kind, {}).values()):
+            self.remove_entry(entry)
+        for text, value in items:
+            self.add_entry(kind, text, value)
+    
+    def load(self, kind, rows, create=False):
+        """Массовое добавление при построении: rows - (название, значение, число, дата), слова сортируются один раз"""
+        self.loading = True
+        try:
+            for text, value, count, last in rows:
+                self.record(kind, text, count, last, value, create)
+        finally:
+            self.loading = False
+            self.words.setdefault(kind, []).sort()
+            for top_key in [top_key for top_key in self.top if top_key[0] == kind]:
+                del self.top[top_key]
+    
+    def record(self, kind, text, count=1, last=None, value=None, create=False):
+        """
+        Учитывает использование варианта. create - завести вариант, если его нет
+        (для описаний: каждое новое описание становится подсказкой).
+        """
+        key = self.usage_key(text, value)
+        if key == "":
+            return
+        stats = self.usage.setdefault(kind, {}).setdefault(key, [0, None])
+        stats[0] += count
+        newest = last and (stats[1] is None or last >= stats[1])
+        if newest:
+            stats[1] = last
+        
+        entry = self.keys.get(kind, {}).get(key)
+        if entry is None:
+            if create:
+                self.add_entry(kind, text, value, key)
+            return
+        if newest and value is None:
+            # Показываем написание из последней операции
+            self.texts[entry] = text.strip()
+        self.scores[entry] = self.score(kind, key)
+        self.promote(entry)
+    
+    def add_entry(self, kind, text, value, key=None):
+        import bisect
+        key = self.usage_key(text, value) if key is None else key
+        if key == "" or key in self.keys.get(kind, {}):
+            return
+        entry = len(self.texts)
+        words = (key if value is None else self.normalize(text)).split()
+        self.texts.append(text.strip())
+        self.values.append(value)
+        self.kinds.append(kind)
+        self.word_lists.append(words)
+        self.scores.append(self.score(kind, key))
+        self.keys.setdefault(kind, {})[key] = entry
+        
+        word_list = self.words.setdefault(kind, [])
+        vocabulary = self.vocabulary.setdefault(kind, set())
+        trigrams = self.trigrams.setdefault(kind, {})
+        for word in set(words):
+            if self.loading:
+                word_list.append((word, entry))
+            else:
+                bisect.insort(word_list, (word, entry))
+            if word not in vocabulary:
+                vocabulary.add(word)
+                for trigram in self.word_trigrams(word):
+                    trigrams.setdefault(trigram, set()).add(word)
+        self.promote(entry)
+    
+    def remove_entry(self, entry):
+        import bisect
+        kind = self.kinds[entry]
+        words = self.word_lists[entry]
+        del self.keys[kind][self.usage_key(self.texts[entry], self.values[entry])]
+        word_list = self.words[kind]
+        for word in set(words):
+            del word_list[bisect.bisect_left(word_list, (word, entry))]
+        self.kinds[entry] = None
+        # Слова остаются в словаре триграмм: без вариантов они ничего не находят.
+        # Готовые списки с удалённым вариантом пересобираются при следующем запросе
+        for prefix in self.prefixes(words):
+            self.top.pop((kind, prefix), None)
+    
+    @staticmethod
+    def prefixes(words):
+        return {""} | {word[:length] for word in words for length in range(1, len(word) + 1)}
+    
+    def promote(self, entry):
+        """Поправляет готовые списки после роста веса варианта (вес только растёт)"""
+        if self.loading:
+            return  # Готовые списки сбрасываются в конце загрузки
+        kind = self.kinds[entry]
+        score = self.scores[entry]
+        for prefix in self.prefixes(self.word_lists[entry]):
+            top = self.top.get((kind, prefix))
+            if top is None:
+                continue
+            if entry in top:
+                top.remove(entry)
+            elif len(top) >= self.TOP_SIZE and score <= self.scores[top[-1]]:
+                continue
+            position = 0
+            while position < len(top) and self.scores[top[position]] >= score:
+                position += 1
+            top.insert(position, entry)
+            del top[self.TOP_SIZE:]
+    
+    def word_range(self, kind, prefix, exact=False):
+        """Срез отсортированного списка слов, начинающихся с prefix (или равных ему)"""
+        import bisect
+        word_list = self.words.get(kind, [])
+        end = (prefix, len(self.texts)) if exact else (prefix + "\uffff",)
+        return word_list, bisect.bisect_left(word_list, (prefix,)), bisect.bisect_left(word_list, end)
+    
+    def best(self, candidates, limit):
+        import heapq
+        return heapq.nlargest(limit, candidates, key=self.scores.__getitem__)
+    
+    def prefix_entries(self, kind, prefix, limit):
+        """Лучшие варианты со словом на prefix; для частых префиксов - из готового списка"""
+        top = self.top.get((kind, prefix))
+        if top is not None and (limit <= len(top) or len(top) < self.TOP_SIZE):
+            return top[:limit]
+        if prefix:
+            word_list, start, end = self.word_range(kind, prefix)
+            candidates = {entry for _, entry in word_list[start:end]}
+        else:
+            candidates = self.keys.get(kind, {}).values()
+        if len(candidates) < self.TOP_FROM or limit > self.TOP_SIZE:
+            return self.best(candidates, limit)
+        top = self.top[(kind, prefix)] = self.best(candidates, self.TOP_SIZE)
+        return top[:limit]
+    
+    def search(self, kind, query, limit=9):
+        """Лучшие варианты для введённого текста: список пар (название, значение)"""
+        tokens = self.normalize(query).split()
+        if len(tokens) <= 1:
+            found = self.prefix_entries(kind, tokens[0] if tokens else "", limit)
+        else:
+            def matches(entry):
+                return all(any(word.startswith(token) for word in self.word_lists[entry]) for token in tokens)
+            
+            ranges = sorted(((self.word_range(kind, token), token) for token in tokens),
+                            key=lambda found: found[0][2] - found[0][1])
+            # Сначала готовый список самого частого слова: если в нём нашлось limit вариантов,
+            # остальные варианты с этим словом легче любого из найденных
+            top = self.prefix_entries(kind, ranges[-1][1], self.TOP_SIZE)
+            found = [entry for entry in top if matches(entry)][:limit]
+            if len(found) < limit and len(top) >= self.TOP_SIZE:
+                # Иначе пересекаются варианты по каждому слову, начиная с самого редкого;
+                # когда кандидатов намного меньше, чем вариантов у слова, они проверяются по одному
+                (word_list, start, end), _ = ranges[0]
+                candidates = {entry for _, entry in word_list[start:end]}
+                for (word_list, start, end), token in ranges[1:]:
+                    if end - start > 4 * len(candidates):
+                        candidates = {entry for entry in candidates
+                                      if any(word.startswith(token) for word in self.word_lists[entry])}
+                    else:
+                        candidates.intersection_update([entry for _, entry in word_list[start:end]])
+                found = self.best(candidates, limit)
+        
+        if not found and any(len(token) >= self.FUZZY_FROM for token in tokens):
+            found = self.fuzzy(kind, tokens, limit)
+        return [(self.texts[entry], self.values[entry]) for entry in found]
+    
+    def similar_words(self, kind, token):
+        """Слова словаря, где встречается хотя бы половина триграмм token: {слово: число общих}"""
+        trigrams = self.trigrams.get(kind, {})
+        # Без закрывающего пробела: token может быть началом слова
+        token_trigrams = sorted({f" {token}"[i:i + 3] for i in range(len(token) - 1)},
+                                key=lambda trigram: len(trigrams.get(trigram, ())))
+        needed = (len(token_trigrams) + 1) // 2
+        # Слово с needed общими триграммами содержит хотя бы одну из самых редких
+        candidates = set()
+        for trigram in token_trigrams[:len(token_trigrams) - needed + 1]:
+            candidates.update(trigrams.get(trigram, ()))
+        
+        similar = {}
+        for word in candidates:
+            word_trigrams = self.word_trigrams(word)
+            common = sum(1 for trigram in token_trigrams if trigram in word_trigrams)
+            if common >= needed:
+                similar[word] = common
+        return similar
+    
+    def fuzzy(self, kind, tokens, limit):
+        """Варианты, где каждое слово запроса похоже на какое-то слово названия: середина слова и опечатки"""
+        matchers = []
+        for token in tokens:
+            if len(token) >= self.FUZZY_FROM:
+                matchers.append(self.similar_words(kind, token))
+            else:
+                word_list, start, end = self.word_range(kind, token)
+                matchers.append({word: 0 for word, _ in word_list[start:end]})
+        
+        # Кандидаты - по слову запроса с самым коротким списком похожих слов, от самых похожих:
+        # когда набралось limit вариантов, менее похожие уже не нужны
+        smallest = min(matchers, key=len)
+        matches = []
+        for similarity in sorted(set(smallest.values()), reverse=True):
+            candidates = set()
+            for word in smallest:
+                if smallest[word] == similarity:
+                    word_list, start, end = self.word_range(kind, word, exact=True)
+                    candidates.update(entry for _, entry in word_list[start:end])
+            if len(matchers) == 1:
+                # Одно слово в запросе: у всех кандидатов группы одинаковая похожесть
+                matches.extend((similarity, self.scores[entry], entry) for entry in self.best(candidates, limit))
+            else:
+                for entry in candidates:
+                    words = self.word_lists[entry]
+                    total = 0
+                    for similar in matchers:
+                        common = [similar[word] for word in words if word in similar]
+                        if not common:
+                            break
+                        total += max(common)
+                    else:
+                        matches.append((total, self.scores[entry], entry))
+            if len(matches) >= limit:
+                break
+        matches.sort(reverse=True)
+        return [entry for _, _, entry in matches[:limit]]
+
+
+def month_end(year, month):
+    """Последний день месяца"""
+    if month == 12:
+        return date(year, 12, 31)
+    return date(year, month + 1, 1) - datetime.timedelta(days=1)
+
+
+# Правила повторения регулярных платежей
+class RecurrenceRule:
+    """
+    Правило разбирается один раз при создании, а следующая дата считается
+    календарной арифметикой без перебора дней: next_on_or_after - O(1) для любого правила.
+    Если в месяце нет нужного дня (31-е, 29 февраля), платёж переносится на последний день месяца.
+    """
+    KINDS = {
+        "monthly": "ежемесячно",
+        "weekly": "еженедельно",
+        "biweekly": "раз в две недели",
+        "yearly": "ежегодно",
+        "last_day": "в последний день месяца",
+        "last_business_day": "в последний рабочий день месяца",
+    }
+
+    def __init__(self, kind, payment_day=None, anchor=None):
+        if kind not in self.KINDS:
+            raise ValueError(f"Неизвестное правило повторения: {kind}")
+        if kind == "monthly" and not (payment_day and 1 <= payment_day <= 31):
+            raise ValueError("День платежа должен быть от 1 до 31")
+        if kind in ("weekly", "biweekly", "yearly") and anchor is None:
+            raise ValueError("Для этого правила нужна дата первого платежа")
+
+        self.kind = kind
+        self.payment_day = payment_day
+        # Дата первого платежа: раньше неё правило не срабатывает
+        self.anchor = anchor
+        self.period = 14 if kind == "biweekly" else 7
+        self._next = {
+            "monthly": self._next_monthly,
+            "weekly": self._next_periodic,
+            "biweekly": self._next_periodic,
+            "yearly": self._next_yearly,
+            "last_day": self._next_last_day,
+            "last_business_day": self._next_last_business_day,
+        }[kind]
+
+    def next_on_or_after(self, day):
+        """Ближайшая дата платежа не раньше day"""
+        if self.anchor is not None and day < self.anchor:
+            day = self.anchor
+        return self._next(day)
+
+    def next_after(self, day):
+        """Следующая дата платежа после day"""
+        return self.next_on_or_after(day + datetime.timedelta(days=1))
+
+    def occurrences(self, start, end):
+        """Даты платежей в [start, end]"""
+        day = self.next_on_or_after(start)
+        while day <= end:
+            yield day
+            day = self.next_after(day)
+
+    def describe(self):
+        text = self.KINDS[self.kind]
+        if self.kind == "monthly":
+            return f"{text}, {self.payment_day}-го"
+        if self.kind == "yearly":
+            return f"{text}, {self.anchor.strftime('%d.%m')}"
+        if self.kind in ("weekly", "biweekly"):
+            return f"{text} с {self.anchor.strftime('%d.%m.%Y')}"
+        return text
+
+    @staticmethod
+    def _next_month(day):
+        return (day.year + 1, 1) if day.month == 12 else (day.year, day.month + 1)
+
+    @staticmethod
+    def _day_in_month(year, month, day_number):
+        end = month_end(year, month)
+        return end if day_number > end.day else end.replace(day=day_number)
+
+    def _next_monthly(self, day):
+        due = self._day_in_month(day.year, day.month, self.payment_day)
+        if due < day:
+            due = self._day_in_month(*self._next_month(day), self.payment_day)
+        return due
+
+    def _next_periodic(self, day):
+        # Целое число периодов от первого платежа, округлённое вверх
+        periods = -(-(day - self.anchor).days // self.period)
+        return self.anchor + datetime.timedelta(days=periods * self.period)
+
+    def _next_yearly(self, day):
+        due = self._day_in_month(day.year, self.anchor.month, self.anchor.day)
+        if due < day:
+            due = self._day_in_month(day.year + 1, self.anchor.month, self.anchor.day)
+        return due
+
+    def _next_last_day(self, day):
+        return month_end(day.year, day.month)
+
+    @staticmethod
+    def _last_business_day(year, month):
+        end = month_end(year, month)
+        # Суббота и воскресенье переносятся на пятницу
+        return end - datetime.timedelta(days=max(0, end.weekday() - 4))
+
+    def _next_last_business_day(self, day):
+        due = self._last_business_day(day.year, day.month)
+        if due < day:
+            due = self._last_business_day(*self._next_month(day))
+        return due
+
+
+# Профилирование SQL-запросов трекера
+class QueryProfiler:
+    """
+    Собирает по каждому методу FinanceTracker количество запросов, время, число строк
+    и гистограмму задержек. Запросы дольше порога пишутся в ротируемый лог,
+    при необходимости вместе с EXPLAIN QUERY PLAN.
+    """
+    # Верхние границы корзин гистограммы в миллисекундах
+    HISTOGRAM_BOUNDS = [0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000]
+    
+    def __init__(self, slow_query_ms=100, log_path=None, explain=False, max_bytes=1024 * 1024, backup_count=3):
+        self.slow_query_ms = slow_query_ms
+        self.explain = explain
+        self.methods = {}
+        self.slow_queries = 0
+        self.cursors = weakref.WeakSet()
+        self.method_names = None
+        
+        self.logger = None
+        if log_path:
+            import logging.handlers
+            self.logger = logging.getLogger(f"finance_tracker.slow_queries.{id(self)}")
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+            handler = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.logger.addHandler(handler)
+    
+    def close(self):
+        self.flush()
+        if self.logger:
+            for handler in list(self.logger.handlers):
+                handler.close()
+                self.logger.removeHandler(handler)
+    
+    def calling_method(self):
+        """Имя внешнего метода FinanceTracker, из которого выполняется запрос"""
+        if self.method_names is None:
+            import inspect
+            
+            # У методов под @undoable общая обёртка - учитываем код самих методов
+            self.method_names = {
+                inspect.unwrap(value).__code__: name for name, value in vars(FinanceTracker).items()
+                if hasattr(value, "__code__")
+            }
+        
+        method = None
+        frame = sys._getframe(2)
+        while frame is not None:
+            name = self.method_names.get(frame.f_code)
+            if name:
+                method = name  # Идём дальше, чтобы найти самый внешний метод трекера
+            frame = frame.f_back
+        return method or "<вне трекера>"
+    
+    def params_shape(self, params, many=False):
+        """Описание параметров без значений: количество и типы"""
+        if many:
+            return f"executemany x{params}"
+        if not params:
+            return "без параметров"
+        if isinstance(params, dict):
+            return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+        return "(" + ", ".join(type(v).__name__ for v in params) + ")"
+    
+    def record(self, entry, cursor):
+        duration_ms = entry["duration"] * 1000
+        method = entry["method"]
+        
+        stats = self.methods.get(method)
+        if stats is None:
+            stats = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0,
+                     "histogram": [0] * (len(self.HISTOGRAM_BOUNDS) + 1)}
+            self.methods[method] = stats
+        
+        stats["count"] += 1
+        stats["total_ms"] += duration_ms
+        stats["max_ms"] = max(stats["max_ms"], duration_ms)
+        stats["rows"] += entry["rows"]
+        
+        bucket = len(self.HISTOGRAM_BOUNDS)
+        for i, bound in enumerate(self.HISTOGRAM_BOUNDS):
+            if duration_ms <= bound:
+                bucket = i
+                break
+        stats["histogram"][bucket] += 1
+        
+        if duration_ms >= self.slow_query_ms:
+            self.slow_queries += 1
+            if self.logger:
+                sql = " ".join(entry["sql"].split())
+                message = (f"{duration_ms:.2f} ms | {method} | строк: {entry['rows']} | "
+                           f"{entry['shape']} | {sql}")
+                if self.explain and sql.upper().startswith(("SELECT", "WITH")) and entry["params"] is not None:
+                    message += " | план: " + self.query_plan(cursor.connection, entry["sql"], entry["params"])
+                self.logger.info(message)
+    
+    def query_plan(self, connection, sql, params):
+        try:
+            plan_cursor = sqlite3.Cursor(connection)
+            plan_cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return "; ".join(row[-1] for row in plan_cursor.fetchall())
+        except sqlite3.Error as e:
+            return f"недоступен ({e})"
+    
+    def flush(self):
+        """Завершает учёт запросов, строки которых ещё читаются"""
+        for cursor in list(self.cursors):
+            cursor.finish_profiling()
+    
+    def stats(self):
+        self.flush()
+        labels = [f"<={bound}ms" for bound in self.HISTOGRAM_BOUNDS] + [f">{self.HISTOGRAM_BOUNDS[-1]}ms"]
+        methods = {}
+        for method, stats in sorted(self.methods.items(), key=lambda item: -item[1]["total_ms"]):
+            methods[method] = {
+                "count": stats["count"],
+                "total_ms": round(stats["total_ms"], 3),
+                "avg_ms": round(stats["total_ms"] / stats["count"], 3),
+                "max_ms": round(stats["max_ms"], 3),
+                "rows": stats["rows"],
+                "histogram": dict(zip(labels, stats["histogram"])),
+            }
+        return {"slow_query_ms": self.slow_query_ms, "slow_queries": self.slow_queries, "methods": methods}
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """
+    Курсор, который сообщает профайлеру о каждом запросе. Время и число строк
+    запроса включают последующие fetch*, поэтому запрос учитывается при следующем
+    execute, закрытии курсора или запросе статистики. Соединение выдаёт его только
+    при включённом профайлере; если профайлер выключили позже - ведёт себя как обычный.
+    """
+    pending = None
+    
+    def execute(self, sql, parameters=()):
+        profiler = self.connection.profiler
+        if profiler is None:
+            return super().execute(sql, parameters)
+        
+        self.finish_profiling()
+        entry = {"sql": sql, "params": parameters, "shape": profiler.params_shape(parameters),
+                 "method": profiler.calling_method(), "rows": 0}
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            entry["duration"] = time.perf_counter() - started
+            self.start_profiling(profiler, entry)
+    
+    def executemany(self, sql, seq_of_parameters):
+        profiler = self.connection.profiler
+        if profiler is None:
+            return super().executemany(sql, seq_of_parameters)
+        
+        self.finish_profiling()
+        seq_of_parameters = list(seq_of_parameters)
+        entry = {"sql": sql, "params": None, "shape": profiler.params_shape(len(seq_of_parameters), many=True),
+                 "method": profiler.calling_method(), "rows": 0}
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            entry["duration"] = time.perf_counter() - started
+            entry["rows"] = max(self.rowcount, 0)
+            self.start_profiling(profiler, entry)
+    
+    def start_profiling(self, profiler, entry):
+        if entry["rows"] == 0 and self.rowcount > 0:
+            entry["rows"] = self.rowcount  # Для UPDATE/DELETE - число изменённых строк
+        self.pending = (profiler, entry)
+        profiler.cursors.add(self)
+    
+    def finish_profiling(self):
+        if self.pending is not None:
+            profiler, entry = self.pending
+            self.pending = None
+            profiler.record(entry, self)
+    
+    def fetch_profiled(self, fetch, *args):
+        if self.pending is None:
+            return fetch(*args)
+        started = time.perf_counter()
+        result = fetch(*args)
+        entry = self.pending[1]
+        entry["duration"] += time.perf_counter() - started
+        if isinstance(result, list):
+            entry["rows"] += len(result)
+        elif result is not None:
+            entry["rows"] += 1
+        return result
+    
+    def fetchone(self):
+        return self.fetch_profiled(super().fetchone)
+    
+    def fetchmany(self, size=None):
+        if size is None:
+            return self.fetch_profiled(super().fetchmany)
+        return self.fetch_profiled(super().fetchmany, size)
+    
+    def fetchall(self):
+        return self.fetch_profiled(super().fetchall)
+    
+    def close(self):
+        self.finish_profiling()
+        super().close()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """
+    Соединение, курсоры которого отчитываются профайлеру, если он включён (иначе курсоры обычные,
+    без накладных расходов на каждый запрос).
+    Время коммитов учитывается в реестре метрик, если он задан.
+    В пакетном режиме (commits_deferred) коммиты методов трекера пропускаются.
+    """
+    profiler = None
+    metrics = None
+    commits_deferred = False
+    
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = sqlite3.Cursor if self.profiler is None else ProfiledCursor
+        return super().cursor(factory)
+    
+    def commit(self):
+        if self.commits_deferred:
+            return  # Транзакцию зафиксирует FinanceTracker.batch
+        if self.metrics is None:
+            return super().commit()
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            self.metrics.observe("finance_commit_duration_seconds", time.perf_counter() - started)
+
+
+# Общий пул соединений для нескольких журналов в одном процессе
+class ConnectionPool:
+    """
+    Ограничивает число открытых соединений SQLite у всех трекеров, созданных с этим пулом
+    (например, по одному на пользователя). Трекер берёт соединение при первом обращении к базе
+    и возвращает его через release(). Когда открыто max_connections соединений, закрывается
+    самое давно простаивающее, а если свободных нет - acquire ждёт. Схема каждого файла
+    проверяется только при первом соединении с ним.
+    """
+    def __init__(self, max_connections=8, timeout=30):
+        import collections
+        import threading
+        
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self.idle = collections.OrderedDict()  # соединение -> (путь, время возврата), от давно простаивающих к недавним
+        self.in_use = 0
+        self.prepared = set()
+        self.closed = False
+        self.stats = {"reused": 0, "opened": 0, "evicted": 0, "waited": 0}
+    
+    def acquire(self, db_path):
+        with self.condition:
+            waited = False
+            while True:
+                if self.closed:
+                    raise RuntimeError("Пул соединений закрыт")
+                for conn, (path, _) in reversed(list(self.idle.items())):
+                    if path == db_path:
+                        del self.idle[conn]
+                        self.in_use += 1
+                        self.stats["reused"] += 1
+                        return conn
+                
+                if self.in_use + len(self.idle) < self.max_connections:
+                    break
+                if self.idle:
+                    evicted, _ = self.idle.popitem(last=False)
+                    evicted.close()
+                    self.stats["evicted"] += 1
+                    break
+                
+                if not waited:
+                    self.stats["waited"] += 1
+                    waited = True
+                if not self.condition.wait(self.timeout):
+                    raise TimeoutError("Нет свободных соединений в пуле")
+            self.in_use += 1
+        
+        # Открываем вне блокировки; соединение может переходить между потоками вместе с трекером
+        try:
+            conn = sqlite3.connect(db_path, factory=ProfiledConnection, check_same_thread=False)
+        except Exception:
+            with self.condition:
+                self.in_use -= 1
+                self.condition.notify()
+            raise
+        self.stats["opened"] += 1
+        return conn
+    
+    def release(self, conn, db_path):
+        if conn.in_transaction:
+            conn.rollback()  # Незафиксированные изменения не должны достаться следующему трекеру
+        conn.profiler = None
+        conn.metrics = None
+        with self.condition:
+            self.in_use -= 1
+            if self.closed:
+                conn.close()
+            else:
+                self.idle[conn] = (db_path, time.monotonic())
+            self.condition.notify()
+    
+    def evict_idle(self, max_idle_seconds):
+        """Закрывает соединения, простаивающие дольше max_idle_seconds; возвращает их количество"""
+        deadline = time.monotonic() - max_idle_seconds
+        evicted = 0
+        with self.condition:
+            while self.idle:
+                conn, (_, released_at) = next(iter(self.idle.items()))
+                if released_at > deadline:
+                    break  # Дальше только более свежие
+                del self.idle[conn]
+                conn.close()
+                evicted += 1
+            self.stats["evicted"] += evicted
+        return evicted
+    
+    def needs_setup(self, db_path):
+        return db_path not in self.prepared
+    
+    def mark_prepared(self, db_path):
+        self.prepared.add(db_path)
+    
+    def close(self):
+        """Закрывает простаивающие соединения; занятые закроются при возврате трекерами"""
+        with self.condition:
+            self.closed = True
+            for conn in self.idle:
+                conn.close()
+            self.idle.clear()
+            self.condition.notify_all()
+
+
+# Метрики сервиса в текстовом формате Prometheus
+class MetricsRegistry:
+    """
+    Счётчики, гистограммы и вычисляемые при чтении метрики трекера.
+    Обновление - это одно сложение в словаре, поэтому блокировок нет:
+    HTTP-поток читает снимок словарей, а основной поток только увеличивает значения.
+    """
+    # Верхние границы корзин гистограмм в секундах
+    DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+    
+    def __init__(self):
+        self.descriptions = {}
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+    
+    def describe(self, name, metric_type, help_text, buckets=None):
+        self.descriptions[name] = (metric_type, help_text)
+        if metric_type == "histogram":
+            self.histograms[name] = {
+                "buckets": tuple(buckets or self.DEFAULT_BUCKETS),
+                "counts": [0] * (len(buckets or self.DEFAULT_BUCKETS) + 1),
+                "sum": 0.0,
+                "count": 0,
+            }
+    
+    def gauge(self, name, help_text, callback):
+        """Метрика, значение которой вычисляется при каждом чтении: callback() -> число или {метки: число}"""
+        self.descriptions[name] = ("gauge", help_text)
+        self.gauges[name] = callback
+    
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, name, value):
+        histogram = self.histograms[name]
+        buckets = histogram["buckets"]
+        index = len(buckets)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                index = i
+                break
+        histogram["counts"][index] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+    
+    def value(self, name, **labels):
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+    
+    @staticmethod
+    def format_labels(labels):
+        if not labels:
+            return ""
+        escaped = []
+        for key, value in labels:
+            value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+            escaped.append(f'{key}="{value}"')
+        return "{" + ",".join(escaped) + "}"
+    
+    @staticmethod
+    def format_value(value):
+        if value == float("inf"):
+            return "+Inf"
+        if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+            return str(int(value))
+        return repr(value) if isinstance(value, float) else str(value)
+    
+    def render(self):
+        """Текст для /metrics в формате Prometheus exposition 0.0.4"""
+        counters = {}
+        for (name, labels), value in list(self.counters.items()):
+            counters.setdefault(name, []).append((labels, value))
+        
+        lines = []
+        for name, (metric_type, help_text) in sorted(self.descriptions.items()):
+            samples = counters.get(name, [])
+            if metric_type == "counter" and not samples:
+                samples = [((), 0)]
+            
+            if metric_type == "gauge" and name in self.gauges:
+                try:
+                    result = self.gauges[name]()
+                except Exception:
+                    continue  # Недоступную метрику просто не отдаём
+                if result is None:
+                    continue
+                if isinstance(result, dict):
+                    samples = [(tuple(sorted(labels)), value) for labels, value in result.items()]
+                else:
+                    samples = [((), result)]
+            
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            
+            if metric_type == "histogram":
+                histogram = self.histograms[name]
+                cumulative = 0
+                counts = list(histogram["counts"])
+                for bound, count in zip(histogram["buckets"] + (float("inf"),), counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{le="{self.format_value(float(bound))}"}} {cumulative}')
+                lines.append(f"{name}_sum {self.format_value(histogram['sum'])}")
+                lines.append(f"{name}_count {histogram['count']}")
+                continue
+            
+            for labels, value in sorted(samples):
+                lines.append(f"{name}{self.format_labels(labels)} {self.format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def metrics_request_handler():
+    """Класс обработчика /metrics; http.server импортируется только при запуске эндпоинта"""
+    import http.server
+    
+    class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+        """Отдаёт /metrics из реестра сервера"""
+        
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = self.server.registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass  # Не засоряем консоль запросами сборщика метрик
+    
+    return MetricsRequestHandler
+
+
+def undoable(action):
+    """
+    Декоратор метода FinanceTracker, меняющего данные: все изменения метода (вместе с вложенными
+    вызовами) попадают в журнал отмены одним действием с названием action
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.undo_action(action):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Создаем класс для работы с базой данных
+class FinanceTracker:
+    # Основная валюта: балансы в ней не пересчитываются, курсы хранятся в рублях за единицу
+    DEFAULT_CURRENCY = "RUB"
+    CURRENCY_SYMBOLS = {"RUB": "₽", "USD": "$", "EUR": "€", "GBP": "£", "CNY": "¥", "KZT": "₸", "TRY": "₺"}
+    
+    # Переменная окружения с путём к базе (если путь не передан явно)
+    DB_PATH_ENV = "FINANCE_TRACKER_DB"
+
+    # Таблицы журнала без rowid и их ключи (строки таких таблиц отменяются и синхронизируются по ключу)
+    KEYLESS_TABLES = {"transaction_tags": ("tag_id", "transaction_id")}
+    
+    # Журнал отмены: таблицы, изменения которых можно отменить, и сколько последних действий хранится
+    UNDO_TABLES = ("accounts", "transactions", "transaction_splits", "transaction_tags", "tags",
+                   "transfers", "recurring_payments", "planned_payments")
+    UNDO_HISTORY_LIMIT = 100
+    
+    # Синхронизация: таблицы журнала в порядке применения изменений и ссылки между ними (колонка -> таблица)
+    SYNC_TABLES = ("accounts", "tags", "transactions", "transaction_splits", "transaction_tags",
+                   "transfers", "recurring_payments", "planned_payments")
+    SYNC_REFERENCES = {
+        "transactions": {"account_id": "accounts"},
+        "transaction_splits": {"transaction_id": "transactions"},
+        "transaction_tags": {"tag_id": "tags", "transaction_id": "transactions"},
+        "transfers": {"from_account_id": "accounts", "to_account_id": "accounts"},
+        "recurring_payments": {"account_id": "accounts", "to_account_id": "accounts"},
+        "planned_payments": {"account_id": "accounts"},
+    }
+    # Из чего строится UUID строк, созданных до появления синхронизации:
+    # у копий одного файла базы они совпадут, и первая синхронизация не задвоит журнал
+    SYNC_LEGACY_IDENTITY = {
+        "accounts": "created_at",
+        "tags": "name",
+        "transactions": "COALESCE(fingerprint, transaction_date)",
+        "transaction_splits": "transaction_id || ':' || category",
+        "transfers": "transfer_date",
+        "recurring_payments": "description",
+        "planned_payments": "description || ':' || planned_date",
+    }
+    # Вклад строки в балансы счетов: (счёт, сумма); баланс счёта = начальный остаток + вклады
+    SYNC_BALANCE_SQL = {
+        "accounts": "SELECT id, opening_balance FROM accounts WHERE id = :id",
+        "transactions": "SELECT account_id, amount FROM transactions WHERE id = :id",
+        "transfers": """SELECT from_account_id, -amount FROM transfers WHERE id = :id
+            UNION ALL SELECT to_account_id, COALESCE(to_amount, amount) FROM transfers WHERE id = :id""",
+    }
+    SYNC_FORMAT = "finance-tracker-changes/1"
+    
+    def __init__(self, db_path=None, pool=None):
+        """
+        db_path - файл базы или ":memory:"; по умолчанию берётся из FINANCE_TRACKER_DB,
+        иначе finance_tracker/finance.db рядом со скриптом. pool - общий ConnectionPool
+        для нескольких трекеров в одном процессе (журналы в памяти в пул не попадают).
+        """
+        db_path, self.data_dir = self.resolve_db_path(db_path)
+        self.db_path = db_path
+        self.pool = pool if db_path != ":memory:" else None
+        self.category_matcher = None  # Компилируется при первом использовании правил
+        self.typeahead = None  # Индекс подсказок строится при первой подсказке
+        self.typeahead_names_loaded = False
+        self.metrics = self._create_metrics()
+        self.metrics_server = None
+        # conn, cursor, fts_enabled и report_currency появляются при первом обращении (см. __getattr__)
+    
+    @classmethod
+    def resolve_db_path(cls, db_path=None):
+        """
+        Путь к базе и каталог, который нужно создать перед подключением (или None):
+        пустой путь заменяется путём из FINANCE_TRACKER_DB или путём по умолчанию
+        """
+        data_dir = None
+        if db_path is None:
+            db_path = os.environ.get(cls.DB_PATH_ENV)
+            if db_path and db_path != ":memory:":
+                data_dir = os.path.dirname(os.path.abspath(db_path))
+        if not db_path:
+            # Используем текущую директорию запуска скрипта
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            data_dir = os.path.join(script_dir, "finance_tracker")
+            db_path = os.path.join(data_dir, "finance.db")
+        return db_path, data_dir
+    
+    def __getattr__(self, name):
+        """
+        Откладывает открытие базы и проверку схемы до первого обращения к ней,
+        чтобы консоль показывала меню сразу. Вызывается только для ещё не созданных атрибутов,
+        поэтому после подключения обращения к conn и cursor ничего не стоят.
+        """
+        if name in ("conn", "cursor", "fts_enabled"):
+            self.connect()
+            return self.__dict__[name]
+        if name == "report_currency":
+            self.report_currency = self.get_setting("report_currency", self.DEFAULT_CURRENCY)
+            return self.report_currency
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+    
+    def connect(self):
+        """Открывает соединение и проверяет схему (повторный вызов ничего не делает)"""
+        if self.is_connected():
+            return
+        if self.data_dir and not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir)
+        
+        if self.pool is None:
+            conn = sqlite3.connect(self.db_path, factory=ProfiledConnection)
+        else:
+            conn = self.pool.acquire(self.db_path)
+        conn.metrics = self.metrics
+        self.conn = conn
+        self.cursor = conn.cursor()
+        
+        if self.pool is None or self.pool.needs_setup(self.db_path):
+            self.setup_database()
+            if self.pool is not None:
+                self.pool.mark_prepared(self.db_path)
+        else:
+            # Схему уже проверил другой трекер пула - узнаём только, есть ли индекс FTS5
+            self.cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'transactions_fts'"
+            )
+            self.fts_enabled = self.cursor.fetchone() is not None
+    
+    def is_connected(self):
+        return "conn" in self.__dict__
+    
+    def release(self):
+        """
+        Возвращает соединение в общий пул, чтобы им мог воспользоваться другой трекер.
+        При следующем обращении к базе соединение будет взято снова. Профилирование при этом выключается.
+        """
+        if self.pool is None or not self.is_connected():
+            return
+        self.disable_profiling()
+        self.cursor.close()
+        conn = self.__dict__.pop("conn")
+        del self.__dict__["cursor"]
+        self.pool.release(conn, self.db_path)
+    
+    def setup_database(self):
+        # Новая база сразу создаётся с инкрементальным auto_vacuum. У существующей прагма
+        # ничего не меняет, но перезаписывает заголовок файла - data_version у других соединений сдвинулся бы
+        if self.cursor.execute("PRAGMA page_count").fetchone()[0] == 0:
+            self.cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        
+        # Создаем таблицу счетов
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS accounts (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            balance REAL DEFAULT 0,
+            type TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            currency TEXT NOT NULL DEFAULT 'RUB',
+            opening_balance REAL NOT NULL DEFAULT 0
+        )
+        ''')
+        self._add_column_if_missing("accounts", "currency", "TEXT NOT NULL DEFAULT 'RUB'")
+        
+        # Создаем таблицу операций
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY,
+            account_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            description TEXT,
+            category TEXT,
+            transaction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            transaction_type TEXT NOT NULL,
+            fingerprint TEXT,
+            is_rollup INTEGER NOT NULL DEFAULT 0,
+            is_split INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        )
+        ''')
+        
+        # Отпечаток содержимого операции для поиска дубликатов (колонка добавлена позже)
+        if self._add_column_if_missing("transactions", "fingerprint", "TEXT"):
+            self._backfill_fingerprints()
+        # Сводные строки, оставленные вместо перенесённых в архив операций
+        self._add_column_if_missing("transactions", "is_rollup", "INTEGER NOT NULL DEFAULT 0")
+        # Разделённая операция: баланс меняет она, категории и суммы - в строках transaction_splits
+        self._add_column_if_missing("transactions", "is_split", "INTEGER NOT NULL DEFAULT 0")
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_transactions_fingerprint ON transactions (fingerprint)"
+        )
+        # Индекс по дате для отчётов за период
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (transaction_date)"
+        )
+        # Операции счёта по дате - для выписок и постраничной прокрутки списка по одному счёту
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_transactions_account_date ON transactions (account_id, transaction_date)"
+        )
+        
+        # Строки разделённых операций (один чек - несколько категорий), суммы со знаком операции
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transaction_splits (
+            id INTEGER PRIMARY KEY,
+            transaction_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            category TEXT,
+            description TEXT,
+            FOREIGN KEY (transaction_id) REFERENCES transactions (id)
+        )
+        ''')
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_transaction_splits_transaction ON transaction_splits (transaction_id, category, amount)"
+        )
+        
+        # Метки операций (многие-ко-многим). Связь хранится в двух порядках: первичный ключ
+        # (tag_id, transaction_id) отдаёт операции метки, индекс (transaction_id, tag_id) - метки операции
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL COLLATE NOCASE
+        )
+        ''')
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transaction_tags (
+            tag_id INTEGER NOT NULL,
+            transaction_id INTEGER NOT NULL,
+            PRIMARY KEY (tag_id, transaction_id),
+            FOREIGN KEY (tag_id) REFERENCES tags (id),
+            FOREIGN KEY (transaction_id) REFERENCES transactions (id)
+        ) WITHOUT ROWID
+        ''')
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_transaction_tags_transaction ON transaction_tags (transaction_id, tag_id)"
+        )
+        
+        # Создаем таблицу для регулярных платежей
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recurring_payments (
+            id INTEGER PRIMARY KEY,
+            account_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            description TEXT NOT NULL,
+            category TEXT,
+            payment_day INTEGER NOT NULL,
+            active INTEGER DEFAULT 1,
+            last_processed DATE,
+            rule TEXT NOT NULL DEFAULT 'monthly',
+            anchor_date DATE,
+            next_due DATE,
+            transaction_type TEXT NOT NULL DEFAULT 'expense',
+            to_account_id INTEGER,
+            FOREIGN KEY (account_id) REFERENCES accounts (id),
+            FOREIGN KEY (to_account_id) REFERENCES accounts (id)
+        )
+        ''')
+        # Правило повторения и вид операции (колонки добавлены позже, старые платежи - ежемесячные расходы)
+        self._add_column_if_missing("recurring_payments", "rule", "TEXT NOT NULL DEFAULT 'monthly'")
+        self._add_column_if_missing("recurring_payments", "anchor_date", "DATE")
+        self._add_column_if_missing("recurring_payments", "transaction_type", "TEXT NOT NULL DEFAULT 'expense'")
+        self._add_column_if_missing("recurring_payments", "to_account_id", "INTEGER")
+        # Дата следующего платежа: обработка выбирает наступившие платежи по индексу
+        if self._add_column_if_missing("recurring_payments", "next_due", "DATE"):
+            self._backfill_next_due()
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_recurring_next_due ON recurring_payments (active, next_due)"
+        )
+        
+        # Создаем таблицу для запланированных платежей
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS planned_payments (
+            id INTEGER PRIMARY KEY,
+            account_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            description TEXT NOT NULL,
+            category TEXT,
+            planned_date DATE,
+            completed INTEGER DEFAULT 0,
+            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        )
+        ''')
+        
+        # Создаем таблицу для переводов между счетами
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transfers (
+            id INTEGER PRIMARY KEY,
+            from_account_id INTEGER NOT NULL,
+            to_account_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            description TEXT,
+            transfer_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            to_amount REAL,
+            FOREIGN KEY (from_account_id) REFERENCES accounts (id),
+            FOREIGN KEY (to_account_id) REFERENCES accounts (id)
+        )
+        ''')
+        # Сумма зачисления для переводов между счетами в разных валютах (NULL - равна amount)
+        self._add_column_if_missing("transfers", "to_amount", "REAL")
+
+        # Создаем таблицу категорий
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS expense_categories (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+
+        # Создаем таблицу категорий доходов
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS income_categories (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+
+        # Курсы валют: сколько рублей стоит единица валюты на дату.
+        # Первичный ключ (currency, rate_date) служит индексом для поиска курса на дату
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fx_rates (
+            currency TEXT NOT NULL,
+            rate_date DATE NOT NULL,
+            rate REAL NOT NULL,
+            PRIMARY KEY (currency, rate_date)
+        )
+        ''')
+
+        # Создаем таблицу настроек
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        ''')
+
+        # Создаем таблицу бюджетов (лимиты по категориям расходов)
+        # spent - счётчик потраченного в текущем периоде, обновляется при каждой операции
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS budgets (
+            id INTEGER PRIMARY KEY,
+            category TEXT NOT NULL,
+            period TEXT NOT NULL,
+            limit_amount REAL NOT NULL,
+            spent REAL DEFAULT 0,
+            period_start DATE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (category, period)
+        )
+        ''')
+
+        # Создаем таблицу правил автоматической категоризации
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS category_rules (
+            id INTEGER PRIMARY KEY,
+            pattern TEXT NOT NULL,
+            match_type TEXT NOT NULL DEFAULT 'substring',
+            transaction_type TEXT NOT NULL DEFAULT 'expense',
+            category TEXT NOT NULL,
+            min_amount REAL,
+            max_amount REAL,
+            account_id INTEGER,
+            priority INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        )
+        ''')
+
+        # Журнал отмены: одна запись - одно действие пользователя. inserted - диапазоны id строк,
+        # добавленных действием (по таблицам), balances - изменения балансов счетов; оба поля в JSON
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS undo_log (
+            id INTEGER PRIMARY KEY,
+            action TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            undone INTEGER NOT NULL DEFAULT 0,
+            inserted TEXT,
+            balances TEXT
+        )
+        ''')
+        # Образы строк действия: deleted - удалённая строка, before/after - строка до и после изменения,
+        # added - строка таблицы без rowid, добавленная действием, inserted - добавленные строки на время отмены
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS undo_rows (
+            entry_id INTEGER NOT NULL,
+            table_name TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            row_id INTEGER,
+            image TEXT NOT NULL,
+            FOREIGN KEY (entry_id) REFERENCES undo_log (id)
+        )
+        ''')
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_undo_rows_entry ON undo_rows (entry_id, table_name, kind, row_id)"
+        )
+
+        self.setup_search_index()
+        self.setup_daily_totals()
+        self.setup_dashboard_months()
+        self.setup_sync()
+        self._fold_tag_names()
 
-# Создаем класс для работы с базой данных
-class FinanceTracker:
-    def __init__(self):
-        # Используем текущую директорию запуска скрипта
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        data_dir = os.path.join(script_dir, "finance_tracker")
-        if not os.path.exists(data_dir):
-            os.makedirs(data_dir)
-            
-        self.db_path = os.path.join(data_dir, "finance.db")
-        self.conn = sqlite3.connect(self.db_path)
-        self.cursor = self.conn.cursor()
-        self.setup_database()
+        # Проверяем, есть ли уже категории расходов, если нет - добавляем стандартные
+        self.cursor.execute("SELECT COUNT(*) FROM expense_categories")
+        if self.cursor.fetchone()[0] == 0:
+            default_expense_categories = [
+                "Продукты", "Кафе и рестораны", "Транспорт", "Жилье", 
+                "Коммунальные услуги", "Связь и интернет", "Одежда", 
+                "Развлечения", "Здоровье", "Образование", "Другое"
+            ]
+            for category in default_expense_categories:
+                self.cursor.execute("INSERT INTO expense_categories (name) VALUES (?)", (category,))
+        
+        # Проверяем, есть ли уже категории доходов, если нет - добавляем стандартные
+        self.cursor.execute("SELECT COUNT(*) FROM income_categories")
+        if self.cursor.fetchone()[0] == 0:
+            default_income_categories = [
+                "Зарплата", "Подработка", "Проценты по вкладам", "Дивиденды", 
+                "Подарки", "Возврат долгов", "Продажи", "Другое"
+            ]
+            for category in default_income_categories:
+                self.cursor.execute("INSERT INTO income_categories (name) VALUES (?)", (category,))
+        
+        self.conn.commit()
     
-    def setup_database(self):
-        # Создаем таблицу счетов
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS accounts (
-            id INTEGER PRIMARY KEY,
-            name TEXT UNIQUE NOT NULL,
-            balance REAL DEFAULT 0,
-            type TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    def _add_column_if_missing(self, table, column, definition):
+        """Добавляет колонку в существующую таблицу; возвращает True, если колонка была добавлена"""
+        self.cursor.execute(f"PRAGMA table_info({table})")
+        if any(row[1] == column for row in self.cursor.fetchall()):
+            return False
+        self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        return True
+    
+    def _backfill_fingerprints(self):
+        """Заполняет отпечатки для операций, созданных до появления колонки"""
+        read_cursor = self.conn.cursor()
+        read_cursor.execute("SELECT id, account_id, amount, description, transaction_date FROM transactions")
+        while True:
+            rows = read_cursor.fetchmany(1000)
+            if not rows:
+                break
+            self.cursor.executemany(
+                "UPDATE transactions SET fingerprint = ? WHERE id = ?",
+                [(self.get_transaction_fingerprint(account_id, amount, description, transaction_date), transaction_id)
+                 for transaction_id, account_id, amount, description, transaction_date in rows]
+            )
+        read_cursor.close()
+    
+    def _backfill_next_due(self):
+        """Считает дату следующего платежа для регулярных платежей, созданных до появления колонки"""
+        self.cursor.execute("SELECT id, rule, payment_day, anchor_date, last_processed FROM recurring_payments")
+        updates = []
+        for payment_id, rule, payment_day, anchor_date, last_processed in self.cursor.fetchall():
+            next_due = self._first_due(self.recurrence_rule(rule, payment_day, anchor_date), last_processed)
+            updates.append((next_due.strftime("%Y-%m-%d"), payment_id))
+        self.cursor.executemany("UPDATE recurring_payments SET next_due = ? WHERE id = ?", updates)
+    
+    def setup_search_index(self):
+        """
+        Создает полнотекстовый индекс FTS5 по описанию и категории операций.
+        Индекс синхронизируется триггерами, поэтому в него автоматически попадают
+        все операции - ручные, автоплатежи ("Авто: ...") и запланированные платежи.
+        """
+        self.cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'transactions_fts'"
         )
+        index_exists = self.cursor.fetchone() is not None
+        
+        try:
+            self.cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+                description, category,
+                content='transactions', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+            ''')
+        except sqlite3.OperationalError:
+            # SQLite собран без FTS5 - поиск будет работать через LIKE
+            self.fts_enabled = False
+            return
+        
+        self.fts_enabled = True
+        
+        self.cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN
+            INSERT INTO transactions_fts (rowid, description, category)
+            VALUES (new.id, new.description, new.category);
+        END
+        ''')
+        self.cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description, category)
+            VALUES ('delete', old.id, old.description, old.category);
+        END
+        ''')
+        self.cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_update AFTER UPDATE OF description, category ON transactions BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description, category)
+            VALUES ('delete', old.id, old.description, old.category);
+            INSERT INTO transactions_fts (rowid, description, category)
+            VALUES (new.id, new.description, new.category);
+        END
         ''')
         
-        # Создаем таблицу операций
+        # Индекс только что создан для существующей базы - заполняем его
+        if not index_exists:
+            self.cursor.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+    
+    def setup_daily_totals(self):
+        """
+        Суммы операций по дням, счетам и типам для графиков. Таблица поддерживается триггерами,
+        поэтому график за десять лет читает несколько тысяч готовых строк, а не весь журнал.
+        """
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'daily_totals'")
+        table_exists = self.cursor.fetchone() is not None
+        
         self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY,
+        CREATE TABLE IF NOT EXISTS daily_totals (
+            day TEXT NOT NULL,
             account_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            description TEXT,
-            category TEXT,
-            transaction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             transaction_type TEXT NOT NULL,
-            FOREIGN KEY (account_id) REFERENCES accounts (id)
+            total REAL NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (day, account_id, transaction_type)
+        ) WITHOUT ROWID
+        ''')
+        
+        add_new = '''
+            INSERT INTO daily_totals (day, account_id, transaction_type, total, count)
+            VALUES (substr(new.transaction_date, 1, 10), new.account_id, new.transaction_type, new.amount, 1)
+            ON CONFLICT (day, account_id, transaction_type) DO UPDATE SET total = total + excluded.total, count = count + 1;
+        '''
+        # Опустевший день удаляем, чтобы в нём не копилась погрешность сложения дробных сумм
+        remove_old = '''
+            UPDATE daily_totals SET total = total - old.amount, count = count - 1
+            WHERE day = substr(old.transaction_date, 1, 10) AND account_id = old.account_id
+              AND transaction_type = old.transaction_type;
+            DELETE FROM daily_totals
+            WHERE day = substr(old.transaction_date, 1, 10) AND account_id = old.account_id
+              AND transaction_type = old.transaction_type AND count = 0;
+        '''
+        self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS daily_totals_insert AFTER INSERT ON transactions BEGIN {add_new} END")
+        self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS daily_totals_delete AFTER DELETE ON transactions BEGIN {remove_old} END")
+        self.cursor.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS daily_totals_update
+            AFTER UPDATE OF account_id, amount, transaction_date, transaction_type ON transactions
+            BEGIN {remove_old} {add_new} END"""
         )
+        
+        # Таблица только что создана для существующей базы - заполняем её одним проходом
+        if not table_exists:
+            self.cursor.execute(
+                """INSERT INTO daily_totals (day, account_id, transaction_type, total, count)
+                SELECT substr(transaction_date, 1, 10), account_id, transaction_type, SUM(amount), COUNT(*)
+                FROM transactions GROUP BY 1, 2, 3"""
+            )
+    
+    def setup_dashboard_months(self):
+        """
+        Версии месяцев для повторной выгрузки дашборда: триггеры увеличивают версию месяца при любом
+        изменении его операций или их строк, и выгрузка пересчитывает только месяцы с новой версией.
+        """
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'dashboard_months'")
+        table_exists = self.cursor.fetchone() is not None
+        
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_months (
+            month TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
         ''')
         
-        # Создаем таблицу для регулярных платежей
+        def bump(month_sql):
+            return f'''
+                INSERT INTO dashboard_months (month, version) {month_sql}
+                ON CONFLICT (month) DO UPDATE SET version = version + 1;
+            '''
+        
+        bump_new = bump("VALUES (substr(new.transaction_date, 1, 7), 1)")
+        bump_old = bump("VALUES (substr(old.transaction_date, 1, 7), 1)")
+        self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS dashboard_months_insert AFTER INSERT ON transactions BEGIN {bump_new} END")
+        self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS dashboard_months_delete AFTER DELETE ON transactions BEGIN {bump_old} END")
+        self.cursor.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS dashboard_months_update
+            AFTER UPDATE OF account_id, amount, category, transaction_date, transaction_type, is_split ON transactions
+            BEGIN {bump_old} {bump_new} END"""
+        )
+        # Строки разделённой операции относятся к месяцу самой операции (если она ещё существует)
+        for event, row in (("INSERT", "new"), ("DELETE", "old"), ("UPDATE", "new")):
+            month_sql = f"SELECT substr(transaction_date, 1, 7), 1 FROM transactions WHERE id = {row}.transaction_id"
+            self.cursor.execute(
+                f"""CREATE TRIGGER IF NOT EXISTS dashboard_months_split_{event.lower()}
+                AFTER {event} ON transaction_splits BEGIN {bump(month_sql)} END"""
+            )
+        
+        # Таблица только что создана для существующей базы - все месяцы начинают с первой версии
+        # (месяцы берутся из дневных сумм, а не из всего журнала)
+        if not table_exists:
+            self.cursor.execute(
+                """INSERT INTO dashboard_months (month, version)
+                SELECT DISTINCT substr(day, 1, 7), 1 FROM daily_totals"""
+            )
+    
+    def _fold_tag_names(self):
+        """
+        Названия меток хранятся в нижнем регистре (см. _normalize_tags). Метки старых версий,
+        различающиеся только регистром кириллицы, сливаются в одну - с наименьшим id
+        """
+        self.cursor.execute("SELECT id, name FROM tags ORDER BY id")
+        tags = self.cursor.fetchall()
+        if all(name == name.lower() for _, name in tags):
+            return
+        
+        keepers = {}
+        for tag_id, name in tags:
+            key = name.lower()
+            keeper = keepers.setdefault(key, tag_id)
+            if keeper != tag_id:
+                self.cursor.execute(
+                    """INSERT OR IGNORE INTO transaction_tags (tag_id, transaction_id)
+                    SELECT ?, transaction_id FROM transaction_tags WHERE tag_id = ?""",
+                    (keeper, tag_id)
+                )
+                self.cursor.execute("DELETE FROM transaction_tags WHERE tag_id = ?", (tag_id,))
+                self.cursor.execute("DELETE FROM tags WHERE id = ?", (tag_id,))
+        for tag_id, name in tags:
+            if keepers[name.lower()] == tag_id and name != name.lower():
+                self.cursor.execute("UPDATE tags SET name = ? WHERE id = ?", (name.lower(), tag_id))
+        # Образы в журнале отмены вернули бы слитые метки
+        self._forget_undo_entries("1")
+        self.conn.commit()
+    
+    def setup_sync(self):
+        """
+        Таблицы и триггеры синхронизации. Каждая строка журнала получает в sync_rows UUID и версию
+        (часы Лэмпорта устройства), а каждое изменение - номер seq: дельта для другого устройства -
+        это строки с seq больше выгруженного ему в прошлый раз, без просмотра всего журнала.
+        Удалённые строки остаются в sync_rows отметками deleted, чтобы удаление тоже доехало.
+        """
+        # Начальный остаток счёта: баланс выводится из него и операций, поэтому синхронизируется он, а не баланс
+        if self._add_column_if_missing("accounts", "opening_balance", "REAL NOT NULL DEFAULT 0"):
+            self.cursor.execute(
+                """UPDATE accounts SET opening_balance = balance
+                    - COALESCE((SELECT SUM(amount) FROM transactions WHERE account_id = accounts.id), 0)
+                    + COALESCE((SELECT SUM(amount) FROM transfers WHERE from_account_id = accounts.id), 0)
+                    - COALESCE((SELECT SUM(COALESCE(to_amount, amount)) FROM transfers WHERE to_account_id = accounts.id), 0)"""
+            )
+        
         self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS recurring_payments (
-            id INTEGER PRIMARY KEY,
-            account_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            description TEXT NOT NULL,
-            category TEXT,
-            payment_day INTEGER NOT NULL,
-            active INTEGER DEFAULT 1,
-            last_processed DATE,
-            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        CREATE TABLE IF NOT EXISTS sync_state (
+            device_id TEXT NOT NULL,
+            clock INTEGER NOT NULL DEFAULT 1,
+            applying INTEGER NOT NULL DEFAULT 0,
+            capture INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_rows (
+            uuid TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            row_id INTEGER,
+            version INTEGER NOT NULL,
+            device_id TEXT NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            seq INTEGER NOT NULL
+        )
+        ''')
+        self.cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_sync_rows_row ON sync_rows (table_name, row_id)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_sync_rows_seq ON sync_rows (seq)")
+        # Чужие изменения, ссылающиеся на строки, которых здесь ещё нет: применяются при следующих обменах
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_pending (
+            uuid TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            device_id TEXT NOT NULL,
+            change TEXT NOT NULL
+        )
+        ''')
+        # Устройства, с которыми обменивались изменениями: до какого seq им уже выгружено
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_peers (
+            device_id TEXT PRIMARY KEY,
+            sent_seq INTEGER NOT NULL DEFAULT -1,
+            received_at TIMESTAMP
+        )
+        ''')
+        
+        # Журнал изменений ведётся только после первого обмена с другим устройством:
+        # до этого триггеры не нужны и не замедляют запись (см. _enable_sync_capture)
+        capture_added = self._add_column_if_missing("sync_state", "capture", "INTEGER NOT NULL DEFAULT 0")
+        self.cursor.execute("SELECT capture FROM sync_state")
+        state = self.cursor.fetchone()
+        if not state:
+            self.cursor.execute("INSERT INTO sync_state (device_id) VALUES (lower(hex(randomblob(16))))")
+            return
+        if capture_added:
+            # База прошлой версии вела журнал всегда; без обменов он никому не нужен и строится заново при первом
+            self.cursor.execute("SELECT 1 FROM sync_peers LIMIT 1")
+            if self.cursor.fetchone():
+                self.cursor.execute("UPDATE sync_state SET capture = 1")
+                state = (1,)
+            else:
+                for table in self.SYNC_TABLES:
+                    for event in ("insert", "update", "delete"):
+                        self.cursor.execute(f"DROP TRIGGER IF EXISTS sync_{table}_{event}")
+                self.cursor.execute("DELETE FROM sync_rows")
+        if state[0]:
+            self._create_sync_triggers()
+    
+    def _enable_sync_capture(self):
+        """
+        Включает журнал изменений перед первым обменом: строки, созданные до этого, получают
+        UUID из неизменных признаков (у копий одного файла они совпадут) и версию 0
+        """
+        self.cursor.execute("SELECT capture FROM sync_state")
+        if self.cursor.fetchone()[0]:
+            return
+        self._backfill_sync_rows()
+        self._create_sync_triggers()
+        self.cursor.execute("UPDATE sync_state SET capture = 1")
+        self.conn.commit()
+    
+    def _create_sync_triggers(self):
+        """Триггеры, записывающие в sync_rows каждое локальное изменение таблиц журнала"""
+        stamp = ("version = (SELECT clock FROM sync_state), device_id = (SELECT device_id FROM sync_state), "
+                 "seq = (SELECT MAX(seq) FROM sync_rows) + 1")
+        new_entry = ("SELECT {uuid}, '{table}', {row_id}, clock, device_id, 0, COALESCE((SELECT MAX(seq) FROM sync_rows), 0) + 1 "
+                     "FROM sync_state WHERE NOT EXISTS (SELECT 1 FROM sync_rows WHERE {match})")
+        local = "WHEN (SELECT applying FROM sync_state) = 0"
+        for table in self.SYNC_TABLES:
+            if table in self.KEYLESS_TABLES:
+                # UUID связи составлен из UUID её концов: одна и та же связь на разных устройствах совпадёт
+                link = " || '/' || ".join(
+                    f"(SELECT uuid FROM sync_rows WHERE table_name = '{self.SYNC_REFERENCES[table][column]}' AND row_id = {{row}}.{column})"
+                    for column in self.KEYLESS_TABLES[table]
+                )
+                new_link, old_link = link.format(row="NEW"), link.format(row="OLD")
+                self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS sync_{table}_insert AFTER INSERT ON {table} {local} BEGIN
+                    UPDATE sync_rows SET deleted = 0, {stamp} WHERE uuid = {new_link};
+                    INSERT INTO sync_rows (uuid, table_name, row_id, version, device_id, deleted, seq)
+                    {new_entry.format(uuid=new_link, table=table, row_id="NULL", match=f"uuid = {new_link}")}
+                        AND {new_link} IS NOT NULL;
+                END
+                ''')
+                self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS sync_{table}_delete AFTER DELETE ON {table} {local} BEGIN
+                    UPDATE sync_rows SET deleted = 1, {stamp} WHERE uuid = {old_link};
+                END
+                ''')
+                continue
+            
+            # Вставка на место удалённой строки (например, при отмене удаления) возвращает ей прежний UUID
+            row = f"table_name = '{table}' AND row_id = NEW.id"
+            self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS sync_{table}_insert AFTER INSERT ON {table} {local} BEGIN
+                UPDATE sync_rows SET deleted = 0, {stamp} WHERE {row};
+                INSERT INTO sync_rows (uuid, table_name, row_id, version, device_id, deleted, seq)
+                {new_entry.format(uuid="lower(hex(randomblob(16)))", table=table, row_id="NEW.id", match=row)};
+            END
+            ''')
+            columns = ", ".join(column for column in self._table_columns(table) if (table, column) != ("accounts", "balance"))
+            self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS sync_{table}_update AFTER UPDATE OF {columns} ON {table} {local} BEGIN
+                UPDATE sync_rows SET {stamp} WHERE {row};
+            END
+            ''')
+            self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS sync_{table}_delete AFTER DELETE ON {table} {local} BEGIN
+                UPDATE sync_rows SET deleted = 1, {stamp} WHERE table_name = '{table}' AND row_id = OLD.id;
+            END
+            ''')
+    
+    def _backfill_sync_rows(self):
+        """
+        UUID для строк, созданных до появления синхронизации (версия 0, без устройства). Они составлены
+        из таблицы, ID и неизменного признака строки; «/» в них не встречается - это разделитель в UUID связей.
+        """
+        for table in self.SYNC_TABLES:
+            if table in self.KEYLESS_TABLES:
+                tag_column, transaction_column = self.KEYLESS_TABLES[table]
+                self.cursor.execute(
+                    f"""INSERT INTO sync_rows (uuid, table_name, row_id, version, device_id, seq)
+                    SELECT a.uuid || '/' || b.uuid, '{table}', NULL, 0, '', 0 FROM {table} l
+                    JOIN sync_rows a ON a.table_name = 'tags' AND a.row_id = l.{tag_column}
+                    JOIN sync_rows b ON b.table_name = 'transactions' AND b.row_id = l.{transaction_column}"""
+                )
+                continue
+            self.cursor.execute(
+                f"""INSERT INTO sync_rows (uuid, table_name, row_id, version, device_id, seq)
+                SELECT '{table}:' || id || ':' || replace(COALESCE({self.SYNC_LEGACY_IDENTITY[table]}, ''), '/', '_'), '{table}', id, 0, '', 0
+                FROM {table}"""
+            )
+    
+    def close(self):
+        self.stop_metrics_server()
+        if self.pool is not None:
+            self.release()
+        elif self.is_connected():
+            self.disable_profiling()
+            self.conn.close()
+    
+    # Обслуживание базы: резервная копия, сжатие и архив старых операций
+    def backup(self, dest_path, pages=256, sleep=0.005, progress=None):
+        """
+        Онлайн-копия через backup API SQLite. Копирование идёт порциями по pages страниц
+        через отдельное соединение, так что между порциями база доступна приложению.
+        """
+        try:
+            if self.db_path == ":memory:":
+                source = self.conn
+            else:
+                source = sqlite3.connect(self.db_path)
+            dest = sqlite3.connect(dest_path)
+            try:
+                source.backup(dest, pages=pages, sleep=sleep, progress=progress)
+            finally:
+                dest.close()
+                if source is not self.conn:
+                    source.close()
+            return True, f"Резервная копия сохранена: {dest_path}"
+        except Exception as e:
+            return False, str(e)
+    
+    def compact(self, max_pages=None):
+        """
+        Возвращает свободные страницы файлу (incremental_vacuum, не больше max_pages за раз)
+        и обновляет статистику планировщика. База, созданная без auto_vacuum=INCREMENTAL,
+        переводится в этот режим однократным полным VACUUM.
+        """
+        try:
+            self.conn.commit()
+            freelist_before = self.cursor.execute("PRAGMA freelist_count").fetchone()[0]
+            
+            if self.cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                self.cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                self.cursor.execute("VACUUM")
+            else:
+                # executescript прогоняет прагму до конца; execute освободил бы только одну страницу
+                self.conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages or 0)})")
+            
+            self.cursor.execute("ANALYZE")
+            self.conn.commit()
+            freelist_after = self.cursor.execute("PRAGMA freelist_count").fetchone()[0]
+            return True, f"Освобождено страниц: {freelist_before - freelist_after}, статистика обновлена"
+        except Exception as e:
+            return False, str(e)
+    
+    def get_archive_path(self, year):
+        base, _ = os.path.splitext(os.path.abspath(self.db_path))
+        return f"{base}_archive_{year}.db"
+    
+    def archive_transactions(self, years=3):
+        """
+        Переносит операции старше years полных лет в годовые архивные базы рядом с основной
+        (finance_archive_2020.db и т.д.). Вместо них остаются сводные строки - по одной на счёт,
+        месяц, тип и категорию - так что отчёты по месяцам и категориям не меняются, а балансы
+        счетов хранятся отдельно и не затрагиваются. Повторный запуск переносит только новые старые операции.
+        """
+        if self.db_path == ":memory:":
+            return False, "Архивация недоступна для базы в памяти"
+        
+        cutoff = f"{date.today().year - years}-01-01"
+        columns = [row[1] for row in self.cursor.execute("PRAGMA table_info(transactions)").fetchall()]
+        column_list = ", ".join(columns)
+        
+        self.cursor.execute(
+            """SELECT DISTINCT substr(transaction_date, 1, 4) FROM transactions
+            WHERE transaction_date < ? AND is_rollup = 0 ORDER BY 1""",
+            (cutoff,)
+        )
+        archive_years = [row[0] for row in self.cursor.fetchall()]
+        if not archive_years:
+            return True, "Нет операций для архивации"
+        
+        archived = 0
+        rollups = 0
+        for year in archive_years:
+            start, end = f"{year}-01-01", f"{int(year) + 1}-01-01"
+            self.conn.commit()  # ATTACH нельзя выполнять внутри транзакции
+            self.cursor.execute("ATTACH DATABASE ? AS archive", (self.get_archive_path(year),))
+            try:
+                self.cursor.execute(
+                    "CREATE TABLE IF NOT EXISTS archive.transactions (id INTEGER PRIMARY KEY, "
+                    + ", ".join(column for column in columns if column != "id") + ")"
+                )
+                self.cursor.execute(
+                    "CREATE TABLE IF NOT EXISTS archive.accounts (id INTEGER PRIMARY KEY, name TEXT, type TEXT, currency TEXT)"
+                )
+                self.cursor.execute(
+                    "INSERT OR REPLACE INTO archive.accounts SELECT id, name, type, currency FROM main.accounts"
+                )
+                self.cursor.execute(
+                    """CREATE TABLE IF NOT EXISTS archive.transaction_splits
+                    (id INTEGER PRIMARY KEY, transaction_id INTEGER, amount REAL, category TEXT, description TEXT)"""
+                )
+                
+                period = "transaction_date >= ? AND transaction_date < ? AND is_rollup = 0"
+                archived_ids = f"SELECT id FROM main.transactions WHERE {period}"
+                self.cursor.execute(
+                    f"INSERT OR IGNORE INTO archive.transactions ({column_list}) SELECT {column_list} FROM main.transactions WHERE {period}",
+                    (start, end)
+                )
+                archived += self.cursor.rowcount
+                self.cursor.execute(
+                    f"""INSERT OR IGNORE INTO archive.transaction_splits
+                    SELECT * FROM main.transaction_splits WHERE transaction_id IN ({archived_ids})""",
+                    (start, end)
+                )
+                # Метки уезжают в архив вместе с операциями; сводные строки меток не несут
+                self.cursor.execute("CREATE TABLE IF NOT EXISTS archive.tags (id INTEGER PRIMARY KEY, name TEXT)")
+                self.cursor.execute("INSERT OR REPLACE INTO archive.tags SELECT id, name FROM main.tags")
+                self.cursor.execute(
+                    """CREATE TABLE IF NOT EXISTS archive.transaction_tags
+                    (tag_id INTEGER, transaction_id INTEGER, PRIMARY KEY (tag_id, transaction_id)) WITHOUT ROWID"""
+                )
+                self.cursor.execute(
+                    f"""INSERT OR IGNORE INTO archive.transaction_tags
+                    SELECT tag_id, transaction_id FROM main.transaction_tags WHERE transaction_id IN ({archived_ids})""",
+                    (start, end)
+                )
+                
+                # Разделённые операции попадают в сводку по категориям своих строк
+                self.cursor.execute(
+                    f"""INSERT INTO main.transactions (account_id, amount, description, category, transaction_date, transaction_type, is_rollup)
+                    SELECT t.account_id, SUM({self.LINE_AMOUNT_SQL}),
+                        'Архив: ' || COUNT(DISTINCT t.id) || ' операций за ' || substr(t.transaction_date, 1, 7),
+                        {self.LINE_CATEGORY_SQL} AS line_category, substr(t.transaction_date, 1, 7) || '-01 00:00:00',
+                        t.transaction_type, 1
+                    FROM main.transactions t {self.SPLIT_LINES_JOIN}
+                    WHERE t.transaction_date >= ? AND t.transaction_date < ? AND t.is_rollup = 0
+                    GROUP BY t.account_id, substr(t.transaction_date, 1, 7), t.transaction_type, line_category""",
+                    (start, end)
+                )
+                rollups += self.cursor.rowcount
+                
+                self.cursor.execute(
+                    f"DELETE FROM main.transaction_splits WHERE transaction_id IN ({archived_ids})", (start, end)
+                )
+                self.cursor.execute(
+                    f"DELETE FROM main.transaction_tags WHERE transaction_id IN ({archived_ids})", (start, end)
+                )
+                self.cursor.execute(f"DELETE FROM main.transactions WHERE {period}", (start, end))
+                self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                return False, f"Архивация {year} года прервана: {e}"
+            finally:
+                self.cursor.execute("DETACH DATABASE archive")
+        
+        # Образы в журнале отмены ссылаются на перенесённые строки - отмена вернула бы их в основную базу
+        self.clear_undo_history()
+        self.typeahead = None  # Операции заменены сводными строками с новыми id
+        return True, f"В архив перенесено операций: {archived}, сводных строк: {rollups} (годы: {', '.join(archive_years)})"
+    
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Выполняет операции блока одной транзакцией БД: коммиты методов внутри откладываются
+        до выхода из блока, при исключении откатываются все изменения блока.
+        """
+        conn = self.conn
+        if conn.commits_deferred:
+            yield  # Вложенный блок - часть внешнего
+            return
+        
+        conn.commits_deferred = True
+        try:
+            yield
+        except BaseException:
+            conn.commits_deferred = False
+            conn.rollback()
+            # Кэши могли запомнить откаченные изменения
+            self.category_matcher = None
+            self.typeahead = None
+            self.__dict__.pop("report_currency", None)
+            raise
+        conn.commits_deferred = False
+        conn.commit()
+    
+    @contextlib.contextmanager
+    def savepoint(self):
+        """
+        Шаг метода, откатываемый отдельно: при исключении отменяются только изменения блока,
+        а сделанное раньше во внешней транзакции (batch, действие отмены) сохраняется
+        """
+        own_transaction = not self.conn.in_transaction
+        if own_transaction:
+            self.cursor.execute("BEGIN")  # Иначе RELEASE внешней точки сам зафиксировал бы транзакцию
+        self.cursor.execute("SAVEPOINT tracker_step")
+        try:
+            yield
+        except BaseException:
+            if own_transaction:
+                self.conn.rollback()
+            else:
+                self.cursor.execute("ROLLBACK TO tracker_step")
+                self.cursor.execute("RELEASE tracker_step")
+            raise
+        self.cursor.execute("RELEASE tracker_step")
+    
+    # Метрики для работы трекера как долгоживущего сервиса
+    def _setup_undo_triggers(self):
+        """
+        Создаёт временные (на время соединения) таблицы и триггеры журнала отмены.
+        Триггеры записывают изменения, только пока открыто действие (в undo_state есть строка).
+        """
+        self.cursor.execute("SELECT 1 FROM sqlite_temp_master WHERE name = 'undo_state'")
+        if self.cursor.fetchone():
+            return
+        
+        self.cursor.execute("CREATE TEMP TABLE undo_state (entry_id INTEGER)")
+        self.cursor.execute(
+            "CREATE TEMP TABLE undo_inserted (table_name TEXT, row_id INTEGER, PRIMARY KEY (table_name, row_id)) WITHOUT ROWID"
         )
+        self.cursor.execute("CREATE TEMP TABLE undo_balances (account_id INTEGER, delta REAL)")
+        
+        entry = "(SELECT entry_id FROM undo_state)"
+        for table in self.UNDO_TABLES:
+            columns = self._table_columns(table)
+            old_image = self._undo_image_sql(table, "OLD.")
+            if table in self.KEYLESS_TABLES:
+                # Таблица без rowid: добавленные и удалённые строки хранятся образами
+                self.cursor.execute(f'''
+                CREATE TEMP TRIGGER undo_{table}_insert AFTER INSERT ON main.{table}
+                WHEN {entry} IS NOT NULL BEGIN
+                    INSERT INTO undo_rows (entry_id, table_name, kind, image)
+                    VALUES ({entry}, '{table}', 'added', {self._undo_image_sql(table, "NEW.")});
+                END
+                ''')
+                added = f"entry_id = {entry} AND table_name = '{table}' AND kind = 'added' AND image = {old_image}"
+                self.cursor.execute(f'''
+                CREATE TEMP TRIGGER undo_{table}_delete BEFORE DELETE ON main.{table}
+                WHEN {entry} IS NOT NULL BEGIN
+                    INSERT INTO undo_rows (entry_id, table_name, kind, image)
+                    SELECT {entry}, '{table}', 'deleted', {old_image}
+                    WHERE NOT EXISTS (SELECT 1 FROM undo_rows WHERE {added});
+                    DELETE FROM undo_rows WHERE {added};
+                END
+                ''')
+                continue
+            
+            inserted_here = f"EXISTS (SELECT 1 FROM undo_inserted WHERE table_name = '{table}' AND row_id = OLD.id)"
+            has_image = f"EXISTS (SELECT 1 FROM undo_rows WHERE entry_id = {entry} AND table_name = '{table}' AND kind = '%s' AND row_id = OLD.id)"
+            self.cursor.execute(f'''
+            CREATE TEMP TRIGGER undo_{table}_insert AFTER INSERT ON main.{table}
+            WHEN {entry} IS NOT NULL BEGIN
+                INSERT OR IGNORE INTO undo_inserted VALUES ('{table}', NEW.id);
+            END
+            ''')
+            # Образ до изменения запоминается один раз за действие; баланс счёта учитывается отдельно приращением
+            updated = ", ".join(column for column in columns if (table, column) != ("accounts", "balance"))
+            self.cursor.execute(f'''
+            CREATE TEMP TRIGGER undo_{table}_update BEFORE UPDATE OF {updated} ON main.{table}
+            WHEN {entry} IS NOT NULL AND NOT {inserted_here} AND NOT {has_image % "before"} BEGIN
+                INSERT INTO undo_rows (entry_id, table_name, kind, row_id, image)
+                VALUES ({entry}, '{table}', 'before', OLD.id, {old_image});
+            END
+            ''')
+            # Удалённая строка, изменённая раньше в том же действии, восстанавливается в исходном виде
+            keep_balance = ", image = json_set(image, '$.balance', OLD.balance)" if table == "accounts" else ""
+            self.cursor.execute(f'''
+            CREATE TEMP TRIGGER undo_{table}_delete BEFORE DELETE ON main.{table}
+            WHEN {entry} IS NOT NULL BEGIN
+                UPDATE undo_rows SET kind = 'deleted'{keep_balance}
+                WHERE entry_id = {entry} AND table_name = '{table}' AND kind = 'before' AND row_id = OLD.id;
+                INSERT INTO undo_rows (entry_id, table_name, kind, row_id, image)
+                SELECT {entry}, '{table}', 'deleted', OLD.id, {old_image}
+                WHERE NOT {inserted_here} AND NOT {has_image % "deleted"};
+                DELETE FROM undo_inserted WHERE table_name = '{table}' AND row_id = OLD.id;
+            END
+            ''')
+        
+        self.cursor.execute(f'''
+        CREATE TEMP TRIGGER undo_accounts_balance AFTER UPDATE OF balance ON main.accounts
+        WHEN {entry} IS NOT NULL AND NEW.balance IS NOT OLD.balance
+            AND NOT EXISTS (SELECT 1 FROM undo_inserted WHERE table_name = 'accounts' AND row_id = NEW.id) BEGIN
+            INSERT INTO undo_balances VALUES (NEW.id, NEW.balance - OLD.balance);
+        END
         ''')
+    
+    def _table_columns(self, table):
+        """Колонки таблицы (по схеме базы, один раз за время жизни трекера)"""
+        if "_columns" not in self.__dict__:
+            self._columns = {}
+        if table not in self._columns:
+            self.cursor.execute(f"PRAGMA table_info({table})")
+            self._columns[table] = [row[1] for row in self.cursor.fetchall()]
+        return self._columns[table]
+    
+    def _undo_image_sql(self, table, prefix):
+        """Выражение json_object с образом строки (prefix - OLD., NEW. или псевдоним таблицы)"""
+        return "json_object(" + ", ".join(f"'{column}', {prefix}{column}" for column in self._table_columns(table)) + ")"
+    
+    @contextlib.contextmanager
+    def undo_action(self, action):
+        """
+        Записывает изменения блока в журнал отмены как одно действие, в одной транзакции с ними.
+        Вложенные действия (например, перевод внутри регулярного платежа) входят во внешнее.
+        """
+        self._setup_undo_triggers()
+        self.cursor.execute("SELECT entry_id FROM undo_state")
+        if self.cursor.fetchone():
+            yield
+            return
+        
+        with self.batch():
+            self.cursor.execute("INSERT INTO undo_log (action) VALUES (?)", (action,))
+            entry_id = self.cursor.lastrowid
+            self.cursor.execute("INSERT INTO undo_state VALUES (?)", (entry_id,))
+            try:
+                yield
+            finally:
+                self.cursor.execute("DELETE FROM undo_state")
+            self._finish_undo_action(entry_id)
+    
+    def _finish_undo_action(self, entry_id):
+        """Сворачивает записанное триггерами в компактную запись журнала и ограничивает его размер"""
+        # Добавленные строки сжимаются в диапазоны подряд идущих id: импорт отменяется одним DELETE
+        self.cursor.execute(
+            """SELECT table_name, MIN(row_id), MAX(row_id) FROM (
+                SELECT table_name, row_id, row_id - ROW_NUMBER() OVER (PARTITION BY table_name ORDER BY row_id) AS island
+                FROM undo_inserted
+            ) GROUP BY table_name, island ORDER BY table_name, MIN(row_id)"""
+        )
+        inserted = {}
+        for table, first_id, last_id in self.cursor.fetchall():
+            inserted.setdefault(table, []).append([first_id, last_id])
+        
+        self.cursor.execute("SELECT account_id, SUM(delta) FROM undo_balances GROUP BY account_id")
+        balances = {str(account_id): delta for account_id, delta in self.cursor.fetchall() if abs(delta) > 1e-9}
+        self.cursor.execute("DELETE FROM undo_inserted")
+        self.cursor.execute("DELETE FROM undo_balances")
+        
+        self.cursor.execute("SELECT 1 FROM undo_rows WHERE entry_id = ? LIMIT 1", (entry_id,))
+        if not inserted and not balances and not self.cursor.fetchone():
+            # Действие ничего не изменило (например, завершилось ошибкой проверки)
+            self.cursor.execute("DELETE FROM undo_log WHERE id = ?", (entry_id,))
+            return
+        
+        self.cursor.execute(
+            "UPDATE undo_log SET inserted = ?, balances = ? WHERE id = ?",
+            (json.dumps(inserted) if inserted else None, json.dumps(balances) if balances else None, entry_id)
+        )
+        # Новое действие обрывает цепочку повторов, самые старые действия сверх лимита забываются
+        self._forget_undo_entries("undone = 1")
+        self.cursor.execute("SELECT id FROM undo_log ORDER BY id DESC LIMIT 1 OFFSET ?", (self.UNDO_HISTORY_LIMIT,))
+        oldest = self.cursor.fetchone()
+        if oldest:
+            self._forget_undo_entries("id <= ?", oldest)
+    
+    def _forget_undo_entries(self, condition, params=()):
+        self.cursor.execute(f"DELETE FROM undo_rows WHERE entry_id IN (SELECT id FROM undo_log WHERE {condition})", params)
+        self.cursor.execute(f"DELETE FROM undo_log WHERE {condition}", params)
+    
+    def get_undo_history(self, limit=20):
+        """Последние действия журнала: (id, название, время, отменено)"""
+        self.cursor.execute("SELECT id, action, created_at, undone FROM undo_log ORDER BY id DESC LIMIT ?", (limit,))
+        return self.cursor.fetchall()
+    
+    def clear_undo_history(self):
+        try:
+            self._forget_undo_entries("1")
+            self.conn.commit()
+            return True, "История действий очищена"
+        except Exception as e:
+            return False, str(e)
+    
+    def undo(self):
+        """Отменяет последнее действие журнала одной транзакцией"""
+        self.cursor.execute("SELECT id, action, inserted, balances FROM undo_log WHERE undone = 0 ORDER BY id DESC LIMIT 1")
+        entry = self.cursor.fetchone()
+        if not entry:
+            return False, "Нет действий для отмены"
+        try:
+            with self.batch():
+                self._apply_undo_entry(entry, undo=True)
+            return True, f"Отменено: {entry[1]}"
+        except Exception as e:
+            return False, f"Не удалось отменить «{entry[1]}»: {e}"
+    
+    def redo(self):
+        """Повторяет последнее отменённое действие (пока после отмены не было новых изменений)"""
+        self.cursor.execute("SELECT id, action, inserted, balances FROM undo_log WHERE undone = 1 ORDER BY id LIMIT 1")
+        entry = self.cursor.fetchone()
+        if not entry:
+            return False, "Нет отменённых действий"
+        try:
+            with self.batch():
+                self._apply_undo_entry(entry, undo=False)
+            return True, f"Повторено: {entry[1]}"
+        except Exception as e:
+            return False, f"Не удалось повторить «{entry[1]}»: {e}"
+    
+    def _apply_undo_entry(self, entry, undo):
+        """
+        Применяет обратные (undo=True) или прямые изменения действия. Все шаги - запросы над множествами:
+        добавленные строки удаляются по диапазонам id, удалённые и изменённые восстанавливаются из образов.
+        """
+        entry_id, _, inserted, balances = entry
+        inserted = json.loads(inserted) if inserted else {}
+        
+        for table in self.UNDO_TABLES:
+            columns = self._table_columns(table)
+            column_list = ", ".join(columns)
+            restored = ", ".join(f"json_extract(image, '$.{column}')" for column in columns)
+            images = f"FROM undo_rows WHERE entry_id = {entry_id} AND table_name = '{table}' AND kind = "
+            
+            if table in self.KEYLESS_TABLES:
+                key = ", ".join(self.KEYLESS_TABLES[table])
+                key_images = ", ".join(f"json_extract(image, '$.{column}')" for column in self.KEYLESS_TABLES[table])
+                remove, add = ("added", "deleted") if undo else ("deleted", "added")
+                self.cursor.execute(f"DELETE FROM {table} WHERE ({key}) IN (SELECT {key_images} {images} '{remove}')")
+                self.cursor.execute(f"INSERT INTO {table} ({column_list}) SELECT {restored} {images} '{add}'")
+                continue
+            
+            ranges = inserted.get(table, [])
+            updated = [column for column in columns if column != "id" and (table, column) != ("accounts", "balance")]
+            apply_images = "UPDATE {table} SET {assignments} FROM undo_rows u WHERE u.entry_id = {entry_id} " \
+                           "AND u.table_name = '{table}' AND u.kind = '{kind}' AND u.row_id = {table}.id"
+            assignments = ", ".join(f"{column} = json_extract(u.image, '$.{column}')" for column in updated)
+            
+            if undo:
+                # Снимок добавленных строк нужен для повтора
+                self.cursor.executemany(
+                    f"""INSERT INTO undo_rows (entry_id, table_name, kind, row_id, image)
+                    SELECT {entry_id}, '{table}', 'inserted', id, {self._undo_image_sql(table, table + ".")}
+                    FROM {table} WHERE id BETWEEN ? AND ?""",
+                    ranges
+                )
+                self.cursor.executemany(f"DELETE FROM {table} WHERE id BETWEEN ? AND ?", ranges)
+                self.cursor.execute(f"INSERT INTO {table} ({column_list}) SELECT {restored} {images} 'deleted'")
+                self.cursor.execute(
+                    f"""INSERT INTO undo_rows (entry_id, table_name, kind, row_id, image)
+                    SELECT {entry_id}, '{table}', 'after', t.id, {self._undo_image_sql(table, "t.")}
+                    FROM {table} t JOIN undo_rows u ON u.row_id = t.id
+                    WHERE u.entry_id = {entry_id} AND u.table_name = '{table}' AND u.kind = 'before'"""
+                )
+                if updated:
+                    self.cursor.execute(apply_images.format(table=table, assignments=assignments, entry_id=entry_id, kind="before"))
+            else:
+                self.cursor.execute(f"DELETE FROM {table} WHERE id IN (SELECT row_id {images} 'deleted')")
+                self.cursor.execute(f"INSERT INTO {table} ({column_list}) SELECT {restored} {images} 'inserted'")
+                if updated:
+                    self.cursor.execute(apply_images.format(table=table, assignments=assignments, entry_id=entry_id, kind="after"))
+                self.cursor.execute(f"DELETE {images} 'inserted'")
+                self.cursor.execute(f"DELETE {images} 'after'")
+        
+        sign = -1 if undo else 1
+        self.cursor.executemany(
+            "UPDATE accounts SET balance = balance + ? WHERE id = ?",
+            [(sign * delta, int(account_id)) for account_id, delta in json.loads(balances or "{}").items()]
+        )
+        self.cursor.execute("UPDATE undo_log SET undone = ? WHERE id = ?", (1 if undo else 0, entry_id))
+        self._recount_budgets()
+        self.category_matcher = None
+        self.typeahead = None
+    
+    # Синхронизация между устройствами через файлы изменений
+    def get_sync_device(self):
+        """ID этого устройства и текущая версия (часы Лэмпорта)"""
+        self.cursor.execute("SELECT device_id, clock FROM sync_state")
+        return self.cursor.fetchone()
+    
+    def get_sync_peers(self):
+        """Устройства, с которыми был обмен: (ID, последний выгруженный seq, время последнего приёма)"""
+        self.cursor.execute("SELECT device_id, sent_seq, received_at FROM sync_peers ORDER BY received_at DESC")
+        return self.cursor.fetchall()
+    
+    def reset_sync_device(self):
+        """Новый ID устройства - для копии файла базы, перенесённой на другой компьютер"""
+        try:
+            self.cursor.execute("UPDATE sync_state SET device_id = lower(hex(randomblob(16)))")
+            self.cursor.execute("DELETE FROM sync_peers")
+            self.conn.commit()
+            return True, f"Новый ID устройства: {self.get_sync_device()[0]}"
+        except Exception as e:
+            return False, str(e)
+    
+    def _sync_uuids(self, table, row_ids, cache):
+        """UUID строк таблицы по локальным ID (с кэшем на время выгрузки)"""
+        missing = [row_id for row_id in row_ids if row_id is not None and (table, row_id) not in cache]
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            self.cursor.execute(
+                f"SELECT row_id, uuid FROM sync_rows WHERE table_name = ? AND row_id IN ({', '.join('?' * len(chunk))})",
+                [table] + chunk
+            )
+            for row_id, uuid in self.cursor.fetchall():
+                cache[(table, row_id)] = uuid
+        return [cache.get((table, row_id)) for row_id in row_ids]
+    
+    def export_changes(self, path, peer=None, full=False):
+        """
+        Выгружает в файл изменения для устройства peer: строки, изменённые после прошлой выгрузки ему
+        (стоимость зависит от числа изменений, а не от размера журнала). Неизвестному устройству
+        и при full=True (например, если прошлый файл потерялся) выгружается весь журнал.
+        Формат - JSON Lines: заголовок и по строке на изменение, ссылки на счета, операции и метки
+        записаны UUID, а не локальными ID.
+        """
+        device_id, clock = self.get_sync_device()
+        if peer == device_id:
+            return False, "Нельзя выгрузить изменения самому себе"
+        self._enable_sync_capture()
+        
+        since = -1
+        if peer and not full:
+            self.cursor.execute("SELECT sent_seq FROM sync_peers WHERE device_id = ?", (peer,))
+            row = self.cursor.fetchone()
+            since = row[0] if row else -1
+        self.cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM sync_rows")
+        upto = self.cursor.fetchone()[0]
+        
+        # Счета и метки раньше операций, операции раньше их строк и меток: получатель применяет по порядку
+        order = " ".join(f"WHEN '{table}' THEN {i}" for i, table in enumerate(self.SYNC_TABLES))
+        read_cursor = self.conn.cursor()
+        read_cursor.execute(
+            f"""SELECT table_name, uuid, row_id, version, device_id, deleted FROM sync_rows
+            WHERE seq > ? AND seq <= ? AND device_id IS NOT ?
+            ORDER BY CASE table_name {order} END, seq""",
+            (since, upto, peer)
+        )
+        
+        exported = 0
+        cache = {}
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"format": self.SYNC_FORMAT, "device": device_id, "clock": clock}) + "\n")
+                while True:
+                    rows = read_cursor.fetchmany(1000)
+                    if not rows:
+                        break
+                    for table, uuid, row_id, version, change_device, deleted in rows:
+                        change = {"table": table, "uuid": uuid, "version": version, "device": change_device}
+                        if deleted:
+                            change["deleted"] = True
+                        elif table not in self.KEYLESS_TABLES:
+                            change["data"] = self._export_row(table, row_id, cache)
+                        f.write(json.dumps(change, ensure_ascii=False) + "\n")
+                        exported += 1
+        finally:
+            read_cursor.close()
+        
+        # Правки после выгрузки получают версию выше выгруженных
+        self.cursor.execute("UPDATE sync_state SET clock = clock + 1")
+        if peer:
+            self.cursor.execute(
+                """INSERT INTO sync_peers (device_id, sent_seq) VALUES (?, ?)
+                ON CONFLICT (device_id) DO UPDATE SET sent_seq = excluded.sent_seq""",
+                (peer, upto)
+            )
+        self.conn.commit()
+        return True, f"Выгружено изменений: {exported}"
+    
+    def _export_row(self, table, row_id, cache):
+        columns = self._table_columns(table)
+        self.cursor.execute(f"SELECT * FROM {table} WHERE id = ?", (row_id,))
+        data = dict(zip(columns, self.cursor.fetchone()))
+        del data["id"]
+        if table == "accounts":
+            del data["balance"]  # Баланс получатель выводит сам
+        for column, target in self.SYNC_REFERENCES.get(table, {}).items():
+            data[column] = self._sync_uuids(target, [data[column]], cache)[0]
+        return data
+    
+    def import_changes(self, path):
+        """
+        Применяет файл изменений другого устройства одной транзакцией. Конфликт по строке решается
+        детерминированно: остаётся изменение с большей версией, при равной версии - с большим ID устройства,
+        поэтому устройства сходятся к одному состоянию при любом порядке обмена. Балансы пересчитываются
+        только у затронутых счетов - по разнице вкладов изменённых строк.
+        """
+        device_id, clock = self.get_sync_device()
+        applied = skipped = 0
+        balance_deltas = {}
+        try:
+            self._enable_sync_capture()
+            with open(path, encoding="utf-8") as f:
+                header = json.loads(f.readline() or "{}")
+                if header.get("format") != self.SYNC_FORMAT:
+                    return False, "Это не файл изменений трекера"
+                if header["device"] == device_id:
+                    return False, ("Файл выгружен устройством с тем же ID. Если база скопирована с другого компьютера, "
+                                   "назначьте копии новый ID устройства")
+                
+                with self.batch():
+                    self.cursor.execute("UPDATE sync_state SET applying = 1")
+                    max_version = header["clock"]
+                    for line in f:
+                        change = json.loads(line)
+                        max_version = max(max_version, change["version"])
+                        result = self._apply_sync_change(change, balance_deltas)
+                        if result is None:
+                            # Ссылка на строку, которой здесь ещё нет: изменение ждёт и не теряется,
+                            # хотя отправитель уже считает его доставленным
+                            self.cursor.execute(
+                                """INSERT INTO sync_pending (uuid, version, device_id, change) VALUES (?, ?, ?, ?)
+                                ON CONFLICT (uuid) DO UPDATE SET version = excluded.version,
+                                    device_id = excluded.device_id, change = excluded.change
+                                WHERE (excluded.version, excluded.device_id) > (sync_pending.version, sync_pending.device_id)""",
+                                (change["uuid"], change["version"], change["device"], line)
+                            )
+                        elif result:
+                            applied += 1
+                        else:
+                            skipped += 1
+                    applied += self._apply_pending_sync_changes(balance_deltas)
+                    
+                    self.cursor.executemany(
+                        "UPDATE accounts SET balance = balance + ? WHERE id = ?",
+                        [(delta, account_id) for account_id, delta in balance_deltas.items() if delta]
+                    )
+                    self._recount_budgets()
+                    self.cursor.execute("UPDATE sync_state SET applying = 0, clock = MAX(clock, ?) + 1", (max_version,))
+                    self.cursor.execute(
+                        """INSERT INTO sync_peers (device_id, received_at) VALUES (?, CURRENT_TIMESTAMP)
+                        ON CONFLICT (device_id) DO UPDATE SET received_at = CURRENT_TIMESTAMP""",
+                        (header["device"],)
+                    )
+                    # Образы в журнале отмены могли устареть после чужих правок
+                    self._forget_undo_entries("1")
+        except Exception as e:
+            return False, f"Синхронизация прервана: {e}"
+        
+        self.category_matcher = None
+        self.typeahead = None
+        self.cursor.execute("SELECT COUNT(*) FROM sync_pending")
+        pending = self.cursor.fetchone()[0]
+        message = f"Применено изменений: {applied}, пропущено (уже есть или устарели): {skipped}"
+        if pending:
+            message += f", ждут строк, на которые ссылаются: {pending}"
+        return True, message
+    
+    def _apply_pending_sync_changes(self, balance_deltas):
+        """Повторяет отложенные изменения, пока применяется хоть одно; возвращает число применённых"""
+        applied = 0
+        progress = True
+        while progress:
+            progress = False
+            self.cursor.execute("SELECT uuid, change FROM sync_pending")
+            changes = [(uuid, json.loads(line)) for uuid, line in self.cursor.fetchall()]
+            changes.sort(key=lambda item: self.SYNC_TABLES.index(item[1]["table"]))
+            for uuid, change in changes:
+                result = self._apply_sync_change(change, balance_deltas)
+                if result is None:
+                    continue
+                self.cursor.execute("DELETE FROM sync_pending WHERE uuid = ?", (uuid,))
+                progress = True
+                applied += 1 if result else 0
+        return applied
+    
+    def _apply_sync_change(self, change, balance_deltas):
+        """
+        Применяет одно изменение. Возвращает True, если оно применено, False - если локальная версия
+        строки новее, и None - если строки, на которую оно ссылается, здесь ещё нет (изменение ждёт
+        в sync_pending). Ссылка на удалённую строку решается в пользу удаления: изменение
+        применяется как удаление, и обе стороны сходятся к одному состоянию.
+        """
+        table, uuid, version, device = change["table"], change["uuid"], change["version"], change["device"]
+        self.cursor.execute("SELECT row_id, version, device_id, deleted FROM sync_rows WHERE uuid = ?", (uuid,))
+        local = self.cursor.fetchone()
+        if local and (local[1], local[2]) >= (version, device):
+            return False
+        deleted = change.get("deleted", False)
+        
+        if table in self.KEYLESS_TABLES:
+            # Связь: концы берутся из её UUID
+            row_ids = []
+            for column, end_uuid in zip(self.KEYLESS_TABLES[table], uuid.split("/")):
+                end = self._sync_reference(end_uuid, self.SYNC_REFERENCES[table][column])
+                if end is None:
+                    return None
+                deleted = deleted or end[1]
+                row_ids.append(end[0])
+            key = " AND ".join(f"{column} = ?" for column in self.KEYLESS_TABLES[table])
+            if deleted:
+                if None not in row_ids:
+                    self.cursor.execute(f"DELETE FROM {table} WHERE {key}", row_ids)
+            else:
+                columns = ", ".join(self.KEYLESS_TABLES[table])
+                self.cursor.execute(f"INSERT OR IGNORE INTO {table} ({columns}) VALUES (?, ?)", row_ids)
+            self._save_sync_row(uuid, table, None, version, device, deleted)
+            return True
         
-        # Создаем таблицу для запланированных платежей
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS planned_payments (
-            id INTEGER PRIMARY KEY,
-            account_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            description TEXT NOT NULL,
-            category TEXT,
-            planned_date DATE,
-            completed INTEGER DEFAULT 0,
-            FOREIGN KEY (account_id) REFERENCES accounts (id)
-        )
-        ''')
+        row_id = local[0] if local and not local[3] else None
+        if not deleted:
+            data = dict(change["data"])
+            for column, target in self.SYNC_REFERENCES.get(table, {}).items():
+                if data.get(column) is not None:
+                    reference = self._sync_reference(data[column], target)
+                    if reference is None:
+                        return None
+                    if reference[1]:
+                        deleted = True
+                        break
+                    data[column] = reference[0]
+        if not deleted:
+            columns = [column for column in self._table_columns(table) if column in data]
+            if table == "tags" and data.get("name"):
+                data["name"] = data["name"].lower()  # Метка с другого устройства старой версии
+            if table in ("accounts", "tags"):
+                self._resolve_sync_name(table, uuid, data, row_id)
+        
+        self._add_balance_effects(table, row_id, -1, balance_deltas)
+        if deleted:
+            if row_id is not None:
+                self._cascade_sync_delete(table, row_id, uuid, version, device, balance_deltas)
+                self.cursor.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+        elif row_id is not None:
+            self.cursor.execute(
+                f"UPDATE {table} SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?",
+                [data[column] for column in columns] + [row_id]
+            )
+        else:
+            self.cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [data[column] for column in columns]
+            )
+            row_id = self.cursor.lastrowid
+        if not deleted:
+            self._add_balance_effects(table, row_id, 1, balance_deltas)
         
-        # Создаем таблицу для переводов между счетами
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transfers (
-            id INTEGER PRIMARY KEY,
-            from_account_id INTEGER NOT NULL,
-            to_account_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            description TEXT,
-            transfer_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (from_account_id) REFERENCES accounts (id),
-            FOREIGN KEY (to_account_id) REFERENCES accounts (id)
-        )
-        ''')
-
-        # Создаем таблицу категорий
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS expense_categories (
-            id INTEGER PRIMARY KEY,
-            name TEXT UNIQUE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        self._save_sync_row(uuid, table, row_id if row_id is not None else (local[0] if local else None),
+                            version, device, deleted)
+        return True
+    
+    def _sync_reference(self, uuid, table):
+        """(локальный ID, удалена ли) строки, на которую ссылается изменение, или None, если её здесь не было"""
+        self.cursor.execute("SELECT row_id, deleted FROM sync_rows WHERE uuid = ? AND table_name = ?", (uuid, table))
+        return self.cursor.fetchone()
+    
+    def _cascade_sync_delete(self, table, row_id, uuid, version, device, balance_deltas):
+        """
+        Удаляет строки, ссылающиеся на удаляемую чужим изменением, и записывает им отметки удаления
+        с версией этого изменения - так же поступит устройство, получившее ссылку на удалённую строку
+        """
+        for child, references in self.SYNC_REFERENCES.items():
+            for column, target in references.items():
+                if target != table:
+                    continue
+                if child in self.KEYLESS_TABLES:
+                    self.cursor.execute(
+                        "SELECT uuid FROM sync_rows WHERE table_name = ? AND deleted = 0 AND (uuid LIKE ? OR uuid LIKE ?)",
+                        (child, f"{uuid}/%", f"%/{uuid}")
+                    )
+                    links = [row[0] for row in self.cursor.fetchall()]
+                    self.cursor.execute(f"DELETE FROM {child} WHERE {column} = ?", (row_id,))
+                    for link in links:
+                        self._save_sync_row(link, child, None, version, device, True)
+                    continue
+                self.cursor.execute(
+                    f"""SELECT c.id, r.uuid FROM {child} c
+                    LEFT JOIN sync_rows r ON r.table_name = ? AND r.row_id = c.id
+                    WHERE c.{column} = ?""",
+                    (child, row_id)
+                )
+                for child_id, child_uuid in self.cursor.fetchall():
+                    self._add_balance_effects(child, child_id, -1, balance_deltas)
+                    if child_uuid is not None:
+                        self._cascade_sync_delete(child, child_id, child_uuid, version, device, balance_deltas)
+                    self.cursor.execute(f"DELETE FROM {child} WHERE id = ?", (child_id,))
+                    if child_uuid is not None:
+                        self._save_sync_row(child_uuid, child, child_id, version, device, True)
+    
+    def _save_sync_row(self, uuid, table, row_id, version, device, deleted):
+        """Запоминает версию строки после применения чужого изменения (с новым seq - для передачи дальше)"""
+        if row_id is not None:
+            # Отметка об удалённой строке с тем же локальным ID больше к ней не относится
+            self.cursor.execute(
+                "UPDATE sync_rows SET row_id = NULL WHERE table_name = ? AND row_id = ? AND uuid != ?", (table, row_id, uuid)
+            )
+        self.cursor.execute(
+            """INSERT INTO sync_rows (uuid, table_name, row_id, version, device_id, deleted, seq)
+            VALUES (?, ?, ?, ?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM sync_rows))
+            ON CONFLICT (uuid) DO UPDATE SET row_id = excluded.row_id, version = excluded.version,
+                device_id = excluded.device_id, deleted = excluded.deleted, seq = excluded.seq""",
+            (uuid, table, row_id, version, device, 1 if deleted else 0)
         )
-        ''')
-
-        # Создаем таблицу категорий доходов
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS income_categories (
-            id INTEGER PRIMARY KEY,
-            name TEXT UNIQUE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    
+    def _add_balance_effects(self, table, row_id, sign, balance_deltas):
+        if row_id is None or table not in self.SYNC_BALANCE_SQL:
+            return
+        self.cursor.execute(self.SYNC_BALANCE_SQL[table], {"id": row_id})
+        for account_id, amount in self.cursor.fetchall():
+            balance_deltas[account_id] = balance_deltas.get(account_id, 0) + sign * (amount or 0)
+    
+    def _resolve_sync_name(self, table, uuid, data, row_id):
+        """
+        Одноимённые счета (метки), созданные на разных устройствах, - разные строки. Суффикс « (2)»
+        получает строка с большим UUID, поэтому на обоих устройствах имена сойдутся одинаково.
+        """
+        collate = " COLLATE NOCASE" if table == "tags" else ""
+        self.cursor.execute(
+            f"""SELECT t.id, r.uuid FROM {table} t LEFT JOIN sync_rows r ON r.table_name = ? AND r.row_id = t.id
+            WHERE t.name = ?{collate} AND t.id IS NOT ?""",
+            (table, data["name"], row_id)
         )
-        ''')
-
-        # Проверяем, есть ли уже категории расходов, если нет - добавляем стандартные
-        self.cursor.execute("SELECT COUNT(*) FROM expense_categories")
-        if self.cursor.fetchone()[0] == 0:
-            default_expense_categories = [
-                "Продукты", "Кафе и рестораны", "Транспорт", "Жилье", 
-                "Коммунальные услуги", "Связь и интернет", "Одежда", 
-                "Развлечения", "Здоровье", "Образование", "Другое"
-            ]
-            for category in default_expense_categories:
-                self.cursor.execute("INSERT INTO expense_categories (name) VALUES (?)", (category,))
+        other = self.cursor.fetchone()
+        if not other:
+            return
         
-        # Проверяем, есть ли уже категории доходов, если нет - добавляем стандартные
-        self.cursor.execute("SELECT COUNT(*) FROM income_categories")
-        if self.cursor.fetchone()[0] == 0:
-            default_income_categories = [
-                "Зарплата", "Подработка", "Проценты по вкладам", "Дивиденды", 
-                "Подарки", "Возврат долгов", "Продажи", "Другое"
-            ]
-            for category in default_income_categories:
-                self.cursor.execute("INSERT INTO income_categories (name) VALUES (?)", (category,))
+        number = 2
+        while True:
+            name = f"{data['name']} ({number})"
+            self.cursor.execute(f"SELECT 1 FROM {table} WHERE name = ?{collate}", (name,))
+            if not self.cursor.fetchone():
+                break
+            number += 1
+        if other[1] is not None and other[1] > uuid:
+            self.cursor.execute(f"UPDATE {table} SET name = ? WHERE id = ?", (name, other[0]))
+        else:
+            data["name"] = name
+    
+    def sync_with(self, other_path):
+        """
+        Двусторонняя синхронизация с другим файлом журнала (например, базой ноутбука на флешке):
+        обмен файлами изменений в обе стороны
+        """
+        import tempfile
         
-        self.conn.commit()
+        if os.path.abspath(other_path) == os.path.abspath(self.db_path):
+            return False, "Нельзя синхронизировать базу саму с собой"
+        if not os.path.exists(other_path):
+            return False, f"Файл не найден: {other_path}"
+        
+        other = FinanceTracker(other_path)
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                outgoing = os.path.join(tmp_dir, "outgoing.jsonl")
+                incoming = os.path.join(tmp_dir, "incoming.jsonl")
+                steps = (
+                    lambda: self.export_changes(outgoing, other.get_sync_device()[0]),
+                    lambda: other.export_changes(incoming, self.get_sync_device()[0]),
+                    lambda: other.import_changes(outgoing),
+                    lambda: self.import_changes(incoming),
+                )
+                messages = []
+                for step in steps:
+                    success, message = step()
+                    if not success:
+                        return False, message
+                    messages.append(message)
+        finally:
+            other.close()
+        return True, f"Отправлено: {messages[2].lower()}\nПолучено: {messages[3].lower()}"
     
-    def close(self):
-        self.conn.close()
+    def _create_metrics(self):
+        metrics = MetricsRegistry()
+        metrics.describe("finance_operations_total", "counter", "Выполненные операции по типам")
+        metrics.describe("finance_imported_transactions_total", "counter", "Операции, загруженные импортом")
+        metrics.describe("finance_commit_duration_seconds", "histogram", "Длительность коммитов SQLite")
+        metrics.describe("finance_cache_requests_total", "counter", "Обращения к кэшам трекера")
+        metrics.describe("finance_recurring_runs_total", "counter", "Запуски обработки регулярных платежей")
+        metrics.describe("finance_recurring_failures_total", "counter", "Регулярные платежи и запуски обработки, завершившиеся ошибкой")
+        metrics.describe("finance_recurring_run_duration_seconds", "histogram", "Длительность обработки регулярных платежей")
+        metrics.gauge("finance_db_size_bytes", "Размер файла базы данных", lambda: self._file_size(self.db_path))
+        metrics.gauge("finance_wal_size_bytes", "Размер WAL-файла базы данных", lambda: self._file_size(self.db_path + "-wal"))
+        metrics.gauge("finance_cache_hit_ratio", "Доля попаданий в кэши трекера", self._cache_hit_ratios)
+        return metrics
+    
+    def _file_size(self, path):
+        if self.db_path == ":memory:":
+            return None
+        return os.path.getsize(path) if os.path.exists(path) else 0
+    
+    def _cache_hit_ratios(self):
+        ratios = {}
+        for (name, labels), _ in list(self.metrics.counters.items()):
+            if name != "finance_cache_requests_total":
+                continue
+            cache = dict(labels)["cache"]
+            hits = self.metrics.value(name, cache=cache, result="hit")
+            misses = self.metrics.value(name, cache=cache, result="miss")
+            ratios[(("cache", cache),)] = hits / (hits + misses) if hits + misses else 0.0
+        return ratios
+    
+    def start_metrics_server(self, port=9464, host="127.0.0.1"):
+        """
+        Поднимает в фоновом потоке HTTP-эндпоинт /metrics (только localhost по умолчанию).
+        Сервер не обращается к базе, поэтому не мешает основному соединению.
+        """
+        import http.server
+        import threading
+        
+        self.stop_metrics_server()
+        server = http.server.ThreadingHTTPServer((host, port), metrics_request_handler())
+        server.daemon_threads = True
+        server.registry = self.metrics
+        thread = threading.Thread(target=server.serve_forever, name="finance-metrics", daemon=True)
+        thread.start()
+        self.metrics_server = server
+        return server.server_address
+    
+    def stop_metrics_server(self):
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
+    
+    # Методы профилирования запросов
+    def enable_profiling(self, slow_query_ms=100, log_path=None, explain=False):
+        """
+        Включает учёт всех SQL-запросов трекера. Запросы дольше slow_query_ms пишутся
+        в ротируемый лог (по умолчанию slow_queries.log рядом с базой).
+        """
+        self.disable_profiling()
+        if log_path is None and self.db_path != ":memory:":
+            log_path = os.path.join(os.path.dirname(os.path.abspath(self.db_path)), "slow_queries.log")
+        self.conn.profiler = QueryProfiler(slow_query_ms, log_path, explain)
+        self.replace_cursor()
+    
+    def disable_profiling(self):
+        if self.conn.profiler is not None:
+            self.conn.profiler.close()
+            self.conn.profiler = None
+            self.replace_cursor()
+    
+    def replace_cursor(self):
+        """Новый основной курсор: профилирующий или обычный, смотря по состоянию профайлера"""
+        self.cursor.close()
+        self.cursor = self.conn.cursor()
+    
+    def stats(self):
+        """Статистика запросов по методам; None, если профилирование выключено"""
+        if not self.is_connected() or self.conn.profiler is None:
+            return None
+        return self.conn.profiler.stats()
     
     # Методы для работы со счетами
-    def create_account(self, name, type, initial_balance=0):
+    @undoable("Создание счёта")
+    def create_account(self, name, type, initial_balance=0, currency=None):
+        currency = (currency or self.DEFAULT_CURRENCY).upper()
+        if not self.is_valid_currency_code(currency):
+            return False, "Код валюты должен состоять из трёх латинских букв"
+        
         try:
             self.cursor.execute(
-                "INSERT INTO accounts (name, balance, type) VALUES (?, ?, ?)",
-                (name, initial_balance, type)
+                "INSERT INTO accounts (name, balance, opening_balance, type, currency) VALUES (?, ?, ?, ?, ?)",
+                (name, initial_balance, initial_balance, type, currency)
             )
             self.conn.commit()
-            return True
+            self.typeahead_names_loaded = False
         except sqlite3.IntegrityError:
-            return False
+            return False, f"Счёт с названием '{name}' уже существует"
+        
+        message = f"Счёт '{name}' успешно создан"
+        if currency in self.get_currencies_without_rates():
+            message += f"\n⚠️ Нет курсов для валюты {currency}: пока их не загрузить, счёт не войдёт в общие суммы"
+        return True, message
     
     def get_accounts(self):
-        self.cursor.execute("SELECT id, name, balance, type FROM accounts")
+        self.cursor.execute("SELECT id, name, balance, type, currency FROM accounts")
         return self.cursor.fetchall()
     
     def get_account_by_id(self, account_id):
-        self.cursor.execute("SELECT id, name, balance, type FROM accounts WHERE id = ?", (account_id,))
+        self.cursor.execute("SELECT id, name, balance, type, currency FROM accounts WHERE id = ?", (account_id,))
         return self.cursor.fetchone()
     
+    @undoable("Изменение счёта")
     def update_account(self, account_id, name=None, account_type=None):
         current = self.get_account_by_id(account_id)
         if not current:
@@ -174,10 +3490,12 @@ class FinanceTracker:
                 (new_name, new_type, account_id)
             )
             self.conn.commit()
+            self.typeahead_names_loaded = False
             return True
         except sqlite3.IntegrityError:
             return False
     
+    @undoable("Удаление счёта")
     def delete_account(self, account_id):
         # Проверяем, есть ли операции, связанные с этим счетом
         self.cursor.execute("SELECT COUNT(*) FROM transactions WHERE account_id = ?", (account_id,))
@@ -186,20 +3504,93 @@ class FinanceTracker:
         
         self.cursor.execute("DELETE FROM accounts WHERE id = ?", (account_id,))
         self.conn.commit()
+        self.typeahead_names_loaded = False
         return True, "Счёт успешно удалён"
     
     # Методы для операций дохода/расхода
+    def get_transaction_fingerprint(self, account_id, amount, description, transaction_date):
+        """
+        Отпечаток содержимого операции: счёт, сумма, нормализованное описание и день.
+        Совпадение отпечатков означает вероятный дубликат (повторный ввод или импорт).
+        """
+        # Приводим описание к виду без регистра, пунктуации и префикса автоплатежа
+        normalized = re.sub(r"[\W_]+", " ", (description or "").lower()).strip()
+        if normalized.startswith("авто "):
+            normalized = normalized[5:]
+        key = f"{account_id}|{amount:.2f}|{normalized}|{transaction_date[:10]}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    
+    def _insert_transaction(self, account_id, amount, description, category, transaction_type, transaction_date=None):
+        """Добавляет строку операции (без изменения баланса) и возвращает её ID"""
+        if not transaction_date:
+            # Тот же формат и часовой пояс (UTC), что и у CURRENT_TIMESTAMP
+            transaction_date = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        
+        self.cursor.execute(
+            "INSERT INTO transactions (account_id, amount, description, category, transaction_date, transaction_type, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (account_id, amount, description, category, transaction_date, transaction_type,
+             self.get_transaction_fingerprint(account_id, amount, description, transaction_date))
+        )
+        return self.cursor.lastrowid
+    
+    def find_duplicate_transactions(self, account_id, amount, description="", transaction_date=None):
+        """
+        Ищет уже существующие операции с тем же отпечатком (одна выборка по индексу).
+        amount - сумма со знаком, как она хранится в БД (расход отрицательный).
+        """
+        if not transaction_date:
+            transaction_date = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d")
+        
+        self.cursor.execute(
+            """SELECT t.id, t.account_id, a.name, t.amount, t.description, t.category, t.transaction_date, t.transaction_type, a.currency
+            FROM transactions t
+            JOIN accounts a ON t.account_id = a.id
+            WHERE t.fingerprint = ?""",
+            (self.get_transaction_fingerprint(account_id, amount, description, transaction_date),)
+        )
+        return self.cursor.fetchall()
+    
+    def get_duplicate_report(self):
+        """
+        Отчёт о вероятных дубликатах по всей истории: группы операций с одинаковым отпечатком.
+        Группировка идёт по индексу отпечатков, без попарного сравнения операций;
+        операции всех групп читаются одним запросом.
+        """
+        self.cursor.execute(
+            """SELECT t.fingerprint, t.id, t.account_id, a.name, t.amount, t.description, t.category,
+                t.transaction_date, t.transaction_type, a.currency
+            FROM (
+                SELECT fingerprint FROM transactions
+                WHERE fingerprint IS NOT NULL
+                GROUP BY fingerprint HAVING COUNT(*) > 1
+            ) d
+            JOIN transactions t ON t.fingerprint = d.fingerprint
+            JOIN accounts a ON t.account_id = a.id
+            ORDER BY t.fingerprint, t.id"""
+        )
+        
+        report = []
+        last_fingerprint = None
+        for row in self.cursor.fetchall():
+            if row[0] != last_fingerprint:
+                report.append([])
+                last_fingerprint = row[0]
+            report[-1].append(row[1:])
+        return report
+    
+    @undoable("Доход")
     def add_income(self, account_id, amount, description="", category=""):
         account = self.get_account_by_id(account_id)
         if not account:
             return False, "Счёт не найден"
         
+        # Если категория не указана, пробуем определить её по правилам
+        if not category:
+            category = self.suggest_category(description, amount, account_id, "income") or category
+        
         try:
             # Добавляем транзакцию
-            self.cursor.execute(
-                "INSERT INTO transactions (account_id, amount, description, category, transaction_type) VALUES (?, ?, ?, ?, ?)",
-                (account_id, amount, description, category, "income")
-            )
+            self._insert_transaction(account_id, amount, description, category, "income")
             
             # Обновляем баланс счета
             new_balance = account[2] + amount
@@ -209,10 +3600,12 @@ class FinanceTracker:
             )
             
             self.conn.commit()
+            self.metrics.inc("finance_operations_total", type="income")
             return True, "Доход успешно добавлен"
         except Exception as e:
             return False, str(e)
     
+    @undoable("Расход")
     def add_expense(self, account_id, amount, description="", category=""):
         account = self.get_account_by_id(account_id)
         if not account:
@@ -221,12 +3614,13 @@ class FinanceTracker:
         if account[2] < amount:
             return False, "Недостаточно средств"
         
+        # Если категория не указана, пробуем определить её по правилам
+        if not category:
+            category = self.suggest_category(description, amount, account_id, "expense") or category
+        
         try:
             # Добавляем транзакцию (расход как отрицательное число)
-            self.cursor.execute(
-                "INSERT INTO transactions (account_id, amount, description, category, transaction_type) VALUES (?, ?, ?, ?, ?)",
-                (account_id, -amount, description, category, "expense")
-            )
+            self._insert_transaction(account_id, -amount, description, category, "expense")
             
             # Обновляем баланс счета
             new_balance = account[2] - amount
@@ -235,8 +3629,16 @@ class FinanceTracker:
                 (new_balance, account_id)
             )
             
+            # Обновляем счётчики бюджетов категории
+            self._apply_budget_delta(category, amount, currency=account[4])
+            
             self.conn.commit()
-            return True, "Расход успешно добавлен"
+            self.metrics.inc("finance_operations_total", type="expense")
+            message = "Расход успешно добавлен"
+            alerts = self.get_budget_alerts(category)
+            if alerts:
+                message += "\n" + "\n".join(alerts)
+            return True, message
         except Exception as e:
             return False, str(e)
         
@@ -244,6 +3646,7 @@ class FinanceTracker:
         self.cursor.execute("SELECT * FROM transactions WHERE id = ?", (transaction_id,))
         return self.cursor.fetchone()
 
+    @undoable("Удаление операции")
     def delete_transaction(self, transaction_id):
         # Находим транзакцию
         transaction = self.get_transaction_by_id(transaction_id)
@@ -266,69 +3669,444 @@ class FinanceTracker:
                 (new_balance, account_id)
             )
             
-            # Удаляем транзакцию
+            # Возвращаем сумму расхода в бюджеты категорий (у разделённой операции - по строкам)
+            if transaction[6] == "expense":
+                for line_category, line_amount in self._category_amounts(transaction_id, transaction[4], amount):
+                    self._apply_budget_delta(line_category, line_amount, self._parse_db_date(transaction[5]), account[4])
+            
+            # Удаляем транзакцию вместе со строками разделения и метками
+            self.cursor.execute("DELETE FROM transaction_splits WHERE transaction_id = ?", (transaction_id,))
+            self.cursor.execute("DELETE FROM transaction_tags WHERE transaction_id = ?", (transaction_id,))
             self.cursor.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
             
             self.conn.commit()
+            self.typeahead = None  # Дочитывание по id не видит удалённых строк
             return True, "Операция успешно удалена"
         except Exception as e:
             return False, str(e)
 
+    @undoable("Изменение операции")
     def update_transaction(self, transaction_id, amount=None, description=None, category=None):
         # Находим транзакцию
         transaction = self.get_transaction_by_id(transaction_id)
         if not transaction:
             return False, "Операция не найдена"
         
-        account_id = transaction[1]
-        old_amount = transaction[2]
+        account_id = transaction[1]
+        old_amount = transaction[2]
+        
+        # Если новая сумма не указана, используем старую
+        new_amount = amount if amount is not None else old_amount
+        
+        # Получаем данные счета
+        account = self.get_account_by_id(account_id)
+        if not account:
+            return False, "Счёт не найден"
+        
+        try:
+            # Проверка на отрицательный баланс для расходов
+            if transaction[6] == "expense" and amount is not None:
+                # Для расхода amount в БД отрицательный, а на входе в функцию положительный:
+                # без этой операции на счёте было бы account[2] - old_amount
+                if account[2] - old_amount < abs(amount):
+                    return False, "Недостаточно средств"
+                new_amount = -abs(amount)
+            
+            # Разница считается по суммам со знаком, как они хранятся в БД
+            amount_diff = new_amount - old_amount
+            new_balance = account[2] + amount_diff
+            
+            # Обновляем баланс
+            self.cursor.execute(
+                "UPDATE accounts SET balance = ? WHERE id = ?",
+                (new_balance, account_id)
+            )
+            
+            # Обновляем транзакцию
+            new_description = description if description is not None else transaction[3]
+            new_category = category if category is not None else transaction[4]
+            transaction_date = self._parse_db_date(transaction[5])
+            
+            # Переносим сумму в счётчиках бюджетов: убираем старую, учитываем новую
+            if transaction[6] == "expense":
+                for line_category, line_amount in self._category_amounts(transaction_id, transaction[4], old_amount):
+                    self._apply_budget_delta(line_category, line_amount, transaction_date, account[4])
+            
+            splits = self.get_transaction_splits(transaction_id)
+            if splits and category is not None:
+                # Одна категория на всю операцию - строки разделения больше не нужны
+                self.cursor.execute("DELETE FROM transaction_splits WHERE transaction_id = ?", (transaction_id,))
+                splits = []
+            elif splits and new_amount != old_amount:
+                self._rescale_splits(splits, new_amount)
+            
+            self.cursor.execute(
+                """UPDATE transactions 
+                SET amount = ?, description = ?, category = ?, fingerprint = ?, is_split = ?
+                WHERE id = ?""",
+                (new_amount, new_description, new_category,
+                 self.get_transaction_fingerprint(account_id, new_amount, new_description, transaction[5]),
+                 1 if splits else 0, transaction_id)
+            )
+            
+            alerts = []
+            if transaction[6] == "expense":
+                for line_category, line_amount in self._category_amounts(transaction_id, new_category, new_amount):
+                    self._apply_budget_delta(line_category, -line_amount, transaction_date, account[4])
+                    alerts.extend(self.get_budget_alerts(line_category))
+            
+            self.conn.commit()
+            self.typeahead = None  # Старые описание и категория не должны подсказываться
+            message = "Операция успешно обновлена"
+            if alerts:
+                message += "\n" + "\n".join(alerts)
+            return True, message
+        except Exception as e:
+            return False, str(e)
+    
+    # Разделённые операции: один чек на несколько категорий
+    SPLIT_CATEGORY = "Разделено"
+    
+    def get_transaction_splits(self, transaction_id):
+        """Строки разделённой операции: (id, сумма со знаком операции, категория, описание)"""
+        self.cursor.execute(
+            "SELECT id, amount, category, description FROM transaction_splits WHERE transaction_id = ? ORDER BY id",
+            (transaction_id,)
+        )
+        return self.cursor.fetchall()
+    
+    def _category_amounts(self, transaction_id, category, amount):
+        """Суммы операции по категориям: строки разделения или сама операция целиком"""
+        self.cursor.execute(
+            "SELECT category, amount FROM transaction_splits WHERE transaction_id = ?", (transaction_id,)
+        )
+        return self.cursor.fetchall() or [(category, amount)]
+    
+    def _rescale_splits(self, splits, new_amount):
+        """Пропорционально меняет строки под новую сумму операции; копейки округления - в последнюю строку"""
+        old_total = sum(line[1] for line in splits)
+        updates = []
+        remaining = new_amount
+        for line_id, line_amount, _, _ in splits[:-1]:
+            scaled = round(line_amount * new_amount / old_total, 2) if old_total else 0
+            updates.append((scaled, line_id))
+            remaining -= scaled
+        updates.append((round(remaining, 2), splits[-1][0]))
+        self.cursor.executemany("UPDATE transaction_splits SET amount = ? WHERE id = ?", updates)
+    
+    @undoable("Разделение операции")
+    def split_transaction(self, transaction_id, lines):
+        """
+        Разделяет доход или расход на строки [(сумма, категория, описание), ...].
+        Суммы строк положительные и в сумме равны операции; баланс счёта не меняется,
+        бюджеты переносятся на категории строк. Повторный вызов заменяет строки.
+        """
+        self.cursor.execute(
+            "SELECT account_id, amount, category, transaction_date, transaction_type, is_rollup FROM transactions WHERE id = ?",
+            (transaction_id,)
+        )
+        transaction = self.cursor.fetchone()
+        if not transaction:
+            return False, "Операция не найдена"
+        
+        account_id, amount, category, transaction_date, transaction_type, is_rollup = transaction
+        if transaction_type not in ("income", "expense") or is_rollup:
+            return False, "Разделить можно только доход или расход"
+        if len(lines) < 2:
+            return False, "Нужно указать хотя бы две строки"
+        if any(line[0] <= 0 for line in lines):
+            return False, "Суммы строк должны быть больше нуля"
+        
+        total = round(sum(line[0] for line in lines), 2)
+        if total != round(abs(amount), 2):
+            return False, f"Сумма строк {total:.2f} не равна сумме операции {abs(amount):.2f}"
+        
+        sign = -1 if amount < 0 else 1
+        currency = self.get_account_by_id(account_id)[4]
+        day = self._parse_db_date(transaction_date)
+        
+        try:
+            with self.savepoint():
+                if transaction_type == "expense":
+                    for line_category, line_amount in self._category_amounts(transaction_id, category, amount):
+                        self._apply_budget_delta(line_category, line_amount, day, currency)
+                
+                self.cursor.execute("DELETE FROM transaction_splits WHERE transaction_id = ?", (transaction_id,))
+                self.cursor.executemany(
+                    "INSERT INTO transaction_splits (transaction_id, amount, category, description) VALUES (?, ?, ?, ?)",
+                    [(transaction_id, sign * line_amount, line_category, line_description)
+                     for line_amount, line_category, line_description in lines]
+                )
+                self.cursor.execute(
+                    "UPDATE transactions SET category = ?, is_split = 1 WHERE id = ?",
+                    (self.SPLIT_CATEGORY, transaction_id)
+                )
+                
+                alerts = []
+                if transaction_type == "expense":
+                    for line_amount, line_category, _ in lines:
+                        self._apply_budget_delta(line_category, line_amount, day, currency)
+                    for line_category in dict.fromkeys(line[1] for line in lines):
+                        alerts.extend(self.get_budget_alerts(line_category))
+                
+            self.conn.commit()
+            self.typeahead = None
+            return True, "\n".join(["Операция разделена"] + alerts)
+        except Exception as e:
+            return False, str(e)
+
+    # Метки операций
+    def _normalize_tags(self, names):
+        """
+        Названия меток в нижнем регистре, без пробелов по краям и повторов; строка - через запятую.
+        Регистр приводится здесь, а не в SQLite: COLLATE NOCASE не различает регистр только у латиницы
+        """
+        if isinstance(names, str):
+            names = names.split(",")
+        return list(dict.fromkeys(name.strip().lower() for name in names if name.strip()))
+    
+    def _tag_ids(self, names):
+        """ID существующих меток по названиям"""
+        if not names:
+            return []
+        self.cursor.execute(f"SELECT id FROM tags WHERE name IN ({', '.join('?' * len(names))})", names)
+        return [row[0] for row in self.cursor.fetchall()]
+    
+    def get_tags(self):
+        """Метки с количеством операций: (id, название, операций)"""
+        self.cursor.execute("""
+            SELECT g.id, g.name, COUNT(tt.transaction_id)
+            FROM tags g
+            LEFT JOIN transaction_tags tt ON tt.tag_id = g.id
+            GROUP BY g.id
+            ORDER BY g.name
+        """)
+        return self.cursor.fetchall()
+    
+    def get_transaction_tags(self, transaction_id):
+        self.cursor.execute(
+            """SELECT g.name FROM transaction_tags tt JOIN tags g ON g.id = tt.tag_id
+            WHERE tt.transaction_id = ? ORDER BY g.name""",
+            (transaction_id,)
+        )
+        return [row[0] for row in self.cursor.fetchall()]
+    
+    @undoable("Добавление меток")
+    def add_tags(self, transaction_id, names):
+        """Добавляет операции метки; новые метки создаются"""
+        names = self._normalize_tags(names)
+        if not names:
+            return False, "Не указаны метки"
+        if not self.get_transaction_by_id(transaction_id):
+            return False, "Операция не найдена"
+        
+        try:
+            self.cursor.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)", [(name,) for name in names])
+            self.cursor.executemany(
+                "INSERT OR IGNORE INTO transaction_tags (tag_id, transaction_id) VALUES (?, ?)",
+                [(tag_id, transaction_id) for tag_id in self._tag_ids(names)]
+            )
+            self.conn.commit()
+            return True, f"Метки добавлены: {', '.join(names)}"
+        except Exception as e:
+            return False, str(e)
+    
+    @undoable("Снятие меток")
+    def remove_tags(self, transaction_id, names):
+        tag_ids = self._tag_ids(self._normalize_tags(names))
+        if not tag_ids:
+            return False, "Метки не найдены"
+        self.cursor.executemany(
+            "DELETE FROM transaction_tags WHERE tag_id = ? AND transaction_id = ?",
+            [(tag_id, transaction_id) for tag_id in tag_ids]
+        )
+        self.conn.commit()
+        return True, "Метки сняты"
+    
+    @undoable("Удаление метки")
+    def delete_tag(self, tag_id):
+        self.cursor.execute("DELETE FROM transaction_tags WHERE tag_id = ?", (tag_id,))
+        self.cursor.execute("DELETE FROM tags WHERE id = ?", (tag_id,))
+        self.conn.commit()
+        return True, "Метка удалена"
+    
+    def _tag_filter_sql(self, tag_filter):
+        """
+        Условие на t.id для фильтра {"any": [...], "all": [...], "none": [...]} по названиям меток.
+        Операции берутся из первичного ключа связей, таблица операций не просматривается.
+        Для all проход идёт по самой редкой метке, а остальные проверяются точечным поиском
+        по ключу (tag_id, transaction_id) - стоимость определяет меньшая из меток.
+        none после any/all проверяется точечно для каждой отобранной операции, без них -
+        исключением множества операций с метками.
+        """
+        if not tag_filter:
+            return "", []
+        
+        sql = ""
+        params = []
+        
+        any_names = self._normalize_tags(tag_filter.get("any") or [])
+        if any_names:
+            tag_ids = self._tag_ids(any_names)
+            if not tag_ids:
+                return " AND 0", []
+            sql += f" AND t.id IN (SELECT transaction_id FROM transaction_tags WHERE tag_id IN ({', '.join('?' * len(tag_ids))}))"
+            params.extend(tag_ids)
+        
+        all_names = self._normalize_tags(tag_filter.get("all") or [])
+        if all_names:
+            tag_ids = self._tag_ids(all_names)
+            if len(tag_ids) < len(all_names):
+                return " AND 0", []  # Одной из меток нет - нет и операций со всеми метками
+            tag_ids.sort(key=self._tag_size)
+            probes = "".join(
+                f" AND EXISTS (SELECT 1 FROM transaction_tags p{i} WHERE p{i}.tag_id = ? AND p{i}.transaction_id = d.transaction_id)"
+                for i in range(1, len(tag_ids))
+            )
+            sql += f" AND t.id IN (SELECT d.transaction_id FROM transaction_tags d WHERE d.tag_id = ?{probes})"
+            params.extend(tag_ids)
+        
+        tag_ids = self._tag_ids(self._normalize_tags(tag_filter.get("none") or []))
+        if tag_ids:
+            placeholders = ", ".join("?" * len(tag_ids))
+            if sql:
+                # Операции уже отобраны по меткам - проверяем каждую точечно
+                sql += (" AND NOT EXISTS (SELECT 1 FROM transaction_tags n WHERE n.transaction_id = t.id"
+                        f" AND n.tag_id IN ({placeholders}))")
+            else:
+                sql += f" AND t.id NOT IN (SELECT transaction_id FROM transaction_tags WHERE tag_id IN ({placeholders}))"
+            params.extend(tag_ids)
+        
+        return sql, params
+    
+    def _tag_size(self, tag_id, limit=10000):
+        """Количество операций с меткой, но не больше limit - хватает, чтобы выбрать самую редкую"""
+        self.cursor.execute(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM transaction_tags WHERE tag_id = ? LIMIT ?)", (tag_id, limit)
+        )
+        return self.cursor.fetchone()[0]
+    
+    def get_tag_summary(self, start_date=None, end_date=None, transaction_type=None):
+        """
+        Сводка по меткам: (метка, тип, операций, сумма в валюте отчётов).
+        Операция с несколькими метками учитывается в каждой из них.
+        """
+        amount_sql, join_sql = self._report_amount_sql()
+        query = f"""
+            SELECT g.name, t.transaction_type, COUNT(*), SUM({amount_sql}) AS total
+            FROM transaction_tags tt
+            JOIN tags g ON g.id = tt.tag_id
+            JOIN transactions t ON t.id = tt.transaction_id {join_sql}
+            WHERE 1=1
+        """
+        params = []
         
-        # Если новая сумма не указана, используем старую
-        new_amount = amount if amount is not None else old_amount
+        if transaction_type is not None:
+            query += " AND t.transaction_type = ?"
+            params.append(transaction_type)
         
-        # Получаем данные счета
-        account = self.get_account_by_id(account_id)
-        if not account:
-            return False, "Счёт не найден"
+        if start_date:
+            query += " AND t.transaction_date >= ?"
+            params.append(start_date)
         
-        try:
-            # Обновляем баланс счета
-            amount_diff = new_amount - old_amount
-            new_balance = account[2] + amount_diff
+        if end_date:
+            query += " AND t.transaction_date < ?"
+            params.append(self._next_day(end_date))
+        
+        # Группы только из сумм в валютах без курсов пересчитать нельзя - их нет в сводке
+        query += " GROUP BY g.id, t.transaction_type HAVING total IS NOT NULL ORDER BY total ASC"
+        
+        self.cursor.execute(query, params)
+        return self.cursor.fetchall()
+
+    @undoable("Импорт операций")
+    def import_transactions(self, rows, skip_duplicates=True):
+        """
+        Пакетная загрузка операций (например, из банковской выписки) в одной транзакции БД.
+        rows - кортежи (account_id, transaction_type, amount, description, category, transaction_date),
+        сумма указывается положительной, пустая категория определяется по правилам.
+        Баланс каждого счёта меняется одним обновлением; остаток не проверяется -
+        выписка считается достоверной. При skip_duplicates операции, уже имеющиеся
+        в базе с тем же отпечатком, пропускаются - повторный импорт выписки ничего не удвоит.
+        """
+        accounts = {account[0]: account[4] for account in self.get_accounts()}
+        matcher = self.get_category_matcher()
+        now = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        
+        prepared = []
+        balance_deltas = {}
+        budget_deltas = {}
+        existing_counts = {}
+        skipped = 0
+        for account_id, transaction_type, amount, description, category, transaction_date in rows:
+            if account_id not in accounts:
+                return False, f"Счёт {account_id} не найден"
+            if transaction_type not in ("income", "expense"):
+                return False, f"Неизвестный тип операции: {transaction_type}"
             
-            # Проверка на отрицательный баланс для расходов
-            if transaction[6] == "expense" and amount is not None:
-                # Для расхода, amount в БД отрицательный, а на входе в функцию положительный
-                if account[2] + old_amount < amount:  # old_amount < 0, поэтому +old_amount
-                    return False, "Недостаточно средств"
-                # Корректируем new_amount, чтобы для расхода было отрицательное значение
-                if new_amount > 0:
-                    new_amount = -new_amount
+            amount = abs(amount)
+            if not category:
+                category = matcher.match(description, amount, account_id, transaction_type) or ""
             
-            # Обновляем баланс
-            self.cursor.execute(
-                "UPDATE accounts SET balance = ? WHERE id = ?",
-                (new_balance, account_id)
-            )
+            if not transaction_date:
+                transaction_date = now
+            elif len(transaction_date) == 10:
+                transaction_date += " 00:00:00"
             
-            # Обновляем транзакцию
-            new_description = description if description is not None else transaction[3]
-            new_category = category if category is not None else transaction[4]
+            signed_amount = amount if transaction_type == "income" else -amount
+            fingerprint = self.get_transaction_fingerprint(account_id, signed_amount, description, transaction_date)
             
-            self.cursor.execute(
-                """UPDATE transactions 
-                SET amount = ?, description = ?, category = ?
-                WHERE id = ?""",
-                (new_amount, new_description, new_category, transaction_id)
-            )
+            if skip_duplicates:
+                # Одинаковые операции внутри выписки допустимы (две чашки кофе за день),
+                # поэтому пропускаем столько повторов, сколько таких операций уже есть в базе
+                if fingerprint not in existing_counts:
+                    self.cursor.execute("SELECT COUNT(*) FROM transactions WHERE fingerprint = ?", (fingerprint,))
+                    existing_counts[fingerprint] = self.cursor.fetchone()[0]
+                if existing_counts[fingerprint] > 0:
+                    existing_counts[fingerprint] -= 1
+                    skipped += 1
+                    continue
+            
+            prepared.append((account_id, signed_amount, description, category, transaction_date, transaction_type, fingerprint))
+            balance_deltas[account_id] = balance_deltas.get(account_id, 0) + signed_amount
             
+            if transaction_type == "expense" and category:
+                key = (category, transaction_date[:10], accounts[account_id])
+                budget_deltas[key] = budget_deltas.get(key, 0) + amount
+        
+        if not prepared:
+            if skipped:
+                return True, f"Все операции уже есть в базе, пропущено дубликатов: {skipped}"
+            return False, "Нет операций для импорта"
+        
+        try:
+            with self.savepoint():
+                self.cursor.executemany(
+                    "INSERT INTO transactions (account_id, amount, description, category, transaction_date, transaction_type, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    prepared
+                )
+                
+                for account_id, delta in balance_deltas.items():
+                    self.cursor.execute(
+                        "UPDATE accounts SET balance = balance + ? WHERE id = ?",
+                        (delta, account_id)
+                    )
+                
+                for (category, day, currency), amount in budget_deltas.items():
+                    self._apply_budget_delta(category, amount, self._parse_db_date(day), currency)
+                
             self.conn.commit()
-            return True, "Операция успешно обновлена"
+            self.metrics.inc("finance_imported_transactions_total", len(prepared))
+            message = f"Импортировано операций: {len(prepared)}"
+            if skipped:
+                message += f", пропущено дубликатов: {skipped}"
+            return True, message
         except Exception as e:
             return False, str(e)
     
     # Методы для перевода между счетами
-    def transfer_money(self, from_account_id, to_account_id, amount, description=""):
+    @undoable("Перевод между счетами")
+    def transfer_money(self, from_account_id, to_account_id, amount, description="", transfer_date=None):
         if from_account_id == to_account_id:
             return False, "Нельзя перевести деньги на тот же счёт"
         
@@ -341,16 +4119,25 @@ class FinanceTracker:
         if from_account[2] < amount:
             return False, "Недостаточно средств для перевода"
         
+        # Между счетами в разных валютах зачисляем сумму по текущему курсу
+        to_amount = None
+        if from_account[4] != to_account[4]:
+            try:
+                to_amount = round(self.convert_amount(amount, from_account[4], to_account[4]), 2)
+            except ValueError as e:
+                return False, str(e)
+        
         try:
             # Создаем запись о переводе
             self.cursor.execute(
-                "INSERT INTO transfers (from_account_id, to_account_id, amount, description) VALUES (?, ?, ?, ?)",
-                (from_account_id, to_account_id, amount, description)
+                """INSERT INTO transfers (from_account_id, to_account_id, amount, description, to_amount, transfer_date)
+                VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))""",
+                (from_account_id, to_account_id, amount, description, to_amount, transfer_date)
             )
             
             # Обновляем балансы обоих счетов
             new_from_balance = from_account[2] - amount
-            new_to_balance = to_account[2] + amount
+            new_to_balance = to_account[2] + (to_amount if to_amount is not None else amount)
             
             self.cursor.execute(
                 "UPDATE accounts SET balance = ? WHERE id = ?",
@@ -363,6 +4150,7 @@ class FinanceTracker:
             )
             
             self.conn.commit()
+            self.metrics.inc("finance_operations_total", type="transfer")
             return True, "Перевод успешно выполнен"
         except Exception as e:
             return False, str(e)
@@ -370,7 +4158,8 @@ class FinanceTracker:
     def get_transfers(self, account_id=None, start_date=None, end_date=None, limit=None):
         query = """
             SELECT t.id, t.from_account_id, fa.name as from_name, t.to_account_id, 
-                ta.name as to_name, t.amount, t.description, t.transfer_date
+                ta.name as to_name, t.amount, t.description, t.transfer_date,
+                fa.currency, COALESCE(t.to_amount, t.amount), ta.currency
             FROM transfers t
             JOIN accounts fa ON t.from_account_id = fa.id
             JOIN accounts ta ON t.to_account_id = ta.id
@@ -399,94 +4188,175 @@ class FinanceTracker:
         return self.cursor.fetchall()
     
     # Методы для работы с регулярными платежами
-    def add_recurring_payment(self, account_id, amount, description, payment_day, category=""):
-        if payment_day < 1 or payment_day > 31:
-            return False, "День платежа должен быть от 1 до 31"
+    RECURRING_TYPES = ("expense", "income", "transfer")
+    
+    def recurrence_rule(self, rule, payment_day, anchor_date):
+        """Правило повторения из полей строки recurring_payments"""
+        if isinstance(anchor_date, str):
+            anchor_date = self._parse_db_date(anchor_date)
+        return RecurrenceRule(rule, payment_day, anchor_date)
+    
+    def _first_due(self, rule, last_processed=None, today=None):
+        """Первая дата платежа начиная с сегодня, но не раньше следующего дня после последней обработки"""
+        start = today or date.today()
+        if last_processed:
+            if isinstance(last_processed, str):
+                last_processed = self._parse_db_date(last_processed)
+            start = max(start, last_processed + datetime.timedelta(days=1))
+        return rule.next_on_or_after(start)
+    
+    @undoable("Новый регулярный платёж")
+    def add_recurring_payment(self, account_id, amount, description, payment_day=None, category="",
+                              rule="monthly", anchor_date=None, transaction_type="expense", to_account_id=None):
+        """
+        Добавляет регулярную операцию. rule - ключ RecurrenceRule.KINDS; для еженедельных,
+        раз в две недели и ежегодных правил anchor_date - дата первого платежа (по умолчанию сегодня).
+        transaction_type - expense, income или transfer (тогда нужен to_account_id).
+        """
+        if transaction_type not in self.RECURRING_TYPES:
+            return False, "Неизвестный вид операции"
         
         account = self.get_account_by_id(account_id)
         if not account:
             return False, "Счёт не найден"
         
+        if transaction_type == "transfer":
+            if not to_account_id or not self.get_account_by_id(to_account_id):
+                return False, "Счёт зачисления не найден"
+            if to_account_id == account_id:
+                return False, "Нельзя перевести деньги на тот же счёт"
+        else:
+            to_account_id = None
+        
+        if rule in ("weekly", "biweekly", "yearly") and anchor_date is None:
+            anchor_date = date.today()
+        try:
+            recurrence = self.recurrence_rule(rule, payment_day, anchor_date)
+        except ValueError as e:
+            return False, str(e)
+        
+        next_due = self._first_due(recurrence)
+        anchor = recurrence.anchor.strftime("%Y-%m-%d") if recurrence.anchor else None
+        
         try:
             self.cursor.execute(
-                "INSERT INTO recurring_payments (account_id, amount, description, category, payment_day) VALUES (?, ?, ?, ?, ?)",
-                (account_id, amount, description, category, payment_day)
+                """INSERT INTO recurring_payments
+                (account_id, amount, description, category, payment_day, rule, anchor_date, next_due, transaction_type, to_account_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (account_id, amount, description, category, payment_day or next_due.day, rule, anchor,
+                 next_due.strftime("%Y-%m-%d"), transaction_type, to_account_id)
             )
             self.conn.commit()
-            return True, "Регулярный платеж добавлен"
+            return True, f"Регулярный платеж добавлен, первый платеж {next_due.strftime('%d.%m.%Y')}"
         except Exception as e:
             return False, str(e)
     
-    def process_recurring_payments(self):
-        self.print_header("ОБРАБОТКА АВТОПЛАТЕЖЕЙ")
-        today = date.today()
-        day_of_month = today.day
+    def _run_recurring(self, account_id, amount, description, category, transaction_type, to_account_id, due, today):
+        """Проводит один платёж на дату due; возвращает (успех, сообщение, категория расхода или None)"""
+        # Пропущенные платежи проводятся своей датой (полдень - чтобы дата не сдвинулась из-за часового пояса)
+        transaction_date = None if due >= today else f"{due.strftime('%Y-%m-%d')} 12:00:00"
         
-        # Получаем все активные регулярные платежи, у которых день платежа равен текущему
-        self.cursor.execute(
-            "SELECT id, account_id, amount, description, category FROM recurring_payments WHERE payment_day = ? AND active = 1",
-            (day_of_month,)
-        )
-        payments = self.cursor.fetchall()
+        if transaction_type == "transfer":
+            success, message = self.transfer_money(account_id, to_account_id, amount, f"Авто: {description}",
+                                                   transfer_date=transaction_date)
+            return success, message, None
         
-        results = []
-        for payment in payments:
-            payment_id, account_id, amount, description, category = payment
-            
-            # Проверяем, не был ли платеж уже обработан в этом месяце
-            self.cursor.execute(
-                "SELECT last_processed FROM recurring_payments WHERE id = ?",
-                (payment_id,)
-            )
-            last_processed = self.cursor.fetchone()[0]
-            
-            if last_processed:
-                last_processed_date = datetime.datetime.strptime(last_processed, "%Y-%m-%d").date()
-                if last_processed_date.month == today.month and last_processed_date.year == today.year:
-                    # Платеж уже обработан в этом месяце
-                    continue
-            
-            # Выполняем платеж
-            account = self.get_account_by_id(account_id)
-            if account[2] < amount:
-                results.append((False, f"{description}: Недостаточно средств"))
-                continue
-            
-            # Добавляем транзакцию
-            self.cursor.execute(
-                "INSERT INTO transactions (account_id, amount, description, category, transaction_type) VALUES (?, ?, ?, ?, ?)",
-                (account_id, -amount, f"Авто: {description}", category, "expense")
-            )
+        account = self.get_account_by_id(account_id)
+        if not account:
+            return False, "Счёт не найден", None
+        
+        if transaction_type == "income":
+            if not category:
+                category = self.suggest_category(description, amount, account_id, "income") or category
+            self._insert_transaction(account_id, amount, f"Авто: {description}", category, "income", transaction_date)
+            self.cursor.execute("UPDATE accounts SET balance = ? WHERE id = ?", (account[2] + amount, account_id))
+            self.metrics.inc("finance_operations_total", type="income")
+            return True, "Доход зачислен", None
+        
+        if account[2] < amount:
+            return False, "Недостаточно средств", None
+        if not category:
+            category = self.suggest_category(description, amount, account_id, "expense") or category
+        self._insert_transaction(account_id, -amount, f"Авто: {description}", category, "expense", transaction_date)
+        self.cursor.execute("UPDATE accounts SET balance = ? WHERE id = ?", (account[2] - amount, account_id))
+        self._apply_budget_delta(category, amount, due, account[4])
+        self.metrics.inc("finance_operations_total", type="expense")
+        return True, "Автоплатеж выполнен", category
+    
+    @undoable("Проведение регулярных платежей")
+    def process_recurring_payments(self, today=None):
+        """
+        Проводит все наступившие регулярные операции (next_due <= сегодня), включая пропущенные
+        с прошлого запуска. Платёж, который не удалось провести, остаётся к оплате до следующего запуска.
+        """
+        started = time.perf_counter()
+        self.metrics.inc("finance_recurring_runs_total")
+        try:
+            today = today or date.today()
             
-            # Обновляем баланс счета
-            new_balance = account[2] - amount
+            # Наступившие платежи находятся по индексу (active, next_due)
             self.cursor.execute(
-                "UPDATE accounts SET balance = ? WHERE id = ?",
-                (new_balance, account_id)
+                """SELECT id, account_id, amount, description, category, rule, payment_day, anchor_date,
+                next_due, transaction_type, to_account_id
+                FROM recurring_payments WHERE active = 1 AND next_due <= ? ORDER BY next_due""",
+                (today.strftime("%Y-%m-%d"),)
             )
+            payments = self.cursor.fetchall()
             
-            # Обновляем дату последней обработки платежа
-            self.cursor.execute(
-                "UPDATE recurring_payments SET last_processed = ? WHERE id = ?",
-                (today.strftime("%Y-%m-%d"), payment_id)
-            )
+            results = []
+            with self.batch():
+                for payment in payments:
+                    (payment_id, account_id, amount, description, category, rule, payment_day, anchor_date,
+                     next_due, transaction_type, to_account_id) = payment
+                    recurrence = self.recurrence_rule(rule, payment_day, anchor_date)
+                    due = self._parse_db_date(next_due)
+                    last_processed = None
+                    
+                    while due <= today:
+                        success, message, expense_category = self._run_recurring(
+                            account_id, amount, description, category, transaction_type, to_account_id, due, today
+                        )
+                        if not success:
+                            results.append((False, f"{description}: {message}"))
+                            self.metrics.inc("finance_recurring_failures_total")
+                            break
+                        results.append((True, f"{description} ({due.strftime('%d.%m.%Y')}): {message}"))
+                        if expense_category is not None:
+                            for alert in self.get_budget_alerts(expense_category):
+                                results.append((False, alert))
+                        last_processed = due
+                        due = recurrence.next_after(due)
+                    
+                    if last_processed:
+                        self.cursor.execute(
+                            "UPDATE recurring_payments SET last_processed = ?, next_due = ? WHERE id = ?",
+                            (last_processed.strftime("%Y-%m-%d"), due.strftime("%Y-%m-%d"), payment_id)
+                        )
             
-            results.append((True, f"{description}: Автоплатеж выполнен"))
-        
-        self.conn.commit()
-        return results
+            return results
+        except Exception:
+            self.metrics.inc("finance_recurring_failures_total")
+            raise
+        finally:
+            self.metrics.observe("finance_recurring_run_duration_seconds", time.perf_counter() - started)
     
     def get_recurring_payments(self):
         self.cursor.execute("""
-            SELECT r.id, r.account_id, a.name, r.amount, r.description, r.category, r.payment_day, r.active 
+            SELECT r.id, r.account_id, a.name, r.amount, r.description, r.category, r.payment_day, r.active,
+                r.rule, r.anchor_date, r.next_due, r.transaction_type, r.to_account_id, ta.name, a.currency
             FROM recurring_payments r
             JOIN accounts a ON r.account_id = a.id
+            LEFT JOIN accounts ta ON r.to_account_id = ta.id
+            ORDER BY r.next_due
         """)
         return self.cursor.fetchall()
     
-    def update_recurring_payment(self, payment_id, account_id=None, amount=None, description=None, payment_day=None, active=None):
+    @undoable("Изменение регулярного платежа")
+    def update_recurring_payment(self, payment_id, account_id=None, amount=None, description=None, payment_day=None, active=None,
+                                 rule=None, anchor_date=None):
         self.cursor.execute(
-            "SELECT account_id, amount, description, payment_day, active FROM recurring_payments WHERE id = ?",
+            """SELECT account_id, amount, description, payment_day, active, rule, anchor_date, last_processed, next_due
+            FROM recurring_payments WHERE id = ?""",
             (payment_id,)
         )
         payment = self.cursor.fetchone()
@@ -499,28 +4369,45 @@ class FinanceTracker:
         new_description = description if description is not None else payment[2]
         new_payment_day = payment_day if payment_day is not None else payment[3]
         new_active = active if active is not None else payment[4]
+        new_rule = rule if rule is not None else payment[5]
+        new_anchor = anchor_date if anchor_date is not None else payment[6]
+        if new_rule in ("weekly", "biweekly", "yearly") and new_anchor is None:
+            new_anchor = date.today()
+        
+        try:
+            recurrence = self.recurrence_rule(new_rule, new_payment_day, new_anchor)
+        except ValueError as e:
+            return False, str(e)
         
-        if new_payment_day < 1 or new_payment_day > 31:
-            return False, "День платежа должен быть от 1 до 31"
+        # Расписание изменилось или платёж снова включён - пропущенные даты не наверстываем
+        next_due = payment[8]
+        if (payment_day is not None or rule is not None or anchor_date is not None
+                or (new_active and not payment[4])):
+            next_due = self._first_due(recurrence, payment[7]).strftime("%Y-%m-%d")
+        new_anchor = recurrence.anchor.strftime("%Y-%m-%d") if recurrence.anchor else None
         
         try:
             self.cursor.execute(
                 """UPDATE recurring_payments 
-                SET account_id = ?, amount = ?, description = ?, payment_day = ?, active = ?
+                SET account_id = ?, amount = ?, description = ?, payment_day = ?, active = ?,
+                    rule = ?, anchor_date = ?, next_due = ?
                 WHERE id = ?""",
-                (new_account_id, new_amount, new_description, new_payment_day, new_active, payment_id)
+                (new_account_id, new_amount, new_description, new_payment_day, new_active,
+                 new_rule, new_anchor, next_due, payment_id)
             )
             self.conn.commit()
             return True, "Регулярный платеж обновлен"
         except Exception as e:
             return False, str(e)
     
+    @undoable("Удаление регулярного платежа")
     def delete_recurring_payment(self, payment_id):
         self.cursor.execute("DELETE FROM recurring_payments WHERE id = ?", (payment_id,))
         self.conn.commit()
         return True, "Регулярный платеж удален"
     
     # Методы для запланированных платежей
+    @undoable("Новый запланированный платёж")
     def add_planned_payment(self, account_id, amount, description, planned_date, category=""):
         account = self.get_account_by_id(account_id)
         if not account:
@@ -561,6 +4448,7 @@ class FinanceTracker:
         
         return original_data
     
+    @undoable("Изменение запланированного платежа")
     def update_planned_payment(self, payment_id, account_id=None, amount=None, description=None, category=None, planned_date=None):
         """Обновляет запланированный платеж"""
         # Пробуем получить реальный ID из расширенного кортежа
@@ -617,6 +4505,7 @@ class FinanceTracker:
         except Exception as e:
             return False, str(e)
     
+    @undoable("Выполнение запланированного платежа")
     def execute_planned_payment(self, payment_id):
         # Пробуем получить реальный ID из расширенного кортежа
         if isinstance(payment_id, int):
@@ -662,10 +4551,7 @@ class FinanceTracker:
         
         try:
             # Добавляем транзакцию
-            self.cursor.execute(
-                "INSERT INTO transactions (account_id, amount, description, category, transaction_type) VALUES (?, ?, ?, ?, ?)",
-                (account_id, -amount, description, category, "expense")
-            )
+            self._insert_transaction(account_id, -amount, description, category, "expense")
             
             # Обновляем баланс счета
             new_balance = account[2] - amount
@@ -674,6 +4560,8 @@ class FinanceTracker:
                 (new_balance, account_id)
             )
             
+            self._apply_budget_delta(category, amount, currency=account[4])
+            
             # Отмечаем платеж как выполненный
             self.cursor.execute(
                 "UPDATE planned_payments SET completed = 1 WHERE id = ?",
@@ -681,10 +4569,16 @@ class FinanceTracker:
             )
             
             self.conn.commit()
-            return True, "Запланированный платеж выполнен"
+            self.metrics.inc("finance_operations_total", type="expense")
+            message = "Запланированный платеж выполнен"
+            alerts = self.get_budget_alerts(category)
+            if alerts:
+                message += "\n" + "\n".join(alerts)
+            return True, message
         except Exception as e:
             return False, str(e)
     
+    @undoable("Удаление запланированного платежа")
     def delete_planned_payment(self, payment_id):
         # Пробуем получить реальный ID из расширенного кортежа
         if isinstance(payment_id, int):
@@ -714,141 +4608,746 @@ class FinanceTracker:
         self.conn.commit()
         return True, "Запланированный платеж удален"
     
+    # Прогноз движения денег по регулярным и запланированным платежам
+    def _cashflow_stream(self, dates, account_id, amount, description, source, today):
+        for day in dates:
+            yield max(day, today), account_id, amount, description, source
+    
+    def iter_cashflows(self, horizon_days, today=None):
+        """
+        Будущие движения по счетам в порядке дат: (дата, счёт, сумма со знаком, описание, источник).
+        Каждое расписание - ленивый генератор, heapq.merge сливает их по дате,
+        поэтому даты не строятся заранее для всего горизонта. Просроченные
+        регулярные и запланированные платежи считаются сегодняшними.
+        """
+        import heapq
+        
+        today = today or date.today()
+        end = today + datetime.timedelta(days=horizon_days)
+        
+        streams = []
+        currencies = {account[0]: account[4] for account in self.get_accounts()}
+        self.cursor.execute(
+            """SELECT account_id, amount, description, rule, payment_day, anchor_date, next_due,
+            transaction_type, to_account_id
+            FROM recurring_payments WHERE active = 1 AND next_due <= ?""",
+            (end.strftime("%Y-%m-%d"),)
+        )
+        for (account_id, amount, description, rule, payment_day, anchor_date, next_due,
+             transaction_type, to_account_id) in self.cursor.fetchall():
+            # Даты считаются тем же правилом, что и при проведении; пропущенные платежи - сегодняшние
+            recurrence = self.recurrence_rule(rule, payment_day, anchor_date)
+            dates = recurrence.occurrences(self._parse_db_date(next_due), end)
+            if transaction_type == "income":
+                streams.append(self._cashflow_stream(dates, account_id, amount, description, "recurring", today))
+                continue
+            if transaction_type == "transfer":
+                to_amount = amount
+                if currencies.get(account_id) != currencies.get(to_account_id):
+                    to_amount = round(self.convert_amount(amount, currencies[account_id], currencies[to_account_id]), 2)
+                # Второй проход по тем же датам - зачисление на счёт получателя
+                to_dates = recurrence.occurrences(self._parse_db_date(next_due), end)
+                streams.append(self._cashflow_stream(to_dates, to_account_id, to_amount, description, "recurring", today))
+            streams.append(self._cashflow_stream(dates, account_id, -amount, description, "recurring", today))
+        
+        # Запланированные платежи уже упорядочены по дате - читаем их отдельным курсором по мере слияния
+        planned_cursor = self.conn.cursor()
+        planned_cursor.execute(
+            """SELECT account_id, amount, description, planned_date FROM planned_payments
+            WHERE completed = 0 AND planned_date <= ? ORDER BY planned_date""",
+            (end.strftime("%Y-%m-%d"),)
+        )
+        streams.append(
+            (max(self._parse_db_date(planned_date), today), account_id, -amount, description, "planned")
+            for account_id, amount, description, planned_date in planned_cursor
+        )
+        
+        return heapq.merge(*streams, key=lambda event: event[0])
+    
+    def forecast_balances(self, horizon_days=90, today=None):
+        """
+        Прогноз остатков счетов на horizon_days вперёд с учётом регулярных и запланированных платежей.
+        Возвращает {id счёта: {...}} с остатком на конец горизонта, минимальным остатком и его датой,
+        а также первой датой, когда остаток уйдёт в минус (None, если не уйдёт).
+        """
+        today = today or date.today()
+        forecast = {}
+        for account_id, name, balance, _, currency in self.get_accounts():
+            forecast[account_id] = {
+                "name": name,
+                "currency": currency,
+                "start_balance": balance,
+                "end_balance": balance,
+                "min_balance": balance,
+                "min_date": today,
+                "first_negative": today if balance < 0 else None,
+                "payments": 0,
+            }
+        
+        for day, account_id, amount, _, _ in self.iter_cashflows(horizon_days, today):
+            account = forecast.get(account_id)
+            if account is None:
+                continue
+            account["end_balance"] += amount
+            account["payments"] += 1
+            if account["end_balance"] < account["min_balance"]:
+                account["min_balance"] = account["end_balance"]
+                account["min_date"] = day
+            if account["end_balance"] < 0 and account["first_negative"] is None:
+                account["first_negative"] = day
+        
+        return forecast
+    
     # Методы для получения статистики/отчетов
-    def get_transactions(self, account_id=None, start_date=None, end_date=None, transaction_type=None, limit=None):
+    def get_transactions(self, account_id=None, start_date=None, end_date=None, transaction_type=None, limit=None,
+                         tag_filter=None):
+        """tag_filter - {"any": [...], "all": [...], "none": [...]} по названиям меток"""
+        query = """
+            SELECT t.id, t.account_id, a.name, t.amount, t.description, t.category, t.transaction_date, t.transaction_type, a.currency
+            FROM transactions t
+            JOIN accounts a ON t.account_id = a.id
+            WHERE 1=1
+        """
+        params = []
+        
+        if account_id:
+            query += " AND t.account_id = ?"
+            params.append(account_id)
+        
+        if start_date:
+            query += " AND DATE(t.transaction_date) >= DATE(?)"
+            params.append(start_date)
+        
+        if end_date:
+            query += " AND DATE(t.transaction_date) <= DATE(?)"
+            params.append(end_date)
+        
+        if transaction_type:
+            query += " AND t.transaction_type = ?"
+            params.append(transaction_type)
+        
+        tag_sql, tag_params = self._tag_filter_sql(tag_filter)
+        query += tag_sql
+        params.extend(tag_params)
+        
+        query += " ORDER BY t.transaction_date DESC"
+        
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        
+        self.cursor.execute(query, params)
+        return self.cursor.fetchall()
+    
+    def get_transactions_page(self, account_id=None, after=None, before=None, limit=50):
+        """
+        Страница операций от новых к старым для прокрутки без OFFSET: after=(дата, id) - ближайшие limit
+        операций старше этой, before=(дата, id) - ближайшие новее неё. Каждая страница читается по индексу
+        прямо с нужного места, поэтому прокрутка в конец длинного журнала стоит столько же, сколько в начало.
+        Строки в формате get_transactions.
+        """
+        query = """
+            SELECT t.id, t.account_id, a.name, t.amount, t.description, t.category, t.transaction_date, t.transaction_type, a.currency
+            FROM transactions t
+            JOIN accounts a ON t.account_id = a.id
+            WHERE 1=1
+        """
+        params = []
+        
+        if account_id:
+            query += " AND t.account_id = ?"
+            params.append(account_id)
+        
+        if after:
+            query += " AND (t.transaction_date, t.id) < (?, ?)"
+            params.extend(after)
+        
+        if before:
+            query += " AND (t.transaction_date, t.id) > (?, ?)"
+            params.extend(before)
+        
+        # Страницу над before читаем от неё вверх и переворачиваем
+        order = "ASC" if before and not after else "DESC"
+        query += f" ORDER BY t.transaction_date {order}, t.id {order} LIMIT {int(limit)}"
+        
+        self.cursor.execute(query, params)
+        rows = self.cursor.fetchall()
+        return rows[::-1] if order == "ASC" else rows
+    
+    def count_transactions(self, account_id=None, newer_than=None):
+        """
+        Число операций (по счёту, если задан); newer_than=(дата, id) - только новее этой операции.
+        Целые дни считаются по дневным суммам daily_totals, из журнала читается только день самой операции.
+        """
+        account_sql = " AND account_id = ?" if account_id else ""
+        account_params = [account_id] if account_id else []
+        
+        if newer_than is None:
+            self.cursor.execute(f"SELECT COALESCE(SUM(count), 0) FROM daily_totals WHERE 1=1 {account_sql}", account_params)
+            return self.cursor.fetchone()[0]
+        
+        day = newer_than[0][:10]
+        self.cursor.execute(
+            f"""SELECT
+                (SELECT COALESCE(SUM(count), 0) FROM daily_totals WHERE day > ? {account_sql}),
+                (SELECT COUNT(*) FROM transactions
+                 WHERE transaction_date >= ? AND transaction_date < ? AND (transaction_date, id) > (?, ?) {account_sql})""",
+            [day] + account_params + [day, self._next_day(day), newer_than[0], newer_than[1]] + account_params
+        )
+        later_days, same_day = self.cursor.fetchone()
+        return later_days + same_day
+    
+    def export_transactions(self, output, account_id=None, start_date=None, end_date=None, transaction_type=None,
+                            tag_filter=None):
+        """
+        Пишет операции в CSV (файловый объект output) от старых к новым, читая базу порциями,
+        поэтому память не зависит от размера истории. Возвращает количество строк.
+        """
+        import csv
+        
         query = """
-            SELECT t.id, t.account_id, a.name, t.amount, t.description, t.category, t.transaction_date, t.transaction_type
+            SELECT t.id, t.transaction_date, a.name, t.transaction_type, t.amount, a.currency, t.category, t.description
             FROM transactions t
             JOIN accounts a ON t.account_id = a.id
             WHERE 1=1
         """
         params = []
         
-        if account_id:
-            query += " AND t.account_id = ?"
-            params.append(account_id)
+        if account_id:
+            query += " AND t.account_id = ?"
+            params.append(account_id)
+        
+        if start_date:
+            query += " AND t.transaction_date >= ?"
+            params.append(start_date)
+        
+        if end_date:
+            query += " AND t.transaction_date < ?"
+            params.append(self._next_day(end_date))
+        
+        if transaction_type:
+            query += " AND t.transaction_type = ?"
+            params.append(transaction_type)
+        
+        tag_sql, tag_params = self._tag_filter_sql(tag_filter)
+        query += tag_sql
+        params.extend(tag_params)
+        
+        query += " ORDER BY t.transaction_date, t.id"
+        
+        writer = csv.writer(output)
+        writer.writerow(["id", "date", "account", "type", "amount", "currency", "category", "description"])
+        
+        read_cursor = self.conn.cursor()
+        read_cursor.execute(query, params)
+        count = 0
+        while True:
+            rows = read_cursor.fetchmany(1000)
+            if not rows:
+                break
+            writer.writerows(rows)
+            count += len(rows)
+        read_cursor.close()
+        return count
+    
+    def export_statement(self, path, account_id, start_date, end_date, font_path=None):
+        """
+        Выписка по счёту за период в PDF: остатки на начало и конец, итоги, суммы по категориям
+        и все операции и переводы по дням с остатком после каждой. Строки читаются порциями
+        (fetchmany) и сразу раскладываются по страницам, которые тут же пишутся в файл,
+        поэтому память не зависит от длины выписки, а время растёт линейно с числом страниц.
+        """
+        import heapq
+        
+        try:
+            account = self.get_account_by_id(account_id)
+            if not account:
+                return False, "Счёт не найден"
+            _, account_name, balance, _, currency = account
+            end_bound = self._next_day(end_date)
+            if start_date[:10] >= end_bound:
+                return False, "Начало периода позже конца"
+            
+            # Остаток на начало: текущий баланс без всего, что случилось с начала периода
+            params = {"account": account_id, "start": start_date[:10], "end": end_bound}
+            self.cursor.execute(
+                """SELECT
+                    (SELECT COALESCE(SUM(amount), 0) FROM transactions
+                     WHERE account_id = :account AND transaction_date >= :start),
+                    (SELECT COALESCE(SUM(COALESCE(to_amount, amount)), 0) FROM transfers
+                     WHERE to_account_id = :account AND transfer_date >= :start),
+                    (SELECT COALESCE(SUM(amount), 0) FROM transfers
+                     WHERE from_account_id = :account AND transfer_date >= :start),
+                    (SELECT COALESCE(SUM(COALESCE(to_amount, amount)), 0) FROM transfers
+                     WHERE to_account_id = :account AND transfer_date >= :start AND transfer_date < :end),
+                    (SELECT COALESCE(SUM(amount), 0) FROM transfers
+                     WHERE from_account_id = :account AND transfer_date >= :start AND transfer_date < :end)""",
+                params
+            )
+            since_transactions, since_in, since_out, transfers_in, transfers_out = self.cursor.fetchone()
+            opening = balance - since_transactions - since_in + since_out
+            
+            # Суммы по категориям; разделённые операции - по категориям своих строк
+            self.cursor.execute(
+                f"""SELECT {self.LINE_CATEGORY_SQL} AS line_category, t.transaction_type, SUM({self.LINE_AMOUNT_SQL})
+                FROM transactions t {self.SPLIT_LINES_JOIN}
+                WHERE t.account_id = :account AND t.transaction_date >= :start AND t.transaction_date < :end
+                GROUP BY line_category, t.transaction_type
+                ORDER BY ABS(SUM({self.LINE_AMOUNT_SQL})) DESC""",
+                params
+            )
+            categories = {"income": [], "expense": []}
+            for category, transaction_type, total in self.cursor.fetchall():
+                categories.setdefault(transaction_type, []).append((category or "Без категории", abs(total)))
+            income = sum(total for _, total in categories["income"])
+            expense = sum(total for _, total in categories["expense"])
+            closing = opening + income - expense + transfers_in - transfers_out
+            
+            def stream(query):
+                read_cursor = self.conn.cursor()
+                read_cursor.execute(query, params)
+                while True:
+                    rows = read_cursor.fetchmany(1000)
+                    if not rows:
+                        break
+                    yield from rows
+                read_cursor.close()
+            
+            # Операции идут по индексу даты, переводы - отдельным запросом; слияние сохраняет порядок дат
+            movements = heapq.merge(
+                stream("""SELECT transaction_date, description, category, amount FROM transactions
+                    WHERE account_id = :account AND transaction_date >= :start AND transaction_date < :end
+                    ORDER BY transaction_date, id"""),
+                stream("""SELECT tr.transfer_date, 'Перевод на счёт «' || a.name || '»'
+                        || CASE WHEN tr.description != '' THEN ': ' || tr.description ELSE '' END,
+                        'Перевод', -tr.amount, tr.id
+                    FROM transfers tr JOIN accounts a ON a.id = tr.to_account_id
+                    WHERE tr.from_account_id = :account AND tr.transfer_date >= :start AND tr.transfer_date < :end
+                    UNION ALL
+                    SELECT tr.transfer_date, 'Перевод со счёта «' || a.name || '»'
+                        || CASE WHEN tr.description != '' THEN ': ' || tr.description ELSE '' END,
+                        'Перевод', COALESCE(tr.to_amount, tr.amount), tr.id
+                    FROM transfers tr JOIN accounts a ON a.id = tr.from_account_id
+                    WHERE tr.to_account_id = :account AND tr.transfer_date >= :start AND tr.transfer_date < :end
+                    ORDER BY 1, 5"""),
+                key=lambda row: row[0]
+            )
+            
+            f = open(path, "wb")  # Если файл не открылся, удалять нечего
+            try:
+                with f:
+                    pdf = PdfWriter(f, font_path)
+                    count = self._write_statement(pdf, account_name, currency, start_date[:10], end_date[:10], opening,
+                                                  closing, income, expense, transfers_in, transfers_out, categories,
+                                                  movements)
+                    pages = pdf.close()
+            except Exception:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)  # Недописанный файл не оставляем
+                raise
+            return True, f"Выписка сохранена в {path}: страниц {pages}, операций {count}"
+        except Exception as e:
+            return False, str(e)
+    
+    def _write_statement(self, pdf, account_name, currency, start_date, end_date, opening, closing, income, expense,
+                         transfers_in, transfers_out, categories, movements):
+        """Раскладывает выписку по страницам PdfWriter; возвращает число операций"""
+        margin = 40
+        right = pdf.PAGE_WIDTH - margin
+        symbol = self.get_currency_symbol(currency)
+        period = f"{format_date(start_date)} - {format_date(end_date)}"
+        
+        def money(value, sign=False):
+            return f"{value:{'+' if sign else ''},.2f}".replace(",", " ")
+        
+        def footer():
+            pdf.line(margin, 32, right, 32)
+            pdf.text(margin, 20, pdf.fit(f"{account_name} · {period}", 400, 7), 7)
+            pdf.text(right, 20, f"Стр. {len(pdf.page_ids) + 1}", 7, "right")
+        
+        # Колонки таблицы операций: дата, описание, категория, сумма и остаток (по правому краю)
+        columns = (margin, margin + 58, margin + 280, right - 75, right)
+        
+        def table_header(y):
+            pdf.rect(margin, y - 4, right - margin, 14)
+            for x, title, align in zip(columns, ("Дата", "Описание", "Категория", "Сумма", "Остаток"),
+                                       ("left", "left", "left", "right", "right")):
+                pdf.text(x, y, title, 8, align)
+            return y - 15
+        
+        y = pdf.PAGE_HEIGHT - margin - 10
+        pdf.text(margin, y, pdf.fit(f"Выписка по счёту «{account_name}»", right - margin, 16), 16)
+        y -= 20
+        pdf.text(margin, y, f"Период: {period}    Валюта: {currency}    "
+                            f"Сформирована: {format_date(datetime.date.today().isoformat())}", 9)
+        y -= 26
+        
+        for label, value in (("Остаток на начало периода", money(opening)),
+                             ("Доходы", money(income, True)),
+                             ("Расходы", money(-expense, True)),
+                             ("Переводы на счёт", money(transfers_in, True)),
+                             ("Переводы со счёта", money(-transfers_out, True)),
+                             ("Остаток на конец периода", money(closing))):
+            pdf.text(margin, y, label, 10)
+            pdf.text(margin + 300, y, f"{value} {symbol}", 10, "right")
+            y -= 15
+        pdf.line(margin, y + 10, margin + 300, y + 10)
+        
+        # Доли категорий: название, сумма, процент и полоса
+        for title, rows, total in (("Расходы по категориям", categories["expense"], expense),
+                                   ("Доходы по категориям", categories["income"], income)):
+            if not rows:
+                continue
+            y -= 12
+            pdf.text(margin, y, title, 11)
+            y -= 15
+            for category, amount in rows:
+                if y < 120:
+                    break
+                share = amount / total if total else 0
+                pdf.text(margin, y, pdf.fit(category, 170, 9), 9)
+                pdf.text(margin + 255, y, money(amount), 9, "right")
+                pdf.text(margin + 300, y, f"{share * 100:.1f}%", 9, "right")
+                pdf.rect(margin + 310, y - 1, max(0.5, 200 * share), 7, 0.6)
+                y -= 12
+        
+        y -= 14
+        pdf.text(margin, y, "Операции", 11)
+        y = table_header(y - 18)
+        
+        count = 0
+        running = opening
+        for day, description, category, amount, *_ in movements:
+            if y < 50:
+                footer()
+                pdf.end_page()
+                y = table_header(pdf.PAGE_HEIGHT - margin)
+            running += amount
+            count += 1
+            pdf.text(columns[0], y, format_date(day), 8)
+            pdf.text(columns[1], y, pdf.fit(description or "", columns[2] - columns[1] - 8, 8), 8)
+            pdf.text(columns[2], y, pdf.fit(category or "", columns[3] - columns[2] - 60, 8), 8)
+            pdf.text(columns[3], y, money(amount, True), 8, "right")
+            pdf.text(columns[4], y, money(running), 8, "right")
+            y -= 11
+        
+        if y < 70:
+            footer()
+            pdf.end_page()
+            y = pdf.PAGE_HEIGHT - margin
+        pdf.line(margin, y + 6, right, y + 6)
+        pdf.text(margin, y - 6, f"Операций и переводов: {count}", 9)
+        pdf.text(right, y - 6, f"Остаток на конец периода: {money(closing)} {symbol}", 9, "right")
+        footer()
+        return count
+    
+    # Формат данных дашборда: при смене формата повторная выгрузка пересчитывает всё
+    DASHBOARD_FORMAT = "finance-tracker-dashboard/1"
+    
+    def export_dashboard(self, path, full=False, upcoming_days=30, today=None):
+        """
+        Статический HTML-дашборд для просмотра с телефона: тренды по месяцам, категории, остатки счетов
+        и ближайшие платежи. Все агрегаты считаются при выгрузке и встраиваются в страницу JSON-блоками,
+        поэтому она открывается мгновенно и без сервера. Суммы по месяцам и категориям - один
+        сгруппированный запрос; при повторной выгрузке в тот же файл пересчитываются только месяцы,
+        версия которых в dashboard_months изменилась (full=True - пересчитать всё).
+        """
+        try:
+            today = today or date.today()
+            self.cursor.execute("SELECT COUNT(*), TOTAL(rate), MAX(rate_date) FROM fx_rates")
+            fx_state = "/".join(str(value) for value in self.cursor.fetchone())
+            self.cursor.execute("SELECT month, version FROM dashboard_months")
+            versions = dict(self.cursor.fetchall())
+            # Версии месяцев своя у каждой базы: в файл, выгруженный из другой, они могут случайно совпасть
+            ledger = self.get_sync_device()[0]
+            
+            # Месяцы прошлой выгрузки переиспользуются, если совпадают база, формат, валюта и курсы
+            months = {}
+            previous = None if full else self._read_dashboard_data(path, "dashboard-months")
+            if (previous and previous.get("format") == self.DASHBOARD_FORMAT and previous.get("ledger") == ledger
+                    and previous.get("currency") == self.report_currency and previous.get("fx") == fx_state):
+                months = {month: data for month, data in previous["months"].items()
+                          if versions.get(month) == data["version"]}
+            stale = sorted(month for month in versions if month not in months)
+            
+            if stale:
+                # Подряд идущие месяцы объединяем в один диапазон дат
+                ranges = []
+                for month in stale:
+                    start = f"{month}-01"
+                    if ranges and ranges[-1][1] == start:
+                        ranges[-1][1] = self._next_month_start(month)
+                    else:
+                        ranges.append([start, self._next_month_start(month)])
+                period_sql = " OR ".join("(t.transaction_date >= ? AND t.transaction_date < ?)" for _ in ranges)
+                
+                amount_sql, join_sql = self._report_amount_sql(amount_expr=self.LINE_AMOUNT_SQL)
+                self.cursor.execute(
+                    f"""SELECT substr(t.transaction_date, 1, 7) AS month, t.transaction_type,
+                        {self.LINE_CATEGORY_SQL} AS line_category, SUM({amount_sql})
+                    FROM transactions t {self.SPLIT_LINES_JOIN} {join_sql}
+                    WHERE {period_sql}
+                    GROUP BY month, t.transaction_type, line_category""",
+                    [day for period in ranges for day in period]
+                )
+                # Месяц, из которого удалили все операции, остаётся с нулями до следующего изменения
+                for month in stale:
+                    months[month] = {"version": versions[month], "income": 0, "expense": 0,
+                                     "categories": {"income": {}, "expense": {}}}
+                for month, transaction_type, category, total in self.cursor.fetchall():
+                    data = months[month]
+                    if transaction_type not in ("income", "expense") or total is None:
+                        continue
+                    total = round(abs(total), 2)
+                    data[transaction_type] = round(data[transaction_type] + total, 2)
+                    data["categories"][transaction_type][category or "Без категории"] = total
+            
+            accounts = {account_id: {"name": name, "type": account_type, "balance": round(balance, 2),
+                                     "currency": currency, "symbol": self.get_currency_symbol(currency)}
+                        for account_id, name, balance, account_type, currency in self.get_accounts()}
+            upcoming = []
+            for day, account_id, amount, description, source in self.iter_cashflows(upcoming_days, today):
+                account = accounts.get(account_id, {"name": "", "symbol": ""})
+                upcoming.append({"date": day.isoformat(), "account": account["name"], "symbol": account["symbol"],
+                                 "amount": round(amount, 2), "description": description or "", "source": source})
+                if len(upcoming) == 100:
+                    break
+            
+            summary = {
+                "generated": datetime.datetime.now().strftime("%d.%m.%Y %H:%M"),
+                "currency": self.report_currency,
+                "symbol": self.get_currency_symbol(),
+                "total_balance": round(self.get_total_balance(), 2),
+                "accounts": list(accounts.values()),
+                "upcoming_days": upcoming_days,
+                "upcoming": upcoming,
+            }
+            month_data = {"format": self.DASHBOARD_FORMAT, "ledger": ledger, "currency": self.report_currency,
+                          "fx": fx_state, "months": dict(sorted(months.items()))}
+            
+            def blob(data):
+                # "</" внутри JSON закрыл бы тег script
+                return json.dumps(data, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+            
+            # Оба блока подставляются за один проход: "__MONTHS__" в названиях из summary останется текстом
+            blobs = {"__SUMMARY__": blob(summary), "__MONTHS__": blob(month_data)}
+            html = re.sub("__SUMMARY__|__MONTHS__", lambda match: blobs[match.group(0)], DASHBOARD_HTML)
+            
+            # Пишем во временный файл и подменяем: прошлая выгрузка остаётся целой при ошибке
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(html)
+            os.replace(tmp_path, path)
+            return True, f"Дашборд сохранён в {path}: месяцев {len(months)}, пересчитано {len(stale)}"
+        except Exception as e:
+            return False, str(e)
+    
+    def _read_dashboard_data(self, path, block_id):
+        """JSON-блок прошлой выгрузки дашборда или None, если файла нет или он не читается"""
+        marker = f'<script type="application/json" id="{block_id}">'
+        try:
+            with open(path, encoding="utf-8") as f:
+                html = f.read()
+            start = html.index(marker) + len(marker)
+            return json.loads(html[start:html.index("</script>", start)])
+        except (OSError, ValueError):
+            return None
+    
+    def _next_month_start(self, month):
+        """Первый день следующего месяца для строки ГГГГ-ММ"""
+        year, month = int(month[:4]), int(month[5:7])
+        return f"{year + month // 12}-{month % 12 + 1:02d}-01"
+    
+    def search_transactions(self, query, filters=None, limit=20, offset=0):
+        """
+        Ищет операции по словам в описании и категории (поиск по началу слова).
+        Сводные строки архива в поиск не попадают - их описание служебное.
+        filters - словарь с необязательными ключами account_id, start_date, end_date, transaction_type.
+        Результаты отсортированы по релевантности, формат строк как у get_transactions.
+        """
+        words = [w for w in query.replace('"', ' ').split() if w]
+        if not words:
+            return []
+        
+        filters = filters or {}
+        params = []
+        
+        if self.fts_enabled:
+            # Каждое слово ищем как префикс: "netfl" найдет "Netflix"
+            match_query = " ".join(f'"{w}"*' for w in words)
+            sql = """
+                SELECT t.id, t.account_id, a.name, t.amount, t.description, t.category, t.transaction_date, t.transaction_type, a.currency
+                FROM transactions_fts f
+                JOIN transactions t ON t.id = f.rowid
+                JOIN accounts a ON t.account_id = a.id
+                WHERE transactions_fts MATCH ? AND t.is_rollup = 0
+            """
+            params.append(match_query)
+        else:
+            sql = """
+                SELECT t.id, t.account_id, a.name, t.amount, t.description, t.category, t.transaction_date, t.transaction_type, a.currency
+                FROM transactions t
+                JOIN accounts a ON t.account_id = a.id
+                WHERE t.is_rollup = 0
+            """
+            for w in words:
+                sql += " AND (t.description LIKE ? OR t.category LIKE ?)"
+                params.extend([f"%{w}%", f"%{w}%"])
         
-        if start_date:
-            query += " AND DATE(t.transaction_date) >= DATE(?)"
-            params.append(start_date)
+        if filters.get("account_id"):
+            sql += " AND t.account_id = ?"
+            params.append(filters["account_id"])
         
-        if end_date:
-            query += " AND DATE(t.transaction_date) <= DATE(?)"
-            params.append(end_date)
+        if filters.get("start_date"):
+            sql += " AND DATE(t.transaction_date) >= DATE(?)"
+            params.append(filters["start_date"])
         
-        if transaction_type:
-            query += " AND t.transaction_type = ?"
-            params.append(transaction_type)
+        if filters.get("end_date"):
+            sql += " AND DATE(t.transaction_date) <= DATE(?)"
+            params.append(filters["end_date"])
         
-        query += " ORDER BY t.transaction_date DESC"
+        if filters.get("transaction_type"):
+            sql += " AND t.transaction_type = ?"
+            params.append(filters["transaction_type"])
         
-        if limit is not None:
-            query += f" LIMIT {int(limit)}"
+        if self.fts_enabled:
+            sql += " ORDER BY f.rank, t.transaction_date DESC"
+        else:
+            sql += " ORDER BY t.transaction_date DESC"
         
-        self.cursor.execute(query, params)
+        sql += f" LIMIT {int(limit)} OFFSET {int(offset)}"
+        
+        self.cursor.execute(sql, params)
         return self.cursor.fetchall()
     
-    def get_category_summary(self, start_date=None, end_date=None, transaction_type=None):
+    def get_category_summary(self, start_date=None, end_date=None, transaction_type=None, tag_filter=None):
         """
         Получает статистику по категориям для определенного типа транзакций
-        (expense, income) или для всех, если тип не указан
-        """
-        # Если тип не указан, используем все типы
-        if transaction_type is None:
-            query = """
-                SELECT category, transaction_type, SUM(amount) as total
-                FROM transactions
-                WHERE 1=1
-            """
-        else:
-            query = """
-                SELECT category, transaction_type, SUM(amount) as total
-                FROM transactions
-                WHERE transaction_type = ?
-            """
-        
+        (expense, income) или для всех, если тип не указан.
+        Суммы пересчитываются в валюту отчётов прямо в запросе, разделённые операции
+        учитываются по категориям своих строк
+        """
+        amount_sql, join_sql = self._report_amount_sql(amount_expr=self.LINE_AMOUNT_SQL)
+        query = f"""
+            SELECT {self.LINE_CATEGORY_SQL} AS line_category, t.transaction_type, SUM({amount_sql}) as total
+            FROM transactions t {self.SPLIT_LINES_JOIN} {join_sql}
+            WHERE 1=1
+        """
         params = []
+        
         if transaction_type is not None:
+            query += " AND t.transaction_type = ?"
             params.append(transaction_type)
         
         if start_date:
-            query += " AND DATE(transaction_date) >= DATE(?)"
+            query += " AND t.transaction_date >= ?"
             params.append(start_date)
         
         if end_date:
-            query += " AND DATE(transaction_date) <= DATE(?)"
-            params.append(end_date)
+            query += " AND t.transaction_date < ?"
+            params.append(self._next_day(end_date))
         
-        query += " GROUP BY category, transaction_type ORDER BY total ASC"
+        tag_sql, tag_params = self._tag_filter_sql(tag_filter)
+        query += tag_sql
+        params.extend(tag_params)
+        
+        # Группы только из сумм в валютах без курсов пересчитать нельзя - их нет в сводке
+        query += " GROUP BY line_category, t.transaction_type HAVING total IS NOT NULL ORDER BY total ASC"
         
         self.cursor.execute(query, params)
         return self.cursor.fetchall()
     
-    def get_monthly_summary(self, year=None):
+    def get_monthly_summary(self, year=None, tag_filter=None):
         if not year:
             year = datetime.datetime.now().year
-            
+        
+        # Все месяцы года считаем одним сгруппированным запросом
+        amount_sql, join_sql = self._report_amount_sql()
+        tag_sql, tag_params = self._tag_filter_sql(tag_filter)
+        self.cursor.execute(
+            f"""SELECT CAST(strftime('%m', t.transaction_date) AS INTEGER) AS month, t.transaction_type, SUM({amount_sql})
+            FROM transactions t {join_sql}
+            WHERE t.transaction_date >= ? AND t.transaction_date < ? {tag_sql}
+            GROUP BY month, t.transaction_type""",
+            [f"{year}-01-01", f"{year + 1}-01-01"] + tag_params
+        )
+        totals = {(month, transaction_type): total for month, transaction_type, total in self.cursor.fetchall()}
+        
         results = []
         for month in range(1, 13):
-            start_date = f"{year}-{month:02d}-01"
-            last_day = calendar.monthrange(year, month)[1]
-            end_date = f"{year}-{month:02d}-{last_day:02d}"
-            
-            # Получаем доходы за месяц
-            self.cursor.execute(
-                "SELECT SUM(amount) FROM transactions WHERE transaction_type = 'income' AND DATE(transaction_date) BETWEEN ? AND ?",
-                (start_date, end_date)
-            )
-            income = self.cursor.fetchone()[0] or 0
-            
-            # Получаем расходы за месяц
-            self.cursor.execute(
-                "SELECT SUM(amount) FROM transactions WHERE transaction_type = 'expense' AND DATE(transaction_date) BETWEEN ? AND ?",
-                (start_date, end_date)
-            )
-            expense = self.cursor.fetchone()[0] or 0
-            
-            month_name = calendar.month_name[month]
+            income = totals.get((month, "income")) or 0
+            expense = totals.get((month, "expense")) or 0
+            month_name = month_names()[month]
             results.append((month_name, income, expense, income + expense))
             
         return results
     
-    def get_day_comparison(self):
-        """Сравнивает расходы и доходы за сегодня с расходами и доходами за вчера"""
-        today = datetime.date.today()
-        yesterday = today - datetime.timedelta(days=1)
+    # Начало интервала графика по дню из daily_totals; неделя начинается с понедельника
+    CHART_BUCKETS = {
+        "day": "d.day",
+        "week": "date(d.day, 'weekday 0', '-6 days')",
+        "month": "substr(d.day, 1, 7)",
+        "year": "substr(d.day, 1, 4)",
+    }
+    
+    def get_bucket_totals(self, bucket="month", start_date=None, end_date=None, account_id=None):
+        """
+        Доходы и расходы (по модулю) по дням, неделям, месяцам или годам в валюте отчётов:
+        список (начало интервала, доходы, расходы) по возрастанию. Один сгруппированный запрос
+        к дневным суммам daily_totals, без чтения операций.
+        """
+        if bucket not in self.CHART_BUCKETS:
+            raise ValueError(f"Неизвестный интервал: {bucket}")
         
-        # Получаем расходы за сегодня
-        self.cursor.execute(
-            "SELECT SUM(amount) FROM transactions WHERE transaction_type = 'expense' " +
-            "AND DATE(transaction_date) = DATE(?)",
-            (today.strftime("%Y-%m-%d"),)
+        amount_sql, join_sql = self._report_amount_sql(
+            amount_expr="d.total", date_expr="d.day", account_expr="d.account_id"
         )
-        today_expenses = abs(self.cursor.fetchone()[0] or 0)
+        query = f"""
+            SELECT {self.CHART_BUCKETS[bucket]} AS bucket,
+                SUM(CASE WHEN d.transaction_type = 'income' THEN {amount_sql} ELSE 0 END),
+                -SUM(CASE WHEN d.transaction_type = 'expense' THEN {amount_sql} ELSE 0 END)
+            FROM daily_totals d {join_sql}
+            WHERE 1=1
+        """
+        params = []
         
-        # Получаем расходы за вчера
-        self.cursor.execute(
-            "SELECT SUM(amount) FROM transactions WHERE transaction_type = 'expense' " +
-            "AND DATE(transaction_date) = DATE(?)",
-            (yesterday.strftime("%Y-%m-%d"),)
-        )
-        yesterday_expenses = abs(self.cursor.fetchone()[0] or 0)
+        if start_date:
+            query += " AND d.day >= ?"
+            params.append(start_date[:10])
         
-        # Получаем доходы за сегодня
-        self.cursor.execute(
-            "SELECT SUM(amount) FROM transactions WHERE transaction_type = 'income' " +
-            "AND DATE(transaction_date) = DATE(?)",
-            (today.strftime("%Y-%m-%d"),)
-        )
-        today_income = self.cursor.fetchone()[0] or 0
+        if end_date:
+            query += " AND d.day <= ?"
+            params.append(end_date[:10])
+        
+        if account_id is not None:
+            query += " AND d.account_id = ?"
+            params.append(account_id)
         
-        # Получаем доходы за вчера
+        query += " GROUP BY bucket ORDER BY bucket"
+        self.cursor.execute(query, params)
+        return [(bucket, income or 0, expense or 0) for bucket, income, expense in self.cursor.fetchall()]
+    
+    def _get_period_totals(self, start_date, end_date):
+        """Возвращает доходы и расходы (по модулю) за период включительно в валюте отчётов"""
+        amount_sql, join_sql = self._report_amount_sql()
         self.cursor.execute(
-            "SELECT SUM(amount) FROM transactions WHERE transaction_type = 'income' " +
-            "AND DATE(transaction_date) = DATE(?)",
-            (yesterday.strftime("%Y-%m-%d"),)
+            f"""SELECT
+                SUM(CASE WHEN t.transaction_type = 'income' THEN {amount_sql} ELSE 0 END),
+                SUM(CASE WHEN t.transaction_type = 'expense' THEN {amount_sql} ELSE 0 END)
+            FROM transactions t {join_sql}
+            WHERE t.transaction_date >= ? AND t.transaction_date < ?""",
+            (start_date.strftime("%Y-%m-%d"), self._next_day(end_date.strftime("%Y-%m-%d")))
         )
-        yesterday_income = self.cursor.fetchone()[0] or 0
+        income, expense = self.cursor.fetchone()
+        return income or 0, abs(expense or 0)
+    
+    def get_day_comparison(self):
+        """Сравнивает расходы и доходы за сегодня с расходами и доходами за вчера"""
+        today = datetime.date.today()
+        yesterday = today - datetime.timedelta(days=1)
+        
+        # Получаем доходы и расходы за сегодня и за вчера
+        today_income, today_expenses = self._get_period_totals(today, today)
+        yesterday_income, yesterday_expenses = self._get_period_totals(yesterday, yesterday)
         
         # Вычисляем процентное изменение для расходов
         if yesterday_expenses == 0:
@@ -898,37 +5397,9 @@ class FinanceTracker:
         prev_week_start = current_week_start - datetime.timedelta(days=7)
         prev_week_end = current_week_start - datetime.timedelta(days=1)
         
-        # Получаем расходы за текущую неделю
-        self.cursor.execute(
-            "SELECT SUM(amount) FROM transactions WHERE transaction_type = 'expense' " +
-            "AND DATE(transaction_date) BETWEEN DATE(?) AND DATE(?)",
-            (current_week_start.strftime("%Y-%m-%d"), current_week_end.strftime("%Y-%m-%d"))
-        )
-        current_week_expenses = abs(self.cursor.fetchone()[0] or 0)
-        
-        # Получаем расходы за предыдущую неделю
-        self.cursor.execute(
-            "SELECT SUM(amount) FROM transactions WHERE transaction_type = 'expense' " +
-            "AND DATE(transaction_date) BETWEEN DATE(?) AND DATE(?)",
-            (prev_week_start.strftime("%Y-%m-%d"), prev_week_end.strftime("%Y-%m-%d"))
-        )
-        prev_week_expenses = abs(self.cursor.fetchone()[0] or 0)
-        
-        # Получаем доходы за текущую неделю
-        self.cursor.execute(
-            "SELECT SUM(amount) FROM transactions WHERE transaction_type = 'income' " +
-            "AND DATE(transaction_date) BETWEEN DATE(?) AND DATE(?)",
-            (current_week_start.strftime("%Y-%m-%d"), current_week_end.strftime("%Y-%m-%d"))
-        )
-        current_week_income = self.cursor.fetchone()[0] or 0
-        
-        # Получаем доходы за предыдущую неделю
-        self.cursor.execute(
-            "SELECT SUM(amount) FROM transactions WHERE transaction_type = 'income' " +
-            "AND DATE(transaction_date) BETWEEN DATE(?) AND DATE(?)",
-            (prev_week_start.strftime("%Y-%m-%d"), prev_week_end.strftime("%Y-%m-%d"))
-        )
-        prev_week_income = self.cursor.fetchone()[0] or 0
+        # Получаем доходы и расходы за текущую и предыдущую недели
+        current_week_income, current_week_expenses = self._get_period_totals(current_week_start, current_week_end)
+        prev_week_income, prev_week_expenses = self._get_period_totals(prev_week_start, prev_week_end)
         
         # Вычисляем процентное изменение для расходов
         if prev_week_expenses == 0:
@@ -985,37 +5456,9 @@ class FinanceTracker:
         # Последний день предыдущего месяца
         prev_month_end = current_month_start - datetime.timedelta(days=1)
         
-        # Получаем расходы за текущий месяц
-        self.cursor.execute(
-            "SELECT SUM(amount) FROM transactions WHERE transaction_type = 'expense' " +
-            "AND DATE(transaction_date) BETWEEN DATE(?) AND DATE(?)",
-            (current_month_start.strftime("%Y-%m-%d"), current_month_end.strftime("%Y-%m-%d"))
-        )
-        current_month_expenses = abs(self.cursor.fetchone()[0] or 0)
-        
-        # Получаем расходы за предыдущий месяц
-        self.cursor.execute(
-            "SELECT SUM(amount) FROM transactions WHERE transaction_type = 'expense' " +
-            "AND DATE(transaction_date) BETWEEN DATE(?) AND DATE(?)",
-            (prev_month_start.strftime("%Y-%m-%d"), prev_month_end.strftime("%Y-%m-%d"))
-        )
-        prev_month_expenses = abs(self.cursor.fetchone()[0] or 0)
-        
-        # Получаем доходы за текущий месяц
-        self.cursor.execute(
-            "SELECT SUM(amount) FROM transactions WHERE transaction_type = 'income' " +
-            "AND DATE(transaction_date) BETWEEN DATE(?) AND DATE(?)",
-            (current_month_start.strftime("%Y-%m-%d"), current_month_end.strftime("%Y-%m-%d"))
-        )
-        current_month_income = self.cursor.fetchone()[0] or 0
-        
-        # Получаем доходы за предыдущий месяц
-        self.cursor.execute(
-            "SELECT SUM(amount) FROM transactions WHERE transaction_type = 'income' " +
-            "AND DATE(transaction_date) BETWEEN DATE(?) AND DATE(?)",
-            (prev_month_start.strftime("%Y-%m-%d"), prev_month_end.strftime("%Y-%m-%d"))
-        )
-        prev_month_income = self.cursor.fetchone()[0] or 0
+        # Получаем доходы и расходы за текущий и предыдущий месяцы
+        current_month_income, current_month_expenses = self._get_period_totals(current_month_start, current_month_end)
+        prev_month_income, prev_month_expenses = self._get_period_totals(prev_month_start, prev_month_end)
         
         # Вычисляем процентное изменение для расходов
         if prev_month_expenses == 0:
@@ -1040,11 +5483,11 @@ class FinanceTracker:
             ratio_percent_change = 0
         
         return {
-            'current_month': current_month_start.strftime("%B %Y"),
+            'current_month': format_month(current_month_start),
             'current_month_expenses': current_month_expenses,
             'current_month_income': current_month_income,
             'current_month_ratio': current_month_ratio if current_month_ratio != float('inf') else None,
-            'prev_month': prev_month_start.strftime("%B %Y"),
+            'prev_month': format_month(prev_month_start),
             'prev_month_expenses': prev_month_expenses,
             'prev_month_income': prev_month_income,
             'prev_month_ratio': prev_month_ratio if prev_month_ratio != float('inf') else None,
@@ -1053,99 +5496,772 @@ class FinanceTracker:
             'ratio_percent_change': ratio_percent_change
         }
     
-    # Методы для работы с категориями
-    def get_categories(self):
-        self.cursor.execute("SELECT id, name FROM expense_categories ORDER BY name")
-        return self.cursor.fetchall()
-
-    def add_category(self, name):
+    # Методы для работы с категориями
+    def get_categories(self):
+        self.cursor.execute("SELECT id, name FROM expense_categories ORDER BY name")
+        return self.cursor.fetchall()
+
+    def add_category(self, name):
+        try:
+            self.cursor.execute(
+                "INSERT INTO expense_categories (name) VALUES (?)",
+                (name,)
+            )
+            self.conn.commit()
+            self.typeahead_names_loaded = False
+            return True, "Категория успешно добавлена"
+        except sqlite3.IntegrityError:
+            return False, "Категория с таким названием уже существует"
+        except Exception as e:
+            return False, str(e)
+
+    def update_category(self, category_id, new_name):
+        old_category = self.get_category_by_id(category_id)
+        try:
+            self.cursor.execute(
+                "UPDATE expense_categories SET name = ? WHERE id = ?",
+                (new_name, category_id)
+            )
+            # Бюджеты привязаны к названию категории - переименовываем и их
+            if old_category:
+                self.cursor.execute(
+                    "UPDATE budgets SET category = ? WHERE category = ?",
+                    (new_name, old_category[1])
+                )
+            self.conn.commit()
+            self.typeahead_names_loaded = False
+            return True, "Категория успешно обновлена"
+        except sqlite3.IntegrityError:
+            return False, "Категория с таким названием уже существует"
+        except Exception as e:
+            return False, str(e)
+
+    def delete_category(self, category_id):
+        try:
+            self.cursor.execute("DELETE FROM expense_categories WHERE id = ?", (category_id,))
+            self.conn.commit()
+            self.typeahead_names_loaded = False
+            return True, "Категория успешно удалена"
+        except Exception as e:
+            return False, str(e)
+
+    def get_category_by_id(self, category_id):
+        self.cursor.execute("SELECT id, name FROM expense_categories WHERE id = ?", (category_id,))
+        return self.cursor.fetchone()
+
+    def get_category_by_name(self, name):
+        self.cursor.execute("SELECT id, name FROM expense_categories WHERE name = ?", (name,))
+        return self.cursor.fetchone()
+    
+    # Методы для работы с категориями доходов
+    def get_income_categories(self):
+        self.cursor.execute("SELECT id, name FROM income_categories ORDER BY name")
+        return self.cursor.fetchall()
+
+    def add_income_category(self, name):
+        try:
+            self.cursor.execute(
+                "INSERT INTO income_categories (name) VALUES (?)",
+                (name,)
+            )
+            self.conn.commit()
+            self.typeahead_names_loaded = False
+            return True, "Категория дохода успешно добавлена"
+        except sqlite3.IntegrityError:
+            return False, "Категория с таким названием уже существует"
+        except Exception as e:
+            return False, str(e)
+
+    def update_income_category(self, category_id, new_name):
+        try:
+            self.cursor.execute(
+                "UPDATE income_categories SET name = ? WHERE id = ?",
+                (new_name, category_id)
+            )
+            self.conn.commit()
+            self.typeahead_names_loaded = False
+            return True, "Категория дохода успешно обновлена"
+        except sqlite3.IntegrityError:
+            return False, "Категория с таким названием уже существует"
+        except Exception as e:
+            return False, str(e)
+
+    def delete_income_category(self, category_id):
+        try:
+            self.cursor.execute("DELETE FROM income_categories WHERE id = ?", (category_id,))
+            self.conn.commit()
+            self.typeahead_names_loaded = False
+            return True, "Категория дохода успешно удалена"
+        except Exception as e:
+            return False, str(e)
+
+    def get_income_category_by_id(self, category_id):
+        self.cursor.execute("SELECT id, name FROM income_categories WHERE id = ?", (category_id,))
+        return self.cursor.fetchone()
+
+    def get_income_category_by_name(self, name):
+        self.cursor.execute("SELECT id, name FROM income_categories WHERE name = ?", (name,))
+        return self.cursor.fetchone()
+
+    
+    # Методы для работы с правилами автокатегоризации
+    def add_category_rule(self, pattern, category, transaction_type="expense", match_type="substring",
+                          min_amount=None, max_amount=None, account_id=None, priority=0):
+        if not pattern:
+            return False, "Шаблон правила не может быть пустым"
+        
+        if match_type not in ("substring", "regex"):
+            return False, "Тип шаблона должен быть substring или regex"
+        
+        if transaction_type not in ("income", "expense"):
+            return False, "Тип операции должен быть income или expense"
+        
+        if match_type == "regex":
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                return False, f"Некорректное регулярное выражение: {e}"
+            # Правила собираются в одно выражение: в нём нельзя глобальные флаги, ссылки на группы и имена групп
+            reason = CategoryMatcher.merge_error(pattern)
+            if reason:
+                return False, f"Выражение нельзя объединить с другими правилами: уберите {reason}"
+        
+        try:
+            self.cursor.execute(
+                """INSERT INTO category_rules 
+                (pattern, match_type, transaction_type, category, min_amount, max_amount, account_id, priority)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (pattern, match_type, transaction_type, category, min_amount, max_amount, account_id, priority)
+            )
+            self.conn.commit()
+            self.category_matcher = None
+            return True, "Правило добавлено"
+        except Exception as e:
+            return False, str(e)
+    
+    def get_category_rules(self):
+        self.cursor.execute(
+            """SELECT id, pattern, match_type, transaction_type, category, min_amount, max_amount, account_id, priority
+            FROM category_rules ORDER BY priority DESC, id"""
+        )
+        return self.cursor.fetchall()
+    
+    def delete_category_rule(self, rule_id):
+        self.cursor.execute("DELETE FROM category_rules WHERE id = ?", (rule_id,))
+        self.conn.commit()
+        self.category_matcher = None
+        return True, "Правило удалено"
+    
+    def get_category_matcher(self):
+        """Возвращает скомпилированный набор правил, пересобирая его после изменений"""
+        if self.category_matcher is None:
+            self.metrics.inc("finance_cache_requests_total", cache="category_rules", result="miss")
+            self.category_matcher = CategoryMatcher(self.get_category_rules())
+        else:
+            self.metrics.inc("finance_cache_requests_total", cache="category_rules", result="hit")
+        return self.category_matcher
+    
+    def get_rule_warning(self):
+        """Предупреждение о правилах с ошибкой в шаблоне (они не применяются) или пустая строка"""
+        invalid = self.get_category_matcher().invalid_rules
+        if not invalid:
+            return ""
+        lines = [f"  {rule_id}. /{pattern}/: {error}" for rule_id, pattern, error in invalid]
+        return "\n".join(["⚠️ Правила с ошибкой в шаблоне не применяются:"] + lines)
+    
+    def suggest_category(self, description, amount, account_id=None, transaction_type="expense"):
+        return self.get_category_matcher().match(description, amount, account_id, transaction_type)
+    
+    # Подсказки при вводе: счета, категории и описания прошлых операций
+    def get_typeahead(self):
+        """
+        Индекс подсказок строится один раз одним проходом по операциям, дальше при каждом
+        обращении дочитываются только операции с id больше последнего учтённого. Правка, удаление,
+        разделение и перекатегоризация операций, отмена, синхронизация и архивация сбрасывают
+        индекс, правка счетов и категорий - только названия.
+        Сводные строки архива не учитываются: "Архив: N операций за ..." - не описание для ввода.
+        """
+        if self.typeahead is None:
+            self.metrics.inc("finance_cache_requests_total", cache="typeahead", result="miss")
+            index = TypeaheadIndex()
+            self.cursor.execute("SELECT COALESCE(MAX(id), 0) FROM transactions")
+            self.typeahead_last_id = self.cursor.fetchone()[0]
+            
+            self.cursor.execute("SELECT account_id, SUM(count), MAX(day) FROM daily_totals GROUP BY account_id")
+            index.load("account", [("", account_id, count, day) for account_id, count, day in self.cursor.fetchall()])
+            self.cursor.execute(
+                """SELECT transaction_type, category, description, COUNT(*), MAX(transaction_date)
+                   FROM transactions WHERE id <= ? AND is_rollup = 0
+                   GROUP BY transaction_type, category, description""",
+                (self.typeahead_last_id,)
+            )
+            groups = self.cursor.fetchall()
+            for kind, transaction_type in (("expense_category", "expense"), ("income_category", "income")):
+                index.load(kind, [(category, None, count, last) for group_type, category, _, count, last in groups
+                                  if group_type == transaction_type and category])
+            index.load("description", [(description, None, count, last) for _, _, description, count, last in groups
+                                       if description], create=True)
+            self.typeahead = index
+            self.typeahead_names_loaded = False
+        else:
+            self.metrics.inc("finance_cache_requests_total", cache="typeahead", result="hit")
+            self.cursor.execute(
+                """SELECT id, account_id, transaction_type, category, description, transaction_date
+                   FROM transactions WHERE id > ? AND is_rollup = 0 ORDER BY id""",
+                (self.typeahead_last_id,)
+            )
+            for row in self.cursor.fetchall():
+                transaction_id, account_id, transaction_type, category, description, transaction_date = row
+                self.typeahead.record("account", "", 1, transaction_date, account_id)
+                if category:
+                    self.typeahead.record(f"{transaction_type}_category", category, 1, transaction_date)
+                if description:
+                    self.typeahead.record("description", description, 1, transaction_date, create=True)
+                self.typeahead_last_id = transaction_id
+        
+        if not self.typeahead_names_loaded:
+            self.typeahead.set_items("account", [(account[1], account[0]) for account in self.get_accounts()])
+            self.typeahead.set_items("expense_category", [(name, None) for _, name in self.get_categories()])
+            self.typeahead.set_items("income_category", [(name, None) for _, name in self.get_income_categories()])
+            self.typeahead_names_loaded = True
+        return self.typeahead
+    
+    def suggest(self, kind, query="", limit=9):
+        """
+        Варианты для ввода по началу слов, части слова или с опечаткой, частые и недавние выше.
+        kind: account, expense_category, income_category или description. Возвращает пары
+        (название, значение): для счетов значение - id, для остальных - None.
+        """
+        return self.get_typeahead().search(kind, query, limit)
+    
+    @undoable("Перекатегоризация операций")
+    def recategorize_transactions(self, only_uncategorized=True):
+        """
+        Применяет правила к истории операций. По умолчанию трогает только операции без категории,
+        иначе переназначает категорию везде, где сработало правило.
+        """
+        matcher = self.get_category_matcher()
+        currencies = {account[0]: account[4] for account in self.get_accounts()}
+        
+        # Категории разделённых операций заданы строками вручную - правила их не трогают
+        query = "SELECT id, account_id, amount, description, category, transaction_date, transaction_type FROM transactions WHERE is_split = 0"
+        if only_uncategorized:
+            query += " AND (category IS NULL OR category = '')"
+        
+        # Читаем отдельным курсором порциями, чтобы не держать всю историю в памяти
+        read_cursor = self.conn.cursor()
+        read_cursor.execute(query)
+        
+        updates = []
+        budget_deltas = {}
+        while True:
+            rows = read_cursor.fetchmany(1000)
+            if not rows:
+                break
+            for transaction_id, account_id, amount, description, category, transaction_date, transaction_type in rows:
+                new_category = matcher.match(description, amount, account_id, transaction_type)
+                if not new_category or new_category == category:
+                    continue
+                updates.append((new_category, transaction_id))
+                if transaction_type == "expense":
+                    old_key = (category, transaction_date[:10], currencies.get(account_id))
+                    new_key = (new_category, transaction_date[:10], currencies.get(account_id))
+                    budget_deltas[old_key] = budget_deltas.get(old_key, 0) + amount
+                    budget_deltas[new_key] = budget_deltas.get(new_key, 0) - amount
+        read_cursor.close()
+        
+        warning = self.get_rule_warning()
+        if not updates:
+            return True, "\n".join(filter(None, ["Нет операций для изменения", warning]))
+        
+        try:
+            with self.savepoint():
+                self.cursor.executemany("UPDATE transactions SET category = ? WHERE id = ?", updates)
+                for (category, day, currency), amount in budget_deltas.items():
+                    self._apply_budget_delta(category, amount, self._parse_db_date(day), currency)
+            self.conn.commit()
+            self.typeahead = None
+            return True, "\n".join(filter(None, [f"Обновлено операций: {len(updates)}", warning]))
+        except Exception as e:
+            return False, str(e)
+    
+    # Методы для работы с бюджетами
+    def _parse_db_date(self, value):
+        """Преобразует дату/время из БД (ГГГГ-ММ-ДД[ ЧЧ:ММ:СС]) в объект date"""
+        return datetime.datetime.strptime(value[:10], "%Y-%m-%d").date()
+    
+    def get_budget_period_start(self, period, day=None):
+        """Возвращает начало периода бюджета (month/week), в который попадает дата"""
+        if day is None:
+            day = date.today()
+        if period == "week":
+            return (day - datetime.timedelta(days=day.weekday())).strftime("%Y-%m-%d")
+        return day.replace(day=1).strftime("%Y-%m-%d")
+    
+    def _roll_budget_periods(self, category=None):
+        """Обнуляет счётчики бюджетов, у которых начался новый период"""
+        for period in ("month", "week"):
+            current_start = self.get_budget_period_start(period)
+            query = "UPDATE budgets SET spent = 0, period_start = ? WHERE period = ? AND period_start < ?"
+            params = [current_start, period, current_start]
+            if category is not None:
+                query += " AND category = ?"
+                params.append(category)
+            self.cursor.execute(query, params)
+    
+    def _apply_budget_delta(self, category, amount, transaction_date=None, currency=None):
+        """
+        Добавляет сумму расхода к счётчикам бюджетов категории (отрицательная сумма - возврат).
+        Учитываются только бюджеты, в текущий период которых попадает дата операции,
+        поэтому обновление не требует пересчёта по таблице операций.
+        Бюджеты ведутся в основной валюте, суммы в других валютах пересчитываются по курсу на дату.
+        """
+        if not category or not amount:
+            return
+        
+        # Курс нужен только для бюджетов категории; без них расход в валюте без курсов проходит
+        self.cursor.execute("SELECT 1 FROM budgets WHERE category = ? LIMIT 1", (category,))
+        if self.cursor.fetchone() is None:
+            return
+        
+        if transaction_date is None:
+            transaction_date = date.today()
+        
+        if currency and currency != self.DEFAULT_CURRENCY:
+            amount *= self.get_fx_rate(currency, transaction_date)
+        
+        self._roll_budget_periods(category)
+        for period in ("month", "week"):
+            self.cursor.execute(
+                "UPDATE budgets SET spent = spent + ? WHERE category = ? AND period = ? AND period_start = ?",
+                (amount, category, period, self.get_budget_period_start(period, transaction_date))
+            )
+    
+    def _recount_budgets(self):
+        """
+        Пересчитывает потраченное по всем бюджетам за их текущие периоды (после отмены действия,
+        когда инкрементальные счётчики не восстановить). Один запрос с подзапросом на бюджет.
+        """
+        self._roll_budget_periods()
+        amount_sql, join_sql = self._report_amount_sql(self.DEFAULT_CURRENCY, self.LINE_AMOUNT_SQL)
+        self.cursor.execute(
+            f"""UPDATE budgets SET spent = ABS(COALESCE((
+                SELECT SUM({amount_sql}) FROM transactions t {self.SPLIT_LINES_JOIN} {join_sql}
+                WHERE t.transaction_type = 'expense' AND {self.LINE_CATEGORY_SQL} = budgets.category
+                    AND t.transaction_date >= budgets.period_start
+            ), 0))"""
+        )
+    
+    def set_budget(self, category, limit_amount, period="month"):
+        if period not in ("month", "week"):
+            return False, "Период бюджета должен быть month или week"
+        
+        if limit_amount <= 0:
+            return False, "Лимит бюджета должен быть больше нуля"
+        
+        period_start = self.get_budget_period_start(period)
+        
         try:
             self.cursor.execute(
-                "INSERT INTO expense_categories (name) VALUES (?)",
-                (name,)
+                "UPDATE budgets SET limit_amount = ? WHERE category = ? AND period = ?",
+                (limit_amount, category, period)
             )
-            self.conn.commit()
-            return True, "Категория успешно добавлена"
-        except sqlite3.IntegrityError:
-            return False, "Категория с таким названием уже существует"
-        except Exception as e:
-            return False, str(e)
-
-    def update_category(self, category_id, new_name):
-        try:
+            if self.cursor.rowcount:
+                self.conn.commit()
+                return True, "Бюджет обновлен"
+            
+            # Новый бюджет: один раз считаем уже потраченное в текущем периоде,
+            # дальше счётчик поддерживается инкрементально
+            amount_sql, join_sql = self._report_amount_sql(self.DEFAULT_CURRENCY, self.LINE_AMOUNT_SQL)
             self.cursor.execute(
-                "UPDATE expense_categories SET name = ? WHERE id = ?",
-                (new_name, category_id)
+                f"SELECT SUM({amount_sql}) FROM transactions t {self.SPLIT_LINES_JOIN} {join_sql} " +
+                f"WHERE t.transaction_type = 'expense' AND {self.LINE_CATEGORY_SQL} = ? AND t.transaction_date >= ?",
+                (category, period_start)
+            )
+            spent = abs(self.cursor.fetchone()[0] or 0)
+            
+            self.cursor.execute(
+                "INSERT INTO budgets (category, period, limit_amount, spent, period_start) VALUES (?, ?, ?, ?, ?)",
+                (category, period, limit_amount, spent, period_start)
             )
             self.conn.commit()
-            return True, "Категория успешно обновлена"
-        except sqlite3.IntegrityError:
-            return False, "Категория с таким названием уже существует"
-        except Exception as e:
-            return False, str(e)
-
-    def delete_category(self, category_id):
-        try:
-            self.cursor.execute("DELETE FROM expense_categories WHERE id = ?", (category_id,))
-            self.conn.commit()
-            return True, "Категория успешно удалена"
+            return True, "Бюджет добавлен"
         except Exception as e:
             return False, str(e)
-
-    def get_category_by_id(self, category_id):
-        self.cursor.execute("SELECT id, name FROM expense_categories WHERE id = ?", (category_id,))
-        return self.cursor.fetchone()
-
-    def get_category_by_name(self, name):
-        self.cursor.execute("SELECT id, name FROM expense_categories WHERE name = ?", (name,))
-        return self.cursor.fetchone()
     
-    # Методы для работы с категориями доходов
-    def get_income_categories(self):
-        self.cursor.execute("SELECT id, name FROM income_categories ORDER BY name")
+    def get_budget_status(self):
+        """Возвращает состояние бюджетов: (id, категория, период, лимит, потрачено, начало периода)"""
+        self._roll_budget_periods()
+        self.conn.commit()
+        self.cursor.execute(
+            "SELECT id, category, period, limit_amount, spent, period_start FROM budgets ORDER BY category, period"
+        )
         return self.cursor.fetchall()
-
-    def add_income_category(self, name):
-        try:
-            self.cursor.execute(
-                "INSERT INTO income_categories (name) VALUES (?)",
-                (name,)
+    
+    def get_budget_alerts(self, category):
+        """
+        Возвращает предупреждения о превышенных бюджетах категории. Бюджеты ведутся
+        в основной валюте, в тексте суммы показаны в валюте отчётов по текущему курсу.
+        """
+        if not category:
+            return []
+        
+        self.cursor.execute(
+            "SELECT period, limit_amount, spent FROM budgets WHERE category = ? AND spent > limit_amount",
+            (category,)
+        )
+        alerts = []
+        for period, limit_amount, spent in self.cursor.fetchall():
+            period_name = "неделю" if period == "week" else "месяц"
+            alerts.append(
+                f"⚠️ Бюджет '{category}' на {period_name} превышен: "
+                f"{self.format_budget_amount(spent, False)} из {self.format_budget_amount(limit_amount)}"
             )
-            self.conn.commit()
-            return True, "Категория дохода успешно добавлена"
-        except sqlite3.IntegrityError:
-            return False, "Категория с таким названием уже существует"
-        except Exception as e:
-            return False, str(e)
-
-    def update_income_category(self, category_id, new_name):
+        return alerts
+    
+    def format_budget_amount(self, amount, symbol=True):
+        """Сумма бюджета (хранится в основной валюте) в валюте отчётов, с её символом или без"""
+        text = f"{self.convert_amount(amount, self.DEFAULT_CURRENCY):.2f}"
+        return f"{text} {self.get_currency_symbol()}" if symbol else text
+    
+    def delete_budget(self, budget_id):
+        self.cursor.execute("DELETE FROM budgets WHERE id = ?", (budget_id,))
+        self.conn.commit()
+        return True, "Бюджет удален"
+    
+    def get_total_balance(self, currency=None):
+        """Общий баланс всех счетов в валюте отчётов (или указанной) по последнему известному курсу"""
+        amount_sql = self._converted_amount_sql("a.balance", "a.currency", "'9999-12-31'", currency)
+        self.cursor.execute(f"SELECT SUM({amount_sql}) FROM accounts a")
+        return self.cursor.fetchone()[0] or 0
+    
+    # Методы для работы с валютами
+    def is_valid_currency_code(self, code):
+        return bool(re.fullmatch(r"[A-Z]{3}", code or ""))
+    
+    def get_currency_symbol(self, currency=None):
+        currency = currency or self.report_currency
+        return self.CURRENCY_SYMBOLS.get(currency, currency)
+    
+    def get_setting(self, key, default=None):
+        self.cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
+        row = self.cursor.fetchone()
+        return row[0] if row else default
+    
+    def set_setting(self, key, value):
+        self.cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+        self.conn.commit()
+    
+    def get_currencies(self):
+        """Возвращает валюты, для которых можно строить отчёты: основная и все, по которым есть курсы"""
+        self.cursor.execute("SELECT DISTINCT currency FROM fx_rates ORDER BY currency")
+        return [self.DEFAULT_CURRENCY] + [row[0] for row in self.cursor.fetchall() if row[0] != self.DEFAULT_CURRENCY]
+    
+    def set_report_currency(self, currency):
+        currency = currency.upper()
+        if currency not in self.get_currencies():
+            return False, f"Нет курсов для валюты {currency}"
+        self.set_setting("report_currency", currency)
+        self.report_currency = currency
+        return True, f"Валюта отчётов: {currency}"
+    
+    def load_fx_rates(self, path):
+        """
+        Загружает курсы из CSV-файла со строками "дата,валюта,курс" (дата ГГГГ-ММ-ДД,
+        курс - рублей за единицу валюты). Строка заголовка допускается. Уже известные курсы заменяются.
+        """
+        import csv
+        
         try:
+            with open(path, newline="", encoding="utf-8") as f:
+                rows = []
+                for line_number, row in enumerate(csv.reader(f), 1):
+                    if not row or row[0].strip().lower() in ("date", "дата"):
+                        continue
+                    try:
+                        rate_date = datetime.datetime.strptime(row[0].strip(), "%Y-%m-%d").strftime("%Y-%m-%d")
+                        currency = row[1].strip().upper()
+                        rate = float(row[2].replace(",", "."))
+                    except (ValueError, IndexError):
+                        return False, f"Ошибка в строке {line_number}: ожидается дата,валюта,курс"
+                    if not self.is_valid_currency_code(currency) or rate <= 0:
+                        return False, f"Ошибка в строке {line_number}: некорректная валюта или курс"
+                    rows.append((currency, rate_date, rate))
+        except OSError as e:
+            return False, f"Не удалось прочитать файл: {e}"
+        
+        self.cursor.executemany(
+            "INSERT OR REPLACE INTO fx_rates (currency, rate_date, rate) VALUES (?, ?, ?)",
+            rows
+        )
+        self.conn.commit()
+        return True, f"Загружено курсов: {len(rows)}"
+    
+    def get_fx_rate(self, currency, day=None):
+        """
+        Курс валюты (рублей за единицу) - последний известный на дату, иначе самый ранний.
+        Если курсов валюты нет совсем, ValueError: сумма 1:1 исказила бы итоги молча.
+        """
+        if currency == self.DEFAULT_CURRENCY:
+            return 1.0
+        
+        day = day or date.today()
+        if not isinstance(day, str):
+            day = day.strftime("%Y-%m-%d")
+        
+        self.cursor.execute(
+            "SELECT rate FROM fx_rates WHERE currency = ? AND rate_date <= ? ORDER BY rate_date DESC LIMIT 1",
+            (currency, day)
+        )
+        row = self.cursor.fetchone()
+        if not row:
             self.cursor.execute(
-                "UPDATE income_categories SET name = ? WHERE id = ?",
-                (new_name, category_id)
+                "SELECT rate FROM fx_rates WHERE currency = ? ORDER BY rate_date LIMIT 1",
+                (currency,)
             )
-            self.conn.commit()
-            return True, "Категория дохода успешно обновлена"
-        except sqlite3.IntegrityError:
-            return False, "Категория с таким названием уже существует"
-        except Exception as e:
-            return False, str(e)
+            row = self.cursor.fetchone()
+        if not row:
+            raise ValueError(f"Нет курсов для валюты {currency}")
+        return row[0]
+    
+    def convert_amount(self, amount, from_currency, to_currency=None, day=None):
+        to_currency = to_currency or self.report_currency
+        if from_currency == to_currency:
+            return amount
+        return amount * self.get_fx_rate(from_currency, day) / self.get_fx_rate(to_currency, day)
+    
+    def _rate_sql(self, currency_expr, date_expr):
+        """
+        SQL-выражение курса на дату: поиск по первичному ключу fx_rates (currency, rate_date).
+        Без курсов валюты выражение NULL - SUM пропускает такие суммы (см. get_currencies_without_rates)
+        """
+        return f"""(CASE WHEN {currency_expr} = '{self.DEFAULT_CURRENCY}' THEN 1.0 ELSE COALESCE(
+            (SELECT r.rate FROM fx_rates r WHERE r.currency = {currency_expr} AND r.rate_date <= {date_expr}
+             ORDER BY r.rate_date DESC LIMIT 1),
+            (SELECT r.rate FROM fx_rates r WHERE r.currency = {currency_expr} ORDER BY r.rate_date LIMIT 1)
+            ) END)"""
+    
+    def get_currencies_without_rates(self):
+        """Валюты счетов, по которым нет ни одного курса: такие счета не входят в суммы отчётов"""
+        self.cursor.execute(
+            """SELECT DISTINCT currency FROM accounts
+            WHERE currency != ? AND currency NOT IN (SELECT currency FROM fx_rates) ORDER BY currency""",
+            (self.DEFAULT_CURRENCY,)
+        )
+        return [row[0] for row in self.cursor.fetchall()]
+    
+    def get_rate_warning(self):
+        """Предупреждение для отчётов о валютах без курсов или пустая строка"""
+        missing = self.get_currencies_without_rates()
+        if not missing:
+            return ""
+        return f"⚠️ Нет курсов для валют {', '.join(missing)}: их счета не вошли в суммы в {self.report_currency}"
+    
+    def _converted_amount_sql(self, amount_expr, currency_expr, date_expr, target_currency=None):
+        """SQL-выражение суммы, пересчитанной из валюты счёта в целевую валюту по курсу на дату"""
+        target = target_currency or self.report_currency
+        if not self.is_valid_currency_code(target):
+            raise ValueError(f"Некорректный код валюты: {target}")
+        return (f"(CASE WHEN {currency_expr} = '{target}' THEN {amount_expr} "
+                f"ELSE {amount_expr} * {self._rate_sql(currency_expr, date_expr)} / {self._rate_sql(repr(target), date_expr)} END)")
+    
+    def _report_amount_sql(self, target_currency=None, amount_expr="t.amount", date_expr="t.transaction_date",
+                           account_expr="t.account_id"):
+        """
+        Возвращает выражение суммы операции в целевой валюте и JOIN, нужный для него.
+        Если все счета в целевой валюте, пересчёт и соединение со счетами не нужны.
+        """
+        target = target_currency or self.report_currency
+        self.cursor.execute("SELECT 1 FROM accounts WHERE currency != ? LIMIT 1", (target,))
+        if self.cursor.fetchone() is None:
+            return amount_expr, ""
+        return (self._converted_amount_sql(amount_expr, "a.currency", date_expr, target),
+                f"JOIN accounts a ON a.id = {account_expr}")
+    
+    # Строки операций по категориям: разделённая операция раскладывается на свои строки
+    # (LEFT JOIN по покрывающему индексу, только для is_split = 1), остальные остаются как есть
+    SPLIT_LINES_JOIN = "LEFT JOIN transaction_splits s ON t.is_split = 1 AND s.transaction_id = t.id"
+    LINE_CATEGORY_SQL = "COALESCE(s.category, t.category)"
+    LINE_AMOUNT_SQL = "COALESCE(s.amount, t.amount)"
+    
+    def _next_day(self, day):
+        """Следующий день для строки ГГГГ-ММ-ДД - верхняя граница периода в запросах по индексу даты"""
+        return (datetime.datetime.strptime(day[:10], "%Y-%m-%d") + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
 
-    def delete_income_category(self, category_id):
-        try:
-            self.cursor.execute("DELETE FROM income_categories WHERE id = ?", (category_id,))
-            self.conn.commit()
-            return True, "Категория дохода успешно удалена"
-        except Exception as e:
-            return False, str(e)
 
-    def get_income_category_by_id(self, category_id):
-        self.cursor.execute("SELECT id, name FROM income_categories WHERE id = ?", (category_id,))
-        return self.cursor.fetchone()
+# Обслуживание журналов арендаторов; функции верхнего уровня, чтобы их можно было передать в процесс пула
+def _maintenance_recurring(tracker):
+    results = tracker.process_recurring_payments()
+    return {"processed": sum(1 for success, _ in results if success),
+            "failed": sum(1 for success, message in results if not success and not message.startswith("⚠️"))}
 
-    def get_income_category_by_name(self, name):
-        self.cursor.execute("SELECT id, name FROM income_categories WHERE name = ?", (name,))
-        return self.cursor.fetchone()
+
+def _maintenance_vacuum(tracker):
+    before = os.path.getsize(tracker.db_path)
+    tracker.conn.execute("VACUUM")
+    return {"bytes_before": before, "bytes_after": os.path.getsize(tracker.db_path)}
+
+
+def _maintenance_analyze(tracker):
+    tracker.conn.execute("ANALYZE")
+    tracker.conn.commit()
+    return {}
+
+
+def _maintenance_compact(tracker):
+    success, message = tracker.compact()
+    if not success:
+        raise RuntimeError(message)
+    return {"message": message}
+
+
+MAINTENANCE_JOBS = {
+    "recurring": _maintenance_recurring,
+    "vacuum": _maintenance_vacuum,
+    "compact": _maintenance_compact,
+    "analyze": _maintenance_analyze,
+}
+
+
+def run_maintenance_job(job, tenant_id, db_path):
+    """Выполняется в процессе пула: своё соединение, ошибка одного арендатора не мешает остальным"""
+    tracker = FinanceTracker(db_path)
+    try:
+        return tenant_id, True, MAINTENANCE_JOBS[job](tracker)
+    except Exception as e:
+        return tenant_id, False, str(e)
+    finally:
+        tracker.close()
+
+
+# Маршрутизация пользователей по отдельным файлам базы
+class TenantRouter:
+    """
+    У каждого арендатора (пользователя) свой файл базы, поэтому запись разных пользователей
+    не упирается в одну блокировку SQLite. Трекеры арендаторов делят ограниченный пул
+    соединений (LRU): давно простаивающие соединения закрываются, схема файла проверяется
+    и мигрирует при первом открытии. Файлы раскладываются по подкаталогам по хешу
+    идентификатора, чтобы в одном каталоге не оказывались тысячи файлов.
+    Сессии одного арендатора из разных потоков выполняются по очереди на общем трекере
+    (с его кэшами правил и подсказок), сессии разных арендаторов - параллельно.
+    """
+    TENANT_ID_PATTERN = re.compile(r"[A-Za-z0-9_@.-]{1,64}")
+    
+    def __init__(self, root_dir, max_connections=64, idle_timeout=300, max_trackers=1024):
+        import collections
+        import threading
+        
+        self.root_dir = root_dir
+        self.idle_timeout = idle_timeout
+        self.max_trackers = max_trackers
+        self.pool = ConnectionPool(max_connections)
+        self.trackers = collections.OrderedDict()  # арендатор -> трекер, от давно использованных к недавним
+        self.tenant_locks = {}  # арендатор -> блокировка его трекера
+        self.sessions = {}  # арендатор -> число открытых и ожидающих сессий
+        self.lock = threading.Lock()
+    
+    def tenant_path(self, tenant_id):
+        if not self.TENANT_ID_PATTERN.fullmatch(tenant_id) or tenant_id.startswith("."):
+            raise ValueError(f"Недопустимый идентификатор арендатора: {tenant_id!r}")
+        shard = hashlib.sha1(tenant_id.encode("utf-8")).hexdigest()[:2]
+        return os.path.join(self.root_dir, shard, f"{tenant_id}.db")
+    
+    def tracker(self, tenant_id):
+        """
+        Отдельный трекер арендатора для вызывающего (файл базы создаётся при первом обращении),
+        соединение берётся из общего пула. После работы вызовите release() трекера.
+        Для повторных обращений лучше session(): она переиспользует трекер вместе с его кэшами.
+        """
+        self.pool.evict_idle(self.idle_timeout)
+        db_path = self.tenant_path(tenant_id)
+        tracker = FinanceTracker(db_path, pool=self.pool)
+        tracker.data_dir = os.path.dirname(db_path)  # Каталог шарда создаётся при подключении
+        return tracker
+    
+    def evict_trackers(self):
+        """Забывает давно не использованные трекеры сверх max_trackers (вызывается под self.lock)"""
+        for tenant_id in list(self.trackers):
+            if len(self.trackers) <= self.max_trackers:
+                break
+            if tenant_id in self.sessions:
+                continue  # Трекером пользуются прямо сейчас
+            self.trackers.pop(tenant_id).release()
+            del self.tenant_locks[tenant_id]
+    
+    @contextlib.contextmanager
+    def session(self, tenant_id):
+        """
+        Трекер арендатора на время блока; соединение возвращается в пул на выходе.
+        Другие сессии того же арендатора ждут окончания блока.
+        """
+        import threading
+        
+        with self.lock:
+            tracker = self.trackers.pop(tenant_id, None)
+            if tracker is None:
+                tracker = self.tracker(tenant_id)
+                self.tenant_locks[tenant_id] = threading.RLock()
+            self.trackers[tenant_id] = tracker
+            tenant_lock = self.tenant_locks[tenant_id]
+            self.sessions[tenant_id] = self.sessions.get(tenant_id, 0) + 1
+            self.evict_trackers()
+        
+        try:
+            with tenant_lock:
+                try:
+                    yield tracker
+                finally:
+                    tracker.release()
+        finally:
+            with self.lock:
+                self.sessions[tenant_id] -= 1
+                if not self.sessions[tenant_id]:
+                    del self.sessions[tenant_id]
+                self.evict_trackers()
+    
+    def tenants(self):
+        """Идентификаторы всех арендаторов, у которых уже есть файл базы"""
+        tenants = []
+        if not os.path.isdir(self.root_dir):
+            return tenants
+        for shard in os.scandir(self.root_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".db") and entry.is_file():
+                    tenants.append(entry.name[:-3])
+        return sorted(tenants)
+    
+    def run_maintenance(self, job, tenants=None, processes=None):
+        """
+        Запускает задачу обслуживания ("recurring", "vacuum", "compact", "analyze") для арендаторов
+        (по умолчанию - всех) в пуле процессов. Возвращает {арендатор: (успех, результат)}.
+        """
+        import concurrent.futures
+        
+        if job not in MAINTENANCE_JOBS:
+            raise ValueError(f"Неизвестная задача обслуживания: {job}")
+        tenants = self.tenants() if tenants is None else tenants
+        
+        # Простаивающие соединения этого процесса не должны мешать VACUUM в других процессах
+        self.pool.evict_idle(0)
+        
+        results = {}
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            futures = [executor.submit(run_maintenance_job, job, tenant_id, self.tenant_path(tenant_id))
+                       for tenant_id in tenants]
+            for future in concurrent.futures.as_completed(futures):
+                tenant_id, success, result = future.result()
+                results[tenant_id] = (success, result)
+        return results
+    
+    def close(self):
+        with self.lock:
+            for tracker in self.trackers.values():
+                tracker.release()
+            self.trackers.clear()
+            self.tenant_locks.clear()
+        self.pool.close()
 
 
 # Класс для управления интерфейсом
@@ -1153,9 +6269,14 @@ class ConsoleUI:
     def __init__(self):
         self.tracker = FinanceTracker()
         self.running = True
+        if os.name == "nt":
+            os.system("")  # Включает обработку ANSI-последовательностей в консоли Windows
     
     def clear_screen(self):
-        os.system('clear' if os.name == 'posix' else 'cls')
+        # ANSI-последовательность вместо запуска clear/cls: без порождения процесса на каждый экран
+        if sys.stdout.isatty():
+            sys.stdout.write("\033[H\033[2J\033[3J")
+            sys.stdout.flush()
     
     def print_header(self, title):
         self.clear_screen()
@@ -1169,6 +6290,11 @@ class ConsoleUI:
         print(f"\n{prefix} {message}")
         input("\n👉 Нажмите Enter, чтобы продолжить...")
     
+    def print_rate_warning(self):
+        warning = self.tracker.get_rate_warning()
+        if warning:
+            print(warning)
+    
     def input_number(self, prompt, min_value=None, max_value=None):
         while True:
             try:
@@ -1197,20 +6323,108 @@ class ConsoleUI:
                 print("Неверный формат даты. Используйте ДД.ММ.ГГ")
     
     def select_account(self, prompt="Выберите счёт:"):
-        accounts = self.tracker.get_accounts()
+        accounts = {account[0]: account for account in self.tracker.get_accounts()}
         if not accounts:
             print("Нет доступных счетов")
             return None
         
-        print(prompt)
-        for i, account in enumerate(accounts, 1):
-            print(f"{i}. {account[1]} ({account[2]} ₽) - {account[3]}")
-        print("0. Назад")  # Добавляем опцию возврата
+        def label(name, account_id):
+            account = accounts[account_id]
+            return f"{account[1]} ({account[2]} {self.tracker.get_currency_symbol(account[4])}) - {account[3]}"
         
-        choice = self.input_number("Введите номер счёта: ", 0, len(accounts))  # Разрешаем 0
-        if choice == 0:  # Проверяем, выбрал ли пользователь опцию выхода
+        print(prompt)
+        choice = self.pick("account", label)
+        if choice is None:  # Пользователь выбрал «0. Назад»
             return 0
-        return accounts[int(choice) - 1][0]  # Возвращаем ID выбранного счёта
+        return choice[1]  # Возвращаем ID выбранного счёта
+    
+    def input_with_suggestions(self, kind, prompt):
+        """input() с дополнением по Tab из подсказок трекера, если доступен readline"""
+        try:
+            import readline
+        except ImportError:  # В Windows readline нет - ввод без дополнения
+            return input(prompt)
+        
+        matches = []
+        
+        def complete(text, state):
+            if state == 0:
+                matches[:] = [match for match, _ in self.tracker.suggest(kind, readline.get_line_buffer())]
+            return matches[state] if state < len(matches) else None
+        
+        previous = readline.get_completer(), readline.get_completer_delims()
+        # Дополняется вся строка целиком, а не последнее слово
+        readline.set_completer(complete)
+        readline.set_completer_delims("")
+        if "libedit" in (readline.__doc__ or ""):
+            readline.parse_and_bind("bind ^I rl_complete")  # readline в macOS
+        else:
+            readline.parse_and_bind("tab: complete")
+        try:
+            return input(prompt)
+        finally:
+            readline.set_completer(previous[0])
+            readline.set_completer_delims(previous[1])
+    
+    def pick(self, kind, label=None, zero_label="Назад", allow_new=False):
+        """
+        Выбор с подсказками: сначала частые и недавние варианты, введённый текст сужает список
+        (по началу слов, части слова или с опечаткой). Номер выбирает вариант из списка, Enter - первый.
+        Возвращает пару (название, значение) или None для «0»; с allow_new текст, для которого
+        ничего не нашлось, возвращается как (текст, None).
+        """
+        query = ""
+        while True:
+            shown = self.tracker.suggest(kind, query)
+            if query:
+                print(f"\nПо запросу «{query}»:" if shown else f"\nПо запросу «{query}» ничего не найдено")
+            for i, (text, value) in enumerate(shown, 1):
+                print(f"{i}. {label(text, value) if label else text}")
+            print(f"0. {zero_label}")
+            
+            answer = self.input_with_suggestions(kind, "Номер или начало названия: ").strip()
+            if answer == "0":
+                return None
+            if answer.isdigit() and 1 <= int(answer) <= len(shown):
+                return shown[int(answer) - 1]
+            if not answer:
+                if query and shown:
+                    return shown[0]
+                continue
+            
+            normalized = TypeaheadIndex.normalize(answer)
+            matches = self.tracker.suggest(kind, answer)
+            for match in matches:
+                if TypeaheadIndex.normalize(match[0]) == normalized:
+                    return match
+            if not matches and allow_new:
+                return answer, None
+            query = answer
+    
+    def input_description(self, prompt):
+        """
+        Описание с подсказками из прошлых операций: Tab дополняет ввод (если есть readline),
+        а для нового текста показываются похожие описания, и номер выбирает одно из них
+        """
+        description = self.input_with_suggestions("description", prompt).strip()
+        if not description:
+            return description
+        
+        normalized = TypeaheadIndex.normalize(description)
+        shown = self.tracker.suggest("description", description)
+        for text, _ in shown:
+            if TypeaheadIndex.normalize(text) == normalized:
+                return text
+        if not shown:
+            return description
+        
+        print("Похожие описания:")
+        for i, (text, _) in enumerate(shown, 1):
+            print(f"{i}. {text}")
+        answer = input(f"Номер или Enter, чтобы оставить «{description}»: ").strip()
+        if answer.isdigit() and 1 <= int(answer) <= len(shown):
+            return shown[int(answer) - 1][0]
+        return description
         
     def main_menu(self):
         while self.running:
@@ -1222,9 +6436,16 @@ class ConsoleUI:
             print("5. 📅 Запланированные платежи")
             print("6. 📊 Отчёты и статистика")
             print("7. 🏷️ Управление категориями") 
+            print("8. 🎯 Бюджеты")
+            print("9. ↩️ Отменить последнее действие")
+            print("10. 🔁 Синхронизация устройств")
             print("0. 🚪 Выход")
             
-            choice = self.input_number("Выберите пункт меню: ", 0, 7)  # Обновляем диапазон
+            # 99 - скрытое меню диагностики, в списке не показывается
+            choice = self.input_number("Выберите пункт меню: ", 0)
+            while choice not in range(11) and choice != 99:
+                print("Такого пункта меню нет")
+                choice = self.input_number("Выберите пункт меню: ", 0)
             
             if choice == 1:
                 self.accounts_menu()
@@ -1240,11 +6461,105 @@ class ConsoleUI:
                 self.reports_menu()
             elif choice == 7:
                 self.categories_menu()  # Вызываем новый метод
+            elif choice == 8:
+                self.budgets_menu()
+            elif choice == 9:
+                self.undo_menu()
+            elif choice == 10:
+                self.sync_menu()
+            elif choice == 99:
+                self.diagnostics_menu()
             elif choice == 0:
                 self.running = False
                 self.tracker.close()
                 print("👋 До свидания!")
     
+    def undo_menu(self):
+        while True:
+            self.print_header("ОТМЕНА ДЕЙСТВИЙ")
+            history = self.tracker.get_undo_history(10)
+            if not history:
+                print("История действий пуста")
+            else:
+                print("Последние действия (сверху - самые новые):")
+                for _, action, created_at, undone in history:
+                    status = "↩️ отменено" if undone else "✅"
+                    print(f"  {created_at[:16]}  {action}  {status}")
+            
+            print("\n1. ↩️ Отменить последнее действие")
+            print("2. ↪️ Повторить отменённое действие")
+            print("3. 🧹 Очистить историю")
+            print("0. 🔙 Назад")
+            
+            choice = self.input_number("Выберите пункт меню: ", 0, 3)
+            
+            if choice == 1:
+                pending = [entry for entry in history if not entry[3]]
+                if not pending:
+                    self.print_message("Нет действий для отмены", False)
+                elif self.input_yes_no(f"Отменить «{pending[0][1]}»? (д/н): "):
+                    success, message = self.tracker.undo()
+                    self.print_message(message, success)
+            elif choice == 2:
+                success, message = self.tracker.redo()
+                self.print_message(message, success)
+            elif choice == 3:
+                if self.input_yes_no("Очистить историю? Отменить сделанное будет нельзя (д/н): "):
+                    success, message = self.tracker.clear_undo_history()
+                    self.print_message(message, success)
+            elif choice == 0:
+                break
+    
+    def sync_menu(self):
+        while True:
+            self.print_header("СИНХРОНИЗАЦИЯ УСТРОЙСТВ")
+            device_id, _ = self.tracker.get_sync_device()
+            print(f"ID этого устройства: {device_id}")
+            peers = self.tracker.get_sync_peers()
+            if peers:
+                print("Устройства, с которыми был обмен:")
+                for peer_id, _, received_at in peers:
+                    print(f"  {peer_id}  (последний приём: {received_at or 'не было'})")
+            
+            print("\n1. 🔁 Синхронизировать с другим файлом базы")
+            print("2. 📤 Выгрузить изменения в файл")
+            print("3. 📥 Загрузить изменения из файла")
+            print("4. 🆔 Новый ID устройства (для скопированной базы)")
+            print("0. 🔙 Назад")
+            
+            choice = self.input_number("Выберите пункт меню: ", 0, 4)
+            
+            if choice == 1:
+                path = input("Путь к файлу базы другого устройства: ").strip()
+                if path:
+                    success, message = self.tracker.sync_with(path)
+                    self.print_message(message, success)
+            elif choice == 2:
+                path = input("Файл для изменений: ").strip()
+                if not path:
+                    continue
+                peer = None
+                if peers:
+                    for i, (peer_id, _, _) in enumerate(peers, 1):
+                        print(f"{i}. {peer_id}")
+                    print("0. Новое устройство (выгрузить весь журнал)")
+                    number = self.input_number("Для какого устройства: ", 0, len(peers))
+                    if number:
+                        peer = peers[int(number) - 1][0]
+                success, message = self.tracker.export_changes(path, peer)
+                self.print_message(message, success)
+            elif choice == 3:
+                path = input("Файл с изменениями: ").strip()
+                if path:
+                    success, message = self.tracker.import_changes(path)
+                    self.print_message(message, success)
+            elif choice == 4:
+                if self.input_yes_no("Назначить новый ID? Нужно только для копии базы, перенесённой на другой компьютер (д/н): "):
+                    success, message = self.tracker.reset_sync_device()
+                    self.print_message(message, success)
+            elif choice == 0:
+                break
+    
     def accounts_menu(self):
         while True:
             self.print_header("УПРАВЛЕНИЕ СЧЕТАМИ")
@@ -1274,14 +6589,15 @@ class ConsoleUI:
         if not accounts:
             print("📭 У вас пока нет счетов")
         else:
-            total_balance = 0
             for account in accounts:
-                total_balance += account[2]
                 account_type_emoji = self.get_account_type_emoji(account[3])
-                print(f"{account_type_emoji} {account[1]} ({account[3]}): {account[2]} ₽")
+                print(f"{account_type_emoji} {account[1]} ({account[3]}): {account[2]} {self.tracker.get_currency_symbol(account[4])}")
             
+            # Счета в разных валютах суммируются по курсу в валюте отчётов
+            total_balance = self.tracker.get_total_balance()
             print("\n" + "-" * 30)
-            print(f"💵 Общий баланс: {total_balance} ₽")
+            print(f"💵 Общий баланс: {total_balance:.2f} {self.tracker.get_currency_symbol()}")
+            self.print_rate_warning()
         
         input("\n👉 Нажмите Enter, чтобы продолжить...")
 
@@ -1312,14 +6628,15 @@ class ConsoleUI:
         account_types = ["Наличные", "Дебетовая карта", "Кредитная карта", "Сберегательный счёт", "Инвестиции", "Другое"]
         account_type = account_types[int(type_choice) - 1]
         
-        initial_balance = self.input_number("Введите начальный баланс: ", 0)
+        currency = input(f"Введите валюту счёта, например USD (или оставьте пустым для {self.tracker.DEFAULT_CURRENCY}): ").strip().upper()
+        if currency and not self.tracker.is_valid_currency_code(currency):
+            self.print_message("Код валюты должен состоять из трёх латинских букв", False)
+            return
         
-        success = self.tracker.create_account(name, account_type, initial_balance)
+        initial_balance = self.input_number("Введите начальный баланс: ", 0)
         
-        if success:
-            self.print_message(f"Счёт '{name}' успешно создан")
-        else:
-            self.print_message(f"Счёт с названием '{name}' уже существует", False)
+        success, message = self.tracker.create_account(name, account_type, initial_balance, currency or None)
+        self.print_message(message, success)
     
     def edit_account(self):
         self.print_header("РЕДАКТИРОВАНИЕ СЧЁТА")
@@ -1371,7 +6688,7 @@ class ConsoleUI:
             return
         
         account = self.tracker.get_account_by_id(account_id)
-        if not self.input_yes_no(f"Вы уверены, что хотите удалить счёт '{account[1]}' с балансом {account[2]} ₽? (д/н): "):
+        if not self.input_yes_no(f"Вы уверены, что хотите удалить счёт '{account[1]}' с балансом {account[2]} {self.tracker.get_currency_symbol(account[4])}? (д/н): "):
             self.print_message("Удаление отменено")
             return
         
@@ -1386,9 +6703,13 @@ class ConsoleUI:
             print("3. 📋 Просмотр операций")
             print("4. ✏️ Редактировать операцию")
             print("5. ❌ Удалить операцию")
+            print("6. 🔍 Поиск операций")
+            print("7. 🔁 Поиск дубликатов")
+            print("8. ✂️ Разделить операцию по категориям")
+            print("9. 🏷️ Метки операции")
             print("0. 🔙 Назад")
             
-            choice = self.input_number("Выберите пункт меню: ", 0, 5)
+            choice = self.input_number("Выберите пункт меню: ", 0, 9)
             
             if choice == 1:
                 self.add_income()
@@ -1400,6 +6721,14 @@ class ConsoleUI:
                 self.edit_transaction()
             elif choice == 5:
                 self.delete_transaction()
+            elif choice == 6:
+                self.search_transactions()
+            elif choice == 7:
+                self.show_duplicate_report()
+            elif choice == 8:
+                self.split_transaction()
+            elif choice == 9:
+                self.edit_transaction_tags()
             elif choice == 0:
                 break
     
@@ -1411,9 +6740,14 @@ class ConsoleUI:
             return
         
         amount = self.input_number("Введите сумму дохода: ", 0.01)
-        description = input("Введите описание: ")
+        description = self.input_description("Введите описание: ")
+        
+        if not self.confirm_not_duplicate(account_id, amount, description):
+            return
         
-        category = self.select_income_category("Выберите категорию дохода:")
+        category = self.suggest_category(description, amount, account_id, "income")
+        if not category:
+            category = self.select_income_category("Выберите категорию дохода:")
         
         success, message = self.tracker.add_income(account_id, amount, description, category)
         self.print_message(message, success)
@@ -1426,13 +6760,79 @@ class ConsoleUI:
             return
         
         amount = self.input_number("Введите сумму расхода: ", 0.01)
-        description = input("Введите описание: ")
+        description = self.input_description("Введите описание: ")
+        
+        if not self.confirm_not_duplicate(account_id, -amount, description):
+            return
+        
+        category = self.suggest_category(description, amount, account_id, "expense")
+        if not category:
+            category = self.select_expense_category("Выберите категорию расхода:")
         
-        category = self.select_expense_category("Выберите категорию расхода:")
+        # Запоминаем балансы до списания, чтобы показать долю расхода
+        account = self.tracker.get_account_by_id(account_id)
+        account_balance = account[2]
+        total_balance = self.tracker.get_total_balance()
         
         success, message = self.tracker.add_expense(account_id, amount, description, category)
+        if success:
+            account_share = amount / account_balance * 100 if account_balance > 0 else 0
+            message += f"\n📊 Расход составил {account_share:.2f}% от баланса счёта"
+            # Общий баланс в валюте отчётов - пересчитываем сумму расхода в неё же (если есть курс)
+            if account[4] not in self.tracker.get_currencies_without_rates():
+                converted_amount = self.tracker.convert_amount(amount, account[4])
+                total_share = converted_amount / total_balance * 100 if total_balance > 0 else 0
+                message += f"\n📊 Расход составил {total_share:.2f}% от общего баланса"
         self.print_message(message, success)
     
+    def print_transaction_line(self, t):
+        amount = t[3]
+        sign = "+" if amount > 0 else ""
+        emoji = "💰" if amount > 0 else "💸"
+        category = f"[{t[5]}]" if t[5] else ""
+        date = datetime.datetime.strptime(t[6], "%Y-%m-%d %H:%M:%S").strftime("%d.%m.%Y %H:%M")
+        symbol = self.tracker.get_currency_symbol(t[8])
+        print(f"{date} | {t[2]} | {emoji} {sign}{amount} {symbol} | {t[4]} {category}")
+    
+    def confirm_not_duplicate(self, account_id, amount, description):
+        """Предупреждает, если такая операция уже внесена сегодня; возвращает True, если добавлять"""
+        duplicates = self.tracker.find_duplicate_transactions(account_id, amount, description)
+        if not duplicates:
+            return True
+        
+        print("\n⚠️ Похоже, такая операция уже есть:")
+        for t in duplicates:
+            self.print_transaction_line(t)
+        
+        if self.input_yes_no("Всё равно добавить? (д/н): "):
+            return True
+        
+        self.print_message("Добавление отменено")
+        return False
+    
+    def show_duplicate_report(self):
+        self.print_header("ВОЗМОЖНЫЕ ДУБЛИКАТЫ")
+        groups = self.tracker.get_duplicate_report()
+        
+        if not groups:
+            print("🎉 Дубликатов не найдено")
+        else:
+            for i, group in enumerate(groups, 1):
+                print(f"\n🔁 Группа {i} ({len(group)} шт.):")
+                for t in group:
+                    print(f"  #{t[0]} ", end="")
+                    self.print_transaction_line(t)
+            print(f"\nВсего групп: {len(groups)}. Лишние операции можно удалить через меню удаления по ID")
+        
+        input("\n👉 Нажмите Enter, чтобы продолжить...")
+    
+    def suggest_category(self, description, amount, account_id, transaction_type):
+        """Предлагает категорию по правилам; возвращает её, если пользователь согласился"""
+        category = self.tracker.suggest_category(description, amount, account_id, transaction_type)
+        if category and self.input_yes_no(f"🤖 Категория по правилу: {category}. Использовать? (д/н): "):
+            return category
+        return None
+    
     def show_transactions(self):
         self.print_header("ПРОСМОТР ОПЕРАЦИЙ")
         
@@ -1442,8 +6842,9 @@ class ConsoleUI:
         print("3. По типу (доходы/расходы)")
         print("4. По периоду")
         print("5. Комбинированный фильтр")
+        print("6. По меткам")
         
-        choice = self.input_number("Выберите фильтр: ", 1, 5)
+        choice = self.input_number("Выберите фильтр: ", 1, 6)
         
         account_id = None
         start_date = None
@@ -1465,7 +6866,12 @@ class ConsoleUI:
             start_date = self.input_date("Введите начальную дату")
             end_date = self.input_date("Введите конечную дату")
         
-        transactions = self.tracker.get_transactions(account_id, start_date, end_date, transaction_type)
+        tag_filter = None
+        if choice == 5 or choice == 6:
+            tag_filter = self.input_tag_filter()
+        
+        transactions = self.tracker.get_transactions(account_id, start_date, end_date, transaction_type,
+                                                     tag_filter=tag_filter)
         
         if not transactions:
             print("\nНет операций, соответствующих фильтрам")
@@ -1475,15 +6881,59 @@ class ConsoleUI:
         self.print_header("СПИСОК ОПЕРАЦИЙ")
         
         for t in transactions:
-            amount = t[3]
-            sign = "+" if amount > 0 else ""
-            emoji = "💰" if amount > 0 else "💸"
-            category = f"[{t[5]}]" if t[5] else ""
-            date = datetime.datetime.strptime(t[6], "%Y-%m-%d %H:%M:%S").strftime("%d.%m.%Y %H:%M")
-            print(f"{date} | {t[2]} | {emoji} {sign}{amount} ₽ | {t[4]} {category}")
+            self.print_transaction_line(t)
         
         input("\n👉 Нажмите Enter, чтобы продолжить...")
 
+    def search_transactions(self):
+        self.print_header("ПОИСК ОПЕРАЦИЙ")
+        
+        query = input("Введите слова для поиска (описание или категория): ").strip()
+        if not query:
+            return
+        
+        filters = {}
+        if not self.input_yes_no("Искать по всем счетам? (д/н): "):
+            account_id = self.select_account()
+            if not account_id:
+                return
+            filters["account_id"] = account_id
+        
+        page_size = 10
+        page = 0
+        
+        while True:
+            # Запрашиваем на одну строку больше, чтобы узнать, есть ли следующая страница
+            results = self.tracker.search_transactions(query, filters, page_size + 1, page * page_size)
+            has_next = len(results) > page_size
+            results = results[:page_size]
+            
+            self.print_header(f"ПОИСК: {query}")
+            
+            if not results:
+                print("\nНичего не найдено")
+                input("\nНажмите Enter, чтобы продолжить...")
+                return
+            
+            for t in results:
+                self.print_transaction_line(t)
+            
+            print(f"\n📄 Страница {page + 1}")
+            options = []
+            if has_next:
+                options.append("с - следующая")
+            if page > 0:
+                options.append("п - предыдущая")
+            options.append("Enter - выход")
+            choice = input(f"{', '.join(options)}: ").strip().lower()
+            
+            if choice == "с" and has_next:
+                page += 1
+            elif choice == "п" and page > 0:
+                page -= 1
+            else:
+                return
+
     def select_transaction(self):
         self.print_header("ВЫБОР ОПЕРАЦИИ")
         
@@ -1496,11 +6946,11 @@ class ConsoleUI:
         
         print("Последние операции:")
         for i, t in enumerate(transactions, 1):
-            transaction_id, account_id, account_name, amount, description, category, date, transaction_type = t
+            transaction_id, account_id, account_name, amount, description, category, date, transaction_type, currency = t
             sign = "+" if amount > 0 else ""
             category_str = f"[{category}]" if category else ""
             formatted_date = datetime.datetime.strptime(date, "%Y-%m-%d %H:%M:%S").strftime("%d.%m.%Y %H:%M")
-            print(f"{i}. {formatted_date} | {account_name} | {sign}{amount} ₽ | {description} {category_str}")
+            print(f"{i}. {formatted_date} | {account_name} | {sign}{amount} {self.tracker.get_currency_symbol(currency)} | {description} {category_str}")
         
         print("\n0. Поиск по номеру ID")
         
@@ -1541,7 +6991,12 @@ class ConsoleUI:
         print(f"Сумма: {abs(amount)} ₽")
         print(f"Описание: {description}")
         print(f"Категория: {category}")
+        splits = self.tracker.get_transaction_splits(transaction_id)
+        for _, line_amount, line_category, line_description in splits:
+            print(f"  - {abs(line_amount)} ₽ [{line_category}] {line_description or ''}")
         print(f"Дата: {datetime.datetime.strptime(date, '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y %H:%M')}")
+        if splits:
+            print("ℹ️ При изменении суммы строки пересчитаются пропорционально, новая категория объединит строки")
         
         # Запрашиваем новые значения
         new_amount_str = input(f"Введите новую сумму (или оставьте пустым для {abs(amount)}): ")
@@ -1581,6 +7036,98 @@ class ConsoleUI:
         
         self.print_message(message, success)
 
+    def input_tag_filter(self):
+        """Спрашивает условия по меткам (через запятую); пустой ввод - условие не задано"""
+        print("\nМетки через запятую, Enter - пропустить условие")
+        tag_filter = {}
+        for key, prompt in (("any", "С любой из меток: "), ("all", "Со всеми метками: "), ("none", "Без меток: ")):
+            value = input(prompt).strip()
+            if value:
+                tag_filter[key] = value
+        return tag_filter or None
+    
+    def edit_transaction_tags(self):
+        self.print_header("МЕТКИ ОПЕРАЦИИ")
+        
+        transaction_id = self.select_transaction()
+        if not transaction_id:
+            return
+        
+        if not self.tracker.get_transaction_by_id(transaction_id):
+            self.print_message("Операция не найдена", False)
+            return
+        
+        tags = self.tracker.get_transaction_tags(transaction_id)
+        print(f"Текущие метки: {', '.join(tags) if tags else 'нет'}")
+        
+        all_tags = self.tracker.get_tags()
+        if all_tags:
+            print("Все метки: " + ", ".join(f"{name} ({count})" for _, name, count in all_tags))
+        
+        messages = []
+        new_tags = input("\nДобавить метки через запятую (например, trip-2026, business): ").strip()
+        if new_tags:
+            success, message = self.tracker.add_tags(transaction_id, new_tags)
+            messages.append((message, success))
+        
+        if tags:
+            removed_tags = input("Снять метки через запятую (Enter - ничего не снимать): ").strip()
+            if removed_tags:
+                success, message = self.tracker.remove_tags(transaction_id, removed_tags)
+                messages.append((message, success))
+        
+        if not messages:
+            self.print_message("Метки не изменены")
+            return
+        for message, success in messages[:-1]:
+            print(("✅ " if success else "❌ ") + message)
+        self.print_message(*messages[-1])
+    
+    def split_transaction(self):
+        self.print_header("РАЗДЕЛЕНИЕ ОПЕРАЦИИ")
+        
+        transaction_id = self.select_transaction()
+        if not transaction_id:
+            return
+        
+        self.tracker.cursor.execute(
+            "SELECT t.amount, t.description, t.transaction_type, a.currency " +
+            "FROM transactions t JOIN accounts a ON t.account_id = a.id " +
+            "WHERE t.id = ?", (transaction_id,)
+        )
+        transaction = self.tracker.cursor.fetchone()
+        
+        if not transaction:
+            self.print_message("Операция не найдена", False)
+            return
+        
+        amount, description, transaction_type, currency = transaction
+        symbol = self.tracker.get_currency_symbol(currency)
+        print(f"Операция: {description} - {abs(amount)} {symbol}")
+        
+        splits = self.tracker.get_transaction_splits(transaction_id)
+        if splits:
+            print("\nТекущие строки (будут заменены):")
+            for _, line_amount, line_category, line_description in splits:
+                print(f"  {abs(line_amount)} {symbol} [{line_category}] {line_description or ''}")
+        
+        print("\nДобавляйте строки, пока не распределите всю сумму")
+        lines = []
+        remaining = round(abs(amount), 2)
+        while remaining > 0:
+            print(f"\nОсталось распределить: {remaining:.2f} {symbol}")
+            line_amount = self.input_number("Сумма строки: ", 0.01, remaining)
+            if transaction_type == "expense":
+                category = self.select_expense_category("Категория строки:")
+            else:
+                category = self.select_income_category("Категория строки:")
+            line_description = input("Описание строки (необязательно): ")
+            lines.append((line_amount, category or "", line_description))
+            remaining = round(remaining - line_amount, 2)
+        
+        success, message = self.tracker.split_transaction(transaction_id, lines)
+        self.print_message(message, success)
+    
     def delete_transaction(self):
         self.print_header("УДАЛЕНИЕ ОПЕРАЦИИ")
         
@@ -1651,7 +7198,7 @@ class ConsoleUI:
         
         print("\nВыберите счёт куда:")
         for i, account in enumerate(filtered_accounts, 1):
-            print(f"{i}. {account[1]} ({account[2]} ₽) - {account[3]}")
+            print(f"{i}. {account[1]} ({account[2]} {self.tracker.get_currency_symbol(account[4])}) - {account[3]}")
         print("0. Назад")  # Добавляем опцию выхода
         
         choice = self.input_number("Введите номер счёта: ", 0, len(filtered_accounts))
@@ -1705,10 +7252,13 @@ class ConsoleUI:
         self.print_header("СПИСОК ПЕРЕВОДОВ")
         
         for t in transfers:
-            transfer_id, from_id, from_name, to_id, to_name, amount, description, date = t
+            transfer_id, from_id, from_name, to_id, to_name, amount, description, date, from_currency, to_amount, to_currency = t
             date_formatted = datetime.datetime.strptime(date, "%Y-%m-%d %H:%M:%S").strftime("%d.%m.%Y %H:%M")
             desc = f" - {description}" if description else ""
-            print(f"{date_formatted} | {from_name} 🔄 {to_name} | {amount} ₽{desc}")
+            amount_str = f"{amount} {self.tracker.get_currency_symbol(from_currency)}"
+            if from_currency != to_currency:
+                amount_str += f" → {to_amount} {self.tracker.get_currency_symbol(to_currency)}"
+            print(f"{date_formatted} | {from_name} 🔄 {to_name} | {amount_str}{desc}")
         
         input("\n👉 Нажмите Enter, чтобы продолжить...")
     
@@ -1737,6 +7287,21 @@ class ConsoleUI:
             elif choice == 0:
                 break
     
+    def describe_recurring_payment(self, payment):
+        """Строка регулярного платежа для списков: что, сколько, откуда и по какому правилу"""
+        (payment_id, account_id, account_name, amount, description, category, payment_day, active,
+         rule, anchor_date, next_due, transaction_type, to_account_id, to_account_name, currency) = payment
+        recurrence = self.tracker.recurrence_rule(rule, payment_day, anchor_date)
+        amount_str = f"{amount} {self.tracker.get_currency_symbol(currency)}"
+        if transaction_type == "transfer":
+            direction = f"'{account_name}' → '{to_account_name}'"
+        elif transaction_type == "income":
+            direction = f"на '{account_name}'"
+        else:
+            direction = f"с '{account_name}'"
+        next_str = datetime.datetime.strptime(next_due, "%Y-%m-%d").strftime("%d.%m.%Y") if next_due else "-"
+        return f"{description} - {amount_str} {direction} ({recurrence.describe()}, следующий: {next_str})"
+    
     def show_recurring_payments(self):
         self.print_header("СПИСОК РЕГУЛЯРНЫХ ПЛАТЕЖЕЙ")
         payments = self.tracker.get_recurring_payments()
@@ -1744,43 +7309,81 @@ class ConsoleUI:
         if not payments:
             print("📭 У вас пока нет регулярных платежей")
         else:
+            type_emoji = {"expense": "🔔", "income": "💵", "transfer": "🔄"}
             for p in payments:
-                payment_id, account_id, account_name, amount, description, category, payment_day, active = p
-                status = "✅ Активен" if active else "⛔ Отключен"
-                category_str = f"[{category}]" if category else ""
-                print(f"{payment_id}. 🔔 {description} {category_str} - {amount} ₽ с '{account_name}' (день: {payment_day}) - {status}")
+                status = "✅ Активен" if p[7] else "⛔ Отключен"
+                category_str = f"[{p[5]}] " if p[5] else ""
+                print(f"{p[0]}. {type_emoji.get(p[11], '🔔')} {category_str}{self.describe_recurring_payment(p)} - {status}")
         
         input("\n👉 Нажмите Enter, чтобы продолжить...")
     
+    def select_recurrence_rule(self):
+        """Спрашивает правило повторения; возвращает (правило, день месяца, дата первого платежа)"""
+        rules = list(RecurrenceRule.KINDS.items())
+        print("\nКак часто повторять:")
+        for i, (_, title) in enumerate(rules, 1):
+            print(f"{i}. {title.capitalize()}")
+        rule = rules[int(self.input_number("Выберите правило: ", 1, len(rules))) - 1][0]
+        
+        payment_day, anchor_date = None, None
+        if rule == "monthly":
+            payment_day = int(self.input_number("Введите день месяца для списания (1-31): ", 1, 31))
+        elif rule in ("weekly", "biweekly", "yearly"):
+            anchor_date = datetime.datetime.strptime(self.input_date("Дата первого платежа"), "%Y-%m-%d").date()
+        return rule, payment_day, anchor_date
+    
     def add_recurring_payment(self):
         self.print_header("ДОБАВЛЕНИЕ РЕГУЛЯРНОГО ПЛАТЕЖА")
-        account_id = self.select_account("С какого счёта будет списываться платеж:")
+        print("1. 💸 Расход")
+        print("2. 💵 Доход")
+        print("3. 🔄 Перевод между счетами")
+        transaction_type = ("expense", "income", "transfer")[int(self.input_number("Выберите вид операции: ", 1, 3)) - 1]
+        
+        prompts = {
+            "expense": "С какого счёта будет списываться платеж:",
+            "income": "На какой счёт будет поступать доход:",
+            "transfer": "С какого счёта переводить:",
+        }
+        account_id = self.select_account(prompts[transaction_type])
         
         if not account_id:
             return
         
+        to_account_id = None
+        if transaction_type == "transfer":
+            to_account_id = self.select_account("На какой счёт переводить:")
+            if not to_account_id:
+                return
+        
         description = input("Введите название платежа (например, Подписка Netflix): ")
         amount = self.input_number("Введите сумму платежа: ", 0.01)
-        payment_day = int(self.input_number("Введите день месяца для списания (1-31): ", 1, 31))
-        
-        # Список категорий расходов
-        categories = [
-            "Подписки", "Кредит", "Аренда", "Коммуналка", 
-            "Связь", "Страховка", "Другое"
-        ]
-        
-        print("\nКатегории:")
-        for i, category in enumerate(categories, 1):
-            print(f"{i}. {category}")
+        rule, payment_day, anchor_date = self.select_recurrence_rule()
+        
+        category = ""
+        if transaction_type == "income":
+            category = self.select_income_category() or ""
+        elif transaction_type == "expense":
+            # Список категорий расходов
+            categories = [
+                "Подписки", "Кредит", "Аренда", "Коммуналка", 
+                "Связь", "Страховка", "Другое"
+            ]
             
-        cat_choice = input("Выберите категорию (или введите свою): ")
-        
-        try:
-            category = categories[int(cat_choice) - 1]
-        except (ValueError, IndexError):
-            category = cat_choice
+            print("\nКатегории:")
+            for i, category in enumerate(categories, 1):
+                print(f"{i}. {category}")
+                
+            cat_choice = input("Выберите категорию (или введите свою): ")
+            
+            try:
+                category = categories[int(cat_choice) - 1]
+            except (ValueError, IndexError):
+                category = cat_choice
         
-        success, message = self.tracker.add_recurring_payment(account_id, amount, description, payment_day, category)
+        success, message = self.tracker.add_recurring_payment(
+            account_id, amount, description, payment_day, category,
+            rule=rule, anchor_date=anchor_date, transaction_type=transaction_type, to_account_id=to_account_id
+        )
         self.print_message(message, success)
     
     def edit_recurring_payment(self):
@@ -1793,9 +7396,8 @@ class ConsoleUI:
         
         print("Выберите платеж для редактирования:")
         for p in payments:
-            payment_id, account_id, account_name, amount, description, category, payment_day, active = p
-            status = "Активен" if active else "Отключен"
-            print(f"{payment_id}. {description} - {amount} ₽ с '{account_name}' (день: {payment_day}) - {status}")
+            status = "Активен" if p[7] else "Отключен"
+            print(f"{p[0]}. {self.describe_recurring_payment(p)} - {status}")
         
         payment_id = int(self.input_number("Введите ID платежа: ", 1))
         
@@ -1825,8 +7427,10 @@ class ConsoleUI:
         new_amount_str = input(f"Введите новую сумму (или оставьте пустым для '{selected_payment[3]}'): ")
         new_amount = float(new_amount_str) if new_amount_str else None
         
-        new_day_str = input(f"Введите новый день месяца (или оставьте пустым для '{selected_payment[6]}'): ")
-        new_day = int(new_day_str) if new_day_str else None
+        new_rule, new_day, new_anchor = None, None, None
+        change_schedule = input("Изменить расписание? (д/н): ")
+        if change_schedule.lower() in ['д', 'y', 'да', 'yes']:
+            new_rule, new_day, new_anchor = self.select_recurrence_rule()
         
         print("\nСтатус платежа:")
         print("1. Активен")
@@ -1838,7 +7442,8 @@ class ConsoleUI:
             new_active = 1 if status_choice == "1" else 0
         
         success, message = self.tracker.update_recurring_payment(
-            payment_id, new_account_id, new_amount, new_description, new_day, new_active
+            payment_id, new_account_id, new_amount, new_description, new_day, new_active,
+            rule=new_rule, anchor_date=new_anchor
         )
         
         self.print_message(message, success)
@@ -1853,9 +7458,8 @@ class ConsoleUI:
         
         print("Выберите платеж для удаления:")
         for p in payments:
-            payment_id, account_id, account_name, amount, description, category, payment_day, active = p
-            status = "Активен" if active else "Отключен"
-            print(f"{payment_id}. {description} - {amount} ₽ с '{account_name}' (день: {payment_day}) - {status}")
+            status = "Активен" if p[7] else "Отключен"
+            print(f"{p[0]}. {self.describe_recurring_payment(p)} - {status}")
         
         payment_id = int(self.input_number("Введите ID платежа: ", 1))
         
@@ -1869,7 +7473,7 @@ class ConsoleUI:
     def process_recurring_payments(self):
         self.print_header("ОБРАБОТКА АВТОПЛАТЕЖЕЙ")
         
-        print("Проверка регулярных платежей на сегодня...")
+        print("Проверка наступивших регулярных платежей...")
         results = self.tracker.process_recurring_payments()
         
         if not results:
@@ -1943,7 +7547,7 @@ class ConsoleUI:
         if not account_id:
             return
         
-        description = input("Введите описание платежа: ")
+        description = self.input_description("Введите описание платежа: ")
         amount = self.input_number("Введите сумму платежа: ", 0.01)
         planned_date = self.input_date("Введите дату платежа")
         
@@ -2125,9 +7729,15 @@ class ConsoleUI:
             print("1. 📊 Статистика по категориям расходов")
             print("2. 📅 Ежемесячный отчёт")
             print("3. 📈 Сравнительная статистика (день/неделя/месяц)")
+            print(f"4. 💱 Валюты и курсы (отчёты в {self.tracker.report_currency})")
+            print("5. 🔮 Прогноз остатков")
+            print("6. 🏷️ Сводка по меткам")
+            print("7. 📉 Графики")
+            print("8. 📄 Выписка по счёту (PDF)")
+            print("9. 🌐 Дашборд в HTML")
             print("0. 🔙 Назад")
             
-            choice = self.input_number("Выберите отчёт: ", 0, 3)
+            choice = self.input_number("Выберите отчёт: ", 0, 9)
             
             if choice == 1:
                 self.category_report()
@@ -2135,6 +7745,231 @@ class ConsoleUI:
                 self.monthly_report()
             elif choice == 3:
                 self.comparative_stats()
+            elif choice == 4:
+                self.currency_settings()
+            elif choice == 5:
+                self.balance_forecast()
+            elif choice == 6:
+                self.tag_report()
+            elif choice == 7:
+                self.charts_menu()
+            elif choice == 8:
+                self.account_statement()
+            elif choice == 9:
+                self.export_dashboard()
+            elif choice == 0:
+                break
+    
+    def charts_menu(self):
+        while True:
+            self.print_header("ГРАФИКИ")
+            print("1. 📊 Доходы и расходы по месяцам")
+            print("2. 🗓️ Календарь расходов по дням")
+            print("3. 📈 Динамика по неделям за год")
+            print("0. 🔙 Назад")
+            
+            choice = self.input_number("Выберите график: ", 0, 3)
+            
+            if choice == 1:
+                self.monthly_chart()
+            elif choice == 2:
+                self.spending_heatmap()
+            elif choice == 3:
+                self.weekly_trend()
+            elif choice == 0:
+                break
+    
+    def monthly_chart(self):
+        self.print_header("ДОХОДЫ И РАСХОДЫ ПО МЕСЯЦАМ")
+        year = datetime.date.today().year
+        year_input = input(f"Введите год (или оставьте пустым для {year}): ").strip()
+        if year_input:
+            try:
+                year = int(year_input)
+            except ValueError:
+                self.print_message("Некорректный формат года", False)
+                return
+        
+        totals = self.tracker.get_bucket_totals("month", f"{year}-01-01", f"{year}-12-31")
+        if not totals:
+            self.print_message(f"Нет данных за {year} год", False)
+            return
+        
+        print(f"\n💱 Суммы в валюте {self.tracker.report_currency}")
+        print("\n💰 ДОХОДЫ:")
+        for line in bar_chart([(month_names()[int(month[5:7])], income) for month, income, _ in totals]):
+            print(line)
+        print("\n💸 РАСХОДЫ:")
+        for line in bar_chart([(month_names()[int(month[5:7])], expense) for month, _, expense in totals]):
+            print(line)
+        
+        input("\n👉 Нажмите Enter, чтобы продолжить...")
+    
+    def spending_heatmap(self):
+        self.print_header("КАЛЕНДАРЬ РАСХОДОВ")
+        years = int(self.input_number("За сколько лет показать календарь (1-10): ", 1, 10))
+        
+        end = datetime.date.today()
+        start = date(end.year - years + 1, 1, 1)
+        totals = self.tracker.get_bucket_totals("day", start.isoformat(), end.isoformat())
+        days = {date.fromisoformat(day): expense for day, _, expense in totals}
+        
+        if not any(days.values()):
+            self.print_message("Нет расходов за выбранный период", False)
+            return
+        
+        print()
+        for line in calendar_heatmap(days, start, end):
+            print(line)
+        
+        busiest = max(days, key=days.get)
+        symbol = self.tracker.get_currency_symbol()
+        print(f"\n💸 Всего расходов: {sum(days.values()):.2f} {symbol}, дней с расходами: "
+              f"{sum(1 for value in days.values() if value > 0)}")
+        print(f"🔥 Самый затратный день: {busiest.strftime('%d.%m.%Y')} - {days[busiest]:.2f} {symbol}")
+        
+        input("\n👉 Нажмите Enter, чтобы продолжить...")
+    
+    def weekly_trend(self):
+        self.print_header("ДИНАМИКА ПО НЕДЕЛЯМ")
+        today = datetime.date.today()
+        first_week = today - datetime.timedelta(days=today.weekday() + 51 * 7)
+        totals = {week: (income, expense) for week, income, expense
+                  in self.tracker.get_bucket_totals("week", first_week.isoformat(), today.isoformat())}
+        
+        # Недели без операций тоже занимают место на графике
+        weeks = [(first_week + datetime.timedelta(weeks=i)).isoformat() for i in range(52)]
+        incomes = [totals.get(week, (0, 0))[0] for week in weeks]
+        expenses = [totals.get(week, (0, 0))[1] for week in weeks]
+        symbol = self.tracker.get_currency_symbol()
+        
+        print(f"52 недели с {first_week.strftime('%d.%m.%Y')}, суммы в валюте {self.tracker.report_currency}\n")
+        print(f"💰 Доходы   {sparkline(incomes)}")
+        print(f"   в среднем {sum(incomes) / 52:.2f} {symbol} в неделю, максимум {max(incomes):.2f} {symbol}")
+        print(f"\n💸 Расходы  {sparkline(expenses)}")
+        print(f"   в среднем {sum(expenses) / 52:.2f} {symbol} в неделю, максимум {max(expenses):.2f} {symbol}")
+        
+        input("\n👉 Нажмите Enter, чтобы продолжить...")
+    
+    def account_statement(self):
+        self.print_header("ВЫПИСКА ПО СЧЁТУ")
+        account_id = self.select_account()
+        
+        if not account_id:
+            return
+        
+        print("\nВыберите период:")
+        print("1. Текущий месяц")
+        print("2. Предыдущий месяц")
+        print("3. Текущий год")
+        print("4. Предыдущий год")
+        print("5. Произвольный период")
+        choice = self.input_number("Выберите вариант: ", 1, 5)
+        
+        today = datetime.date.today()
+        if choice == 1:
+            start_date, end_date = today.replace(day=1), today
+        elif choice == 2:
+            end_date = today.replace(day=1) - datetime.timedelta(days=1)
+            start_date = end_date.replace(day=1)
+        elif choice == 3:
+            start_date, end_date = today.replace(month=1, day=1), today
+        elif choice == 4:
+            start_date, end_date = date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)
+        else:
+            start_date = date.fromisoformat(self.input_date("Введите начальную дату"))
+            end_date = date.fromisoformat(self.input_date("Введите конечную дату"))
+        
+        default_path = f"statement_{account_id}_{start_date.isoformat()}_{end_date.isoformat()}.pdf"
+        path = input(f"Файл выписки (Enter - {default_path}): ").strip() or default_path
+        
+        print("⏳ Формируем выписку...")
+        success, message = self.tracker.export_statement(path, account_id, start_date.isoformat(), end_date.isoformat())
+        self.print_message(message, success)
+    
+    def export_dashboard(self):
+        self.print_header("ДАШБОРД В HTML")
+        print("Страница открывается в любом браузере без программы и сети - например, на телефоне.")
+        print("Повторная выгрузка в тот же файл пересчитывает только изменившиеся месяцы.\n")
+        path = input("Файл дашборда (Enter - dashboard.html): ").strip() or "dashboard.html"
+        
+        success, message = self.tracker.export_dashboard(path)
+        self.print_message(message, success)
+    
+    def tag_report(self):
+        self.print_header("СВОДКА ПО МЕТКАМ")
+        summary = self.tracker.get_tag_summary()
+        
+        if not summary:
+            print("📭 Операций с метками пока нет")
+            input("\n👉 Нажмите Enter, чтобы продолжить...")
+            return
+        
+        # Сводим доходы и расходы метки в одну строку
+        tags = {}
+        for name, transaction_type, count, total in summary:
+            tag = tags.setdefault(name, {"count": 0, "income": 0, "expense": 0})
+            tag["count"] += count
+            if transaction_type in ("income", "expense"):
+                tag[transaction_type] += total or 0
+        
+        print(f"💱 Суммы в валюте {self.tracker.report_currency}\n")
+        print(f"{'Метка':<20} {'Операций':>9} {'Доходы':>12} {'Расходы':>12}")
+        print("-" * 56)
+        for name, tag in sorted(tags.items(), key=lambda item: item[1]["expense"]):
+            print(f"🏷️ {name:<17} {tag['count']:>9} {tag['income']:>12.2f} {abs(tag['expense']):>12.2f}")
+        
+        names = input("\nПоказать расходы по категориям для меток (через запятую, Enter - выход): ").strip()
+        if names:
+            rows = self.tracker.get_category_summary(transaction_type="expense", tag_filter={"all": names})
+            print(f"\n💸 Расходы с метками: {names}")
+            for category, _, total in rows:
+                print(f"{self.get_category_emoji(category)} {category or 'Без категории':<18} {abs(total):>12.2f}")
+            if not rows:
+                print("Нет операций")
+        
+        input("\n👉 Нажмите Enter, чтобы продолжить...")
+    
+    def balance_forecast(self):
+        self.print_header("ПРОГНОЗ ОСТАТКОВ")
+        horizon_days = int(self.input_number("На сколько дней вперёд (например, 90): ", 1, 3650))
+        forecast = self.tracker.forecast_balances(horizon_days)
+        
+        if not forecast:
+            print("📭 У вас пока нет счетов")
+        else:
+            print(f"\nС учётом регулярных и запланированных платежей на {horizon_days} дн.:\n")
+            for account in forecast.values():
+                symbol = self.tracker.get_currency_symbol(account["currency"])
+                print(f"💼 {account['name']}: {account['start_balance']:.2f} → {account['end_balance']:.2f} {symbol} "
+                      f"(платежей: {account['payments']})")
+                print(f"   Минимум: {account['min_balance']:.2f} {symbol} ({account['min_date'].strftime('%d.%m.%Y')})")
+                if account["first_negative"]:
+                    print(f"   ⚠️ Уйдёт в минус {account['first_negative'].strftime('%d.%m.%Y')}")
+        
+        input("\n👉 Нажмите Enter, чтобы продолжить...")
+    
+    def currency_settings(self):
+        while True:
+            self.print_header("ВАЛЮТЫ И КУРСЫ")
+            print(f"Валюта отчётов: {self.tracker.report_currency}")
+            print(f"Доступные валюты: {', '.join(self.tracker.get_currencies())}")
+            print("\n1. 📥 Загрузить курсы из файла (CSV: дата,валюта,курс в рублях)")
+            print("2. 💱 Выбрать валюту отчётов")
+            print("0. 🔙 Назад")
+            
+            choice = self.input_number("Выберите пункт меню: ", 0, 2)
+            
+            if choice == 1:
+                path = input("Введите путь к файлу с курсами: ").strip()
+                if path:
+                    success, message = self.tracker.load_fx_rates(path)
+                    self.print_message(message, success)
+            elif choice == 2:
+                currency = input("Введите код валюты (например, USD): ").strip()
+                if currency:
+                    success, message = self.tracker.set_report_currency(currency)
+                    self.print_message(message, success)
             elif choice == 0:
                 break
     
@@ -2193,13 +8028,20 @@ class ConsoleUI:
             start_date = self.input_date("Введите начальную дату")
             end_date = self.input_date("Введите конечную дату")
         
-        summary = self.tracker.get_category_summary(start_date, end_date, transaction_type)
+        tag_filter = None
+        filter_by_tags = input("Отфильтровать по меткам? (д/н): ")
+        if filter_by_tags.lower() in ['д', 'y', 'да', 'yes']:
+            tag_filter = self.input_tag_filter()
+        
+        summary = self.tracker.get_category_summary(start_date, end_date, transaction_type, tag_filter)
         
         if not summary:
             self.print_message("Нет данных за выбранный период", False)
             return
         
         self.print_header(report_title)
+        print(f"💱 Суммы в валюте {self.tracker.report_currency}")
+        self.print_rate_warning()
         
         # Группируем данные по типам транзакций
         expense_data = []
@@ -2223,12 +8065,13 @@ class ConsoleUI:
             
             # Сортируем по убыванию суммы (по модулю)
             expense_data.sort(key=lambda x: abs(x[1]), reverse=True)
+            max_expense = abs(expense_data[0][1])
             
             for category, amount in expense_data:
                 percent = abs(amount) / total_expense * 100 if total_expense else 0
                 emoji = self.get_category_emoji(category)
                 # Используем абсолютное значение для вывода, так как расходы хранятся как отрицательные числа
-                print(f"{emoji} {category:<18} {abs(amount):<10.2f} {percent:<10.2f}%")
+                print(f"{emoji} {category:<18} {abs(amount):<10.2f} {percent:>6.2f}% {bar(abs(amount), max_expense, 20)}")
             
             print("-" * 40)
             print(f"💰 {'ИТОГО РАСХОДЫ':<18} {total_expense:<10.2f} {'100.00':<10}%")
@@ -2243,11 +8086,12 @@ class ConsoleUI:
             
             # Сортируем по убыванию суммы
             income_data.sort(key=lambda x: x[1], reverse=True)
+            max_income = income_data[0][1]
             
             for category, amount in income_data:
                 percent = amount / total_income * 100 if total_income else 0
                 emoji = self.get_category_emoji(category)
-                print(f"{emoji} {category:<18} {amount:<10.2f} {percent:<10.2f}%")
+                print(f"{emoji} {category:<18} {amount:<10.2f} {percent:>6.2f}% {bar(amount, max_income, 20)}")
             
             print("-" * 40)
             print(f"💰 {'ИТОГО ДОХОДЫ':<18} {total_income:<10.2f} {'100.00':<10}%")
@@ -2303,6 +8147,8 @@ class ConsoleUI:
             return
         
         self.print_header(f"ОТЧЁТ ЗА {year} ГОД")
+        print(f"💱 Суммы в валюте {self.tracker.report_currency}")
+        self.print_rate_warning()
         
         # Выводим таблицу
         print(f"{'Месяц':<12} {'Доходы':<12} {'Расходы':<12} {'Баланс':<12} {'Расход/Доход':<12}")
@@ -2343,6 +8189,10 @@ class ConsoleUI:
         
         print(f"{'ИТОГО':<12} {total_income:<12.2f} {abs(total_expense):<12.2f} {balance_emoji} {total_balance:<8.2f} {total_ratio_str:<12}")
         
+        # Месяцы с января по декабрь одной строкой
+        print(f"\n💰 Доходы  {sparkline([income for _, income, _, _ in monthly_data])}")
+        print(f"💸 Расходы {sparkline([abs(expense) for _, _, expense, _ in monthly_data])}")
+        
         # Добавляем интерпретацию соотношения для общего результата
         if total_income > 0:
             print("\n💡 ИТОГОВАЯ ОЦЕНКА:")
@@ -2379,10 +8229,11 @@ class ConsoleUI:
     def show_day_comparison(self):
         self.print_header("СРАВНЕНИЕ ПО ДНЯМ")
         
+        symbol = self.tracker.get_currency_symbol()
         stats = self.tracker.get_day_comparison()
         
-        print(f"💸 Расходы сегодня ({stats['today_date']}): {stats['today_expenses']:.2f} ₽")
-        print(f"💸 Расходы вчера ({stats['yesterday_date']}): {stats['yesterday_expenses']:.2f} ₽")
+        print(f"💸 Расходы сегодня ({stats['today_date']}): {stats['today_expenses']:.2f} {symbol}")
+        print(f"💸 Расходы вчера ({stats['yesterday_date']}): {stats['yesterday_expenses']:.2f} {symbol}")
         
         if stats['expense_percent_change'] > 0:
             print(f"📈 Сегодня вы потратили на {stats['expense_percent_change']:.2f}% БОЛЬШЕ, чем вчера")
@@ -2393,8 +8244,8 @@ class ConsoleUI:
         
         print("\n" + "-" * 40)
         
-        print(f"💰 Доходы сегодня ({stats['today_date']}): {stats['today_income']:.2f} ₽")
-        print(f"💰 Доходы вчера ({stats['yesterday_date']}): {stats['yesterday_income']:.2f} ₽")
+        print(f"💰 Доходы сегодня ({stats['today_date']}): {stats['today_income']:.2f} {symbol}")
+        print(f"💰 Доходы вчера ({stats['yesterday_date']}): {stats['yesterday_income']:.2f} {symbol}")
         
         if stats['income_percent_change'] > 0:
             print(f"📈 Сегодня вы заработали на {stats['income_percent_change']:.2f}% БОЛЬШЕ, чем вчера")
@@ -2430,12 +8281,13 @@ class ConsoleUI:
     def show_week_comparison(self):
         self.print_header("СРАВНЕНИЕ ПО НЕДЕЛЯМ")
         
+        symbol = self.tracker.get_currency_symbol()
         stats = self.tracker.get_week_comparison()
         
         # Выводим информацию о расходах
         print(f"💸 РАСХОДЫ:")
-        print(f"Текущая неделя ({stats['current_week_start']} - {stats['current_week_end']}): {stats['current_week_expenses']:.2f} ₽")
-        print(f"Прошлая неделя ({stats['prev_week_start']} - {stats['prev_week_end']}): {stats['prev_week_expenses']:.2f} ₽")
+        print(f"Текущая неделя ({stats['current_week_start']} - {stats['current_week_end']}): {stats['current_week_expenses']:.2f} {symbol}")
+        print(f"Прошлая неделя ({stats['prev_week_start']} - {stats['prev_week_end']}): {stats['prev_week_expenses']:.2f} {symbol}")
         
         if stats['expense_percent_change'] > 0:
             print(f"📈 На этой неделе вы потратили на {stats['expense_percent_change']:.2f}% БОЛЬШЕ, чем на прошлой")
@@ -2448,8 +8300,8 @@ class ConsoleUI:
         
         # Выводим информацию о доходах
         print(f"💰 ДОХОДЫ:")
-        print(f"Текущая неделя ({stats['current_week_start']} - {stats['current_week_end']}): {stats['current_week_income']:.2f} ₽")
-        print(f"Прошлая неделя ({stats['prev_week_start']} - {stats['prev_week_end']}): {stats['prev_week_income']:.2f} ₽")
+        print(f"Текущая неделя ({stats['current_week_start']} - {stats['current_week_end']}): {stats['current_week_income']:.2f} {symbol}")
+        print(f"Прошлая неделя ({stats['prev_week_start']} - {stats['prev_week_end']}): {stats['prev_week_income']:.2f} {symbol}")
         
         if stats['income_percent_change'] > 0:
             print(f"📈 На этой неделе вы заработали на {stats['income_percent_change']:.2f}% БОЛЬШЕ, чем на прошлой")
@@ -2497,12 +8349,13 @@ class ConsoleUI:
     def show_month_comparison(self):
         self.print_header("СРАВНЕНИЕ ПО МЕСЯЦАМ")
         
+        symbol = self.tracker.get_currency_symbol()
         stats = self.tracker.get_month_comparison()
         
         # Выводим информацию о расходах
         print(f"💸 РАСХОДЫ:")
-        print(f"Текущий месяц ({stats['current_month']}): {stats['current_month_expenses']:.2f} ₽")
-        print(f"Прошлый месяц ({stats['prev_month']}): {stats['prev_month_expenses']:.2f} ₽")
+        print(f"Текущий месяц ({stats['current_month']}): {stats['current_month_expenses']:.2f} {symbol}")
+        print(f"Прошлый месяц ({stats['prev_month']}): {stats['prev_month_expenses']:.2f} {symbol}")
         
         if stats['expense_percent_change'] > 0:
             print(f"📈 В этом месяце вы потратили на {stats['expense_percent_change']:.2f}% БОЛЬШЕ, чем в прошлом")
@@ -2515,8 +8368,8 @@ class ConsoleUI:
         
         # Выводим информацию о доходах
         print(f"💰 ДОХОДЫ:")
-        print(f"Текущий месяц ({stats['current_month']}): {stats['current_month_income']:.2f} ₽")
-        print(f"Прошлый месяц ({stats['prev_month']}): {stats['prev_month_income']:.2f} ₽")
+        print(f"Текущий месяц ({stats['current_month']}): {stats['current_month_income']:.2f} {symbol}")
+        print(f"Прошлый месяц ({stats['prev_month']}): {stats['prev_month_income']:.2f} {symbol}")
         
         if stats['income_percent_change'] > 0:
             print(f"📈 В этом месяце вы заработали на {stats['income_percent_change']:.2f}% БОЛЬШЕ, чем в прошлом")
@@ -2561,6 +8414,172 @@ class ConsoleUI:
         
         input("\n👉 Нажмите Enter, чтобы продолжить...")
 
+    def budgets_menu(self):
+        while True:
+            self.print_header("БЮДЖЕТЫ")
+            print("1. 👁️ Состояние бюджетов")
+            print("2. ➕ Установить бюджет")
+            print("3. ❌ Удалить бюджет")
+            print("0. 🔙 Назад")
+            
+            choice = self.input_number("Выберите пункт меню: ", 0, 3)
+            
+            if choice == 1:
+                self.show_budgets()
+            elif choice == 2:
+                self.set_budget()
+            elif choice == 3:
+                self.delete_budget()
+            elif choice == 0:
+                break
+    
+    def print_budgets(self, budgets):
+        for b in budgets:
+            budget_id, category, period, limit_amount, spent, period_start = b
+            period_name = "неделя" if period == "week" else "месяц"
+            percent = spent / limit_amount * 100 if limit_amount else 0
+            status = "🚨" if spent > limit_amount else "⚠️" if percent >= 80 else "✅"
+            emoji = self.get_category_emoji(category)
+            print(f"{budget_id}. {emoji} {category} ({period_name}): {self.tracker.format_budget_amount(spent, False)} из "
+                  f"{self.tracker.format_budget_amount(limit_amount)} ({percent:.1f}%) {status}")
+    
+    def show_budgets(self):
+        self.print_header("СОСТОЯНИЕ БЮДЖЕТОВ")
+        budgets = self.tracker.get_budget_status()
+        
+        if not budgets:
+            print("📭 У вас пока нет бюджетов")
+        else:
+            self.print_budgets(budgets)
+        
+        input("\n👉 Нажмите Enter, чтобы продолжить...")
+    
+    def set_budget(self):
+        self.print_header("УСТАНОВКА БЮДЖЕТА")
+        category = self.select_expense_category("Выберите категорию для бюджета:")
+        
+        if not category:
+            return
+        
+        print("\nПериод бюджета:")
+        print("1. Месяц")
+        print("2. Неделя")
+        period_choice = self.input_number("Выберите период: ", 1, 2)
+        period = "month" if period_choice == 1 else "week"
+        
+        limit_amount = self.input_number(
+            f"Введите лимит ({self.tracker.get_currency_symbol(self.tracker.DEFAULT_CURRENCY)}): ", 0.01
+        )
+        
+        success, message = self.tracker.set_budget(category, limit_amount, period)
+        self.print_message(message, success)
+    
+    def delete_budget(self):
+        self.print_header("УДАЛЕНИЕ БЮДЖЕТА")
+        budgets = self.tracker.get_budget_status()
+        
+        if not budgets:
+            self.print_message("У вас пока нет бюджетов", False)
+            return
+        
+        print("Выберите бюджет для удаления:")
+        self.print_budgets(budgets)
+        
+        budget_id = int(self.input_number("Введите ID бюджета: ", 1))
+        
+        if not any(b[0] == budget_id for b in budgets):
+            self.print_message("Бюджет не найден", False)
+            return
+        
+        if not self.input_yes_no("Вы уверены, что хотите удалить этот бюджет? (д/н): "):
+            self.print_message("Удаление отменено")
+            return
+        
+        success, message = self.tracker.delete_budget(budget_id)
+        self.print_message(message, success)
+
+    def diagnostics_menu(self):
+        while True:
+            self.print_header("ДИАГНОСТИКА")
+            profiler = self.tracker.conn.profiler
+            if profiler is None:
+                print("Профилирование запросов: ⛔ выключено")
+            else:
+                print(f"Профилирование запросов: ✅ включено (порог {profiler.slow_query_ms} мс, "
+                      f"EXPLAIN {'вкл' if profiler.explain else 'выкл'})")
+            if self.tracker.metrics_server is None:
+                print("Эндпоинт метрик: ⛔ не запущен")
+            else:
+                host, port = self.tracker.metrics_server.server_address[:2]
+                print(f"Эндпоинт метрик: ✅ http://{host}:{port}/metrics")
+            print("\n1. ▶️ Включить профилирование")
+            print("2. ⏹️ Выключить профилирование")
+            print("3. 📊 Статистика запросов по методам")
+            print("4. 📈 Запустить эндпоинт метрик")
+            print("5. 📄 Показать метрики")
+            print("6. 💾 Резервная копия базы")
+            print("7. 🧹 Сжатие базы и обновление статистики")
+            print("8. 🗄️ Архивировать старые операции")
+            print("0. 🔙 Назад")
+            
+            choice = self.input_number("Выберите пункт меню: ", 0, 8)
+            
+            if choice == 1:
+                slow_query_ms = self.input_number("Порог медленного запроса, мс: ", 0)
+                explain = self.input_yes_no("Сохранять EXPLAIN QUERY PLAN для медленных запросов? (д/н): ")
+                self.tracker.enable_profiling(slow_query_ms, explain=explain)
+            elif choice == 2:
+                self.tracker.disable_profiling()
+            elif choice == 3:
+                self.show_query_stats()
+            elif choice == 4:
+                port = self.input_number("Порт (только localhost): ", 1, 65535)
+                try:
+                    host, port = self.tracker.start_metrics_server(int(port))[:2]
+                    self.print_message(f"Метрики доступны на http://{host}:{port}/metrics")
+                except OSError as e:
+                    self.print_message(f"Не удалось запустить сервер: {e}", False)
+            elif choice == 5:
+                self.print_header("МЕТРИКИ")
+                print(self.tracker.metrics.render())
+                input("\n👉 Нажмите Enter, чтобы продолжить...")
+            elif choice == 6:
+                dest_path = input("Файл для копии: ").strip()
+                if dest_path:
+                    success, message = self.tracker.backup(dest_path)
+                    self.print_message(message, success)
+            elif choice == 7:
+                success, message = self.tracker.compact()
+                self.print_message(message, success)
+            elif choice == 8:
+                years = int(self.input_number("Архивировать операции старше скольких полных лет: ", 1))
+                if self.input_yes_no(f"Перенести операции старше {years} лет в годовые архивы? (д/н): "):
+                    success, message = self.tracker.archive_transactions(years)
+                    self.print_message(message, success)
+            elif choice == 0:
+                break
+    
+    def show_query_stats(self):
+        self.print_header("СТАТИСТИКА ЗАПРОСОВ")
+        stats = self.tracker.stats()
+        
+        if stats is None:
+            self.print_message("Профилирование выключено", False)
+            return
+        
+        if not stats["methods"]:
+            print("📭 Запросов пока не было")
+        else:
+            print(f"{'Метод':<32} {'Запросов':>8} {'Всего, мс':>10} {'Сред.':>8} {'Макс.':>8} {'Строк':>8}")
+            print("-" * 78)
+            for method, m in stats["methods"].items():
+                print(f"{method:<32} {m['count']:>8} {m['total_ms']:>10.2f} {m['avg_ms']:>8.3f} {m['max_ms']:>8.2f} {m['rows']:>8}")
+                histogram = "  ".join(f"{label}: {count}" for label, count in m["histogram"].items() if count)
+                print(f"    {histogram}")
+            print(f"\n🐢 Медленных запросов (≥ {stats['slow_query_ms']} мс): {stats['slow_queries']}")
+        
+        input("\n👉 Нажмите Enter, чтобы продолжить...")
+    
     def input_yes_no(self, prompt):
         """
         Запрашивает у пользователя ответ да/нет.
@@ -2588,21 +8607,163 @@ class ConsoleUI:
         print("            свои финансы!")
         input("\n  👉 Нажмите Enter, чтобы начать...")
 
-    def categories_menu(self):
-        while True:
-            self.print_header("УПРАВЛЕНИЕ КАТЕГОРИЯМИ")
-            print("1. 💸 Категории расходов")
-            print("2. 💰 Категории доходов")
-            print("0. 🔙 Назад")
-            
-            choice = self.input_number("Выберите тип категорий: ", 0, 2)
-            
-            if choice == 1:
-                self.expense_categories_menu()
-            elif choice == 2:
-                self.income_categories_menu()
-            elif choice == 0:
-                break
+    def categories_menu(self):
+        while True:
+            self.print_header("УПРАВЛЕНИЕ КАТЕГОРИЯМИ")
+            print("1. 💸 Категории расходов")
+            print("2. 💰 Категории доходов")
+            print("3. 🤖 Правила автокатегоризации")
+            print("0. 🔙 Назад")
+            
+            choice = self.input_number("Выберите тип категорий: ", 0, 3)
+            
+            if choice == 1:
+                self.expense_categories_menu()
+            elif choice == 2:
+                self.income_categories_menu()
+            elif choice == 3:
+                self.category_rules_menu()
+            elif choice == 0:
+                break
+
+    def category_rules_menu(self):
+        while True:
+            self.print_header("ПРАВИЛА АВТОКАТЕГОРИЗАЦИИ")
+            print("1. 👁️ Просмотр правил")
+            print("2. ➕ Добавить правило")
+            print("3. ❌ Удалить правило")
+            print("4. 🔄 Применить правила к истории операций")
+            print("0. 🔙 Назад")
+            
+            choice = self.input_number("Выберите пункт меню: ", 0, 4)
+            
+            if choice == 1:
+                self.show_category_rules()
+            elif choice == 2:
+                self.add_category_rule()
+            elif choice == 3:
+                self.delete_category_rule()
+            elif choice == 4:
+                self.recategorize_transactions()
+            elif choice == 0:
+                break
+
+    def print_category_rules(self, rules):
+        for rule in rules:
+            rule_id, pattern, match_type, transaction_type, category, min_amount, max_amount, account_id, priority = rule
+            type_emoji = "💸" if transaction_type == "expense" else "💰"
+            pattern_str = f"/{pattern}/" if match_type == "regex" else f"'{pattern}'"
+            conditions = []
+            if min_amount is not None:
+                conditions.append(f"от {min_amount} ₽")
+            if max_amount is not None:
+                conditions.append(f"до {max_amount} ₽")
+            if account_id is not None:
+                account = self.tracker.get_account_by_id(account_id)
+                conditions.append(f"счёт '{account[1] if account else account_id}'")
+            conditions_str = f" ({', '.join(conditions)})" if conditions else ""
+            print(f"{rule_id}. {type_emoji} {pattern_str} → {category}{conditions_str} [приоритет {priority}]")
+
+    def show_category_rules(self):
+        self.print_header("СПИСОК ПРАВИЛ")
+        rules = self.tracker.get_category_rules()
+        
+        if not rules:
+            print("📭 У вас пока нет правил автокатегоризации")
+        else:
+            self.print_category_rules(rules)
+            warning = self.tracker.get_rule_warning()
+            if warning:
+                print(f"\n{warning}")
+        
+        input("\n👉 Нажмите Enter, чтобы продолжить...")
+
+    def add_category_rule(self):
+        self.print_header("ДОБАВЛЕНИЕ ПРАВИЛА")
+        
+        print("Тип операции:")
+        print("1. 💸 Расход")
+        print("2. 💰 Доход")
+        type_choice = self.input_number("Выберите тип: ", 1, 2)
+        transaction_type = "expense" if type_choice == 1 else "income"
+        
+        print("\nТип шаблона:")
+        print("1. Подстрока в описании (без учёта регистра)")
+        print("2. Регулярное выражение")
+        match_choice = self.input_number("Выберите тип шаблона: ", 1, 2)
+        match_type = "substring" if match_choice == 1 else "regex"
+        
+        pattern = input("Введите шаблон (например, netflix): ")
+        
+        if transaction_type == "expense":
+            category = self.select_expense_category("Какую категорию назначать:")
+        else:
+            category = self.select_income_category("Какую категорию назначать:")
+        
+        if not category:
+            self.print_message("Категория не выбрана", False)
+            return
+        
+        min_amount_str = input("Минимальная сумма (или оставьте пустым): ")
+        max_amount_str = input("Максимальная сумма (или оставьте пустым): ")
+        try:
+            min_amount = float(min_amount_str) if min_amount_str else None
+            max_amount = float(max_amount_str) if max_amount_str else None
+        except ValueError:
+            self.print_message("Некорректная сумма", False)
+            return
+        
+        account_id = None
+        if not self.input_yes_no("Применять для всех счетов? (д/н): "):
+            account_id = self.select_account()
+            if not account_id:
+                return
+        
+        priority_str = input("Приоритет (больше - важнее, по умолчанию 0): ")
+        priority = int(priority_str) if priority_str.lstrip("-").isdigit() else 0
+        
+        success, message = self.tracker.add_category_rule(
+            pattern, category, transaction_type, match_type, min_amount, max_amount, account_id, priority
+        )
+        self.print_message(message, success)
+
+    def delete_category_rule(self):
+        self.print_header("УДАЛЕНИЕ ПРАВИЛА")
+        rules = self.tracker.get_category_rules()
+        
+        if not rules:
+            self.print_message("У вас пока нет правил автокатегоризации", False)
+            return
+        
+        print("Выберите правило для удаления:")
+        self.print_category_rules(rules)
+        
+        rule_id = int(self.input_number("Введите ID правила: ", 1))
+        
+        if not any(rule[0] == rule_id for rule in rules):
+            self.print_message("Правило не найдено", False)
+            return
+        
+        if not self.input_yes_no("Вы уверены, что хотите удалить это правило? (д/н): "):
+            self.print_message("Удаление отменено")
+            return
+        
+        success, message = self.tracker.delete_category_rule(rule_id)
+        self.print_message(message, success)
+
+    def recategorize_transactions(self):
+        self.print_header("ПРИМЕНЕНИЕ ПРАВИЛ К ИСТОРИИ")
+        
+        print("1. Только операции без категории")
+        print("2. Все операции (категория будет заменена, если сработало правило)")
+        choice = self.input_number("Выберите вариант: ", 1, 2)
+        
+        if choice == 2 and not self.input_yes_no("Категории существующих операций могут измениться. Продолжить? (д/н): "):
+            self.print_message("Операция отменена")
+            return
+        
+        success, message = self.tracker.recategorize_transactions(only_uncategorized=choice == 1)
+        self.print_message(message, success)
 
     def expense_categories_menu(self):
         while True:
@@ -2895,20 +9056,21 @@ class ConsoleUI:
         self.print_message(message, success)
 
     def select_expense_category(self, prompt="Выберите категорию расхода:"):
-        categories = self.tracker.get_categories()  # Это для расходов
-        if not categories:
+        if not self.tracker.get_categories():
             print("Нет доступных категорий расходов")
             return None
         
         print(prompt)
-        for i, category in enumerate(categories, 1):
-            print(f"{i}. {category[1]}")
-        print("0. Ввести новую категорию")
-        
-        choice = self.input_number("Введите номер категории: ", 0, len(categories))
-        
-        if choice == 0:
-            new_category = input("Введите название новой категории расхода: ")
+        choice = self.pick("expense_category", zero_label="Ввести новую категорию", allow_new=True)
+        
+        if choice is None or self.tracker.get_category_by_name(choice[0]) is None:
+            # «0» или название, которого нет среди категорий
+            if choice is None:
+                new_category = input("Введите название новой категории расхода: ")
+            elif self.input_yes_no(f"Категории «{choice[0]}» нет. Создать? (д/н): "):
+                new_category = choice[0]
+            else:
+                return ""
             if new_category:
                 success, _ = self.tracker.add_category(new_category)
                 if success:
@@ -2917,23 +9079,24 @@ class ConsoleUI:
                 return new_category
             return ""
         
-        return categories[int(choice) - 1][1]  # Возвращаем название выбранной категории
+        return choice[0]  # Возвращаем название выбранной категории
 
     def select_income_category(self, prompt="Выберите категорию дохода:"):
-        categories = self.tracker.get_income_categories()  # Для доходов
-        if not categories:
+        if not self.tracker.get_income_categories():
             print("Нет доступных категорий доходов")
             return None
         
         print(prompt)
-        for i, category in enumerate(categories, 1):
-            print(f"{i}. {category[1]}")
-        print("0. Ввести новую категорию")
-        
-        choice = self.input_number("Введите номер категории: ", 0, len(categories))
-        
-        if choice == 0:
-            new_category = input("Введите название новой категории дохода: ")
+        choice = self.pick("income_category", zero_label="Ввести новую категорию", allow_new=True)
+        
+        if choice is None or self.tracker.get_income_category_by_name(choice[0]) is None:
+            # «0» или название, которого нет среди категорий
+            if choice is None:
+                new_category = input("Введите название новой категории дохода: ")
+            elif self.input_yes_no(f"Категории «{choice[0]}» нет. Создать? (д/н): "):
+                new_category = choice[0]
+            else:
+                return ""
             if new_category:
                 success, _ = self.tracker.add_income_category(new_category)
                 if success:
@@ -2942,14 +9105,1348 @@ class ConsoleUI:
                 return new_category
             return ""
         
-        return categories[int(choice) - 1][1]  # Возвращаем название выбранной категории
+        return choice[0]  # Возвращаем название выбранной категории
+
+# Полноэкранный интерфейс на curses поверх того же FinanceTracker
+class CursesUI:
+    """
+    Счета, операции и статистика на одном экране. Каждая панель - своё окно curses, и клавиша
+    помечает к перерисовке только затронутые панели (перемещение по списку - только две строки).
+    Список операций виртуальный: в памяти лишь видимые строки, соседние страницы читаются
+    по ключу (дата, id), а позиция в списке считается по дневным суммам.
+    """
+    ACCOUNTS_WIDTH = 34
+    STATS_HEIGHT = 11
+    MIN_HEIGHT = 20
+    MIN_WIDTH = 80
+    PANES = ("header", "accounts", "stats", "transactions", "status")
+    HELP = "Tab панель  a расход  i доход  x удалить  u отмена  U повтор  q выход"
+    
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.accounts = []  # Первая строка - все счета: (None, "Все счета", ...)
+        self.account_index = 0
+        self.rows = []  # Видимые строки списка операций
+        self.row_index = 0
+        self.position = 0  # Сколько операций списка выше первой видимой
+        self.total = 0
+        self.stats = []
+        self.focus = "transactions"
+        self.message = ""
+        self.dirty = set()
+        self.dirty_lines = set()
+    
+    def run(self):
+        import curses
+        import locale
+        
+        locale.setlocale(locale.LC_ALL, "")  # Иначе ncurses не выводит кириллицу
+        os.environ.setdefault("ESCDELAY", "25")  # Esc отменяет ввод сразу, а не через секунду
+        curses.wrapper(self.main_loop)
+    
+    def main_loop(self, screen):
+        import curses
+        
+        self.curses = curses
+        self.screen = screen
+        curses.curs_set(0)
+        self.colors = {}
+        if curses.has_colors():
+            curses.use_default_colors()
+            for number, (name, color) in enumerate((("income", curses.COLOR_GREEN), ("expense", curses.COLOR_RED),
+                                                    ("title", curses.COLOR_CYAN)), 1):
+                curses.init_pair(number, color, -1)
+                self.colors[name] = curses.color_pair(number)
+        
+        self.layout()
+        self.load_accounts()
+        self.load_stats()
+        self.load_first_page()
+        while True:
+            self.draw()
+            key = screen.get_wch()
+            if key == curses.KEY_RESIZE:
+                self.layout()
+                self.reload_page()
+                continue
+            if not self.handle_key(key):
+                break
+    
+    # Разметка и вывод
+    def layout(self):
+        curses = self.curses
+        height, width = self.screen.getmaxyx()
+        self.too_small = height < self.MIN_HEIGHT or width < self.MIN_WIDTH
+        self.screen.erase()
+        self.screen.noutrefresh()
+        if self.too_small:
+            self.windows = {}
+            return
+        
+        side_height = height - 2 - self.STATS_HEIGHT
+        self.windows = {
+            "header": curses.newwin(1, width, 0, 0),
+            "accounts": curses.newwin(side_height, self.ACCOUNTS_WIDTH, 1, 0),
+            "stats": curses.newwin(self.STATS_HEIGHT, self.ACCOUNTS_WIDTH, 1 + side_height, 0),
+            "transactions": curses.newwin(height - 2, width - self.ACCOUNTS_WIDTH, 1, self.ACCOUNTS_WIDTH),
+            "status": curses.newwin(1, width, height - 1, 0),
+        }
+        for window in self.windows.values():
+            window.keypad(True)
+        # Рамка и строка заголовков колонок
+        self.page_size = height - 5
+        self.dirty.update(self.PANES)
+    
+    def put(self, window, y, x, text, attr=0):
+        """Выводит строку, обрезанную по ширине окна (запись в правый нижний угол curses считает ошибкой)"""
+        width = window.getmaxyx()[1]
+        try:
+            window.addstr(y, x, text[:max(0, width - x)], attr)
+        except self.curses.error:
+            pass
+    
+    def frame(self, window, title, pane):
+        window.erase()
+        window.box()
+        attr = self.curses.A_REVERSE if self.focus == pane else self.colors.get("title", 0) | self.curses.A_BOLD
+        self.put(window, 0, 2, f" {title} ", attr)
+    
+    def draw(self):
+        if self.too_small:
+            self.screen.erase()
+            self.put(self.screen, 0, 0, f"Окно слишком маленькое: нужно не меньше {self.MIN_WIDTH}x{self.MIN_HEIGHT}")
+            self.screen.refresh()
+            return
+        
+        for pane in self.PANES:
+            if pane in self.dirty:
+                getattr(self, f"draw_{pane}")(self.windows[pane])
+                self.windows[pane].noutrefresh()
+        # Курсор сдвинулся в пределах страницы - перерисовываем только старую и новую строку
+        if self.dirty_lines and "transactions" not in self.dirty:
+            window = self.windows["transactions"]
+            for index in self.dirty_lines:
+                self.draw_transaction_line(window, index)
+            window.noutrefresh()
+        self.dirty.clear()
+        self.dirty_lines.clear()
+        self.curses.doupdate()
+    
+    def money(self, value, currency=None, sign=False):
+        text = f"{value:{'+' if sign else ''},.2f}".replace(",", " ")
+        return f"{text} {self.tracker.get_currency_symbol(currency)}"
+    
+    def draw_header(self, window):
+        window.erase()
+        window.bkgd(" ", self.curses.A_REVERSE)
+        total = f"Всего: {self.money(self.total_balance)}"
+        if self.missing_rates:
+            total += f" (без {', '.join(self.missing_rates)}: нет курсов)"
+        self.put(window, 0, 1, f"Finance Tracker   {total}", self.curses.A_REVERSE)
+        today = date.today().strftime("%d.%m.%Y")
+        self.put(window, 0, window.getmaxyx()[1] - len(today) - 2, today, self.curses.A_REVERSE)
+    
+    def draw_status(self, window):
+        window.erase()
+        self.put(window, 0, 1, self.message or self.HELP, self.curses.A_BOLD if self.message else self.curses.A_DIM)
+    
+    def draw_accounts(self, window):
+        self.frame(window, "Счета", "accounts")
+        height, width = window.getmaxyx()
+        visible = height - 2
+        top = max(0, self.account_index - visible + 1)
+        for line, (account_id, name, balance, _, currency) in enumerate(self.accounts[top:top + visible]):
+            index = top + line
+            attr = 0
+            if index == self.account_index:
+                attr = self.curses.A_REVERSE if self.focus == "accounts" else self.curses.A_BOLD
+            amount = self.money(balance, currency) if account_id else ""
+            name = name[:width - len(amount) - 5]
+            self.put(window, line + 1, 1, f" {name:<{width - len(amount) - 4}}{amount} ", attr)
+    
+    def draw_stats(self, window):
+        self.frame(window, "Статистика", "stats")
+        for line, (text, kind) in enumerate(self.stats[:window.getmaxyx()[0] - 2]):
+            self.put(window, line + 1, 2, text, self.colors.get(kind, 0))
+    
+    def transaction_columns(self, width):
+        """Ширины колонок: дата, счёт (только в списке всех счетов), описание, категория, сумма"""
+        account = 12 if not self.account_id() else 0
+        category = 18
+        amount = 16
+        description = max(10, width - 15 - account - category - amount)
+        return account, description, category, amount
+    
+    def draw_transactions(self, window):
+        account_name = self.accounts[self.account_index][1]
+        if self.total:
+            title = f"Операции: {account_name} ({self.position + 1}-{self.position + len(self.rows)} из {self.total})"
+        else:
+            title = f"Операции: {account_name}"
+        self.frame(window, title, "transactions")
+        
+        account, description, category, amount = self.transaction_columns(window.getmaxyx()[1])
+        header = "Дата       " + ("Счёт".ljust(account) if account else "") + "Описание".ljust(description)
+        header += "Категория".ljust(category) + "Сумма".rjust(amount)
+        self.put(window, 1, 1, " " + header, self.curses.A_BOLD)
+        if not self.rows:
+            self.put(window, 3, 2, "Нет операций")
+        for index in range(len(self.rows)):
+            self.draw_transaction_line(window, index)
+    
+    def draw_transaction_line(self, window, index):
+        if index >= len(self.rows):
+            return
+        _, _, account_name, amount, description, category, transaction_date, _, currency = self.rows[index]
+        account, description_width, category_width, amount_width = self.transaction_columns(window.getmaxyx()[1])
+        
+        def cut(text, width):
+            text = (text or "").replace("\n", " ")
+            return (text[:width - 2] + "… " if len(text) > width - 1 else text).ljust(width)
+        
+        line = f" {format_date(transaction_date)} " + (cut(account_name, account) if account else "")
+        line += cut(description, description_width) + cut(category, category_width)
+        selected = index == self.row_index
+        attr = 0
+        if selected:
+            attr = self.curses.A_REVERSE if self.focus == "transactions" else self.curses.A_BOLD
+        self.put(window, index + 2, 1, line, attr)
+        amount_text = self.money(amount, currency, True).rjust(amount_width) + " "
+        color = self.colors.get("income" if amount > 0 else "expense", 0)
+        self.put(window, index + 2, 1 + len(line), amount_text, attr | (0 if selected else color))
+    
+    # Данные: читаются только при смене счёта и после изменений
+    def account_id(self):
+        return self.accounts[self.account_index][0] if self.accounts else None
+    
+    def load_accounts(self):
+        self.accounts = [(None, "Все счета", 0, "", None)] + self.tracker.get_accounts()
+        self.account_index = min(self.account_index, len(self.accounts) - 1)
+        self.total_balance = self.tracker.get_total_balance()
+        self.missing_rates = self.tracker.get_currencies_without_rates()
+        self.dirty.update(("header", "accounts"))
+    
+    def load_stats(self):
+        """Доходы и расходы за этот и прошлый месяц и расходы за 12 месяцев по выбранному счёту"""
+        today = date.today()
+        month_start = today.replace(day=1)
+        first_month = date(today.year - 1, today.month, 1) + datetime.timedelta(days=31)
+        first_month = first_month.replace(day=1)
+        totals = {bucket: (income, expense) for bucket, income, expense in self.tracker.get_bucket_totals(
+            "month", first_month.isoformat(), today.isoformat(), self.account_id())}
+        
+        months = []
+        day = first_month
+        while day <= month_start:
+            months.append(day.strftime("%Y-%m"))
+            day = (day + datetime.timedelta(days=32)).replace(day=1)
+        
+        self.stats = []
+        for title, month in (("Этот месяц", months[-1]), ("Прошлый месяц", months[-2])):
+            income, expense = totals.get(month, (0, 0))
+            self.stats.append((title, "title"))
+            self.stats.append((f"доходы  {self.money(income).rjust(20)}", "income"))
+            self.stats.append((f"расходы {self.money(expense).rjust(20)}", "expense"))
+        expenses = [totals.get(month, (0, 0))[1] for month in months[-12:]]
+        self.stats.append(("Расходы за 12 месяцев", "title"))
+        self.stats.append((sparkline(expenses), "expense"))
+        self.stats.append((f"в среднем {self.money(sum(expenses) / 12)} в мес.", None))
+        self.dirty.add("stats")
+    
+    def page(self, after=None, before=None, limit=None):
+        return self.tracker.get_transactions_page(self.account_id(), after, before, limit or self.page_size)
+    
+    def key(self, row):
+        return row[6], row[0]
+    
+    def load_first_page(self):
+        self.rows = self.page() if not self.too_small else []
+        self.row_index = 0
+        self.position = 0
+        self.total = self.tracker.count_transactions(self.account_id())
+        self.dirty.add("transactions")
+    
+    def load_last_page(self):
+        self.rows = self.page(before=("", 0))
+        self.row_index = len(self.rows) - 1
+        self.total = self.tracker.count_transactions(self.account_id())
+        self.position = self.total - len(self.rows)
+        self.dirty.add("transactions")
+    
+    def reload_page(self):
+        """Перечитывает страницу с той же первой строки (после изменений или смены размера окна)"""
+        if self.too_small:
+            return
+        if not self.rows:
+            self.load_first_page()
+            return
+        first_date, first_id = self.key(self.rows[0])
+        self.rows = self.page(after=(first_date, first_id + 1))
+        if not self.rows:
+            # Удалено всё от первой видимой строки до конца - показываем последнюю страницу
+            self.rows = self.page(before=("", 0))
+        elif len(self.rows) < self.page_size:
+            # Конец списка поднялся (окно выросло или строки удалены) - добираем строки сверху
+            newer = self.page(before=self.key(self.rows[0]), limit=self.page_size - len(self.rows))
+            self.rows = newer + self.rows
+            self.row_index += len(newer)
+        self.row_index = min(self.row_index, max(0, len(self.rows) - 1))
+        self.total = self.tracker.count_transactions(self.account_id())
+        self.position = self.tracker.count_transactions(self.account_id(), self.key(self.rows[0])) if self.rows else 0
+        self.dirty.add("transactions")
+    
+    def move(self, delta):
+        """Сдвигает курсор списка; за край страницы дочитывает ровно столько строк, сколько нужно"""
+        if not self.rows:
+            return
+        old_index = self.row_index
+        target = self.row_index + delta
+        if target >= len(self.rows):
+            more = self.page(after=self.key(self.rows[-1]), limit=target - len(self.rows) + 1)
+            self.rows += more
+            target = min(target, len(self.rows) - 1)
+            drop = max(0, len(self.rows) - self.page_size)
+            self.rows = self.rows[drop:]
+            self.position += drop
+            target -= drop
+            if more:
+                self.dirty.add("transactions")
+        elif target < 0:
+            more = self.page(before=self.key(self.rows[0]), limit=-target)
+            self.rows = (more + self.rows)[:self.page_size]
+            self.position -= len(more)
+            target = max(0, target + len(more))
+            if more:
+                self.dirty.add("transactions")
+        self.row_index = target
+        self.dirty_lines.update((old_index, target))
+    
+    def data_changed(self, first_page=False):
+        self.load_accounts()
+        self.load_stats()
+        if first_page:
+            self.load_first_page()
+        else:
+            self.reload_page()
+    
+    # Клавиши и действия
+    def handle_key(self, key):
+        curses = self.curses
+        if self.message:
+            self.message = ""
+            self.dirty.add("status")
+        if key in ("q", "Q", "й"):
+            return False
+        if self.too_small:
+            return True
+        
+        if key in ("\t", curses.KEY_BTAB, curses.KEY_LEFT, curses.KEY_RIGHT):
+            if key == curses.KEY_LEFT:
+                self.focus = "accounts"
+            elif key == curses.KEY_RIGHT:
+                self.focus = "transactions"
+            else:
+                self.focus = "accounts" if self.focus == "transactions" else "transactions"
+            self.dirty.update(("accounts", "transactions"))
+        elif self.focus == "accounts" and key in (curses.KEY_UP, curses.KEY_DOWN, curses.KEY_HOME, curses.KEY_END):
+            index = {curses.KEY_UP: self.account_index - 1, curses.KEY_DOWN: self.account_index + 1,
+                     curses.KEY_HOME: 0, curses.KEY_END: len(self.accounts) - 1}[key]
+            index = max(0, min(index, len(self.accounts) - 1))
+            if index != self.account_index:
+                self.account_index = index
+                self.load_stats()
+                self.load_first_page()
+                self.dirty.add("accounts")
+        elif key == curses.KEY_DOWN:
+            self.move(1)
+        elif key == curses.KEY_UP:
+            self.move(-1)
+        elif key == curses.KEY_NPAGE:
+            self.move(self.page_size)
+        elif key == curses.KEY_PPAGE:
+            self.move(-self.page_size)
+        elif key == curses.KEY_HOME:
+            self.load_first_page()
+        elif key == curses.KEY_END:
+            self.load_last_page()
+        elif key in ("a", "ф"):
+            self.add_transaction("expense")
+        elif key in ("i", "ш"):
+            self.add_transaction("income")
+        elif key in ("x", "ч", curses.KEY_DC):
+            self.delete_transaction()
+        elif key in ("u", "г"):
+            self.show_result(*self.tracker.undo())
+        elif key in ("U", "Г"):
+            self.show_result(*self.tracker.redo())
+        elif key in ("r", "к"):
+            self.data_changed()
+        return True
+    
+    def show_result(self, success, message, first_page=False):
+        self.message = ("✓ " if success else "✗ ") + " ".join(message.split())
+        self.dirty.add("status")
+        if success:
+            self.data_changed(first_page)
+    
+    def prompt(self, label, default="", kind=None):
+        """
+        Строка ввода в строке состояния: Enter - готово, Esc - отмена (None).
+        С kind после текста показывается лучшая подсказка трекера, Tab её подставляет.
+        """
+        curses = self.curses
+        window = self.windows["status"]
+        text = default
+        curses.curs_set(1)
+        try:
+            while True:
+                suggestions = self.tracker.suggest(kind, text, 1) if kind else []
+                hint = suggestions[0][0] if suggestions else ""
+                window.erase()
+                if hint and hint != text:
+                    self.put(window, 0, len(label + text) + 3, f"→ {hint} (Tab)", curses.A_DIM)
+                self.put(window, 0, 1, label + text, curses.A_BOLD)
+                window.refresh()
+                key = window.get_wch()
+                if key in ("\n", "\r", curses.KEY_ENTER):
+                    return text.strip()
+                if key == "\x1b":
+                    return None
+                if key == "\t" and hint:
+                    text = hint
+                elif key in (curses.KEY_BACKSPACE, "\x7f", "\b"):
+                    text = text[:-1]
+                elif isinstance(key, str) and key.isprintable():
+                    text += key
+        finally:
+            curses.curs_set(0)
+            self.dirty.add("status")
+    
+    def add_transaction(self, transaction_type):
+        account_id = self.account_id()
+        if not account_id:
+            self.show_result(False, "Сначала выберите счёт в панели слева")
+            return
+        
+        kind = "расход" if transaction_type == "expense" else "доход"
+        amount = self.prompt(f"Сумма ({kind}, Esc - отмена): ")
+        if not amount:
+            return
+        try:
+            amount = float(amount.replace(",", ".").replace(" ", ""))
+        except ValueError:
+            self.show_result(False, "Некорректная сумма")
+            return
+        if amount <= 0:
+            self.show_result(False, "Сумма должна быть больше нуля")
+            return
+        
+        description = self.prompt("Описание: ", kind="description")
+        if description is None:
+            return
+        suggested = self.tracker.suggest_category(description, amount, account_id, transaction_type) or ""
+        category = self.prompt("Категория: ", suggested, f"{transaction_type}_category")
+        if category is None:
+            return
+        
+        if transaction_type == "expense":
+            result = self.tracker.add_expense(account_id, amount, description, category)
+        else:
+            result = self.tracker.add_income(account_id, amount, description, category)
+        self.show_result(*result, first_page=True)
+    
+    def delete_transaction(self):
+        if self.focus != "transactions" or not self.rows:
+            return
+        transaction = self.rows[self.row_index]
+        answer = self.prompt(f"Удалить «{transaction[4]}» на {self.money(transaction[3], transaction[8], True)}? (д/н): ")
+        if answer and answer.lower() in ("д", "да", "y", "yes"):
+            self.show_result(*self.tracker.delete_transaction(transaction[0]))
+
+# Локальный HTTP/JSON API поверх FinanceTracker
+class ApiServer:
+    """
+    Чтение выполняет пул потоков, у каждого своё соединение с базой (WAL позволяет читать
+    параллельно с записью). Все изменения проходят через единственный поток-писатель,
+    поэтому запись в SQLite не конкурирует сама с собой. Каждое изменение увеличивает
+    поколение журнала; GET-ответы помечаются ETag с этим поколением, и повторный опрос
+    с If-None-Match получает 304 без чтения данных. Поколение - PRAGMA data_version
+    отдельного соединения-наблюдателя: оно меняется после любого коммита в файл базы,
+    в том числе из консоли или командной строки. Журнал в памяти (":memory:") не подходит -
+    у каждого соединения он свой.
+    """
+    # Названия полей для строк, которые возвращает FinanceTracker
+    COLUMNS = {
+        "accounts": ("id", "name", "balance", "type", "currency"),
+        "transactions": ("id", "account_id", "account", "amount", "description", "category", "date", "type", "currency"),
+        "transfers": ("id", "from_account_id", "from_account", "to_account_id", "to_account", "amount",
+                      "description", "date", "from_currency", "to_amount", "to_currency"),
+        "recurring": ("id", "account_id", "account", "amount", "description", "category", "payment_day", "active",
+                      "rule", "anchor_date", "next_due", "type", "to_account_id", "to_account", "currency"),
+        "planned": ("id", "account_id", "account", "amount", "description", "category", "planned_date", "completed"),
+        "splits": ("id", "amount", "category", "description"),
+        "tags": ("id", "name", "transactions"),
+        "undo": ("id", "action", "created_at", "undone"),
+    }
+    
+    def __init__(self, db_path=None, host="127.0.0.1", port=8765, readers=4):
+        import concurrent.futures
+        import threading
+        
+        db_path, _ = FinanceTracker.resolve_db_path(db_path)
+        if db_path == ":memory:":
+            raise ValueError("API нужен файл базы: журнал в памяти не виден потокам-читателям")
+        
+        self.db_path = db_path
+        self.address = (host, port)
+        self.watcher = None  # Соединение только для PRAGMA data_version
+        self.watcher_lock = threading.Lock()
+        self.boot_id = f"{int(time.time() * 1000):x}"  # ETag прошлого запуска не совпадёт с новым
+        self.local = threading.local()
+        self.reader_pool = concurrent.futures.ThreadPoolExecutor(readers, thread_name_prefix="finance-api-reader")
+        self.writer_pool = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="finance-api-writer")
+        self.httpd = None
+        
+        # (метод, путь, обработчик, изменяет ли данные)
+        routes = [
+            ("GET", r"/api/accounts", self.get_accounts, False),
+            ("GET", r"/api/accounts/(\d+)", self.get_account, False),
+            ("POST", r"/api/accounts", self.create_account, True),
+            ("GET", r"/api/balance", self.get_balance, False),
+            ("GET", r"/api/transactions", self.get_transactions, False),
+            ("POST", r"/api/transactions", self.add_transaction, True),
+            ("DELETE", r"/api/transactions/(\d+)", self.delete_transaction, True),
+            ("GET", r"/api/transactions/(\d+)/splits", self.get_splits, False),
+            ("POST", r"/api/transactions/(\d+)/splits", self.split_transaction, True),
+            ("GET", r"/api/transactions/(\d+)/tags", self.get_transaction_tags, False),
+            ("POST", r"/api/transactions/(\d+)/tags", self.edit_transaction_tags, True),
+            ("GET", r"/api/tags", self.get_tags, False),
+            ("GET", r"/api/transfers", self.get_transfers, False),
+            ("POST", r"/api/transfers", self.add_transfer, True),
+            ("GET", r"/api/recurring", self.get_recurring, False),
+            ("POST", r"/api/recurring", self.add_recurring, True),
+            ("POST", r"/api/recurring/process", self.process_recurring, True),
+            ("GET", r"/api/planned", self.get_planned, False),
+            ("POST", r"/api/planned", self.add_planned, True),
+            ("POST", r"/api/planned/(\d+)/execute", self.execute_planned, True),
+            ("GET", r"/api/reports/monthly", self.report_monthly, False),
+            ("GET", r"/api/reports/categories", self.report_categories, False),
+            ("GET", r"/api/reports/comparison/(day|week|month)", self.report_comparison, False),
+            ("GET", r"/api/reports/forecast", self.report_forecast, False),
+            ("GET", r"/api/reports/tags", self.report_tags, False),
+            ("GET", r"/api/undo", self.get_undo_history, False),
+            ("POST", r"/api/undo", self.undo, True),
+            ("POST", r"/api/redo", self.redo, True),
+        ]
+        self.routes = [(method, re.compile(path), handler, writes) for method, path, handler, writes in routes]
+    
+    # Жизненный цикл
+    def start(self):
+        """Запускает HTTP-сервер в фоновом потоке и возвращает его адрес"""
+        import http.server
+        import threading
+        
+        # WAL: читатели не ждут писателя. Режим сохраняется в файле базы
+        self.writer_pool.submit(lambda: self.tracker().conn.execute("PRAGMA journal_mode=WAL")).result()
+        self.generation()  # Наблюдатель подключается к уже подготовленной базе
+        
+        self.httpd = http.server.ThreadingHTTPServer(self.address, self.request_handler())
+        self.httpd.daemon_threads = True
+        self.httpd.api = self
+        threading.Thread(target=self.httpd.serve_forever, name="finance-api", daemon=True).start()
+        return self.httpd.server_address
+    
+    def serve_forever(self):
+        """Запуск в текущем потоке (для командной строки), остановка по Ctrl+C"""
+        self.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+    
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+        self.writer_pool.submit(self.close_tracker).result()
+        self.writer_pool.shutdown()
+        self.reader_pool.shutdown()
+        with self.watcher_lock:
+            if self.watcher is not None:
+                self.watcher.close()
+                self.watcher = None
+    
+    def tracker(self):
+        """Трекер текущего потока пула: соединение SQLite нельзя передавать между потоками"""
+        tracker = getattr(self.local, "tracker", None)
+        if tracker is None:
+            tracker = FinanceTracker(self.db_path)
+            self.local.tracker = tracker
+        return tracker
+    
+    def close_tracker(self):
+        tracker = getattr(self.local, "tracker", None)
+        if tracker is not None:
+            tracker.close()
+            self.local.tracker = None
+    
+    def generation(self):
+        """Счётчик изменений базы: data_version наблюдателя растёт после каждого чужого коммита"""
+        with self.watcher_lock:
+            if self.watcher is None:
+                self.watcher = sqlite3.connect(self.db_path, check_same_thread=False)
+            return self.watcher.execute("PRAGMA data_version").fetchone()[0]
+    
+    def etag(self):
+        return f'"{self.boot_id}-{self.generation()}"'
+    
+    @staticmethod
+    def etag_matches(etag, header):
+        """Совпадает ли ETag с одной из меток If-None-Match (слабое сравнение: W/ не учитывается)"""
+        if header.strip() == "*":
+            return True
+        return any(tag == etag for tag in re.findall(r'(?:W/)?("[^"]*")', header))
+    
+    # Обработка запросов
+    def dispatch(self, method, path, headers, body):
+        """Возвращает (код, заголовки, тело ответа) для HTTP-запроса"""
+        import urllib.parse
+        
+        url = urllib.parse.urlsplit(path)
+        query = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+        
+        allowed = False
+        for route_method, pattern, handler, writes in self.routes:
+            match = pattern.fullmatch(url.path)
+            if not match:
+                continue
+            allowed = True
+            if route_method == method:
+                break
+        else:
+            if allowed:
+                return self.response(405, {"error": "Метод не поддерживается"})
+            return self.response(404, {"error": "Не найдено"})
+        
+        if not writes:
+            etag = self.etag()
+            if self.etag_matches(etag, headers.get("If-None-Match", "")):
+                return 304, {"ETag": etag}, b""
+            status, payload = self.reader_pool.submit(self.call, handler, match.groups(), query).result()
+            response = self.response(status, payload)
+            if status == 200:
+                response[1]["ETag"] = etag
+            return response
+        
+        try:
+            data = json.loads(body.decode("utf-8")) if body else {}
+            if not isinstance(data, dict):
+                raise ValueError
+        except ValueError:
+            return self.response(400, {"error": "Тело запроса должно быть JSON-объектом"})
+        
+        status, payload = self.writer_pool.submit(self.call, handler, match.groups(), data).result()
+        return self.response(status, payload)
+    
+    def call(self, handler, groups, params):
+        try:
+            return handler(self.tracker(), *groups, params)
+        except (KeyError, ValueError, TypeError) as e:
+            return 400, {"error": f"Неверный параметр: {e}"}
+        except Exception as e:
+            return 500, {"error": str(e)}
+    
+    def response(self, status, payload):
+        body = json.dumps(self.json_safe(payload), ensure_ascii=False).encode("utf-8")
+        return status, {"Content-Type": "application/json; charset=utf-8"}, body
+    
+    def json_safe(self, value):
+        """Бесконечности и NaN из отчётов не представимы в JSON - заменяем на null"""
+        if isinstance(value, float) and (value != value or value in (float("inf"), float("-inf"))):
+            return None
+        if isinstance(value, dict):
+            return {key: self.json_safe(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.json_safe(item) for item in value]
+        return value
+    
+    def request_handler(self):
+        import http.server
+        
+        class ApiRequestHandler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive для частых опросов
+            disable_nagle_algorithm = True  # Заголовки и тело уходят отдельно - без задержки ACK
+            
+            def handle_api(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, headers, content = self.server.api.dispatch(self.command, self.path, self.headers, body)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+            
+            do_GET = do_POST = do_DELETE = handle_api
+            
+            def log_message(self, format, *args):
+                pass  # Не засоряем консоль журналом запросов
+        
+        return ApiRequestHandler
+    
+    # Разбор параметров
+    def rows(self, kind, rows):
+        columns = self.COLUMNS[kind]
+        return [dict(zip(columns, row)) for row in rows]
+    
+    def result(self, success, message, created=False):
+        if success:
+            return (201 if created else 200), {"ok": True, "message": message}
+        return 400, {"ok": False, "error": message}
+    
+    def amount(self, data, name="amount"):
+        amount = float(data[name])
+        if amount <= 0:
+            raise ValueError(f"{name} должна быть больше нуля")
+        return amount
+    
+    def tag_filter(self, params):
+        """Фильтр по меткам из параметров tags_any, tags_all, tags_none (через запятую)"""
+        tag_filter = {key: params[f"tags_{key}"] for key in ("any", "all", "none") if params.get(f"tags_{key}")}
+        return tag_filter or None
+    
+    def date_param(self, params, name):
+        value = params.get(name)
+        if value:
+            datetime.datetime.strptime(value, "%Y-%m-%d")
+        return value
+    
+    # Чтение
+    def get_accounts(self, tracker, params):
+        return 200, self.rows("accounts", tracker.get_accounts())
+    
+    def get_account(self, tracker, account_id, params):
+        account = tracker.get_account_by_id(int(account_id))
+        if not account:
+            return 404, {"error": "Счёт не найден"}
+        return 200, self.rows("accounts", [account])[0]
+    
+    def get_balance(self, tracker, params):
+        currency = params.get("currency") or tracker.report_currency
+        return 200, {"balance": tracker.get_total_balance(currency), "currency": currency,
+                     "missing_rates": tracker.get_currencies_without_rates()}
+    
+    def get_transactions(self, tracker, params):
+        limit = int(params.get("limit", 100))
+        rows = tracker.get_transactions(int(params.get("account_id", 0)) or None, self.date_param(params, "from"),
+                                        self.date_param(params, "to"), params.get("type"), limit,
+                                        self.tag_filter(params))
+        return 200, self.rows("transactions", rows)
+    
+    def get_tags(self, tracker, params):
+        return 200, self.rows("tags", tracker.get_tags())
+    
+    def get_transaction_tags(self, tracker, transaction_id, params):
+        return 200, tracker.get_transaction_tags(int(transaction_id))
+    
+    def get_splits(self, tracker, transaction_id, params):
+        return 200, self.rows("splits", tracker.get_transaction_splits(int(transaction_id)))
+    
+    def get_undo_history(self, tracker, params):
+        return 200, self.rows("undo", tracker.get_undo_history(int(params.get("limit", 20))))
+    
+    def get_transfers(self, tracker, params):
+        limit = int(params.get("limit", 100))
+        rows = tracker.get_transfers(int(params.get("account_id", 0)) or None, self.date_param(params, "from"),
+                                     self.date_param(params, "to"), limit)
+        return 200, self.rows("transfers", rows)
+    
+    def get_recurring(self, tracker, params):
+        return 200, self.rows("recurring", tracker.get_recurring_payments())
+    
+    def get_planned(self, tracker, params):
+        # Настоящие ID (без "виртуальной" нумерации консоли)
+        rows = tracker.get_planned_payments(only_active=False)
+        if params.get("all") not in ("1", "true"):
+            rows = [row for row in rows if not row[7]]
+        return 200, self.rows("planned", rows)
+    
+    def report_monthly(self, tracker, params):
+        year = int(params["year"]) if params.get("year") else None
+        return 200, [
+            {"month": month, "income": income, "expense": expense, "balance": balance}
+            for month, income, expense, balance in tracker.get_monthly_summary(year, self.tag_filter(params))
+        ]
+    
+    def report_categories(self, tracker, params):
+        rows = tracker.get_category_summary(self.date_param(params, "from"), self.date_param(params, "to"),
+                                            params.get("type"), self.tag_filter(params))
+        return 200, [{"category": category, "type": transaction_type, "total": total}
+                     for category, transaction_type, total in rows]
+    
+    def report_tags(self, tracker, params):
+        rows = tracker.get_tag_summary(self.date_param(params, "from"), self.date_param(params, "to"), params.get("type"))
+        return 200, [{"tag": name, "type": transaction_type, "count": count, "total": total}
+                     for name, transaction_type, count, total in rows]
+    
+    def report_comparison(self, tracker, period, params):
+        comparisons = {"day": tracker.get_day_comparison, "week": tracker.get_week_comparison,
+                       "month": tracker.get_month_comparison}
+        return 200, comparisons[period]()
+    
+    def report_forecast(self, tracker, params):
+        forecast = tracker.forecast_balances(int(params.get("days", 90)))
+        accounts = []
+        for account_id, account in forecast.items():
+            account = dict(account, id=account_id, min_date=account["min_date"].isoformat())
+            if account["first_negative"]:
+                account["first_negative"] = account["first_negative"].isoformat()
+            accounts.append(account)
+        return 200, accounts
+    
+    # Изменения (только в потоке-писателе)
+    def create_account(self, tracker, data):
+        currency = data.get("currency")
+        success, message = tracker.create_account(data["name"], data.get("type", "Другое"),
+                                                  float(data.get("initial_balance", 0)), currency)
+        return self.result(success, message, created=True)
+    
+    def add_transaction(self, tracker, data):
+        methods = {"income": tracker.add_income, "expense": tracker.add_expense}
+        method = methods.get(data.get("type"))
+        if method is None:
+            raise ValueError("type должен быть income или expense")
+        success, message = method(int(data["account_id"]), self.amount(data), data.get("description", ""),
+                                  data.get("category", ""))
+        return self.result(success, message, created=True)
+    
+    def delete_transaction(self, tracker, transaction_id, data):
+        return self.result(*tracker.delete_transaction(int(transaction_id)))
+    
+    def edit_transaction_tags(self, tracker, transaction_id, data):
+        results = []
+        if data.get("add"):
+            results.append(tracker.add_tags(int(transaction_id), data["add"]))
+        if data.get("remove"):
+            results.append(tracker.remove_tags(int(transaction_id), data["remove"]))
+        if not results:
+            raise KeyError("add")
+        failed = [message for success, message in results if not success]
+        if failed:
+            return self.result(False, "; ".join(failed))
+        return self.result(True, "; ".join(message for _, message in results))
+    
+    def split_transaction(self, tracker, transaction_id, data):
+        lines = [(self.amount(line), line.get("category", ""), line.get("description", "")) for line in data["lines"]]
+        return self.result(*tracker.split_transaction(int(transaction_id), lines))
+    
+    def add_transfer(self, tracker, data):
+        success, message = tracker.transfer_money(int(data["from_account_id"]), int(data["to_account_id"]),
+                                                  self.amount(data), data.get("description", ""))
+        return self.result(success, message, created=True)
+    
+    def add_recurring(self, tracker, data):
+        anchor_date = self.date_param(data, "anchor_date")
+        payment_day = data.get("payment_day")
+        to_account_id = data.get("to_account_id")
+        success, message = tracker.add_recurring_payment(
+            int(data["account_id"]), self.amount(data), data["description"],
+            int(payment_day) if payment_day is not None else None, data.get("category", ""),
+            rule=data.get("rule", "monthly"),
+            anchor_date=datetime.datetime.strptime(anchor_date, "%Y-%m-%d").date() if anchor_date else None,
+            transaction_type=data.get("type", "expense"),
+            to_account_id=int(to_account_id) if to_account_id is not None else None,
+        )
+        return self.result(success, message, created=True)
+    
+    def process_recurring(self, tracker, data):
+        return 200, [{"ok": success, "message": message} for success, message in tracker.process_recurring_payments()]
+    
+    def add_planned(self, tracker, data):
+        planned_date = self.date_param(data, "planned_date")
+        if not planned_date:
+            raise KeyError("planned_date")
+        success, message = tracker.add_planned_payment(int(data["account_id"]), self.amount(data), data["description"],
+                                                       planned_date, data.get("category", ""))
+        return self.result(success, message, created=True)
+    
+    def execute_planned(self, tracker, payment_id, data):
+        return self.result(*tracker.execute_planned_payment(int(payment_id)))
+    
+    def undo(self, tracker, data):
+        return self.result(*tracker.undo())
+    
+    def redo(self, tracker, data):
+        return self.result(*tracker.redo())
+
+
+# Неинтерактивный интерфейс для скриптов и пакетной обработки
+class CommandLine:
+    """
+    Подкоманды вызывают FinanceTracker напрямую, без вопросов input().
+    В режиме --batch команды читаются построчно из файла или stdin и выполняются
+    одной транзакцией БД: одна ошибка отменяет весь пакет.
+    """
+    # Команды, которые сами управляют транзакциями или работают долго - в пакете недопустимы
+    NOT_IN_BATCH = ("serve", "maintenance", "backup", "compact", "archive", "tui")
+    
+    class BatchError(Exception):
+        def __init__(self, line_number, message):
+            super().__init__(f"строка {line_number}: {message}")
+    
+    def __init__(self, out=None, err=None):
+        self.out = out or sys.stdout
+        self.err = err or sys.stderr
+        self.tracker = None
+        self.parser = self.build_parser()
+    
+    def build_parser(self):
+        import argparse
+        
+        def amount_type(value):
+            try:
+                amount = float(value.replace(",", "."))
+            except ValueError:
+                raise argparse.ArgumentTypeError(f"не число: {value}")
+            if amount <= 0:
+                raise argparse.ArgumentTypeError("сумма должна быть больше нуля")
+            return amount
+        
+        def date_type(value):
+            try:
+                return datetime.datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+            except ValueError:
+                raise argparse.ArgumentTypeError(f"дата должна быть в формате ГГГГ-ММ-ДД: {value}")
+        
+        def month_type(value):
+            try:
+                return datetime.datetime.strptime(value, "%Y-%m").date()
+            except ValueError:
+                raise argparse.ArgumentTypeError(f"месяц должен быть в формате ГГГГ-ММ: {value}")
+        
+        parser = argparse.ArgumentParser(
+            prog="main.py",
+            description="Финансовый трекер. Без аргументов запускается интерактивное меню."
+        )
+        parser.add_argument("--db", help="путь к файлу базы данных (по умолчанию из FINANCE_TRACKER_DB)")
+        parser.add_argument("--batch", nargs="?", const="-", metavar="ФАЙЛ",
+                            help="выполнить команды из файла (по одной на строку, по умолчанию stdin) одной транзакцией")
+        commands = parser.add_subparsers(dest="command", metavar="КОМАНДА")
+        
+        command = commands.add_parser("accounts", help="список счетов")
+        command.set_defaults(handler=self.accounts)
+        
+        for name, handler, title in (("add-expense", self.add_expense, "добавить расход"),
+                                     ("add-income", self.add_income, "добавить доход")):
+            command = commands.add_parser(name, help=title)
+            command.add_argument("account", help="ID или название счёта")
+            command.add_argument("amount", type=amount_type, help="сумма")
+            command.add_argument("-d", "--description", default="", help="описание")
+            command.add_argument("-c", "--category", default="", help="категория (по умолчанию - по правилам)")
+            command.set_defaults(handler=handler)
+        
+        command = commands.add_parser("transfer", help="перевод между счетами")
+        command.add_argument("from_account", help="ID или название счёта списания")
+        command.add_argument("to_account", help="ID или название счёта зачисления")
+        command.add_argument("amount", type=amount_type, help="сумма в валюте счёта списания")
+        command.add_argument("-d", "--description", default="", help="описание")
+        command.set_defaults(handler=self.transfer)
+        
+        command = commands.add_parser("report", help="отчёты")
+        reports = command.add_subparsers(dest="report", metavar="ОТЧЁТ", required=True)
+        def add_tag_arguments(command):
+            command.add_argument("--tags-any", metavar="МЕТКИ", help="только операции с любой из меток (через запятую)")
+            command.add_argument("--tags-all", metavar="МЕТКИ", help="только операции со всеми метками")
+            command.add_argument("--tags-none", metavar="МЕТКИ", help="исключить операции с метками")
+        
+        report = reports.add_parser("monthly", help="доходы и расходы по месяцам года")
+        report.add_argument("--year", type=int, help="год (по умолчанию текущий)")
+        add_tag_arguments(report)
+        report.set_defaults(handler=self.report_monthly)
+        report = reports.add_parser("categories", help="суммы по категориям за период")
+        report.add_argument("--from", dest="start_date", type=date_type, help="начало периода ГГГГ-ММ-ДД")
+        report.add_argument("--to", dest="end_date", type=date_type, help="конец периода ГГГГ-ММ-ДД")
+        report.add_argument("--type", choices=["expense", "income"], help="тип операций")
+        add_tag_arguments(report)
+        report.set_defaults(handler=self.report_categories)
+        report = reports.add_parser("tags", help="суммы по меткам за период")
+        report.add_argument("--from", dest="start_date", type=date_type, help="начало периода ГГГГ-ММ-ДД")
+        report.add_argument("--to", dest="end_date", type=date_type, help="конец периода ГГГГ-ММ-ДД")
+        report.set_defaults(handler=self.report_tags)
+        report = reports.add_parser("forecast", help="прогноз остатков по регулярным и запланированным платежам")
+        report.add_argument("--days", type=int, default=90, help="горизонт в днях (по умолчанию 90)")
+        report.set_defaults(handler=self.report_forecast)
+        report = reports.add_parser("chart", help="столбчатая диаграмма доходов или расходов по интервалам")
+        report.add_argument("--bucket", choices=["day", "week", "month", "year"], default="month",
+                            help="интервал (по умолчанию месяц)")
+        report.add_argument("--from", dest="start_date", type=date_type, help="начало периода ГГГГ-ММ-ДД")
+        report.add_argument("--to", dest="end_date", type=date_type, help="конец периода ГГГГ-ММ-ДД")
+        report.add_argument("--type", choices=["expense", "income"], default="expense", help="тип операций")
+        report.set_defaults(handler=self.report_chart)
+        report = reports.add_parser("heatmap", help="календарь расходов по дням")
+        report.add_argument("--years", type=int, default=1, help="сколько последних лет показать (по умолчанию 1)")
+        report.set_defaults(handler=self.report_heatmap)
+        
+        command = commands.add_parser("process-recurring", help="провести регулярные платежи на сегодня")
+        command.set_defaults(handler=self.process_recurring)
+        
+        command = commands.add_parser("sync", help="синхронизация с другим устройством через файлы изменений")
+        actions = command.add_subparsers(dest="sync", metavar="ДЕЙСТВИЕ", required=True)
+        action = actions.add_parser("with", help="обменяться изменениями с другим файлом базы")
+        action.add_argument("other", help="файл базы другого устройства")
+        action.set_defaults(handler=self.sync_with)
+        action = actions.add_parser("export", help="выгрузить изменения в файл")
+        action.add_argument("file", help="файл изменений")
+        action.add_argument("--peer", help="ID устройства-получателя: только новые для него изменения")
+        action.add_argument("--full", action="store_true", help="выгрузить весь журнал")
+        action.set_defaults(handler=self.sync_export)
+        action = actions.add_parser("import", help="применить файл изменений")
+        action.add_argument("file", help="файл изменений")
+        action.set_defaults(handler=self.sync_import)
+        action = actions.add_parser("device", help="показать ID устройства")
+        action.add_argument("--new", action="store_true", help="назначить новый ID (для скопированной базы)")
+        action.set_defaults(handler=self.sync_device)
+        
+        command = commands.add_parser("undo", help="отменить последнее действие")
+        command.set_defaults(handler=self.undo)
+        command = commands.add_parser("redo", help="повторить отменённое действие")
+        command.set_defaults(handler=self.redo)
+        
+        command = commands.add_parser("export", help="выгрузить операции в CSV")
+        command.add_argument("-o", "--output", help="файл (по умолчанию stdout)")
+        command.add_argument("--account", help="ID или название счёта")
+        command.add_argument("--from", dest="start_date", type=date_type, help="начало периода ГГГГ-ММ-ДД")
+        command.add_argument("--to", dest="end_date", type=date_type, help="конец периода ГГГГ-ММ-ДД")
+        command.add_argument("--type", choices=["expense", "income"], help="тип операций")
+        add_tag_arguments(command)
+        command.set_defaults(handler=self.export)
+        
+        command = commands.add_parser("statement", help="выписка по счёту в PDF")
+        command.add_argument("account", help="ID или название счёта")
+        command.add_argument("-o", "--output", required=True, help="файл PDF")
+        period = command.add_mutually_exclusive_group(required=True)
+        period.add_argument("--month", type=month_type, help="месяц ГГГГ-ММ")
+        period.add_argument("--year", type=int, help="год")
+        period.add_argument("--from", dest="start_date", type=date_type, help="начало периода ГГГГ-ММ-ДД (с --to)")
+        command.add_argument("--to", dest="end_date", type=date_type, help="конец периода ГГГГ-ММ-ДД")
+        command.add_argument("--font", help="шрифт TrueType с кириллицей (по умолчанию ищется в системе)")
+        command.set_defaults(handler=self.statement)
+        
+        command = commands.add_parser("dashboard", help="статический HTML-дашборд для телефона")
+        command.add_argument("-o", "--output", default="dashboard.html", help="файл HTML (по умолчанию dashboard.html)")
+        command.add_argument("--full", action="store_true", help="пересчитать все месяцы, а не только изменившиеся")
+        command.add_argument("--days", type=int, default=30, help="горизонт ближайших платежей в днях")
+        command.set_defaults(handler=self.dashboard)
+        
+        command = commands.add_parser("backup", help="онлайн-копия базы")
+        command.add_argument("dest", help="файл копии")
+        command.set_defaults(handler=self.backup)
+        
+        command = commands.add_parser("compact", help="вернуть свободное место файлу и обновить статистику")
+        command.add_argument("--max-pages", type=int, help="освободить не больше стольких страниц")
+        command.set_defaults(handler=self.compact)
+        
+        command = commands.add_parser("archive", help="перенести старые операции в годовые архивные базы")
+        command.add_argument("--years", type=int, default=3, help="старше скольких полных лет (по умолчанию 3)")
+        command.set_defaults(handler=self.archive)
+        
+        command = commands.add_parser("maintenance", help="обслуживание баз арендаторов в пуле процессов")
+        command.add_argument("root", help="каталог с базами арендаторов")
+        command.add_argument("job", choices=sorted(MAINTENANCE_JOBS), help="задача")
+        command.add_argument("--tenant", action="append", help="только указанные арендаторы (можно повторять)")
+        command.add_argument("--processes", type=int, help="число процессов (по умолчанию по числу ядер)")
+        command.set_defaults(handler=self.maintenance)
+        
+        command = commands.add_parser("tui", help="полноэкранный интерфейс в терминале (curses)")
+        command.set_defaults(handler=self.tui)
+        
+        command = commands.add_parser("serve", help="запустить локальный HTTP/JSON API")
+        command.add_argument("--host", default="127.0.0.1", help="адрес (по умолчанию только localhost)")
+        command.add_argument("--port", type=int, default=8765, help="порт")
+        command.add_argument("--readers", type=int, default=4, help="потоков для чтения")
+        command.set_defaults(handler=self.serve)
+        
+        return parser
+    
+    def run(self, argv):
+        """Выполняет команду (или пакет) и возвращает код выхода: 0 - успех, 1 - ошибка, 2 - неверные аргументы"""
+        try:
+            args = self.parser.parse_args(argv)
+        except SystemExit as e:
+            return e.code
+        
+        if args.batch is not None and args.command:
+            self.error("--batch нельзя совмещать с командой")
+            return 2
+        if args.batch is None and not args.command:
+            self.parser.print_help(self.err)
+            return 2
+        
+        self.tracker = FinanceTracker(args.db)
+        try:
+            if args.batch is not None:
+                return self.run_batch(args.batch)
+            return 0 if args.handler(args) else 1
+        finally:
+            self.tracker.close()
+    
+    def run_batch(self, source):
+        import shlex
+        
+        stream = sys.stdin if source == "-" else open(source, encoding="utf-8")
+        executed = 0
+        try:
+            with self.tracker.batch():
+                for line_number, line in enumerate(stream, 1):
+                    line = line.strip()
+                    if not line or line.startswith("#"):
+                        continue
+                    
+                    try:
+                        args = self.parser.parse_args(shlex.split(line))
+                    except (SystemExit, ValueError):
+                        raise self.BatchError(line_number, "неверная команда")
+                    if args.batch is not None or args.db or not args.command or args.command in self.NOT_IN_BATCH:
+                        raise self.BatchError(line_number, "команда недопустима в пакете")
+                    
+                    if not args.handler(args):
+                        raise self.BatchError(line_number, line)
+                    executed += 1
+        except self.BatchError as e:
+            self.error(f"Пакет отменён, {e}")
+            return 1
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        
+        print(f"Выполнено команд: {executed}", file=self.out)
+        return 0
+    
+    def error(self, message):
+        print(f"❌ {message}", file=self.err)
+    
+    def print_rate_warning(self):
+        warning = self.tracker.get_rate_warning()
+        if warning:
+            print(warning, file=self.err)
+    
+    def result(self, success, message):
+        if success:
+            print(message, file=self.out)
+        else:
+            self.error(message)
+        return success
+    
+    def resolve_account(self, value):
+        """ID счёта по номеру или названию"""
+        for account in self.tracker.get_accounts():
+            if str(account[0]) == value or account[1] == value:
+                return account[0]
+        self.error(f"Счёт не найден: {value}")
+        return None
+    
+    def accounts(self, args):
+        for account in self.tracker.get_accounts():
+            symbol = self.tracker.get_currency_symbol(account[4])
+            print(f"{account[0]}\t{account[1]}\t{account[2]:.2f} {symbol}\t{account[3]}", file=self.out)
+        return True
+    
+    def add_expense(self, args):
+        account_id = self.resolve_account(args.account)
+        if account_id is None:
+            return False
+        return self.result(*self.tracker.add_expense(account_id, args.amount, args.description, args.category))
+    
+    def add_income(self, args):
+        account_id = self.resolve_account(args.account)
+        if account_id is None:
+            return False
+        return self.result(*self.tracker.add_income(account_id, args.amount, args.description, args.category))
+    
+    def transfer(self, args):
+        from_account_id = self.resolve_account(args.from_account)
+        to_account_id = self.resolve_account(args.to_account)
+        if from_account_id is None or to_account_id is None:
+            return False
+        return self.result(*self.tracker.transfer_money(from_account_id, to_account_id, args.amount, args.description))
+    
+    def report_monthly(self, args):
+        symbol = self.tracker.get_currency_symbol()
+        self.print_rate_warning()
+        for month_name, income, expense, balance in self.tracker.get_monthly_summary(args.year, self.tag_filter(args)):
+            print(f"{month_name}\t{income:.2f}\t{abs(expense):.2f}\t{balance:.2f} {symbol}", file=self.out)
+        return True
+    
+    def report_categories(self, args):
+        symbol = self.tracker.get_currency_symbol()
+        self.print_rate_warning()
+        rows = self.tracker.get_category_summary(args.start_date, args.end_date, args.type, self.tag_filter(args))
+        for category, transaction_type, total in rows:
+            print(f"{category or 'Без категории'}\t{transaction_type}\t{abs(total):.2f} {symbol}", file=self.out)
+        return True
+    
+    def report_tags(self, args):
+        symbol = self.tracker.get_currency_symbol()
+        for name, transaction_type, count, total in self.tracker.get_tag_summary(args.start_date, args.end_date):
+            print(f"{name}\t{transaction_type}\t{count}\t{abs(total):.2f} {symbol}", file=self.out)
+        return True
+    
+    def tag_filter(self, args):
+        tag_filter = {key: getattr(args, f"tags_{key}") for key in ("any", "all", "none") if getattr(args, f"tags_{key}")}
+        return tag_filter or None
+    
+    def report_forecast(self, args):
+        for account in self.tracker.forecast_balances(args.days).values():
+            symbol = self.tracker.get_currency_symbol(account["currency"])
+            first_negative = account["first_negative"].isoformat() if account["first_negative"] else "-"
+            print(f"{account['name']}\t{account['start_balance']:.2f}\t{account['end_balance']:.2f}\t"
+                  f"{account['min_balance']:.2f} {symbol}\t{account['min_date'].isoformat()}\t{first_negative}", file=self.out)
+        return True
+    
+    def report_chart(self, args):
+        totals = self.tracker.get_bucket_totals(args.bucket, args.start_date, args.end_date)
+        column = 1 if args.type == "income" else 2
+        for line in bar_chart([(row[0], row[column]) for row in totals]):
+            print(line, file=self.out)
+        return True
+    
+    def report_heatmap(self, args):
+        if args.years < 1:
+            return self.result(False, "Число лет должно быть не меньше 1")
+        end = datetime.date.today()
+        start = date(end.year - args.years + 1, 1, 1)
+        totals = self.tracker.get_bucket_totals("day", start.isoformat(), end.isoformat())
+        for line in calendar_heatmap({date.fromisoformat(day): expense for day, _, expense in totals}, start, end):
+            print(line, file=self.out)
+        return True
+    
+    def process_recurring(self, args):
+        success = True
+        for payment_success, message in self.tracker.process_recurring_payments():
+            self.result(payment_success, message)
+            # Предупреждения о бюджете тоже приходят с False, но платёж при этом проведён
+            if not payment_success and not message.startswith("⚠️"):
+                success = False
+        return success
+    
+    def sync_with(self, args):
+        return self.result(*self.tracker.sync_with(args.other))
+    
+    def sync_export(self, args):
+        return self.result(*self.tracker.export_changes(args.file, args.peer, args.full))
+    
+    def sync_import(self, args):
+        return self.result(*self.tracker.import_changes(args.file))
+    
+    def sync_device(self, args):
+        if args.new:
+            return self.result(*self.tracker.reset_sync_device())
+        print(self.tracker.get_sync_device()[0], file=self.out)
+        return True
+    
+    def undo(self, args):
+        return self.result(*self.tracker.undo())
+    
+    def redo(self, args):
+        return self.result(*self.tracker.redo())
+    
+    def statement(self, args):
+        account_id = self.resolve_account(args.account)
+        if account_id is None:
+            return False
+        
+        if args.month:
+            start_date, end_date = args.month.isoformat(), month_end(args.month.year, args.month.month).isoformat()
+        elif args.year:
+            start_date, end_date = f"{args.year}-01-01", f"{args.year}-12-31"
+        else:
+            start_date, end_date = args.start_date, args.end_date or datetime.date.today().isoformat()
+        return self.result(*self.tracker.export_statement(args.output, account_id, start_date, end_date, args.font))
+    
+    def dashboard(self, args):
+        return self.result(*self.tracker.export_dashboard(args.output, args.full, args.days))
+    
+    def backup(self, args):
+        return self.result(*self.tracker.backup(args.dest))
+    
+    def compact(self, args):
+        return self.result(*self.tracker.compact(args.max_pages))
+    
+    def archive(self, args):
+        return self.result(*self.tracker.archive_transactions(args.years))
+    
+    def maintenance(self, args):
+        router = TenantRouter(args.root)
+        try:
+            results = router.run_maintenance(args.job, args.tenant, args.processes)
+        finally:
+            router.close()
+        
+        success = True
+        for tenant_id, (tenant_success, result) in sorted(results.items()):
+            if tenant_success:
+                details = ", ".join(f"{key}: {value}" for key, value in result.items())
+                print(f"{tenant_id}\tok\t{details}", file=self.out)
+            else:
+                self.error(f"{tenant_id}: {result}")
+                success = False
+        return success
+    
+    def tui(self, args):
+        try:
+            import curses  # В Windows модуль ставится отдельно (windows-curses)
+        except ImportError:
+            return self.result(False, "Нет модуля curses (в Windows: pip install windows-curses)")
+        if not sys.stdin.isatty() or not sys.stdout.isatty():
+            return self.result(False, "Полноэкранный интерфейс работает только в терминале")
+        CursesUI(self.tracker).run()
+        return True
+    
+    def serve(self, args):
+        try:
+            server = ApiServer(args.db, args.host, args.port, args.readers)
+        except ValueError as e:
+            return self.result(False, str(e))
+        host, port = server.address
+        print(f"API: http://{host}:{port}/api/ (Ctrl+C - остановить)", file=self.err)
+        server.serve_forever()
+        return True
+    
+    def export(self, args):
+        account_id = None
+        if args.account:
+            account_id = self.resolve_account(args.account)
+            if account_id is None:
+                return False
+        
+        if args.output:
+            with open(args.output, "w", newline="", encoding="utf-8") as f:
+                count = self.tracker.export_transactions(f, account_id, args.start_date, args.end_date, args.type,
+                                                         self.tag_filter(args))
+            print(f"Выгружено операций: {count}", file=self.err)
+        else:
+            self.tracker.export_transactions(self.out, account_id, args.start_date, args.end_date, args.type,
+                                             self.tag_filter(args))
+        return True
 
 # Функция для запуска приложения
-def main():
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    
+    # С аргументами работаем как утилита командной строки, без них - интерактивное меню
+    if argv:
+        return CommandLine().run(argv)
+    
     ui = ConsoleUI()
     ui.display_welcome_emoji()
     ui.main_menu()
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
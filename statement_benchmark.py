@@ -0,0 +1,88 @@
+"""
+Бенчмарк PDF-выписки по счёту на синтетическом журнале из benchmark.py.
+
+Для каждого размера строит годовую выписку по первому счёту и замеряет время, число страниц,
+размер файла и пиковую память Python (tracemalloc, отдельным прогоном). Выписка пишется
+потоком, поэтому время на страницу должно быть постоянным, а пиковая память - не расти с размером.
+
+Пример:
+    python statement_benchmark.py --rows 10000 100000 --output statement.json
+"""
+import argparse
+import datetime
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmark import generate_ledger, git_commit
+from main import FinanceTracker
+
+
+def run_statement(tracker, path, start_date, end_date, repeat):
+    """Строит выписку repeat раз; возвращает лучшее время, число страниц, операций и пиковую память"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        success, message = tracker.export_statement(path, 1, start_date, end_date)
+        timings.append(time.perf_counter() - started)
+        if not success:
+            raise RuntimeError(message)
+
+    tracemalloc.start()
+    tracker.export_statement(path, 1, start_date, end_date)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    tracker.cursor.execute(
+        """SELECT (SELECT COUNT(*) FROM transactions WHERE account_id = 1 AND transaction_date >= ?)
+            + (SELECT COUNT(*) FROM transfers WHERE (from_account_id = 1 OR to_account_id = 1) AND transfer_date >= ?)""",
+        (start_date, start_date)
+    )
+    with open(path, "rb") as f:
+        pages = f.read().count(b"/Type /Page ")
+    return min(timings), pages, tracker.cursor.fetchone()[0], peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк PDF-выписки по счёту")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000],
+                        help="примерное число строк в годовой выписке, например 10000 100000")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов каждого замера")
+    parser.add_argument("--seed", type=int, default=42, help="seed генератора")
+    parser.add_argument("--output", help="файл для JSON с результатами (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    today = datetime.date.today()
+    start_date = (today - datetime.timedelta(days=365)).isoformat()
+    report = {"commit": git_commit(), "params": {"repeat": args.repeat, "seed": args.seed}, "runs": []}
+
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Два счёта за один год: на первый приходится около половины операций и переводов
+            tracker = FinanceTracker(os.path.join(tmp_dir, "statement.db"))
+            generate_ledger(tracker, rows * 2, accounts=2, years=1, seed=args.seed, today=today)
+            path = os.path.join(tmp_dir, "statement.pdf")
+            seconds, pages, statement_rows, peak = run_statement(tracker, path, start_date, today.isoformat(),
+                                                                 args.repeat)
+            report["runs"].append({
+                "rows": statement_rows,
+                "pages": pages,
+                "seconds": round(seconds, 3),
+                "ms_per_page": round(seconds * 1000 / pages, 3),
+                "file_bytes": os.path.getsize(path),
+                "peak_python_kb": round(peak / 1024, 1),
+            })
+            tracker.close()
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from main import ApiServer, FinanceTracker
+
+
+class ApiEtagTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_path = os.path.join(directory.name, "finance.db")
+        self.server = ApiServer(self.db_path, port=0, readers=2)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+    
+    def get(self, path, etag=""):
+        return self.server.dispatch("GET", path, {"If-None-Match": etag}, b"")
+    
+    def test_memory_database_is_rejected(self):
+        with self.assertRaises(ValueError):
+            ApiServer(":memory:")
+    
+    def test_etag_changes_after_api_write(self):
+        status, headers, _ = self.get("/api/accounts")
+        self.assertEqual(status, 200)
+        etag = headers["ETag"]
+        self.assertEqual(self.get("/api/accounts", etag)[0], 304)
+        
+        body = json.dumps({"name": "Карта", "initial_balance": 100}).encode("utf-8")
+        self.assertEqual(self.server.dispatch("POST", "/api/accounts", {}, body)[0], 201)
+        status, _, content = self.get("/api/accounts", etag)
+        self.assertEqual(status, 200)
+        self.assertEqual(len(json.loads(content)), 1)
+    
+    def test_etag_changes_after_write_outside_api(self):
+        etag = self.get("/api/accounts")[1]["ETag"]
+        
+        tracker = FinanceTracker(self.db_path)
+        self.addCleanup(tracker.close)
+        tracker.create_account("Наличные", "Наличные", 50)
+        
+        status, headers, content = self.get("/api/accounts", etag)
+        self.assertEqual(status, 200)
+        self.assertNotEqual(headers["ETag"], etag)
+        self.assertEqual([account["name"] for account in json.loads(content)], ["Наличные"])
+
+    
+    def test_if_none_match_compares_whole_tags(self):
+        etag = self.get("/api/accounts")[1]["ETag"]
+        self.assertEqual(self.get("/api/accounts", f'"stale", W/{etag}')[0], 304)
+        self.assertEqual(self.get("/api/accounts", "*")[0], 304)
+        # Метка, внутри которой есть текущая, - другая метка
+        self.assertEqual(self.get("/api/accounts", f'"x{etag[1:-1]}x"')[0], 200)
+        self.assertEqual(self.get("/api/accounts", etag[1:-1])[0], 200)
+
+
+class DbPathTest(unittest.TestCase):
+    def test_server_and_tracker_resolve_path_from_environment(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        db_path = os.path.join(directory.name, "env.db")
+        
+        with mock.patch.dict(os.environ, {FinanceTracker.DB_PATH_ENV: db_path}):
+            self.assertEqual(FinanceTracker.resolve_db_path(), (db_path, directory.name))
+            self.assertEqual(FinanceTracker().db_path, db_path)
+            server = ApiServer(port=0)
+            server.stop()
+            self.assertEqual(server.db_path, db_path)
+        # Сервер не открывает базу, пока не запущен
+        self.assertFalse(os.path.exists(db_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import os
+import tempfile
+import unittest
+
+from main import FinanceTracker
+
+
+class ArchiveRollupTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.tracker = FinanceTracker(os.path.join(directory.name, "finance.db"))
+        self.addCleanup(self.tracker.close)
+        self.tracker.create_account("Карта", "Дебетовая карта", 1000)
+        self.tracker.import_transactions([
+            (1, "expense", 100, "Кофейня у дома", "Кафе", "2015-03-01"),
+            (1, "expense", 200, "Кофейня у работы", "Кафе", "2015-03-02"),
+        ])
+        success, message = self.tracker.archive_transactions(years=3)
+        self.assertTrue(success, message)
+        self.tracker.add_expense(1, 50, "Кофе с собой", "Кафе")
+    
+    def test_search_skips_rollups(self):
+        self.assertEqual(self.tracker.search_transactions("Архив"), [])
+        self.assertEqual([row[4] for row in self.tracker.search_transactions("Кафе")], ["Кофе с собой"])
+    
+    def test_typeahead_skips_rollups(self):
+        self.assertEqual(self.tracker.suggest("description", "Архив"), [])
+        self.tracker.add_expense(1, 70, "Кофе и круассан", "Кафе")
+        descriptions = [name for name, _ in self.tracker.suggest("description", "")]
+        self.assertEqual(sorted(descriptions), ["Кофе и круассан", "Кофе с собой"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+from main import FinanceTracker
+
+
+class BatchRollbackTest(unittest.TestCase):
+    def setUp(self):
+        self.tracker = FinanceTracker(":memory:")
+        self.addCleanup(self.tracker.close)
+        self.tracker.create_account("Карта", "Дебетовая карта", 1000)
+    
+    def fail_budget_update(self, *args):
+        raise RuntimeError("бюджет недоступен")
+    
+    def descriptions(self):
+        self.tracker.cursor.execute("SELECT description FROM transactions ORDER BY id")
+        return [row[0] for row in self.tracker.cursor.fetchall()]
+    
+    def test_failed_import_keeps_earlier_batch_changes(self):
+        with self.tracker.batch():
+            self.tracker.add_expense(1, 100, "Кофе", "Кафе")
+            self.tracker._apply_budget_delta = self.fail_budget_update
+            success, message = self.tracker.import_transactions([
+                (1, "expense", 50, "Такси", "Транспорт", "2026-10-01"),
+            ])
+            self.assertFalse(success)
+            self.assertIn("бюджет недоступен", message)
+            del self.tracker._apply_budget_delta
+            self.tracker.add_income(1, 10, "Кэшбэк", "Бонусы")
+        
+        self.assertEqual(self.descriptions(), ["Кофе", "Кэшбэк"])
+        self.assertEqual(self.tracker.get_account_by_id(1)[2], 910)
+    
+    def test_failed_split_keeps_earlier_batch_changes(self):
+        self.tracker.add_expense(1, 100, "Супермаркет", "Продукты")
+        transaction_id = self.tracker.get_transactions()[0][0]
+        with self.tracker.batch():
+            self.tracker.add_expense(1, 30, "Кофе", "Кафе")
+            self.tracker._apply_budget_delta = self.fail_budget_update
+            success, _ = self.tracker.split_transaction(
+                transaction_id, [(60, "Продукты", ""), (40, "Бытовая химия", "")]
+            )
+            self.assertFalse(success)
+            del self.tracker._apply_budget_delta
+        
+        self.assertEqual(self.descriptions(), ["Супермаркет", "Кофе"])
+        self.assertEqual(self.tracker.get_transaction_splits(transaction_id), [])
+        self.assertEqual(self.tracker.get_account_by_id(1)[2], 870)
+    
+    def test_failed_import_outside_batch_leaves_no_transaction_open(self):
+        self.tracker._apply_budget_delta = self.fail_budget_update
+        success, _ = self.tracker.import_transactions([
+            (1, "expense", 50, "Такси", "Транспорт", "2026-10-01"),
+        ])
+        self.assertFalse(success)
+        self.assertFalse(self.tracker.conn.in_transaction)
+        self.assertEqual(self.descriptions(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
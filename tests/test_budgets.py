@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+
+from main import FinanceTracker
+
+
+class BudgetAlertTest(unittest.TestCase):
+    def setUp(self):
+        self.tracker = FinanceTracker(":memory:")
+        self.addCleanup(self.tracker.close)
+        self.tracker.create_account("Карта", "Дебетовая карта", 5000)
+        self.tracker.set_budget("Еда", 1000)
+    
+    def test_alert_uses_default_currency_symbol(self):
+        self.tracker.add_expense(1, 1500, "Ресторан", "Еда")
+        self.assertEqual(self.tracker.get_budget_alerts("Еда"),
+                         ["⚠️ Бюджет 'Еда' на месяц превышен: 1500.00 из 1000.00 ₽"])
+    
+    def test_alert_uses_report_currency(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "rates.csv")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("2020-01-01,USD,100\n")
+            self.assertTrue(self.tracker.load_fx_rates(path)[0])
+        self.assertTrue(self.tracker.set_report_currency("USD")[0])
+        
+        success, message = self.tracker.add_expense(1, 1500, "Ресторан", "Еда")
+        self.assertTrue(success, message)
+        self.assertIn("превышен: 15.00 из 10.00 $", message)
+
+
+if __name__ == "__main__":
+    unittest.main()
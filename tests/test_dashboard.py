@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+
+from main import FinanceTracker
+
+
+class DashboardExportTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "dashboard.html")
+    
+    def ledger(self, account_name, expense):
+        tracker = FinanceTracker(":memory:")
+        self.addCleanup(tracker.close)
+        tracker.create_account(account_name, "Дебетовая карта", 1000)
+        tracker.add_expense(1, expense, "Продукты", "Еда")
+        return tracker
+    
+    def test_months_from_another_ledger_are_rebuilt(self):
+        first = self.ledger("Карта", 100)
+        second = self.ledger("Карта", 300)
+        self.assertTrue(first.export_dashboard(self.path)[0])
+        
+        success, message = second.export_dashboard(self.path)
+        self.assertTrue(success, message)
+        self.assertTrue(message.endswith("пересчитано 1"), message)
+        months = second._read_dashboard_data(self.path, "dashboard-months")["months"]
+        self.assertEqual([data["expense"] for data in months.values()], [300])
+        
+        success, message = second.export_dashboard(self.path)
+        self.assertTrue(message.endswith("пересчитано 0"), message)
+    
+    def test_placeholder_text_in_data_is_kept(self):
+        tracker = self.ledger("Счёт __MONTHS__", 100)
+        success, message = tracker.export_dashboard(self.path)
+        self.assertTrue(success, message)
+        
+        summary = tracker._read_dashboard_data(self.path, "dashboard-summary")
+        self.assertEqual(summary["accounts"][0]["name"], "Счёт __MONTHS__")
+        months = tracker._read_dashboard_data(self.path, "dashboard-months")
+        self.assertEqual(len(months["months"]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from main import FinanceTracker
+
+
+class DuplicateReportTest(unittest.TestCase):
+    def setUp(self):
+        self.tracker = FinanceTracker(":memory:")
+        self.addCleanup(self.tracker.close)
+        self.tracker.create_account("Карта", "Дебетовая карта", 1000)
+        self.tracker.import_transactions([
+            (1, "expense", 100, "Кофе", "Кафе", "2026-10-01"),
+            (1, "expense", 100, "Кофе", "Кафе", "2026-10-01"),
+            (1, "expense", 250, "Такси", "Транспорт", "2026-10-02"),
+            (1, "expense", 250, "Такси", "Транспорт", "2026-10-02"),
+            (1, "expense", 250, "Такси", "Транспорт", "2026-10-02"),
+            (1, "income", 5000, "Зарплата", "Работа", "2026-10-03"),
+        ], skip_duplicates=False)
+    
+    def test_groups_are_read_in_one_query(self):
+        statements = []
+        self.tracker.conn.set_trace_callback(statements.append)
+        self.addCleanup(self.tracker.conn.set_trace_callback, None)
+        report = self.tracker.get_duplicate_report()
+        
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(sorted((len(group), group[0][4]) for group in report), [(2, "Кофе"), (3, "Такси")])
+        for group in report:
+            ids = [row[0] for row in group]
+            self.assertEqual(ids, sorted(ids))
+            self.assertEqual(len(group[0]), 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+from main import FinanceTracker
+
+
+class CurrencyConversionTest(unittest.TestCase):
+    """Счета в рублях и долларах: пересчёт по курсам и поведение без курсов"""
+    
+    def setUp(self):
+        self.tracker = FinanceTracker(":memory:")
+        self.addCleanup(self.tracker.close)
+        self.tracker.create_account("Рубли", "Наличные", 1000)
+        self.tracker.create_account("Доллары", "Наличные", 100, "usd")
+        self.tracker.add_expense(2, 10, "Кофе в аэропорту", "Кафе")
+    
+    def load_rates(self, text):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "rates.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        self.addCleanup(os.remove, path)
+        return self.tracker.load_fx_rates(path)
+    
+    def test_currency_without_rates_is_left_out_with_warning(self):
+        self.assertEqual(self.tracker.get_total_balance(), 1000)
+        self.assertEqual(self.tracker.get_currencies_without_rates(), ["USD"])
+        self.assertIn("USD", self.tracker.get_rate_warning())
+        self.assertEqual(self.tracker.get_category_summary(transaction_type="expense"), [])
+        with self.assertRaises(ValueError):
+            self.tracker.get_fx_rate("USD")
+    
+    def test_amounts_are_converted_once_rates_are_loaded(self):
+        self.assertTrue(self.load_rates("date,currency,rate\n2020-01-01,USD,90\n")[0])
+        self.assertEqual(self.tracker.get_rate_warning(), "")
+        self.assertAlmostEqual(self.tracker.get_total_balance(), 1000 + 90 * 90)
+        self.assertEqual(self.tracker.get_category_summary(transaction_type="expense"), [("Кафе", "expense", -900)])
+        self.assertAlmostEqual(self.tracker.get_total_balance("USD"), 1000 / 90 + 90)
+    
+    def test_transfer_between_currencies_needs_a_rate(self):
+        success, message = self.tracker.transfer_money(1, 2, 100)
+        self.assertFalse(success)
+        self.assertIn("USD", message)
+        self.assertEqual(self.tracker.get_account_by_id(1)[2], 1000)
+    
+    def test_create_account_reports_why_it_failed(self):
+        success, invalid_currency = self.tracker.create_account("Евро", "Наличные", 0, "EURO")
+        self.assertFalse(success)
+        success, duplicate = self.tracker.create_account("Рубли", "Наличные", 0)
+        self.assertFalse(success)
+        self.assertNotEqual(invalid_currency, duplicate)
+        
+        success, message = self.tracker.create_account("Тенге", "Наличные", 0, "KZT")
+        self.assertTrue(success)
+        self.assertIn("Нет курсов для валюты KZT", message)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from main import ConnectionPool, FinanceTracker, TenantRouter
+
+
+class SharedPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+    
+    def test_second_tracker_on_pool_can_search(self):
+        pool = ConnectionPool()
+        self.addCleanup(pool.close)
+        db_path = os.path.join(self.tmp_dir.name, "shared.db")
+        
+        first = FinanceTracker(db_path, pool=pool)
+        first.create_account("Карта", "Дебетовая карта", 1000)
+        first.add_expense(1, 100, "Кофейня у дома", "Кафе и рестораны")
+        first.release()
+        
+        # Второй трекер пропускает проверку схемы, но поиск должен работать так же
+        second = FinanceTracker(db_path, pool=pool)
+        results = second.search_transactions("кофейня")
+        second.release()
+        self.assertEqual([row[4] for row in results], ["Кофейня у дома"])
+    
+    def test_router_search_after_tracker_eviction(self):
+        router = TenantRouter(self.tmp_dir.name, max_trackers=1)
+        self.addCleanup(router.close)
+        
+        with router.session("alice") as tracker:
+            tracker.create_account("Карта", "Дебетовая карта", 1000)
+            tracker.add_expense(1, 100, "Аптека", "Здоровье")
+        with router.session("bob") as tracker:
+            tracker.create_account("Наличные", "Наличные", 500)
+        
+        # Трекер alice вытеснен из кэша и создаётся заново на уже подготовленном файле
+        with router.session("alice") as tracker:
+            results = tracker.search_transactions("аптека")
+        self.assertEqual([row[4] for row in results], ["Аптека"])
+
+
+
+class TenantSessionTest(unittest.TestCase):
+    """Сессии арендаторов из нескольких потоков"""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.router = TenantRouter(self.tmp_dir.name, max_connections=4, max_trackers=2)
+        self.addCleanup(self.router.close)
+    
+    def test_concurrent_sessions_of_one_tenant_are_serialized(self):
+        with self.router.session("family") as tracker:
+            tracker.create_account("Общая карта", "Дебетовая карта", 10000)
+        
+        errors = []
+        
+        def spend(thread_number):
+            try:
+                for i in range(20):
+                    with self.router.session("family") as tracker:
+                        success, message = tracker.add_expense(1, 5, f"Покупка {thread_number}-{i}", "Другое")
+                        if not success:
+                            errors.append(message)
+            except Exception as e:
+                errors.append(repr(e))
+        
+        threads = [threading.Thread(target=spend, args=(n,)) for n in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(errors, [])
+        with self.router.session("family") as tracker:
+            self.assertEqual(tracker.get_account_by_id(1)[2], 10000 - 6 * 20 * 5)
+            self.assertEqual(len(tracker.get_transactions()), 120)
+        self.assertEqual(self.router.sessions, {})
+    
+    def test_evicted_tracker_returns_its_connection(self):
+        with self.router.session("anna") as anna:
+            anna.create_account("Карта", "Дебетовая карта", 100)
+        anna.get_accounts()  # Трекер снова взял соединение после сессии
+        self.assertTrue(anna.is_connected())
+        
+        for tenant_id in ("boris", "vera"):
+            with self.router.session(tenant_id) as tracker:
+                tracker.get_accounts()
+        
+        self.assertNotIn("anna", self.router.trackers)
+        self.assertFalse(anna.is_connected())
+        self.assertEqual(self.router.pool.in_use, 0)
+    
+    def test_tracker_in_use_is_not_evicted(self):
+        with self.router.session("anna") as anna:
+            for tenant_id in ("boris", "vera"):
+                with self.router.session(tenant_id):
+                    pass
+            self.assertIn("anna", self.router.trackers)
+            self.assertTrue(anna.get_accounts() is not None)
+        self.assertLessEqual(len(self.router.trackers), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
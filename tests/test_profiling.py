@@ -0,0 +1,32 @@
+import sqlite3
+import unittest
+
+from main import FinanceTracker, ProfiledCursor
+
+
+class ProfilingSwitchTest(unittest.TestCase):
+    def setUp(self):
+        self.tracker = FinanceTracker(":memory:")
+        self.addCleanup(self.tracker.close)
+        self.tracker.create_account("Вклад", "Сбережения", 25000)
+
+    def test_plain_cursor_without_profiler(self):
+        self.assertIs(type(self.tracker.cursor), sqlite3.Cursor)
+        self.assertIs(type(self.tracker.conn.cursor()), sqlite3.Cursor)
+        self.assertIsNone(self.tracker.stats())
+
+    def test_enabling_and_disabling_swaps_cursor(self):
+        self.tracker.enable_profiling(slow_query_ms=10000)
+        self.assertIsInstance(self.tracker.cursor, ProfiledCursor)
+        
+        self.tracker.add_income(1, 500, "Проценты", "Другое")
+        methods = self.tracker.stats()["methods"]
+        self.assertIn("add_income", methods)
+        
+        self.tracker.disable_profiling()
+        self.assertIs(type(self.tracker.cursor), sqlite3.Cursor)
+        self.assertEqual(self.tracker.get_account_by_id(1)[2], 25500)
+
+
+if __name__ == "__main__":
+    unittest.main()
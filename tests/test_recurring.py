@@ -0,0 +1,101 @@
+import datetime
+import unittest
+from datetime import date
+
+from main import FinanceTracker, RecurrenceRule
+
+
+class RecurrenceRuleTest(unittest.TestCase):
+    def test_missing_day_moves_to_month_end(self):
+        rule = RecurrenceRule("monthly", 31)
+        self.assertEqual(rule.next_on_or_after(date(2025, 2, 1)), date(2025, 2, 28))
+        self.assertEqual(rule.next_on_or_after(date(2024, 2, 1)), date(2024, 2, 29))
+        self.assertEqual(rule.next_after(date(2024, 2, 29)), date(2024, 3, 31))
+    
+    def test_leap_day_anniversary(self):
+        rule = RecurrenceRule("yearly", anchor=date(2024, 2, 29))
+        self.assertEqual(rule.next_on_or_after(date(2025, 1, 1)), date(2025, 2, 28))
+        self.assertEqual(rule.next_on_or_after(date(2027, 3, 1)), date(2028, 2, 29))
+    
+    def test_biweekly_counts_from_anchor(self):
+        rule = RecurrenceRule("biweekly", anchor=date(2026, 1, 5))
+        self.assertEqual(rule.next_on_or_after(date(2025, 12, 1)), date(2026, 1, 5))
+        self.assertEqual(rule.next_on_or_after(date(2026, 1, 6)), date(2026, 1, 19))
+        self.assertEqual(list(rule.occurrences(date(2026, 1, 1), date(2026, 2, 28))),
+                         [date(2026, 1, 5), date(2026, 1, 19), date(2026, 2, 2), date(2026, 2, 16)])
+    
+    def test_last_business_day_skips_weekend(self):
+        rule = RecurrenceRule("last_business_day")
+        # 31 мая 2026 - воскресенье
+        self.assertEqual(rule.next_on_or_after(date(2026, 5, 1)), date(2026, 5, 29))
+        self.assertEqual(rule.next_after(date(2026, 5, 29)), date(2026, 6, 30))
+    
+    def test_invalid_rules_are_rejected(self):
+        with self.assertRaises(ValueError):
+            RecurrenceRule("monthly", 0)
+        with self.assertRaises(ValueError):
+            RecurrenceRule("weekly")
+        with self.assertRaises(ValueError):
+            RecurrenceRule("daily")
+
+
+class RecurringProcessingTest(unittest.TestCase):
+    """Пропущенные платежи проводятся своими датами, неудачный остаётся к оплате"""
+    
+    def setUp(self):
+        self.tracker = FinanceTracker(":memory:")
+        self.addCleanup(self.tracker.close)
+        self.tracker.create_account("Зарплатная", "Дебетовая карта", 0)
+        self.tracker.create_account("Копилка", "Накопительный счёт", 0)
+        self.today = date.today()
+    
+    def schedule(self):
+        self.tracker.cursor.execute("SELECT description, next_due, last_processed FROM recurring_payments ORDER BY id")
+        return self.tracker.cursor.fetchall()
+    
+    def balance(self, account_id):
+        return self.tracker.get_account_by_id(account_id)[2]
+    
+    def test_missed_months_are_caught_up(self):
+        success, message = self.tracker.add_recurring_payment(1, 50000, "Зарплата", 10, "Зарплата",
+                                                              transaction_type="income")
+        self.assertTrue(success, message)
+        first_due = date.fromisoformat(self.schedule()[0][1])
+        self.assertEqual(first_due.day, 10)
+        self.assertGreaterEqual(first_due, self.today)
+        
+        # Приложение не запускали три месяца
+        rule = RecurrenceRule("monthly", 10)
+        third_due = rule.next_after(rule.next_after(first_due))
+        results = self.tracker.process_recurring_payments(today=third_due + datetime.timedelta(days=3))
+        
+        self.assertEqual([success for success, _ in results], [True, True, True])
+        self.assertEqual(self.balance(1), 150000)
+        dates = sorted(row[6][:10] for row in self.tracker.get_transactions())
+        self.assertEqual(dates, [due.isoformat() for due in (first_due, rule.next_after(first_due), third_due)])
+        self.assertEqual(self.schedule(), [("Зарплата", rule.next_after(third_due).isoformat(), third_due.isoformat())])
+        
+        # Повторный запуск в тот же день ничего не проводит
+        self.assertEqual(self.tracker.process_recurring_payments(today=third_due + datetime.timedelta(days=3)), [])
+    
+    def test_failed_transfer_stays_due(self):
+        anchor = self.today + datetime.timedelta(days=1)
+        success, message = self.tracker.add_recurring_payment(1, 3000, "В копилку", rule="weekly", anchor_date=anchor,
+                                                              transaction_type="transfer", to_account_id=2)
+        self.assertTrue(success, message)
+        
+        results = self.tracker.process_recurring_payments(today=anchor)
+        self.assertEqual(len(results), 1)
+        self.assertFalse(results[0][0])
+        self.assertEqual(self.schedule(), [("В копилку", anchor.isoformat(), None)])
+        
+        # После пополнения проводятся обе недели: пропущенная и текущая
+        self.tracker.add_income(1, 10000, "Аванс", "Зарплата")
+        results = self.tracker.process_recurring_payments(today=anchor + datetime.timedelta(days=7))
+        self.assertEqual([success for success, _ in results], [True, True])
+        self.assertEqual((self.balance(1), self.balance(2)), (4000, 6000))
+        self.assertEqual(self.schedule()[0][1], (anchor + datetime.timedelta(days=14)).isoformat())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+
+from main import CategoryMatcher, FinanceTracker
+
+
+class RegexRuleTest(unittest.TestCase):
+    PATTERNS = ["(?i)netflix", r"(\w+) \1"]
+    
+    def setUp(self):
+        self.tracker = FinanceTracker(":memory:")
+        self.addCleanup(self.tracker.close)
+        self.tracker.create_account("Карта", "Дебетовая карта", 1000)
+    
+    def test_unmergeable_patterns_are_rejected(self):
+        for pattern in self.PATTERNS:
+            success, _ = self.tracker.add_category_rule(pattern, "Развлечения", match_type="regex")
+            self.assertFalse(success, pattern)
+        self.assertEqual(self.tracker.get_category_rules(), [])
+    
+    def test_stored_unmergeable_patterns_do_not_block_inserts(self):
+        # Правила, сохранённые в обход проверки (например, старой версией)
+        for pattern in self.PATTERNS:
+            self.tracker.cursor.execute(
+                "INSERT INTO category_rules (pattern, match_type, transaction_type, category) VALUES (?, 'regex', 'expense', ?)",
+                (pattern, "Развлечения")
+            )
+        self.tracker.conn.commit()
+        self.tracker.category_matcher = None
+        
+        success, _ = self.tracker.add_expense(1, 100, "NETFLIX подписка", "")
+        self.assertTrue(success)
+        success, _ = self.tracker.add_expense(1, 50, "кофе кофе", "")
+        self.assertTrue(success)
+        self.assertEqual(
+            [row[5] for row in self.tracker.get_transactions()],
+            ["Развлечения", "Развлечения"]
+        )
+    
+    def test_matcher_checks_unmergeable_regexes_separately(self):
+        rules = [(rule_id, pattern, "regex", "expense", "Развлечения", None, None, None, 0)
+                 for rule_id, pattern in enumerate(self.PATTERNS, 1)]
+        matcher = CategoryMatcher(rules)
+        self.assertEqual([rule_id for rule_id, _ in matcher.separate_regexes], [1, 2])
+        self.assertEqual(matcher.find_regex_rules("Netflix", 10, None, "expense"), {1})
+        self.assertEqual(matcher.find_regex_rules("такси такси", 10, None, "expense"), {2})
+        self.assertEqual(matcher.find_regex_rules("метро", 10, None, "expense"), set())
+    
+    def test_invalid_stored_pattern_is_reported(self):
+        self.tracker.cursor.execute(
+            "INSERT INTO category_rules (pattern, match_type, transaction_type, category) VALUES ('такси(', 'regex', 'expense', 'Транспорт')"
+        )
+        self.tracker.conn.commit()
+        self.tracker.category_matcher = None
+        
+        self.assertIn("такси(", self.tracker.get_rule_warning())
+        success, message = self.tracker.recategorize_transactions()
+        self.assertTrue(success)
+        self.assertIn("с ошибкой в шаблоне", message)
+
+
+class MergedRegexTest(unittest.TestCase):
+    """Регулярные правила одного типа проверяются одним выражением-альтернативой"""
+    
+    def matcher(self, *rules):
+        # (id, шаблон, категория, приоритет, мин. сумма)
+        return CategoryMatcher([(rule_id, pattern, "regex", "expense", category, min_amount, None, None, priority)
+                                for rule_id, pattern, category, priority, min_amount in rules])
+    
+    def test_higher_priority_wins_at_same_position(self):
+        matcher = self.matcher((1, r"кофе\w*", "Кафе", 0, None), (2, r"кофейня", "Рестораны", 5, None))
+        self.assertEqual(matcher.match("Кофейня у дома", 300), "Рестораны")
+        self.assertEqual(matcher.match("Кофемашина", 300), "Кафе")
+    
+    def test_overlapping_matches_are_all_found(self):
+        matcher = self.matcher((1, r"\d{4}", "Связь", 0, None), (2, r"\d\d мес", "Кредит", 1, None))
+        self.assertEqual(matcher.match("платёж 0123 мес", 100), "Кредит")
+        self.assertEqual(matcher.find_regex_rules("платёж 0123 мес", 100, None, "expense"), {1, 2})
+    
+    def test_rejected_rule_yields_to_next_at_same_position(self):
+        # Правило с приоритетом совпадает первым, но не проходит по сумме
+        matcher = self.matcher((1, r"аптека", "Лекарства", 9, 1000), (2, r"апт\w+", "Здоровье", 0, None))
+        self.assertEqual(matcher.match("Аптека 36.6", 200), "Здоровье")
+        self.assertEqual(matcher.match("Аптека 36.6", 2000), "Лекарства")
+    
+    def test_income_rules_do_not_shadow_expenses(self):
+        matcher = CategoryMatcher([
+            (1, r"перевод", "regex", "income", "Переводы", None, None, None, 9),
+            (2, r"перевод\s+\w+", "regex", "expense", "Семья", None, None, None, 0),
+        ])
+        self.assertEqual(matcher.match("Перевод маме", 500), "Семья")
+        self.assertEqual(matcher.match("Перевод маме", 500, transaction_type="income"), "Переводы")
+    
+    def test_literal_start_is_routed_through_automaton(self):
+        self.assertEqual(CategoryMatcher.required_literal(r"^Магазин\s*\d+"), "магазин")
+        self.assertEqual(CategoryMatcher.required_literal(r"такси?"), "такс")
+        self.assertIsNone(CategoryMatcher.required_literal(r"кофе|чай"))
+        self.assertIsNone(CategoryMatcher.required_literal(r"\d+ руб"))
+        
+        matcher = self.matcher((1, r"магазин\s*\d+", "Продукты", 0, None), (2, r"\w+ №\d+", "Другое", 0, None))
+        self.assertEqual(matcher.regex["expense"][1], [2])
+        self.assertEqual(matcher.match("МАГАЗИН 24", 100), "Продукты")
+        self.assertEqual(matcher.match("магазин без номера №5", 100), "Другое")
+    
+    def test_named_groups_are_not_merged(self):
+        self.assertIsNotNone(CategoryMatcher.merge_error(r"(?P<shop>\w+) маркет"))
+        self.assertIsNone(CategoryMatcher.merge_error(r"(?<!не)доставка (еды|продуктов)"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from main import FinanceTracker
+
+
+class SplitUpdateTest(unittest.TestCase):
+    def setUp(self):
+        self.tracker = FinanceTracker(":memory:")
+        self.addCleanup(self.tracker.close)
+        self.tracker.create_account("Карта", "Дебетовая карта", 1000)
+        self.tracker.add_expense(1, 100, "Супермаркет", "Продукты")
+        self.transaction_id = self.tracker.get_transactions()[0][0]
+        success, message = self.tracker.split_transaction(
+            self.transaction_id, [(60, "Продукты", ""), (40, "Бытовая химия", "")]
+        )
+        self.assertTrue(success, message)
+    
+    def balance(self):
+        self.tracker.cursor.execute("SELECT balance FROM accounts WHERE id = 1")
+        return self.tracker.cursor.fetchone()[0]
+    
+    def test_raising_split_expense_lowers_balance(self):
+        self.assertEqual(self.balance(), 900)
+        
+        success, message = self.tracker.update_transaction(self.transaction_id, amount=150)
+        self.assertTrue(success, message)
+        self.assertEqual(self.balance(), 850)
+        lines = [line[1] for line in self.tracker.get_transaction_splits(self.transaction_id)]
+        self.assertEqual(lines, [-90, -60])
+        
+        success, message = self.tracker.update_transaction(self.transaction_id, amount=50)
+        self.assertTrue(success, message)
+        self.assertEqual(self.balance(), 950)
+        lines = [line[1] for line in self.tracker.get_transaction_splits(self.transaction_id)]
+        self.assertEqual(lines, [-30, -20])
+    
+    def test_raising_expense_beyond_funds_is_rejected(self):
+        success, _ = self.tracker.update_transaction(self.transaction_id, amount=1000)
+        self.assertTrue(success)
+        self.assertEqual(self.balance(), 0)
+        
+        success, _ = self.tracker.update_transaction(self.transaction_id, amount=1001)
+        self.assertFalse(success)
+        self.assertEqual(self.balance(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
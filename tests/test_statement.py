@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from main import FinanceTracker
+
+
+class StatementExportTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.tracker = FinanceTracker(":memory:")
+        self.addCleanup(self.tracker.close)
+        self.tracker.create_account("Кредитка", "Кредитная карта", 30000)
+        self.tracker.add_expense(1, 1200, "Заправка", "Транспорт")
+        self.tracker.add_income(1, 400, "Возврат", "Другое")
+    
+    def export(self, path):
+        return self.tracker.export_statement(path, 1, "2000-01-01", "2100-01-01")
+    
+    def test_statement_is_written(self):
+        path = os.path.join(self.directory, "statement.pdf")
+        success, message = self.export(path)
+        self.assertTrue(success, message)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(5), b"%PDF-")
+    
+    def test_file_that_could_not_be_opened_is_kept(self):
+        path = os.path.join(self.directory, "old.pdf")
+        with open(path, "wb") as f:
+            f.write(b"%PDF-1.4 old")
+        
+        with mock.patch("builtins.open", side_effect=PermissionError("нет доступа")):
+            self.assertEqual(self.export(path), (False, "нет доступа"))
+        self.assertTrue(os.path.exists(path))
+        
+        missing = os.path.join(self.directory, "нет каталога", "statement.pdf")
+        success, message = self.export(missing)
+        self.assertFalse(success)
+        self.assertIn("No such file", message)
+    
+    def test_partial_file_is_removed(self):
+        path = os.path.join(self.directory, "broken.pdf")
+        with mock.patch.object(FinanceTracker, "_write_statement", side_effect=RuntimeError("нет шрифта")):
+            self.assertEqual(self.export(path), (False, "нет шрифта"))
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
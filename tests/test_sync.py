@@ -0,0 +1,104 @@
+import json
+import os
+import tempfile
+import unittest
+
+from main import FinanceTracker
+
+
+class SyncTest(unittest.TestCase):
+    """Два устройства - два файла базы в одном временном каталоге"""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.laptop = self.open("laptop.db")
+        self.phone = self.open("phone.db")
+    
+    def open(self, name):
+        tracker = FinanceTracker(os.path.join(self.directory, name))
+        self.addCleanup(tracker.close)
+        tracker.conn  # Файл базы создаётся при первом подключении
+        return tracker
+    
+    def sync(self):
+        success, message = self.laptop.sync_with(self.phone.db_path)
+        self.assertTrue(success, message)
+        return message
+    
+    def accounts(self, tracker):
+        return sorted((name, balance) for _, name, balance, _, _ in tracker.get_accounts())
+    
+    def descriptions(self, tracker):
+        tracker.cursor.execute("SELECT description FROM transactions ORDER BY description")
+        return [row[0] for row in tracker.cursor.fetchall()]
+    
+    def test_changes_travel_both_ways(self):
+        self.laptop.create_account("Карта", "Дебетовая карта", 1000)
+        self.laptop.add_expense(1, 200, "Продукты", "Еда")
+        self.sync()
+        self.phone.add_income(1, 50, "Кэшбэк", "Бонусы")
+        self.sync()
+        
+        for tracker in (self.laptop, self.phone):
+            self.assertEqual(self.accounts(tracker), [("Карта", 850)])
+            self.assertEqual(self.descriptions(tracker), ["Кэшбэк", "Продукты"])
+    
+    def test_change_to_deleted_account_is_deleted_on_both_sides(self):
+        self.laptop.create_account("Карта", "Дебетовая карта", 1000)
+        self.laptop.create_account("Вклад", "Сберегательный счёт", 500)
+        self.sync()
+        
+        self.assertTrue(self.laptop.delete_account(2)[0])
+        phone_deposit = [account[0] for account in self.phone.get_accounts() if account[1] == "Вклад"][0]
+        self.assertTrue(self.phone.add_expense(phone_deposit, 100, "Снятие", "")[0])
+        self.sync()
+        self.sync()
+        
+        for tracker in (self.laptop, self.phone):
+            self.assertEqual(self.accounts(tracker), [("Карта", 1000)])
+            self.assertEqual(self.descriptions(tracker), [])
+            tracker.cursor.execute("SELECT COUNT(*) FROM sync_pending")
+            self.assertEqual(tracker.cursor.fetchone()[0], 0)
+    
+    def test_change_waits_for_missing_reference(self):
+        self.laptop.create_account("Карта", "Дебетовая карта", 1000)
+        self.laptop.add_expense(1, 300, "Аптека", "Здоровье")
+        full_path = os.path.join(self.directory, "full.jsonl")
+        self.assertTrue(self.laptop.export_changes(full_path)[0])
+        
+        # Файл без строки счёта: операция ссылается на счёт, которого у получателя нет
+        with open(full_path, encoding="utf-8") as f:
+            lines = f.readlines()
+        partial_path = os.path.join(self.directory, "partial.jsonl")
+        with open(partial_path, "w", encoding="utf-8") as f:
+            f.writelines(line for line in lines if json.loads(line).get("table") != "accounts")
+        
+        success, message = self.phone.import_changes(partial_path)
+        self.assertTrue(success, message)
+        self.assertIn("ждут строк", message)
+        self.assertEqual(self.descriptions(self.phone), [])
+        
+        self.assertTrue(self.phone.import_changes(full_path)[0])
+        self.assertEqual(self.descriptions(self.phone), ["Аптека"])
+        self.assertEqual(self.accounts(self.phone), [("Карта", 700)])
+        self.phone.cursor.execute("SELECT COUNT(*) FROM sync_pending")
+        self.assertEqual(self.phone.cursor.fetchone()[0], 0)
+    
+    def test_changes_are_captured_only_after_first_exchange(self):
+        self.laptop.create_account("Карта", "Дебетовая карта", 1000)
+        self.laptop.cursor.execute("SELECT COUNT(*) FROM sync_rows")
+        self.assertEqual(self.laptop.cursor.fetchone()[0], 0)
+        self.laptop.cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'sync_%'")
+        self.assertEqual(self.laptop.cursor.fetchone()[0], 0)
+        
+        self.sync()
+        self.assertEqual(self.accounts(self.phone), [("Карта", 1000)])
+        self.laptop.add_expense(1, 10, "Кофе", "Кафе")
+        self.sync()
+        self.assertEqual(self.descriptions(self.phone), ["Кофе"])
+
+
+if __name__ == "__main__":
+    unittest.main()
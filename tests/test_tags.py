@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+
+from main import FinanceTracker
+
+
+class CyrillicTagCaseTest(unittest.TestCase):
+    """COLLATE NOCASE различает регистр кириллицы - регистр меток приводится в Python"""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_path = os.path.join(directory.name, "travel.db")
+        self.tracker = FinanceTracker(self.db_path)
+        self.addCleanup(self.tracker.close)
+        self.tracker.create_account("Карта", "Дебетовая карта", 50000)
+        self.tracker.add_expense(1, 9000, "Авиабилеты", "Транспорт")
+        self.tracker.add_expense(1, 4000, "Гостиница", "Жилье")
+        self.ids = sorted(row[0] for row in self.tracker.get_transactions())
+    
+    def test_case_variants_share_one_tag(self):
+        self.tracker.add_tags(self.ids[0], "Отпуск, Сочи")
+        self.tracker.add_tags(self.ids[1], "отпуск, СОЧИ")
+        
+        self.assertEqual([(name, count) for _, name, count in self.tracker.get_tags()], [("отпуск", 2), ("сочи", 2)])
+        found = self.tracker.get_transactions(tag_filter={"all": ["ОТПУСК", "Сочи"]})
+        self.assertEqual(sorted(row[0] for row in found), self.ids)
+        
+        success, message = self.tracker.remove_tags(self.ids[1], "Отпуск")
+        self.assertTrue(success, message)
+        self.assertEqual(self.tracker.get_transaction_tags(self.ids[1]), ["сочи"])
+    
+    def test_legacy_case_duplicates_are_merged(self):
+        # Старая версия сохранила метки как ввёл пользователь
+        self.tracker.cursor.executemany("INSERT INTO tags (id, name) VALUES (?, ?)", [(1, "Отпуск"), (2, "отпуск")])
+        self.tracker.cursor.executemany(
+            "INSERT INTO transaction_tags (tag_id, transaction_id) VALUES (?, ?)",
+            [(1, self.ids[0]), (2, self.ids[0]), (2, self.ids[1])]
+        )
+        self.tracker.conn.commit()
+        self.tracker.close()
+        
+        reopened = FinanceTracker(self.db_path)
+        self.addCleanup(reopened.close)
+        self.assertEqual(reopened.get_tags(), [(1, "отпуск", 2)])
+        found = reopened.get_transactions(tag_filter={"any": ["Отпуск"]})
+        self.assertEqual(sorted(row[0] for row in found), self.ids)
+
+
+if __name__ == "__main__":
+    unittest.main()
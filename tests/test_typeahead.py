@@ -0,0 +1,49 @@
+import unittest
+
+from main import FinanceTracker
+
+
+class TypeaheadEditsTest(unittest.TestCase):
+    """Подсказки после того, как индекс уже построен, должны видеть правки и удаления"""
+
+    def setUp(self):
+        self.tracker = FinanceTracker(":memory:")
+        self.addCleanup(self.tracker.close)
+        self.tracker.create_account("Наличные", "Кошелёк", 5000)
+        for amount, description in ((120, "Пятёрочка Ленина"), (80, "Кофейня"), (300, "Аптека")):
+            self.tracker.add_expense(1, amount, description, "Продукты")
+        self.ids = {row[4]: row[0] for row in self.tracker.get_transactions()}
+        # Индекс строится здесь, до правок
+        self.assertEqual(self.descriptions("пят"), ["Пятёрочка Ленина"])
+
+    def descriptions(self, query):
+        return [name for name, _ in self.tracker.suggest("description", query)]
+
+    def test_updated_description_replaces_old_one(self):
+        success, message = self.tracker.update_transaction(self.ids["Пятёрочка Ленина"], description="Магнит")
+        self.assertTrue(success, message)
+        
+        self.assertEqual(self.descriptions("магн"), ["Магнит"])
+        self.assertEqual(self.descriptions("пят"), [])
+
+    def test_deleted_description_is_not_suggested(self):
+        success, message = self.tracker.delete_transaction(self.ids["Аптека"])
+        self.assertTrue(success, message)
+        
+        self.assertEqual(self.descriptions("апт"), [])
+        self.assertIn("Кофейня", self.descriptions(""))
+
+    def test_changed_category_counts_for_new_category(self):
+        categories = [name for name, _ in self.tracker.suggest("expense_category", "")]
+        self.assertEqual(categories[0], "Продукты")
+        self.assertNotEqual(categories[1], "Здоровье")
+        
+        success, message = self.tracker.update_transaction(self.ids["Аптека"], category="Здоровье")
+        self.assertTrue(success, message)
+        
+        categories = [name for name, _ in self.tracker.suggest("expense_category", "")]
+        self.assertEqual(categories[:2], ["Продукты", "Здоровье"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from main import FinanceTracker
+
+
+class UndoRedoTest(unittest.TestCase):
+    """Журнал отмены на файловой базе: действие отменяется и повторяется целиком"""
+    
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.tracker = FinanceTracker(os.path.join(directory, "family.db"))
+        self.addCleanup(self.tracker.close)
+        self.tracker.create_account("Семейная карта", "Дебетовая карта", 20000)
+        self.tracker.create_account("Отпуск", "Накопительный счёт", 0)
+        self.tracker.set_budget("Продукты", 15000)
+        self.tracker.clear_undo_history()
+    
+    def state(self):
+        self.tracker.cursor.execute("SELECT id, balance FROM accounts ORDER BY id")
+        balances = self.tracker.cursor.fetchall()
+        self.tracker.cursor.execute("SELECT COUNT(*) FROM transactions")
+        count = self.tracker.cursor.fetchone()[0]
+        spent = [row[4] for row in self.tracker.get_budget_status()]
+        return balances, count, spent
+    
+    def test_import_is_undone_as_one_action(self):
+        before = self.state()
+        rows = [(1, "expense", 2300, "Лента", "Продукты", "2026-10-03"),
+                (1, "expense", 900, "Вкусвилл", "Продукты", "2026-10-05"),
+                (1, "income", 1500, "Кешбэк", "Другое", "2026-10-06")]
+        success, message = self.tracker.import_transactions(rows)
+        self.assertTrue(success, message)
+        after = self.state()
+        self.assertEqual(after[1], 3)
+        
+        self.assertEqual(self.tracker.undo(), (True, "Отменено: Импорт операций"))
+        self.assertEqual(self.state(), before)
+        
+        success, message = self.tracker.redo()
+        self.assertTrue(success, message)
+        self.assertEqual(self.state(), after)
+    
+    def test_deleted_split_with_tags_is_restored(self):
+        self.tracker.add_expense(1, 4000, "Гипермаркет", "Продукты")
+        transaction_id = self.tracker.get_transactions()[0][0]
+        self.tracker.split_transaction(transaction_id, [(3000, "Продукты", ""), (1000, "Дом", "")])
+        self.tracker.add_tags(transaction_id, "дача, выходные")
+        before = self.state()
+        
+        success, message = self.tracker.delete_transaction(transaction_id)
+        self.assertTrue(success, message)
+        self.assertEqual(self.state()[1], 0)
+        
+        success, message = self.tracker.undo()
+        self.assertTrue(success, message)
+        self.assertEqual(self.state(), before)
+        self.assertEqual([line[2] for line in self.tracker.get_transaction_splits(transaction_id)], ["Продукты", "Дом"])
+        self.assertEqual(self.tracker.get_transaction_tags(transaction_id), ["выходные", "дача"])
+    
+    def test_new_action_after_undo_drops_redo(self):
+        self.tracker.transfer_money(1, 2, 5000, "Откладываем на отпуск")
+        success, message = self.tracker.undo()
+        self.assertTrue(success, message)
+        self.assertEqual(self.state()[0], [(1, 20000), (2, 0)])
+        
+        self.tracker.add_expense(1, 700, "Аптека", "Здоровье")
+        self.assertEqual(self.tracker.redo(), (False, "Нет отменённых действий"))
+        self.assertEqual(self.state()[0], [(1, 19300), (2, 0)])
+    
+    def test_undo_survives_reopening(self):
+        self.tracker.add_income(2, 12000, "Премия", "Зарплата")
+        self.tracker.close()
+        
+        reopened = FinanceTracker(self.tracker.db_path)
+        self.addCleanup(reopened.close)
+        success, message = reopened.undo()
+        self.assertTrue(success, message)
+        self.assertEqual(reopened.get_account_by_id(2)[2], 0)
+        self.assertEqual(reopened.undo(), (False, "Нет действий для отмены"))
+
+
+if __name__ == "__main__":
+    unittest.main()